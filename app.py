@@ -1,11 +1,26 @@
 import asyncio
 import base64
+import contextvars
+import csv
+import functools
+import hashlib
+import io
 import json
 import logging
+import math
 import os
+import random
+import sys
+import threading
 import time
+import traceback
+import unicodedata
 import uuid
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 from zoneinfo import ZoneInfo
 
@@ -14,9 +29,9 @@ from dotenv import load_dotenv
 import firebase_admin
 import httpx
 import stripe
-from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from firebase_admin import auth as firebase_auth
 from firebase_admin import firestore as firebase_firestore
@@ -217,35 +232,71 @@ class MockFirestoreClient:
     def collection(self, name):
         if name not in self.data:
             self.data[name] = {}
-        return MockCollection(self.data[name])
+        return MockCollection(self.data[name], self.data, name)
 
     def transaction(self):
         return MockTransaction(self.data)
 
+    def batch(self):
+        return MockWriteBatch()
+
 
 class MockCollection:
-    def __init__(self, data):
+    # サブコレクションはクライアント直下に "users/{uid}/dictionary" のようなパスで保持する
+    def __init__(self, data, root=None, path=None):
         self.data = data
+        self.root = root
+        self.path = path
+
+    def document(self, doc_id=None):
+        return MockDocument(self.data, doc_id or uuid.uuid4().hex, self.root, self.path)
+
+    def add(self, data):
+        doc_ref = self.document()
+        doc_ref.set(data)
+        return datetime.now(timezone.utc), doc_ref
 
-    def document(self, doc_id):
-        return MockDocument(self.data, doc_id)
+    def _query(self):
+        return MockQuery(self.data, root=self.root, path=self.path)
 
     def where(self, field, op, value):
-        return MockQuery(self.data, field, op, value)
+        return self._query().where(field, op, value)
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._query().order_by(field, direction)
+
+    def limit(self, count):
+        return self._query().limit(count)
+
+    def select(self, field_paths):
+        return self._query().select(field_paths)
+
+    def stream(self):
+        return self._query().stream()
+
+    def count(self):
+        return self._query().count()
 
 
 class MockDocument:
-    def __init__(self, data, doc_id):
+    def __init__(self, data, doc_id, root=None, path=None):
         self.data = data
         self.doc_id = doc_id
         self.id = doc_id
         self.reference = self
+        self.root = root
+        self.path = path
 
-    def get(self, transaction=None):
+    def collection(self, name):
+        sub_path = f"{self.path}/{self.doc_id}/{name}"
+        return MockCollection(self.root.setdefault(sub_path, {}), self.root, sub_path)
+
+    def get(self, field_paths=None, transaction=None):
         return MockSnapshot(self.data.get(self.doc_id), self.doc_id)
 
     def set(self, data, merge=False):
-        processed_data = self._process_timestamps(data)
+        existing = self.data.get(self.doc_id) if merge else None
+        processed_data = self._process_timestamps(data, existing)
         if self.doc_id in self.data and merge:
             self.data[self.doc_id].update(processed_data)
         else:
@@ -253,15 +304,18 @@ class MockDocument:
 
     def update(self, data):
         if self.doc_id in self.data:
-            processed_data = self._process_timestamps(data)
+            processed_data = self._process_timestamps(data, self.data[self.doc_id])
             self.data[self.doc_id].update(processed_data)
 
-    def _process_timestamps(self, data):
-        """Replace SERVER_TIMESTAMP placeholders with actual datetime"""
+    def _process_timestamps(self, data, existing=None):
+        """Replace SERVER_TIMESTAMP placeholders with actual datetime (and apply Increment)"""
         processed = {}
         for key, value in data.items():
             if isinstance(value, MockServerTimestamp) or (hasattr(firebase_firestore, 'SERVER_TIMESTAMP') and value is firebase_firestore.SERVER_TIMESTAMP):
                 processed[key] = datetime.now(timezone.utc)
+            elif isinstance(value, firebase_firestore.Increment):
+                current = (existing or {}).get(key)
+                processed[key] = (current if isinstance(current, (int, float)) else 0) + value.value
             else:
                 processed[key] = value
         return processed
@@ -278,6 +332,7 @@ class MockSnapshot:
     def __init__(self, data, doc_id):
         self.data = data
         self.doc_id = doc_id
+        self.id = doc_id
         self.exists = data is not None
 
     def to_dict(self):
@@ -285,51 +340,146 @@ class MockSnapshot:
 
 
 class MockQuery:
-    def __init__(self, data, field, op, value):
+    def __init__(self, data, field=None, op=None, value=None, root=None, path=None):
         self.data = data
-        self.field = field
-        self.op = op
-        self.value = value
+        self.root = root
+        self.path = path
+        self._filters = [(field, op, value)] if field is not None else []
+        self._orders: list[tuple[str, str]] = []
+        self._start_after = None
+        self._fields = None
         self._limit = None
 
+    def where(self, field, op, value):
+        self._filters.append((field, op, value))
+        return self
+
+    def order_by(self, field, direction="ASCENDING"):
+        self._orders.append((field, direction))
+        return self
+
+    def start_after(self, cursor):
+        self._start_after = cursor
+        return self
+
+    def select(self, field_paths):
+        self._fields = list(field_paths)
+        return self
+
     def limit(self, count):
         self._limit = count
         return self
 
+    def _sort_key(self, doc_id, doc_data):
+        values = []
+        for field, _ in self._orders:
+            value = doc_id if field == "__name__" else doc_data.get(field)
+            values.append((value is not None, value))
+        return tuple(values)
+
+    def _cursor_key(self):
+        cursor = self._start_after
+        if isinstance(cursor, dict):
+            return tuple(
+                (cursor.get(field) is not None, cursor.get(field)) for field, _ in self._orders
+            )
+        return self._sort_key(cursor.id, cursor.to_dict() or {})
+
     def stream(self):
+        items = [
+            (doc_id, doc_data) for doc_id, doc_data in self.data.items()
+            if all(self._matches(doc_data, *condition) for condition in self._filters)
+        ]
+        descending = bool(self._orders) and self._orders[0][1] == "DESCENDING"
+        if self._orders:
+            items.sort(key=lambda item: self._sort_key(*item), reverse=descending)
+        if self._start_after is not None and self._orders:
+            cursor_key = self._cursor_key()
+            items = [
+                item for item in items
+                if (self._sort_key(*item) < cursor_key if descending else self._sort_key(*item) > cursor_key)
+            ]
         results = []
-        for doc_id, doc_data in self.data.items():
-            if self._matches(doc_data):
-                results.append(MockDocumentSnapshot(doc_data, doc_id, self.data))
-                if self._limit and len(results) >= self._limit:
-                    break
+        for doc_id, doc_data in items:
+            if self._fields is not None:
+                doc_data = {key: value for key, value in doc_data.items() if key in self._fields}
+            results.append(MockDocumentSnapshot(doc_data, doc_id, self.data))
+            if self._limit and len(results) >= self._limit:
+                break
         return results
 
-    def _matches(self, doc_data):
-        field_value = doc_data.get(self.field)
-        if self.op == "<":
-            return field_value < self.value
-        elif self.op == "<=":
-            return field_value <= self.value
-        elif self.op == "==":
-            return field_value == self.value
-        elif self.op == ">":
-            return field_value > self.value
-        elif self.op == ">=":
-            return field_value >= self.value
+    def count(self):
+        return MockAggregationQuery(self)
+
+    @staticmethod
+    def _matches(doc_data, field, op, value):
+        field_value = doc_data.get(field)
+        if field_value is None:
+            return op == "==" and value is None
+        if op == "<":
+            return field_value < value
+        elif op == "<=":
+            return field_value <= value
+        elif op == "==":
+            return field_value == value
+        elif op == ">":
+            return field_value > value
+        elif op == ">=":
+            return field_value >= value
         return False
 
 
+class MockAggregationResult:
+    def __init__(self, value):
+        self.alias = "count"
+        self.value = value
+
+
+class MockAggregationQuery:
+    def __init__(self, query):
+        self.query = query
+
+    def get(self, transaction=None):
+        return [[MockAggregationResult(len(self.query.stream()))]]
+
+
 class MockDocumentSnapshot:
     def __init__(self, data, doc_id, collection_data):
         self.data = data
         self.doc_id = doc_id
+        self.id = doc_id
+        self.exists = True
         self.reference = MockDocument(collection_data, doc_id)
 
     def to_dict(self):
         return self.data.copy() if self.data else None
 
 
+class MockWriteBatch:
+    def __init__(self):
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def set(self, doc_ref, data, merge=False):
+        self._writes.append(lambda: doc_ref.set(data, merge))
+
+    def create(self, doc_ref, data):
+        self._writes.append(lambda: doc_ref.set(data))
+
+    def update(self, doc_ref, data):
+        self._writes.append(lambda: doc_ref.update(data))
+
+    def delete(self, doc_ref):
+        self._writes.append(doc_ref.delete)
+
+    def commit(self):
+        for write in self._writes:
+            write()
+        self._writes = []
+
+
 class MockTransaction:
     def __init__(self, data):
         self.data = data
@@ -343,9 +493,15 @@ class MockTransaction:
     def set(self, doc_ref, data, merge=False):
         doc_ref.set(data, merge)
 
+    def create(self, doc_ref, data):
+        doc_ref.set(data)
+
     def update(self, doc_ref, data):
         doc_ref.update(data)
 
+    def delete(self, doc_ref):
+        doc_ref.delete()
+
     def _begin(self):
         """Mock transaction begin"""
         pass
@@ -482,6 +638,7 @@ def ensure_user_profile(uid: str) -> dict:
     if updates:
         updates["updatedAt"] = firebase_firestore.SERVER_TIMESTAMP
         user_ref.set(updates, merge=True)
+        invalidate_user_doc(uid)
 
     return {
         "plan": plan,
@@ -585,6 +742,8 @@ def apply_user_updates(
         transaction.set(user_ref, payload, merge=True)
     else:
         user_ref.set(payload, merge=True)
+    # トランザクションの場合はコミット後にも呼び出し側で無効化する
+    invalidate_user_doc(user_ref.id)
 
 
 def read_user_state(
@@ -592,18 +751,28 @@ def read_user_state(
     uid: str,
     current_jst: datetime,
     transaction: firebase_firestore.Transaction | MockTransaction | None = None,
+    persist: bool = True,
 ) -> tuple[firebase_firestore.DocumentReference, dict, str, dict]:
+    """
+    ユーザー状態を日次/月次ロールオーバー済みの形で返す。
+    persist=False は参照専用 GET 向け: 正規化はメモリ上だけで行い、書き込みはジョブの作成/完了トランザクションに任せる。
+    """
     user_ref = db.collection("users").document(uid)
     if transaction is not None:
         snap = user_ref.get(transaction=transaction)
+        raw_data = snap.to_dict() if snap.exists else None
+    elif not persist:
+        # 参照専用はキャッシュ経由（クォータを消費するトランザクション内では常に最新を読む）
+        raw_data = get_user_doc(db, uid)
     else:
         snap = user_ref.get()
+        raw_data = snap.to_dict() if snap.exists else None
     state, updates, plan, plan_config = normalize_user_usage_data(
-        snap.to_dict() if snap.exists else {},
+        raw_data or {},
         current_jst,
-        not snap.exists,
+        raw_data is None,
     )
-    if updates:
+    if updates and persist:
         apply_user_updates(user_ref, updates, transaction)
     return user_ref, state, plan, plan_config
 
@@ -979,33 +1148,72 @@ def _complete_job_core(
     return response
 
 
-def get_uid_from_request(request: Request) -> str:
+def is_debug_auth_bypass() -> bool:
     # 【セキュリティガード】本番環境ではDEBUG_AUTH_BYPASSを強制無効化
     if IS_PRODUCTION:
-        debug_bypass = False
-    else:
-        debug_bypass = os.getenv("DEBUG_AUTH_BYPASS") == "1"
+        return False
+    return os.getenv("DEBUG_AUTH_BYPASS") == "1"
 
-    if debug_bypass:
-        logger.warning("DEBUG_AUTH_BYPASS is enabled - development only!")
-        return "debug-user"
 
-    auth_header = request.headers.get("authorization", "")
-    if not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="auth_required")
-    token = auth_header.split(" ", 1)[1].strip()
+def lookup_verified_token(token: str) -> dict | None:
+    """Claims of an already verified token, or None (cheap enough to call on the event loop)."""
+    if not AUTH_TOKEN_CACHE_ENABLED:
+        return None
+    return _auth_token_cache.get(auth_token_cache_key(token))
+
+
+def verify_firebase_token(token: str) -> dict:
+    """Verify a Firebase ID token and return its decoded claims (401 on failure)."""
     if not token:
         raise HTTPException(status_code=401, detail="auth_required")
+    cached = lookup_verified_token(token)
+    if cached is not None:
+        return cached
+    return verify_firebase_token_uncached(token)
+
+
+def verify_firebase_token_uncached(token: str) -> dict:
     ensure_firebase_app()
+    started = time.perf_counter()
     try:
-        decoded = firebase_auth.verify_id_token(token)
+        decoded = firebase_auth.verify_id_token(token, check_revoked=AUTH_CHECK_REVOKED)
     except Exception as exc:  # noqa: BLE001
+        record_auth_token_verification(elapsed_ms(started), ok=False)
         logger.error(f"Firebase token verification failed: {exc}")
         raise HTTPException(status_code=401, detail="invalid_auth") from exc
-    uid = decoded.get("uid")
-    if not uid:
+    record_auth_token_verification(elapsed_ms(started), ok=True)
+    if not decoded.get("uid"):
         raise HTTPException(status_code=401, detail="invalid_auth")
-    return uid
+    if AUTH_TOKEN_CACHE_ENABLED:
+        store_verified_token(auth_token_cache_key(token), decoded)
+    return decoded
+
+
+def get_bearer_token(request: Request) -> str:
+    auth_header = request.headers.get("authorization", "")
+    if not auth_header.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="auth_required")
+    return auth_header.split(" ", 1)[1].strip()
+
+
+def get_uid_from_request(request: Request) -> str:
+    if is_debug_auth_bypass():
+        logger.warning("DEBUG_AUTH_BYPASS is enabled - development only!")
+        return "debug-user"
+    return verify_firebase_token(get_bearer_token(request))["uid"]
+
+
+async def require_uid(request: Request) -> str:
+    """get_uid_from_request for async handlers: cache hits stay on the loop, RSA verification goes to the pool."""
+    if is_debug_auth_bypass():
+        return get_uid_from_request(request)
+    token = get_bearer_token(request)
+    if not token:
+        raise HTTPException(status_code=401, detail="auth_required")
+    claims = lookup_verified_token(token)
+    if claims is None:
+        claims = await run_blocking(verify_firebase_token_uncached, token)
+    return claims["uid"]
 
 
 def verify_admin_access(request: Request) -> None:
@@ -1103,1629 +1311,5409 @@ async def cleanup_stale_downloads() -> None:
     logger.info(f"startup cleanup: removed {deleted} stale file(s) from downloads/")
 
 
-async def post_openai(url: str, payload: dict, headers: dict | None = None) -> dict:
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        response = await client.post(url, json=payload, headers=headers or {})
-        if not response.is_success:
-            # デバッグ用: エラー時のステータスとレスポンスボディをログ出力（秘匿情報マスク）
-            logger.error(f"OpenAI API error: status={response.status_code}, body={mask_secrets(response.text)}")
-        response.raise_for_status()
-        return response.json()
-
+# ========== Blocking I/O offload ==========
+# Firestore / Stripe / Firebase Auth の SDK は同期 API なので、イベントループではなく専用の有界スレッドプールで実行する
+BLOCKING_IO_MAX_WORKERS = int(os.getenv("BLOCKING_IO_MAX_WORKERS", "32"))
+# イベントループがこの時間以上止まったら、ループスレッドのスタックをログに出す（0 で無効）
+LOOP_BLOCK_WARN_MS = float(os.getenv("LOOP_BLOCK_WARN_MS", "100"))
+LOOP_WATCHDOG_INTERVAL_SECONDS = float(os.getenv("LOOP_WATCHDOG_INTERVAL_SECONDS", "0.05"))
+LOOP_WATCHDOG_TOP_SITES = 10
 
-audio_model_default = "gpt-4o-mini-transcribe"
-realtime_model_default = os.getenv("OPENAI_REALTIME_MODEL", "gpt-4o-realtime-preview-2024-12-17")
-translate_model_default = "gpt-4o-mini"
-summarize_model_default = "gpt-4o-mini"
+_blocking_io_executor = ThreadPoolExecutor(
+    max_workers=max(1, BLOCKING_IO_MAX_WORKERS),
+    thread_name_prefix="blocking-io",
+)
+_blocking_io_lock = threading.Lock()
+_blocking_io_stats = {
+    "calls": 0,
+    "errors": 0,
+    "inflight": 0,
+    "peakInflight": 0,
+    "queueMsMax": 0.0,
+    "runMsTotal": 0.0,
+}
 
 
-def extract_output_text(result: dict) -> str:
-    if "output" in result and isinstance(result.get("output"), list):
-        first = result["output"][0]
-        content = first.get("content") if isinstance(first, dict) else None
-        if content and isinstance(content, list) and content:
-            text_item = content[0]
-            if isinstance(text_item, dict):
-                return text_item.get("text", "").strip()
-    return (result.get("output_text") or result.get("content") or "").strip()
+async def run_blocking(func, *args, **kwargs):
+    """Run a synchronous SDK call on the blocking-I/O pool (like asyncio.to_thread, but bounded)."""
+    loop = asyncio.get_running_loop()
+    submitted = time.perf_counter()
 
+    def call():
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            finished = time.perf_counter()
+            with _blocking_io_lock:
+                _blocking_io_stats["queueMsMax"] = max(
+                    _blocking_io_stats["queueMsMax"], (started - submitted) * 1000
+                )
+                _blocking_io_stats["runMsTotal"] += (finished - started) * 1000
 
-BASE_SESSION_INSTRUCTIONS = (
-    "You are a real-time interpreter. "
-    "Output only the translated text. No extra commentary. "
-    "Preserve proper nouns, acronyms, and numbers."
-)
-GLOSSARY_MAX_LINES = 200
+    _blocking_io_stats["calls"] += 1
+    _blocking_io_stats["inflight"] += 1
+    _blocking_io_stats["peakInflight"] = max(_blocking_io_stats["peakInflight"], _blocking_io_stats["inflight"])
+    try:
+        return await loop.run_in_executor(_blocking_io_executor, functools.partial(contextvars.copy_context().run, call))
+    except Exception:
+        _blocking_io_stats["errors"] += 1
+        raise
+    finally:
+        _blocking_io_stats["inflight"] -= 1
 
 
-def parse_glossary_text(text: str | None) -> list[tuple[str, str]]:
-    if not text:
-        return []
-    entries: list[tuple[str, str]] = []
-    for line in text.splitlines():
-        if len(entries) >= GLOSSARY_MAX_LINES:
+def blocking_call_site(frame) -> str:
+    """Innermost app.py frame of a stack (falls back to the innermost frame)."""
+    innermost = None
+    while frame is not None:
+        if innermost is None:
+            innermost = frame
+        if frame.f_code.co_filename == __file__:
             break
-        line = line.strip()
-        if not line or line.startswith("#"):
-            continue
-        match = re.match(r"^(.+?)\s*(?:=>|=)\s*(.+)$", line)
-        if not match:
-            continue
-        source = match.group(1).strip()
-        target = match.group(2).strip()
-        if source and target:
-            entries.append((source, target))
-    return entries
+        frame = frame.f_back
+    target = frame or innermost
+    if target is None:
+        return "unknown"
+    return f"{Path(target.f_code.co_filename).name}:{target.f_lineno} in {target.f_code.co_name}"
 
 
-def build_session_instructions(glossary_entries: list[tuple[str, str]], output_lang: str | None) -> str:
-    instructions = BASE_SESSION_INSTRUCTIONS
-    if output_lang and output_lang != "auto":
-        lang_names = {"ja": "Japanese", "en": "English", "zh": "Chinese", "vi": "Vietnamese"}
-        lang_name = lang_names.get(output_lang, output_lang)
-        instructions += f" You MUST translate into {lang_name}. Do NOT output in any other language."
-    if glossary_entries:
-        instructions += "\n\nGlossary (must-follow):"
-        for source, target in glossary_entries:
-            instructions += f"\n- {source} => {target}"
-        instructions += "\n\nGlossary rules:"
-        instructions += "\n- If a glossary entry matches, you MUST use the specified target term."
-        instructions += "\n- Avoid partial-match mistakes; prefer whole-word matches when reasonable."
-        instructions += "\n- Do not invent glossary entries."
-    return instructions
+class EventLoopWatchdog:
+    """Flags blocking calls left on the event loop.
 
+    A heartbeat task ticks on the loop; a daemon thread notices when the ticks stop
+    and logs the loop thread's current stack, which points at the blocking call.
+    """
 
-def sanitize_session_for_log(session: dict) -> dict:
-    if not isinstance(session, dict):
-        return {}
-    sanitized: dict = {}
-    for key, value in session.items():
-        if key == "instructions" and isinstance(value, str):
-            sanitized[key] = f"<len={len(value)}>"
-        else:
-            sanitized[key] = value
-    return sanitized
+    def __init__(self, threshold_ms: float, interval_seconds: float):
+        self.threshold_ms = threshold_ms
+        self.interval_seconds = interval_seconds
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id: int | None = None
+        self.stalls = 0
+        self.max_stall_ms = 0.0
+        self.sites: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._task: asyncio.Task | None = None
+
+    async def _beat(self) -> None:
+        while True:
+            self.heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval_seconds)
+            lag_ms = (time.monotonic() - self.heartbeat - self.interval_seconds) * 1000
+            self.max_stall_ms = max(self.max_stall_ms, lag_ms)
+
+    def _watch(self) -> None:
+        reported_beat = None
+        while not self._stop.wait(self.interval_seconds):
+            beat = self.heartbeat
+            stalled_ms = (time.monotonic() - beat - self.interval_seconds) * 1000
+            if stalled_ms < self.threshold_ms or beat == reported_beat:
+                continue
+            reported_beat = beat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            site = blocking_call_site(frame)
+            self.stalls += 1
+            self.sites[site] += 1
+            stack = "".join(traceback.format_stack(frame, limit=8)) if frame is not None else ""
+            logger.warning(f"event loop blocked for >{stalled_ms:.0f}ms at {site}\n{stack}")
+
+    def start(self) -> None:
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._beat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "thresholdMs": self.threshold_ms,
+            "stalls": self.stalls,
+            "maxStallMs": round(self.max_stall_ms, 1),
+            "topSites": dict(self.sites.most_common(LOOP_WATCHDOG_TOP_SITES)),
+        }
 
 
-@app.get("/", response_class=HTMLResponse)
-async def index() -> HTMLResponse:
-    index_file = STATIC_DIR / "index.html"
-    return HTMLResponse(index_file.read_text(encoding="utf-8"))
+_loop_watchdog: EventLoopWatchdog | None = None
 
 
-@app.get("/sw.js", include_in_schema=False)
-async def service_worker() -> FileResponse:
-    return FileResponse(STATIC_DIR / "sw.js", media_type="application/javascript")
+def get_blocking_io_stats() -> dict:
+    with _blocking_io_lock:
+        stats = dict(_blocking_io_stats)
+    return dict(
+        stats,
+        queueMsMax=round(stats["queueMsMax"], 1),
+        runMsTotal=round(stats["runMsTotal"], 1),
+        maxWorkers=_blocking_io_executor._max_workers,
+        loopWatchdog=_loop_watchdog.stats() if _loop_watchdog is not None else None,
+    )
 
 
-@app.get("/favicon.ico", include_in_schema=False)
-async def favicon() -> FileResponse:
-    return FileResponse(STATIC_DIR / "icon-192.png", media_type="image/png")
+@app.on_event("startup")
+async def start_loop_watchdog() -> None:
+    global _loop_watchdog
+    if LOOP_BLOCK_WARN_MS <= 0:
+        return
+    _loop_watchdog = EventLoopWatchdog(LOOP_BLOCK_WARN_MS, LOOP_WATCHDOG_INTERVAL_SECONDS)
+    _loop_watchdog.start()
 
 
-@app.post("/token")
-async def create_token(
-    request: Request,
-    vad_silence: int | None = Form(None),
-    glossary_text: str | None = Form(None, alias="glossaryText"),
-    output_lang: str | None = Form(None, alias="outputLang"),
-) -> JSONResponse:
-    # 認証必須: Firebase ID トークンを検証
-    uid = get_uid_from_request(request)
-    logger.info(f"Token requested by uid: {uid}")
+@app.on_event("shutdown")
+async def stop_loop_watchdog() -> None:
+    if _loop_watchdog is not None:
+        await _loop_watchdog.stop()
 
-    # TODO: vad_silence, transcription, server_vad を最小疎通後に戻す
-    # silence_ms = vad_silence if vad_silence is not None else 400
 
-    # OpenAI docs: /v1/realtime/client_secrets with session wrapper
-    # https://platform.openai.com/docs/guides/realtime-webrtc
-    # 最小構成で疎通確認 - 追加オプションは疎通後に有効化
-    glossary_entries = parse_glossary_text(glossary_text)
-    instructions = build_session_instructions(glossary_entries, output_lang)
+# ========== In-process cache ==========
+def estimate_cache_bytes(key: str, value) -> int:
+    """Rough in-memory footprint of a cache entry (UTF-8 bytes of key + JSON value)."""
+    if isinstance(value, str):
+        payload = value
+    else:
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+    return len(key.encode("utf-8")) + len(payload.encode("utf-8"))
+
+
+class LRUTTLCache:
+    """LRU cache bounded by entry count and byte size, with a TTL per entry."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, int, object]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, _, value = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value, ttl_seconds: float | None = None, size: int | None = None) -> bool:
+        size = size if size is not None else estimate_cache_bytes(key, value)
+        if size > self.max_bytes:
+            return False
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0:
+            return False
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+        return True
+
+    def pop(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def purge_expired(self) -> int:
+        """Drop expired entries now instead of on their next lookup (frees their bytes)."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (expires_at, _, _) in self._entries.items() if expires_at <= now]
+            for key in expired:
+                self._remove(key)
+            self.expirations += len(expired)
+        return len(expired)
+
+    def stats(self) -> dict:
+        # ワーカースレッド（run_blocking）からも更新されるので、entries と bytes を同じ時点で読む
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "maxEntries": self.max_entries,
+                "maxBytes": self.max_bytes,
+                "ttlSeconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hitRate": round(self.hits / lookups, 4) if lookups else None,
+            }
 
-    payload = {
-        "session": {
-            "type": "realtime",
-            "model": "gpt-4o-realtime-preview",
-            "instructions": instructions,
-            "audio": {
-                "output": {
-                    "voice": "alloy",
-                }
-            },
-            # TODO: 疎通確認後に以下を有効化
-            # "turn_detection": {
-            #     "type": "server_vad",
-            #     "silence_duration_ms": silence_ms,
-            # },
-            # "input_audio_transcription": {
-            #     "model": audio_model_default,
-            # },
-        }
-    }
 
-    api_key = get_openai_api_key()
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+class FirestoreCacheTier:
+    """Shared cache tier: one Firestore document per key, so hits are shared across instances.
 
-    # payload の session 情報をログ出力
-    session_info = payload.get("session", {})
-    logger.info(
-        f"Requesting ephemeral key | type={session_info.get('type')}, "
-        f"model={session_info.get('model')}, voice={session_info.get('audio', {}).get('output', {}).get('voice')}, "
-        f"glossary_entries={len(glossary_entries)}, instructions_len={len(instructions)}"
-    )
-    session_log = sanitize_session_for_log(session_info)
+    Any object exposing the same ``get(key)`` / ``set(key, value, ttl_seconds)`` methods
+    can stand in for it (e.g. a local dict in development).
+    """
 
-    try:
-        data = await post_openai(
-            "https://api.openai.com/v1/realtime/client_secrets",
-            payload,
-            headers,
-        )
-    except httpx.HTTPStatusError as exc:
-        resp = exc.response
-        status_code = resp.status_code if resp is not None else 502
-        reason = resp.reason_phrase if resp is not None else "Error"
-        body_text = resp.text if resp is not None else ""
-        logger.error(
-            "OpenAI client_secrets error: "
-            f"status={status_code}, reason={reason}, body={mask_secrets(body_text)}, session={session_log}"
-        )
-        raise HTTPException(
-            status_code=status_code,
-            detail=f"OpenAI API error ({status_code} {reason})",
-        ) from exc
-    except httpx.RequestError as exc:
-        logger.error(
-            "OpenAI request error: "
-            f"{type(exc).__name__}: {exc} session={session_log}"
-        )
-        raise HTTPException(
-            status_code=502,
-            detail="OpenAI request error",
+    def __init__(self, collection: str):
+        self.collection = collection
+
+    def get(self, key: str):
+        snap = get_firestore_client().collection(self.collection).document(key).get()
+        if not snap.exists:
+            return None
+        data = snap.to_dict() or {}
+        expires_at = to_utc_datetime(data.get("expiresAt"))
+        if expires_at is not None and expires_at <= datetime.now(timezone.utc):
+            return None
+        return data.get("value")
+
+    def set(self, key: str, value, ttl_seconds: float) -> None:
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+        get_firestore_client().collection(self.collection).document(key).set(
+            {"value": value, "expiresAt": expires_at}
         )
 
-    # /v1/realtime/client_secrets returns: { "value": "ek_...", "expires_at": ..., "session": {...} }
-    raw_secret = data.get("value")
 
-    if not isinstance(raw_secret, str) or not raw_secret.strip():
-        logger.error(f"value missing in OpenAI response: {mask_secrets(str(data))}")
-        raise HTTPException(status_code=502, detail="client_secret missing in OpenAI response")
+# ========== Firebase ID token cache ==========
+# verify_id_token は RSA 署名検証で重いので、検証済みトークン（の SHA-256）→ claims を exp 直前まで使い回す
+AUTH_TOKEN_CACHE_ENABLED = parse_bool(os.getenv("AUTH_TOKEN_CACHE_ENABLED", "1"))
+AUTH_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_TOKEN_CACHE_MAX_ENTRIES", "10000"))
+AUTH_TOKEN_CACHE_MAX_BYTES = int(os.getenv("AUTH_TOKEN_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# exp のこの秒数前にはキャッシュから外す（インスタンス間の時計のずれを吸収）
+AUTH_TOKEN_CACHE_SKEW_SECONDS = float(os.getenv("AUTH_TOKEN_CACHE_SKEW_SECONDS", "60"))
+# 失効（revoke）チェックは 1 回ごとに Auth API を呼ぶため既定では無効
+AUTH_CHECK_REVOKED = parse_bool(os.getenv("AUTH_CHECK_REVOKED", "0"))
+# 失効チェック有効時は、この秒数ごとに検証し直す（revoke の反映遅延の上限）
+AUTH_REVOCATION_RECHECK_SECONDS = float(os.getenv("AUTH_REVOCATION_RECHECK_SECONDS", "300"))
+# Google の署名証明書をバックグラウンドで取り直す間隔（0 で無効）
+AUTH_CERTS_REFRESH_SECONDS = float(os.getenv("AUTH_CERTS_REFRESH_SECONDS", "600"))
+# verify_id_token が署名検証に使う公開鍵（公開 URL。firebase_admin 内部の定数には依存しない）
+FIREBASE_ID_TOKEN_CERT_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+
+_auth_token_cache = LRUTTLCache(
+    AUTH_TOKEN_CACHE_MAX_ENTRIES,
+    AUTH_TOKEN_CACHE_MAX_BYTES,
+    AUTH_REVOCATION_RECHECK_SECONDS,
+)
+_auth_token_stats = {
+    "verifications": 0,
+    "failures": 0,
+    "verifyMsTotal": 0.0,
+    "verifyMsMax": 0.0,
+    "certRefreshes": 0,
+    "certRefreshErrors": 0,
+}
+_auth_certs_refresh_task: asyncio.Task | None = None
 
-    logger.info(f"Ephemeral key obtained successfully (prefix: {raw_secret[:10]}...)")
-    # フロントが data.value を読む前提に合わせる
-    return JSONResponse({"value": raw_secret})
 
+def auth_token_cache_key(token: str) -> str:
+    # トークン本体はメモリに残さない
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
 
 
-@app.post("/api/v1/jobs/create")
-async def create_job(request: Request) -> JSONResponse:
-    uid = get_uid_from_request(request)
-    db = get_firestore_client()
-    current_jst = now_jst()
-    now_utc = datetime.now(timezone.utc)
-    job_id = uuid.uuid4().hex
+def record_auth_token_verification(duration_ms: float, ok: bool) -> None:
+    _auth_token_stats["verifications"] += 1
+    if not ok:
+        _auth_token_stats["failures"] += 1
+    _auth_token_stats["verifyMsTotal"] += duration_ms
+    _auth_token_stats["verifyMsMax"] = max(_auth_token_stats["verifyMsMax"], duration_ms)
 
-    force_takeover = False
-    raw_force_takeover = request.query_params.get("force_takeover")
-    if raw_force_takeover is not None:
-        force_takeover = parse_bool(raw_force_takeover)
-    else:
-        try:
-            body = await request.json()
-        except Exception:
-            body = {}
-        if isinstance(body, dict):
-            raw_force_takeover = body.get("force_takeover")
-            if raw_force_takeover is None:
-                raw_force_takeover = body.get("forceTakeover")
-            force_takeover = parse_bool(raw_force_takeover)
-
-    use_simple = False
-    if not IS_PRODUCTION:
-        use_simple = os.getenv("DEBUG_AUTH_BYPASS") == "1"
 
-    if use_simple:
-        result = create_job_transaction_simple(
-            db, uid, job_id, current_jst, now_utc, force_takeover=force_takeover
-        )
-    else:
-        transaction = db.transaction(max_attempts=10)
-        result = create_job_transaction(
-            transaction, db, uid, job_id, current_jst, now_utc, force_takeover=force_takeover
-        )
+def store_verified_token(cache_key: str, claims: dict, now: float | None = None) -> bool:
+    exp = claims.get("exp")
+    if not isinstance(exp, (int, float)):
+        return False
+    now = time.time() if now is None else now
+    ttl = exp - AUTH_TOKEN_CACHE_SKEW_SECONDS - now
+    if AUTH_CHECK_REVOKED:
+        ttl = min(ttl, AUTH_REVOCATION_RECHECK_SECONDS)
+    return _auth_token_cache.set(cache_key, claims, ttl_seconds=ttl)
 
-    log_payload = {
-        "uid": uid,
-        "jobId": job_id,
-        "endpoint": "jobs.create",
-        "plan": result.get("plan"),
-        "reservedSeconds": result.get("reservedSeconds"),
-        "reservedBaseSeconds": result.get("reservedBaseSeconds"),
-        "reservedTicketSeconds": result.get("reservedTicketSeconds"),
-        "totalAvailableThisMonth": result.get("totalAvailableThisMonth"),
-    }
-    logger.info(f"Job reservation | {json.dumps(log_payload)}")
-    return JSONResponse(result)
 
+def firebase_cert_fetch_request():
+    """Return the cache-control request object firebase_admin's verify_id_token fetches certs with.
 
-@app.post("/api/v1/jobs/complete")
-async def complete_job(request: Request) -> JSONResponse:
-    uid = get_uid_from_request(request)
-    body = await request.json()
-    job_id = body.get("jobId")
-    if not job_id:
-        raise HTTPException(status_code=400, detail="jobId is required")
-    audio_seconds = None
-    if "audioSeconds" in body:
-        try:
-            audio_seconds = int(body.get("audioSeconds"))
-        except (TypeError, ValueError):
-            raise HTTPException(status_code=400, detail="audioSeconds must be an integer")
-        if audio_seconds < 0:
-            raise HTTPException(status_code=400, detail="audioSeconds must be >= 0")
+    firebase_admin has no public handle on it, so this is the one place that touches its
+    internals; tests/test_auth_token_cache.py fails if the installed version moves them.
+    """
+    ensure_firebase_app()
+    client = firebase_auth._get_client(firebase_admin.get_app())
+    request = getattr(getattr(client, "_token_verifier", None), "request", None)
+    if not callable(request):
+        raise RuntimeError("firebase_admin no longer exposes its cert fetch request")
+    return request
 
-    db = get_firestore_client()
-    job_ref = db.collection("jobs").document(job_id)
-    current_jst = now_jst()
-    now_utc = datetime.now(timezone.utc)
 
-    # 【セキュリティガード】本番環境では simplified transaction を使わない
-    use_simple = False
-    if not IS_PRODUCTION:
-        use_simple = os.getenv("DEBUG_AUTH_BYPASS") == "1"
+def refresh_firebase_certs() -> None:
+    """Fetch the ID-token signing certs through the same cache-control session verify_id_token uses.
 
-    if use_simple:
-        result = complete_job_transaction_simple(db, job_ref, uid, audio_seconds, current_jst, now_utc)
-    else:
-        transaction = db.transaction(max_attempts=10)
-        result = complete_job_transaction(
-            transaction, db, job_ref, uid, audio_seconds, current_jst, now_utc
-        )
+    The fetch is a no-op while the cached response is fresh; when it is stale the
+    refresh happens here instead of inside a user request.
+    """
+    response = firebase_cert_fetch_request()(url=FIREBASE_ID_TOKEN_CERT_URL, method="GET")
+    if response.status != 200:
+        raise RuntimeError(f"cert fetch returned {response.status}")
 
-    result["serverTime"] = now_utc.isoformat()
 
-    log_payload = {
-        "uid": uid,
-        "jobId": job_id,
-        "endpoint": "jobs.complete",
-        "status": result.get("status"),
-        "billedSeconds": result.get("billedSeconds"),
-        "billedBaseSeconds": result.get("billedBaseSeconds"),
-        "billedTicketSeconds": result.get("billedTicketSeconds"),
-    }
-    logger.info(f"Job completed | {json.dumps(log_payload)}")
-    return JSONResponse(result)
+async def run_auth_certs_refresh() -> None:
+    while True:
+        try:
+            await run_blocking(refresh_firebase_certs)
+            _auth_token_stats["certRefreshes"] += 1
+        except Exception as exc:  # noqa: BLE001
+            _auth_token_stats["certRefreshErrors"] += 1
+            logger.warning(f"firebase cert refresh failed: {type(exc).__name__}: {exc}")
+        await asyncio.sleep(AUTH_CERTS_REFRESH_SECONDS)
+
+
+def get_auth_token_cache_stats() -> dict:
+    verifications = _auth_token_stats["verifications"]
+    return dict(
+        _auth_token_stats,
+        verifyMsTotal=round(_auth_token_stats["verifyMsTotal"], 1),
+        verifyMsMax=round(_auth_token_stats["verifyMsMax"], 1),
+        verifyMsAvg=round(_auth_token_stats["verifyMsTotal"] / verifications, 1) if verifications else None,
+        enabled=AUTH_TOKEN_CACHE_ENABLED,
+        checkRevoked=AUTH_CHECK_REVOKED,
+        cache=_auth_token_cache.stats(),
+    )
 
 
-@app.patch("/api/v1/jobs/{job_id}/title")
-async def update_job_title(job_id: str, request: Request) -> JSONResponse:
-    uid = get_uid_from_request(request)
-    body = await request.json()
-    raw_title = body.get("title")
-    if not isinstance(raw_title, str):
-        raise HTTPException(status_code=400, detail="title_required")
+@app.on_event("startup")
+async def start_auth_certs_refresh() -> None:
+    global _auth_certs_refresh_task
+    if AUTH_CERTS_REFRESH_SECONDS <= 0 or is_debug_auth_bypass():
+        return
+    _auth_certs_refresh_task = asyncio.create_task(run_auth_certs_refresh())
 
-    # Normalize: trim + collapse internal whitespace
-    title = re.sub(r"\s+", " ", raw_title).strip()
 
-    if not title:
-        raise HTTPException(status_code=400, detail="title_required")
-    if len(title) > TITLE_MAX_LENGTH:
-        raise HTTPException(status_code=400, detail="title_too_long")
-    if TITLE_FORBIDDEN_CHARS_RE.search(title):
-        raise HTTPException(status_code=400, detail="title_invalid_chars")
+@app.on_event("shutdown")
+async def stop_auth_certs_refresh() -> None:
+    global _auth_certs_refresh_task
+    task = _auth_certs_refresh_task
+    _auth_certs_refresh_task = None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
 
-    db = get_firestore_client()
-    job_ref = db.collection("jobs").document(job_id)
-    job_snap = job_ref.get()
 
-    if not job_snap.exists:
-        raise HTTPException(status_code=404, detail="job_not_found")
+# ========== User document cache ==========
+# /api/v1/me などが users/{uid} を何度も読むので、インスタンス内で短時間だけキャッシュする
+USER_DOC_CACHE_ENABLED = parse_bool(os.getenv("USER_DOC_CACHE_ENABLED", "1"))
+USER_DOC_CACHE_TTL_SECONDS = float(os.getenv("USER_DOC_CACHE_TTL_SECONDS", "5"))
+USER_DOC_CACHE_MAX_ENTRIES = int(os.getenv("USER_DOC_CACHE_MAX_ENTRIES", "5000"))
+USER_DOC_CACHE_MAX_BYTES = int(os.getenv("USER_DOC_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# 有効にすると、ヒット時に updatedAt だけを読んで update_time を比較する（他インスタンスの書き込みを検出）
+USER_DOC_CACHE_VALIDATE = parse_bool(os.getenv("USER_DOC_CACHE_VALIDATE", "0"))
 
-    job_data = job_snap.to_dict() or {}
-    if job_data.get("uid") != uid:
-        raise HTTPException(status_code=403, detail="forbidden")
+_user_doc_cache = LRUTTLCache(USER_DOC_CACHE_MAX_ENTRIES, USER_DOC_CACHE_MAX_BYTES, USER_DOC_CACHE_TTL_SECONDS)
+_user_doc_stats = {"invalidations": 0, "validations": 0, "validationMisses": 0}
+# 無効化のたびに進める。読み込み中に無効化が挟まった結果はキャッシュしない
+_user_doc_generation = 0
 
-    if job_data.get("status") not in TITLE_EDITABLE_STATUSES:
-        raise HTTPException(status_code=409, detail="job_not_completed")
 
-    delete_at = job_data.get("deleteAt")
-    now_utc = datetime.now(timezone.utc)
-    if delete_at:
-        # Firestore timestamps → datetime comparison
-        delete_at_dt = delete_at if isinstance(delete_at, datetime) else delete_at.replace(tzinfo=timezone.utc)
-        if now_utc > delete_at_dt:
-            raise HTTPException(status_code=409, detail="job_expired")
+def get_user_doc(db, uid: str) -> dict | None:
+    """users/{uid} through the per-instance cache (None when the document does not exist).
 
-    title_updated_at = now_utc
-    job_ref.update({
-        "title": title,
-        "titleUpdatedAt": title_updated_at,
-        "updatedAt": firebase_firestore.SERVER_TIMESTAMP,
-    })
+    Blocking; never use inside a transaction.
+    """
+    user_ref = db.collection("users").document(uid)
+    if USER_DOC_CACHE_ENABLED:
+        cached = _user_doc_cache.get(uid)
+        if cached is not None:
+            update_time, data = cached
+            if not USER_DOC_CACHE_VALIDATE:
+                return dict(data) if data is not None else None
+            _user_doc_stats["validations"] += 1
+            probe = user_ref.get(field_paths=["updatedAt"])
+            if getattr(probe, "update_time", None) == update_time:
+                return dict(data) if data is not None else None
+            _user_doc_stats["validationMisses"] += 1
+    generation = _user_doc_generation
+    snap = user_ref.get()
+    data = snap.to_dict() if snap.exists else None
+    if USER_DOC_CACHE_ENABLED and generation == _user_doc_generation:
+        _user_doc_cache.set(uid, (getattr(snap, "update_time", None), data))
+    return dict(data) if data is not None else None
 
-    logger.info(f"Job title updated | uid={uid} jobId={job_id} title={title!r}")
-    return JSONResponse({
-        "jobId": job_id,
-        "title": title,
-        "titleUpdatedAt": title_updated_at.isoformat(),
-        "serverTime": now_utc.isoformat(),
-    })
 
+def invalidate_user_doc(uid: str | None) -> None:
+    global _user_doc_generation
+    if not uid:
+        return
+    _user_doc_generation += 1
+    _user_doc_stats["invalidations"] += 1
+    _user_doc_cache.pop(uid)
 
-@app.get("/api/v1/usage/remaining")
-async def get_remaining_usage(request: Request) -> JSONResponse:
-    uid = get_uid_from_request(request)
-    db = get_firestore_client()
-    current_jst = now_jst()
-    _, user_state, plan, plan_config = read_user_state(db, uid, current_jst)
-    snapshot = build_quota_snapshot(user_state, plan_config)
-    response = {
-        "plan": plan,
-        "quotaSeconds": snapshot["baseMonthlyQuotaSeconds"],
-        "usedSeconds": snapshot["usedBaseSecondsThisMonth"],
-        "remainingSeconds": snapshot["baseRemainingThisMonth"],
-        "yyyymm": user_state.get("monthKey"),
-        "baseMonthlyQuotaSeconds": snapshot["baseMonthlyQuotaSeconds"],
-        "baseRemainingThisMonth": snapshot["baseRemainingThisMonth"],
-        "ticketSecondsBalance": snapshot["ticketSecondsBalance"],
-        "totalAvailableThisMonth": snapshot["totalAvailableThisMonth"],
-        "baseDailyQuotaSeconds": snapshot["baseDailyQuotaSeconds"],
-        "usedSecondsToday": snapshot["usedSecondsToday"],
-        "dailyRemainingSeconds": snapshot["dailyRemainingSeconds"],
-    }
 
-    logger.info(
-        f"Usage snapshot | {json.dumps({'uid': uid, 'plan': plan, 'baseRemaining': response['baseRemainingThisMonth'], 'tickets': response['ticketSecondsBalance']})}"
+def get_user_doc_cache_stats() -> dict:
+    return dict(
+        _user_doc_stats,
+        enabled=USER_DOC_CACHE_ENABLED,
+        validate=USER_DOC_CACHE_VALIDATE,
+        cache=_user_doc_cache.stats(),
     )
 
-    return JSONResponse(response)
-
 
-@app.get("/api/v1/me")
-async def get_me(request: Request) -> JSONResponse:
-    uid = get_uid_from_request(request)
-    db = get_firestore_client()
-    current_jst = now_jst()
-    now_utc = datetime.now(timezone.utc)
-    _, user_state, plan, plan_config = read_user_state(db, uid, current_jst)
-    snapshot = build_quota_snapshot(user_state, plan_config)
+# ========== OpenAI HTTP client ==========
+# プロセス内で 1 つの AsyncClient を共有し、TLS ハンドシェイクを発話ごとに払わないようにする
+OPENAI_HTTP2_ENABLED = parse_bool(os.getenv("OPENAI_HTTP2", "1"))
+OPENAI_POOL_MAX_CONNECTIONS = int(os.getenv("OPENAI_POOL_MAX_CONNECTIONS", "100"))
+OPENAI_POOL_MAX_KEEPALIVE = int(os.getenv("OPENAI_POOL_MAX_KEEPALIVE", "20"))
+OPENAI_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY_SECONDS", "60"))
+OPENAI_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OPENAI_CONNECT_TIMEOUT_SECONDS", "5"))
+OPENAI_POOL_TIMEOUT_SECONDS = float(os.getenv("OPENAI_POOL_TIMEOUT_SECONDS", "5"))
 
-    # Calculate nextResetAt (first day of next month in JST, as UTC ISO8601)
-    next_reset = next_month_start_utc(current_jst)
+# エンドポイント（URL パス）ごとの読み取りタイムアウト（秒）
+OPENAI_READ_TIMEOUTS = {
+    "/v1/responses": float(os.getenv("OPENAI_RESPONSES_TIMEOUT_SECONDS", "30")),
+    "/v1/realtime/client_secrets": float(os.getenv("OPENAI_CLIENT_SECRETS_TIMEOUT_SECONDS", "10")),
+}
+OPENAI_DEFAULT_READ_TIMEOUT_SECONDS = 30.0
 
-    # Determine blockedReason if user cannot start
-    blocked_reason = None
-    total_available = snapshot["totalAvailableThisMonth"]
-    daily_remaining = snapshot["dailyRemainingSeconds"]
-    daily_job_limit = plan_config.get("dailyJobLimit")
-    job_count_today = user_state.get("jobCountToday", 0)
+_openai_client: httpx.AsyncClient | None = None
 
-    if total_available <= 0:
-        blocked_reason = "monthly_quota_exhausted"
-    elif plan == "free" and daily_remaining is not None and daily_remaining <= 0:
-        blocked_reason = "daily_limit_reached"
-    elif daily_job_limit is not None and job_count_today >= daily_job_limit:
-        blocked_reason = "daily_job_limit_reached"
 
-    # 日次ジョブ残り計算
-    day_job_remaining = None
-    if daily_job_limit is not None:
-        day_job_remaining = max(0, daily_job_limit - job_count_today)
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
 
-    # 分単位変換ヘルパー
-    def to_min(seconds):
-        return seconds // 60 if seconds is not None else None
 
-    response = {
-        "uid": uid,
-        "plan": plan,
-        "serverTime": now_utc.isoformat(),
+def resolve_openai_timeout(url: str) -> httpx.Timeout:
+    """Build the per-endpoint timeout for an OpenAI URL."""
+    path = httpx.URL(url).path
+    read_timeout = OPENAI_READ_TIMEOUTS.get(path, OPENAI_DEFAULT_READ_TIMEOUT_SECONDS)
+    return httpx.Timeout(
+        read_timeout,
+        connect=OPENAI_CONNECT_TIMEOUT_SECONDS,
+        pool=OPENAI_POOL_TIMEOUT_SECONDS,
+    )
 
-        # 月次 (秒単位 + 分単位)
-        "baseMonthlyQuotaSeconds": snapshot["baseMonthlyQuotaSeconds"],
-        "usedBaseSecondsThisMonth": snapshot["usedBaseSecondsThisMonth"],
-        "baseRemainingThisMonth": snapshot["baseRemainingThisMonth"],
-        "monthLimitMin": to_min(snapshot["baseMonthlyQuotaSeconds"]),
-        "monthUsedMin": to_min(snapshot["usedBaseSecondsThisMonth"]),
-        "monthRemainingMin": to_min(snapshot["baseRemainingThisMonth"]),
 
-        # チケット/合計
-        "ticketSecondsBalance": snapshot["ticketSecondsBalance"],
-        "creditSeconds": snapshot["ticketSecondsBalance"],  # フロント互換性
-        "totalAvailableThisMonth": snapshot["totalAvailableThisMonth"],
+def create_openai_client(transport: httpx.AsyncBaseTransport | None = None) -> httpx.AsyncClient:
+    http2 = OPENAI_HTTP2_ENABLED
+    if http2 and not _http2_available():
+        logger.warning("OPENAI_HTTP2 is enabled but h2 is not installed; falling back to HTTP/1.1")
+        http2 = False
+    limits = httpx.Limits(
+        max_connections=OPENAI_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY_SECONDS,
+    )
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=limits,
+        timeout=httpx.Timeout(OPENAI_DEFAULT_READ_TIMEOUT_SECONDS),
+        transport=transport,
+    )
 
-        # 日次ジョブ数
-        "dayJobLimit": daily_job_limit,
-        "dayJobUsed": job_count_today,
-        "dayJobRemaining": day_job_remaining,
 
-        # 同時接続
-        "concurrentLimit": plan_config.get("maxConcurrentJobs", 1),
-        "concurrentActive": 1 if user_state.get("activeJobId") else 0,
+def get_openai_client() -> httpx.AsyncClient:
+    """Return the process-wide OpenAI client, creating it lazily if startup has not run."""
+    global _openai_client
+    if _openai_client is None or _openai_client.is_closed:
+        _openai_client = create_openai_client()
+    return _openai_client
+
+
+async def close_openai_client() -> None:
+    global _openai_client
+    client = _openai_client
+    _openai_client = None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+def get_openai_pool_stats() -> dict:
+    """Connection pool stats of the shared OpenAI client (open / in use / waiting)."""
+    stats = {
+        "http2": False,
+        "maxConnections": OPENAI_POOL_MAX_CONNECTIONS,
+        "maxKeepalive": OPENAI_POOL_MAX_KEEPALIVE,
+        "open": 0,
+        "inUse": 0,
+        "idle": 0,
+        "waiting": 0,
+    }
+    client = _openai_client
+    if client is None or client.is_closed:
+        return stats
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    if pool is None:
+        return stats
+    stats["http2"] = bool(getattr(pool, "_http2", False))
+    connections = list(getattr(pool, "connections", []))
+    idle = sum(1 for conn in connections if conn.is_idle())
+    stats["open"] = len(connections)
+    stats["idle"] = idle
+    stats["inUse"] = len(connections) - idle
+    stats["waiting"] = sum(1 for req in list(getattr(pool, "_requests", [])) if req.is_queued())
+    return stats
 
-        # セッション/保持
-        "maxSessionSeconds": plan_config.get("maxSessionSeconds"),
-        "retentionDays": plan_config.get("retentionDays", 7),
 
-        # 状態
-        "activeJob": bool(user_state.get("activeJobId")),
-        "monthKey": user_state.get("monthKey"),
-        "dayKey": user_state.get("dayKey"),
-        "nextResetAt": next_reset.isoformat(),
+@app.on_event("startup")
+async def init_openai_client() -> None:
+    get_openai_client()
+    logger.info(f"OpenAI client initialized | {json.dumps(get_openai_pool_stats())}")
+
+
+@app.on_event("shutdown")
+async def shutdown_openai_client() -> None:
+    await close_openai_client()
+
+
+# ========== Upstream concurrency limiter / retries ==========
+# エンドポイントごとに同時実行数の予算を持ち、429 では予算を半減（AIMD）して Retry-After を尊重する
+OPENAI_RETRY_STATUSES = {429, 500, 502, 503, 504}
+OPENAI_RETRY_MAX_ATTEMPTS = int(os.getenv("OPENAI_RETRY_MAX_ATTEMPTS", "4"))
+OPENAI_RETRY_DEADLINE_SECONDS = float(os.getenv("OPENAI_RETRY_DEADLINE_SECONDS", "20"))
+OPENAI_RETRY_BASE_DELAY_SECONDS = float(os.getenv("OPENAI_RETRY_BASE_DELAY_SECONDS", "0.25"))
+OPENAI_RETRY_MAX_DELAY_SECONDS = float(os.getenv("OPENAI_RETRY_MAX_DELAY_SECONDS", "4"))
+
+
+class UpstreamOverloadedError(Exception):
+    """Raised when a request is shed because the upstream budget queue is full or too slow."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"upstream_overloaded: {name}")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class UpstreamLimiter:
+    """Adaptive (AIMD) concurrency limit with a bounded FIFO wait queue."""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, max_wait_seconds: float):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, self.max_concurrency // 8)
+        self.limit = self.max_concurrency
+        self.max_queue = max(0, max_queue)
+        self.max_wait_seconds = max_wait_seconds
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._success_streak = 0
+        self.acquired = 0
+        self.shed = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.max_queue_depth = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+
+    def _shed(self) -> UpstreamOverloadedError:
+        self.shed += 1
+        retry_after = max(1.0, self.cooldown_until - time.monotonic())
+        return UpstreamOverloadedError(self.name, retry_after)
+
+    def _grant(self, started: float) -> None:
+        self.acquired += 1
+        waited_ms = (time.monotonic() - started) * 1000
+        self.wait_ms_total += waited_ms
+        self.wait_ms_max = max(self.wait_ms_max, waited_ms)
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    async def acquire(self) -> None:
+        started = time.monotonic()
+        deadline = started + self.max_wait_seconds
+        cooldown = self.cooldown_until - started
+        if cooldown > 0:
+            if started + cooldown > deadline:
+                raise self._shed()
+            await asyncio.sleep(cooldown)
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self._grant(started)
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._shed()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        try:
+            await asyncio.wait_for(waiter, timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise self._shed() from None
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self._grant(started)
+
+    def release(self) -> None:
+        self.in_flight = max(0, self.in_flight - 1)
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def on_success(self) -> None:
+        self._success_streak += 1
+        if self.limit < self.max_concurrency and self._success_streak >= self.limit:
+            self.limit += 1
+            self._success_streak = 0
+            self._wake()
+
+    def on_rate_limited(self, retry_after: float | None) -> None:
+        self.rate_limited += 1
+        self._success_streak = 0
+        self.limit = max(self.min_concurrency, self.limit // 2)
+        if retry_after:
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + retry_after)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "maxConcurrency": self.max_concurrency,
+            "inFlight": self.in_flight,
+            "queueDepth": len(self._waiters),
+            "maxQueueDepth": self.max_queue_depth,
+            "maxQueue": self.max_queue,
+            "acquired": self.acquired,
+            "waitMsAvg": round(self.wait_ms_total / self.acquired, 1) if self.acquired else 0.0,
+            "waitMsMax": round(self.wait_ms_max, 1),
+            "shed": self.shed,
+            "rateLimited": self.rate_limited,
+            "retries": self.retries,
+            "coolingDownMs": max(0, int((self.cooldown_until - time.monotonic()) * 1000)),
+        }
 
-        # Billing
-        "billingEnabled": True,
-        "purchaseAvailable": True,
-    }
 
-    if blocked_reason:
-        response["blockedReason"] = blocked_reason
+_upstream_limiters = {
+    "/v1/responses": UpstreamLimiter(
+        "responses",
+        int(os.getenv("OPENAI_RESPONSES_MAX_CONCURRENCY", "64")),
+        int(os.getenv("OPENAI_RESPONSES_MAX_QUEUE", "256")),
+        float(os.getenv("OPENAI_RESPONSES_MAX_QUEUE_WAIT_SECONDS", "10")),
+    ),
+    "/v1/realtime/client_secrets": UpstreamLimiter(
+        "client_secrets",
+        int(os.getenv("OPENAI_CLIENT_SECRETS_MAX_CONCURRENCY", "16")),
+        int(os.getenv("OPENAI_CLIENT_SECRETS_MAX_QUEUE", "64")),
+        float(os.getenv("OPENAI_CLIENT_SECRETS_MAX_QUEUE_WAIT_SECONDS", "5")),
+    ),
+}
 
-    # 日次制限がある場合（freeプラン）
-    if snapshot["baseDailyQuotaSeconds"] is not None:
-        response.update(
-            {
-                "baseDailyQuotaSeconds": snapshot["baseDailyQuotaSeconds"],
-                "usedSecondsToday": snapshot["usedSecondsToday"],
-                "dailyRemainingSeconds": snapshot["dailyRemainingSeconds"],
-                "dayLimitMin": to_min(snapshot["baseDailyQuotaSeconds"]),
-                "dayUsedMin": to_min(snapshot["usedSecondsToday"]),
-                "dayRemainingMin": to_min(snapshot["dailyRemainingSeconds"]),
-            }
-        )
 
-    logger.info(
-        f"Account snapshot | {json.dumps({'uid': uid, 'plan': plan, 'totalAvailable': response['totalAvailableThisMonth'], 'ticketSecondsBalance': response['ticketSecondsBalance']})}"
-    )
+def get_upstream_limiter(url: str) -> UpstreamLimiter:
+    return _upstream_limiters.get(httpx.URL(url).path, _upstream_limiters["/v1/responses"])
 
-    return JSONResponse(response)
 
+def get_upstream_limiter_stats() -> dict:
+    return {limiter.name: limiter.stats() for limiter in _upstream_limiters.values()}
 
-@app.post("/api/v1/test/create-expired-job")
-async def create_expired_job(request: Request) -> JSONResponse:
-    """DEBUG only: Create a job with past deleteAt for testing cleanup"""
-    # 【セキュリティガード】本番環境では無効化
-    if IS_PRODUCTION:
-        raise HTTPException(status_code=404, detail="not_found")
 
-    if os.getenv("DEBUG_AUTH_BYPASS") != "1":
-        raise HTTPException(status_code=404, detail="not_found")
+_RATE_LIMIT_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
 
-    uid = get_uid_from_request(request)
-    db = get_firestore_client()
-    current_jst = now_jst()
-    yyyymm = month_key(current_jst)
 
-    job_id = uuid.uuid4().hex
-    delete_at = (current_jst - timedelta(days=1)).astimezone(timezone.utc)
-    plan = "free"
-    plan_config = resolve_plan_config(plan)
-    now_utc = datetime.now(timezone.utc)
-    job_data = {
-        "uid": uid,
-        "status": "completed",
-        "plan": plan,
-        "planAtStart": plan,
-        "reservedSeconds": 0,
-        "reservedBaseSeconds": 0,
-        "reservedTicketSeconds": 0,
-        "billedSeconds": 0,
-        "billedBaseSeconds": 0,
-        "billedTicketSeconds": 0,
-        "maxSessionSeconds": plan_config["maxSessionSeconds"],
-        "retentionDays": plan_config["retentionDays"],
-        "monthKey": yyyymm,
-        "dayKey": day_key(current_jst),
-        "createdAt": now_utc,
-        "startedAt": now_utc - timedelta(minutes=5),
-        "completedAt": now_utc - timedelta(minutes=1),
-        "endedAt": now_utc - timedelta(minutes=1),
-        "deleteAt": delete_at,
-    }
-    db.collection("jobs").document(job_id).set(job_data)
+def parse_rate_limit_duration(value: str | None) -> float | None:
+    """Parse OpenAI reset headers such as ``1s``, ``20ms``, ``6m0s`` or a bare number of seconds."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _RATE_LIMIT_DURATION_RE.findall(value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(number) * scale[unit] for number, unit in parts)
 
-    logger.info(f"Test expired job created: {job_id} | {json.dumps({'jobId': job_id})}")
-    return JSONResponse({"jobId": job_id, "deleteAt": delete_at.isoformat()})
+
+def retry_after_seconds(response: httpx.Response | None) -> float | None:
+    if response is None:
+        return None
+    headers = response.headers
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        seconds = parse_rate_limit_duration(retry_after)
+        if seconds is not None:
+            return seconds
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+            return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            pass
+    resets = []
+    for kind in ("requests", "tokens"):
+        if headers.get(f"x-ratelimit-remaining-{kind}") == "0":
+            reset = parse_rate_limit_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if reset is not None:
+                resets.append(reset)
+    return max(resets) if resets else None
+
+
+def next_retry_delay(response: httpx.Response | None, attempt: int, deadline: float) -> float | None:
+    """Delay before the next attempt, or None when the error is final or the deadline would pass."""
+    if response is not None:
+        if response.status_code not in OPENAI_RETRY_STATUSES:
+            return None
+        # 残高不足の 429 は待っても回復しない
+        if response.status_code == 429 and "insufficient_quota" in response.text:
+            return None
+    if attempt + 1 >= OPENAI_RETRY_MAX_ATTEMPTS:
+        return None
+    backoff = min(OPENAI_RETRY_MAX_DELAY_SECONDS, OPENAI_RETRY_BASE_DELAY_SECONDS * (2 ** attempt))
+    delay = max(retry_after_seconds(response) or 0.0, backoff * random.uniform(0.5, 1.0))
+    if time.monotonic() + delay > deadline:
+        return None
+    return delay
 
 
-@app.post("/api/v1/admin/cleanup")
-async def cleanup_jobs(request: Request, limit: int = 200) -> JSONResponse:
-    """
-    期限切れjobsを削除
-    本番: Cloud SchedulerからOIDC認証で呼び出し
-    開発: x-admin-tokenで認証
+def note_upstream_response(limiter: UpstreamLimiter, response: httpx.Response) -> None:
+    if response.status_code == 429:
+        limiter.on_rate_limited(retry_after_seconds(response))
+    elif response.is_success:
+        limiter.on_success()
+
+
+# ========== Circuit breaker ==========
+# OpenAI 障害時に 30 秒のタイムアウトを待たず即座に失敗させる（closed → open → half_open → closed）
+OPENAI_BREAKER_ENABLED = parse_bool(os.getenv("OPENAI_BREAKER_ENABLED", "1"))
+OPENAI_BREAKER_WINDOW_SECONDS = float(os.getenv("OPENAI_BREAKER_WINDOW_SECONDS", "30"))
+OPENAI_BREAKER_MIN_CALLS = int(os.getenv("OPENAI_BREAKER_MIN_CALLS", "10"))
+OPENAI_BREAKER_ERROR_RATE = float(os.getenv("OPENAI_BREAKER_ERROR_RATE", "0.5"))
+OPENAI_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("OPENAI_BREAKER_SLOW_CALL_SECONDS", "15"))
+OPENAI_BREAKER_SLOW_RATE = float(os.getenv("OPENAI_BREAKER_SLOW_RATE", "0.8"))
+OPENAI_BREAKER_OPEN_SECONDS = float(os.getenv("OPENAI_BREAKER_OPEN_SECONDS", "15"))
+OPENAI_BREAKER_HALF_OPEN_MAX_CALLS = int(os.getenv("OPENAI_BREAKER_HALF_OPEN_MAX_CALLS", "2"))
+
+
+class OpenAICircuitOpenError(Exception):
+    """Raised without calling upstream while the OpenAI circuit breaker is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("openai_circuit_open")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Rolling-window breaker on upstream error rate and slow-call rate.
+
+    Transport errors and 5xx count as failures; 4xx (including 429, which the
+    limiter handles) count as successes because the dependency answered.
     """
-    verify_admin_access(request)
-    db = get_firestore_client()
-    now_utc = datetime.now(timezone.utc)
-    query = db.collection("jobs").where("deleteAt", "<", now_utc).limit(limit)
 
-    deleted = 0
-    errors = 0
-    scanned = 0
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float,
+        min_calls: int,
+        error_rate: float,
+        slow_call_seconds: float,
+        slow_rate: float,
+        open_seconds: float,
+        half_open_max_calls: int,
+        enabled: bool = True,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = max(1, min_calls)
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self.enabled = enabled
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._calls: deque[tuple[float, bool, bool]] = deque()
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        self.times_opened = 0
+        self.rejected = 0
+
+    def _prune(self, now: float) -> None:
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def _trip(self, now: float, reason: str) -> None:
+        self.state = "open"
+        self.opened_at = now
+        self._calls.clear()
+        self.times_opened += 1
+        logger.warning(f"Circuit breaker opened | name={self.name} reason={reason}")
+
+    def _close(self) -> None:
+        self.state = "closed"
+        self._calls.clear()
+        logger.info(f"Circuit breaker closed | name={self.name}")
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def allow(self) -> None:
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if self.state == "open":
+            if now - self.opened_at < self.open_seconds:
+                self.rejected += 1
+                raise OpenAICircuitOpenError(self.retry_after())
+            self.state = "half_open"
+            self._half_open_in_flight = 0
+            self._half_open_successes = 0
+        if self.state == "half_open":
+            if self._half_open_in_flight >= self.half_open_max_calls:
+                self.rejected += 1
+                raise OpenAICircuitOpenError(1.0)
+            self._half_open_in_flight += 1
+
+    def record(self, ok: bool, latency: float) -> None:
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        slow = latency >= self.slow_call_seconds
+        if self.state == "half_open":
+            self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+            if not ok or slow:
+                self._trip(now, "half_open_probe_failed")
+                return
+            self._half_open_successes += 1
+            if self._half_open_successes >= self.half_open_max_calls:
+                self._close()
+            return
+        if self.state == "open":
+            return
+        self._calls.append((now, not ok, slow))
+        self._prune(now)
+        total = len(self._calls)
+        if total < self.min_calls:
+            return
+        failures = sum(1 for _, failed, _ in self._calls if failed)
+        slow_calls = sum(1 for _, _, was_slow in self._calls if was_slow)
+        if failures / total >= self.error_rate:
+            self._trip(now, f"error_rate={failures}/{total}")
+        elif slow_calls / total >= self.slow_rate:
+            self._trip(now, f"slow_rate={slow_calls}/{total}")
+
+    def abandon(self) -> None:
+        """A permitted call ended without an upstream outcome (cancelled or shed)."""
+        if self.state == "half_open":
+            self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+
+    @asynccontextmanager
+    async def call(self):
+        """Guard one upstream attempt; the body sets ``outcome["ok"]`` and optionally ``outcome["latency"]``."""
+        self.allow()
+        started = time.monotonic()
+        outcome: dict = {"ok": None}
+        try:
+            yield outcome
+        except httpx.RequestError:
+            self.record(False, outcome.get("latency", time.monotonic() - started))
+            raise
+        except BaseException:
+            if outcome["ok"] is None:
+                self.abandon()
+            else:
+                self.record(outcome["ok"], outcome.get("latency", time.monotonic() - started))
+            raise
+        if outcome["ok"] is None:
+            self.abandon()
+        else:
+            self.record(outcome["ok"], outcome.get("latency", time.monotonic() - started))
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        self._prune(now)
+        total = len(self._calls)
+        failures = sum(1 for _, failed, _ in self._calls if failed)
+        return {
+            "enabled": self.enabled,
+            "state": self.state,
+            "windowCalls": total,
+            "windowErrorRate": round(failures / total, 4) if total else None,
+            "timesOpened": self.times_opened,
+            "rejected": self.rejected,
+            "retryAfterSeconds": round(self.retry_after(), 1) if self.state == "open" else None,
+        }
 
-    for doc in query.stream():
-        scanned += 1
+
+_openai_breaker = CircuitBreaker(
+    "openai",
+    OPENAI_BREAKER_WINDOW_SECONDS,
+    OPENAI_BREAKER_MIN_CALLS,
+    OPENAI_BREAKER_ERROR_RATE,
+    OPENAI_BREAKER_SLOW_CALL_SECONDS,
+    OPENAI_BREAKER_SLOW_RATE,
+    OPENAI_BREAKER_OPEN_SECONDS,
+    OPENAI_BREAKER_HALF_OPEN_MAX_CALLS,
+    enabled=OPENAI_BREAKER_ENABLED,
+)
+
+
+async def post_openai(
+    url: str,
+    payload: dict,
+    headers: dict | None = None,
+    timeout: httpx.Timeout | float | None = None,
+) -> dict:
+    client = get_openai_client()
+    limiter = get_upstream_limiter(url)
+    deadline = time.monotonic() + OPENAI_RETRY_DEADLINE_SECONDS
+    attempt = 0
+    while True:
         try:
-            job_data = doc.to_dict() or {}
-            job_id = doc.id
-            maybe_delete_job_assets(job_data)
-            doc.reference.delete()
-            deleted += 1
-            logger.info(f"Deleted expired job: {job_id} | {json.dumps({'jobId': job_id, 'deleteAt': str(job_data.get('deleteAt'))})}")
-        except Exception as e:
-            errors += 1
-            logger.error(f"Failed to delete job: {e} | {json.dumps({'error': str(e)})}")
+            async with _openai_breaker.call() as outcome:
+                async with limiter.slot():
+                    started = time.monotonic()
+                    response = await client.post(
+                        url,
+                        json=payload,
+                        headers=headers or {},
+                        timeout=timeout if timeout is not None else resolve_openai_timeout(url),
+                    )
+                    outcome["latency"] = time.monotonic() - started
+                outcome["ok"] = response.status_code < 500
+        except httpx.ConnectError:
+            delay = next_retry_delay(None, attempt, deadline)
+            if delay is None:
+                raise
+        else:
+            note_upstream_response(limiter, response)
+            if response.is_success:
+                data = response.json()
+                if isinstance(data, dict):
+                    observe_token_usage(payload, data.get("usage"))
+                return data
+            # デバッグ用: エラー時のステータスとレスポンスボディをログ出力（秘匿情報マスク）
+            logger.error(f"OpenAI API error: status={response.status_code}, body={mask_secrets(response.text)}")
+            delay = next_retry_delay(response, attempt, deadline)
+            if delay is None:
+                response.raise_for_status()
+        limiter.retries += 1
+        attempt += 1
+        logger.warning(f"OpenAI retry | endpoint={limiter.name} attempt={attempt} delay_ms={int(delay * 1000)}")
+        await asyncio.sleep(delay)
 
-    result = {"deleted": deleted, "scanned": scanned, "errors": errors}
-    logger.info(f"Cleanup completed | {json.dumps(result)}")
-    return JSONResponse(result)
 
+# ========== Request coalescing (single-flight) ==========
+# 同一ペイロードの呼び出しが進行中なら、新たに上流を叩かず同じ結果を待つ
+OPENAI_COALESCE_ENABLED = parse_bool(os.getenv("OPENAI_COALESCE_ENABLED", "1"))
 
-@app.post("/api/v1/billing/stripe/checkout")
-async def create_checkout_session(request: Request) -> JSONResponse:
-    """Stripe Checkout Session 作成（Proプラン登録用）"""
-    uid = get_uid_from_request(request)
-    body = await request.json()
-    success_url = body.get("successUrl", "https://example.com/success")
-    cancel_url = body.get("cancelUrl", "https://example.com/cancel")
+_openai_inflight: dict[str, dict] = {}
+_openai_coalesce_stats = {"leaders": 0, "deduplicated": 0, "failures": 0, "abandoned": 0}
 
-    secret_key = os.getenv("STRIPE_SECRET_KEY")
-    price_id = os.getenv("STRIPE_PRO_PRICE_ID")
-    if not secret_key or not price_id:
-        raise HTTPException(status_code=500, detail="stripe_not_configured")
 
-    stripe.api_key = secret_key
+def openai_request_fingerprint(url: str, payload: dict) -> str:
+    raw = json.dumps([url, payload], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
-    try:
-        session = stripe.checkout.Session.create(
-            mode="subscription",
-            payment_method_types=["card"],
-            line_items=[
-                {
-                    "price": price_id,
-                    "quantity": 1,
-                }
-            ],
-            client_reference_id=uid,
-            metadata={"uid": uid},
-            subscription_data={"metadata": {"uid": uid}},
-            success_url=success_url,
-            cancel_url=cancel_url,
-            customer_email=body.get("email"),
-        )
-        logger.info(f"Checkout session created for uid: {uid} | {json.dumps({'uid': uid, 'sessionId': session.id})}")
-        return JSONResponse({"sessionId": session.id, "url": session.url})
-    except Exception as e:
-        logger.error(f"Stripe checkout session creation failed: {e} | {json.dumps({'uid': uid, 'error': str(e)})}")
-        raise HTTPException(status_code=500, detail=f"checkout_failed: {str(e)}")
 
+def _finish_inflight(key: str, task: asyncio.Task) -> None:
+    entry = _openai_inflight.get(key)
+    if entry is not None and entry["task"] is task:
+        _openai_inflight.pop(key, None)
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        _openai_coalesce_stats["failures"] += 1
 
-@app.get("/api/v1/company/profile")
-async def get_company_profile(request: Request) -> JSONResponse:
-    """会社情報を取得"""
-    uid = get_uid_from_request(request)
-    db = get_firestore_client()
-    user_ref = db.collection("users").document(uid)
-    user_snap = user_ref.get()
-    user_data = user_snap.to_dict() if user_snap.exists else {}
-    company_profile = user_data.get("companyProfile", {})
-    logger.info(f"[company_profile] GET | {json.dumps({'uid': uid})}")
-    return JSONResponse({"companyProfile": company_profile})
 
+async def post_openai_coalesced(url: str, payload: dict, headers: dict | None = None) -> dict:
+    """post_openai with identical in-flight requests sharing one upstream call.
 
-def build_stripe_customer_payload(company_profile: dict) -> dict:
+    The upstream call runs in its own task, so a cancelled caller does not cancel the
+    call for the others; it is only cancelled once every waiter has gone away. Errors
+    are delivered to every waiter and the entry is dropped so the next call retries.
+    The returned dict is shared between callers and must not be mutated.
     """
-    companyProfile から Stripe Customer.modify 用の payload を構築
-    安全域のみ: name, address, metadata
-    """
-    payload = {}
+    if not OPENAI_COALESCE_ENABLED:
+        return await post_openai(url, payload, headers)
+
+    key = openai_request_fingerprint(url, payload)
+    entry = _openai_inflight.get(key)
+    if entry is None:
+        task = asyncio.create_task(post_openai(url, payload, headers))
+        entry = {"task": task, "waiters": 0}
+        _openai_inflight[key] = entry
+        task.add_done_callback(lambda done, key=key: _finish_inflight(key, done))
+        _openai_coalesce_stats["leaders"] += 1
+    else:
+        _openai_coalesce_stats["deduplicated"] += 1
 
-    # name = companyName（あれば）
-    company_name = company_profile.get("companyName", "").strip()
-    if company_name:
-        payload["name"] = company_name
+    entry["waiters"] += 1
+    try:
+        return await asyncio.shield(entry["task"])
+    except asyncio.CancelledError:
+        if entry["waiters"] == 1 and not entry["task"].done():
+            entry["task"].cancel()
+            _openai_coalesce_stats["abandoned"] += 1
+        raise
+    finally:
+        entry["waiters"] -= 1
 
-    # address（line1, postal_code, country）
-    address = {}
-    addr_line1 = company_profile.get("address", "").strip()
-    if addr_line1:
-        address["line1"] = addr_line1
-    postal_code = company_profile.get("postalCode", "").strip()
-    if postal_code:
-        address["postal_code"] = postal_code
-    country = company_profile.get("country", "").strip()
-    if country:
-        address["country"] = country
-    if address:
-        payload["address"] = address
 
-    # metadata に全フィールドを保存
-    metadata = {
-        "source": "company_profile_sync",
-    }
-    for key in ["companyName", "department", "position", "address", "postalCode", "country", "taxIdLabel", "taxIdValue"]:
-        val = company_profile.get(key, "").strip()
-        if val:
-            metadata[key] = val[:500]  # Stripe metadata value limit
-    payload["metadata"] = metadata
+def get_openai_coalesce_stats() -> dict:
+    return dict(_openai_coalesce_stats, enabled=OPENAI_COALESCE_ENABLED, inflight=len(_openai_inflight))
 
-    return payload
 
+async def stream_openai(
+    url: str,
+    payload: dict,
+    headers: dict | None = None,
+    timeout: httpx.Timeout | float | None = None,
+):
+    """POST with ``stream: true`` and yield each Server-Sent Event payload as a dict.
 
-def sync_company_profile_to_stripe(customer_id: str, company_profile: dict) -> dict:
-    """
-    companyProfile を Stripe Customer に同期（ベストエフォート）
-    Returns: {"attempted": bool, "updated": bool, "skipped": bool, "reason": str|None, "error": str|None}
+    Closing the generator early closes the upstream response as well.
     """
-    result = {
-        "attempted": False,
-        "updated": False,
-        "skipped": False,
-        "reason": None,
-        "error": None,
-    }
+    client = get_openai_client()
+    limiter = get_upstream_limiter(url)
+    deadline = time.monotonic() + OPENAI_RETRY_DEADLINE_SECONDS
+    body = dict(payload, stream=True)
+    attempt = 0
+    while True:
+        async with _openai_breaker.call() as outcome, limiter.slot():
+            started = time.monotonic()
+            async with client.stream(
+                "POST",
+                url,
+                json=body,
+                headers=headers or {},
+                timeout=timeout if timeout is not None else resolve_openai_timeout(url),
+            ) as response:
+                # ストリームは最初のヘッダー受信までをレイテンシとして扱う
+                outcome["latency"] = time.monotonic() - started
+                outcome["ok"] = response.status_code < 500
+                note_upstream_response(limiter, response)
+                if response.is_success:
+                    async for event in iter_sse_events(response):
+                        if event.get("type") == "response.completed" and isinstance(event.get("response"), dict):
+                            observe_token_usage(payload, event["response"].get("usage"))
+                        yield event
+                    return
+                await response.aread()
+                logger.error(f"OpenAI API error: status={response.status_code}, body={mask_secrets(response.text)}")
+                # 本文を 1 バイトも返していないので再試行できる
+                delay = next_retry_delay(response, attempt, deadline)
+                if delay is None:
+                    response.raise_for_status()
+        limiter.retries += 1
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+async def iter_sse_events(response: httpx.Response):
+    data_lines: list[str] = []
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            data_lines.append(line[5:].lstrip())
+            continue
+        if line or not data_lines:
+            continue
+        data = "\n".join(data_lines)
+        data_lines = []
+        if data == "[DONE]":
+            return
+        try:
+            yield json.loads(data)
+        except json.JSONDecodeError:
+            logger.warning(f"OpenAI stream: undecodable event {mask_secrets(data[:200])!r}")
+    if data_lines and data_lines != ["[DONE]"]:
+        try:
+            yield json.loads("\n".join(data_lines))
+        except json.JSONDecodeError:
+            pass
 
-    secret_key = os.getenv("STRIPE_SECRET_KEY")
-    if not secret_key:
-        result["skipped"] = True
-        result["reason"] = "stripe_not_configured"
-        logger.info(f"[stripe_sync] Skipped: STRIPE_SECRET_KEY not set")
-        return result
 
-    if not customer_id:
-        result["skipped"] = True
-        result["reason"] = "no_customer_id"
-        logger.info(f"[stripe_sync] Skipped: no stripeCustomerId")
-        return result
+SSE_RESPONSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
 
-    result["attempted"] = True
-    stripe.api_key = secret_key
 
-    try:
-        payload = build_stripe_customer_payload(company_profile)
-        stripe.Customer.modify(customer_id, **payload)
-        result["updated"] = True
-        logger.info(f"[stripe_sync] Customer updated | {json.dumps({'customerId': customer_id, 'fields': list(payload.keys())})}")
-    except Exception as e:
-        result["error"] = str(e)
-        logger.error(f"[stripe_sync] Customer update failed | {json.dumps({'customerId': customer_id, 'error': str(e)})}")
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-    return result
 
+# ストリーム開始後は HTTP ステータスを変えられないので、上流エラーは error イベントで返す
+SSE_UPSTREAM_ERRORS = (httpx.HTTPError, UpstreamOverloadedError, OpenAICircuitOpenError, RuntimeError)
 
-@app.post("/api/v1/company/profile")
-async def save_company_profile(request: Request) -> JSONResponse:
-    """会社情報を保存"""
-    uid = get_uid_from_request(request)
-    body = await request.json()
-    company_profile = body.get("companyProfile", {})
 
-    # 許可するフィールドのみ保存
-    allowed_fields = ["companyName", "department", "position", "address", "postalCode", "country", "taxIdLabel", "taxIdValue"]
-    sanitized = {k: v for k, v in company_profile.items() if k in allowed_fields and isinstance(v, str)}
+def format_upstream_error_sse(exc: Exception, endpoint: str) -> str:
+    if isinstance(exc, httpx.HTTPStatusError):
+        status_code = exc.response.status_code if exc.response is not None else 502
+        logger.error(f"{endpoint} upstream error | status={status_code}")
+        return format_sse("error", {"detail": f"OpenAI API error ({status_code})", "status": status_code})
+    if isinstance(exc, UpstreamOverloadedError):
+        return format_sse("error", {"detail": "upstream_overloaded", "status": 503, "retryAfter": exc.retry_after})
+    if isinstance(exc, OpenAICircuitOpenError):
+        return format_sse("error", {"detail": "openai_circuit_open", "status": 503, "retryAfter": exc.retry_after})
+    logger.error(f"{endpoint} request error | {type(exc).__name__}: {exc}")
+    return format_sse("error", {"detail": "OpenAI request error", "status": 502})
 
-    db = get_firestore_client()
-    user_ref = db.collection("users").document(uid)
 
-    # Firestore に保存
-    user_ref.set({
-        "companyProfile": sanitized,
-        "updatedAt": firebase_firestore.SERVER_TIMESTAMP,
-    }, merge=True)
+audio_model_default = "gpt-4o-mini-transcribe"
+realtime_model_default = os.getenv("OPENAI_REALTIME_MODEL", "gpt-4o-realtime-preview-2024-12-17")
+translate_model_default = "gpt-4o-mini"
+summarize_model_default = "gpt-4o-mini"
 
-    logger.info(f"[company_profile] POST | {json.dumps({'uid': uid, 'fields': list(sanitized.keys())})}")
 
-    # Stripe Customer に同期（ベストエフォート）
-    user_snap = user_ref.get()
-    user_data = user_snap.to_dict() if user_snap.exists else {}
-    customer_id = user_data.get("stripeCustomerId")
+def extract_output_text(result: dict) -> str:
+    if "output" in result and isinstance(result.get("output"), list):
+        first = result["output"][0]
+        content = first.get("content") if isinstance(first, dict) else None
+        if content and isinstance(content, list) and content:
+            text_item = content[0]
+            if isinstance(text_item, dict):
+                return text_item.get("text", "").strip()
+    return (result.get("output_text") or result.get("content") or "").strip()
 
-    stripe_sync = sync_company_profile_to_stripe(customer_id, sanitized)
 
-    # Firestore に同期結果を保存（任意）
-    sync_status = {
-        "lastCompanyProfileSyncAt": firebase_firestore.SERVER_TIMESTAMP,
-    }
-    if stripe_sync["updated"]:
-        sync_status["lastCompanyProfileSyncOk"] = True
-        sync_status["lastCompanyProfileSyncError"] = None
-    elif stripe_sync["error"]:
-        sync_status["lastCompanyProfileSyncOk"] = False
-        sync_status["lastCompanyProfileSyncError"] = stripe_sync["error"]
-    elif stripe_sync["skipped"]:
-        sync_status["lastCompanyProfileSyncOk"] = None
-        sync_status["lastCompanyProfileSyncError"] = stripe_sync["reason"]
+# ========== Token estimation and prompt budgets ==========
+# トークナイザを持たずに文字種ごとの重みで見積もる（o200k 系の傾向: 英語は約 4 文字 / token、漢字・かなはほぼ 1 文字 / token）
+TOKEN_CHAR_WEIGHTS = {"cjk": 1.0, "ascii": 0.25, "latin_ext": 0.5, "symbol": 0.6}
+# 言語ごとの補正係数（初期値）。実測 usage との比で自動補正する
+TOKEN_LANG_MULTIPLIERS = {"ja": 0.9, "zh": 0.75, "en": 1.0, "vi": 1.0}
+# Responses API の 1 メッセージあたりのオーバーヘッド（role 等）
+TOKEN_MESSAGE_OVERHEAD = 4
+TOKEN_CALIBRATION_MIN_SAMPLES = int(os.getenv("TOKEN_CALIBRATION_MIN_SAMPLES", "20"))
+TOKEN_CALIBRATION_ALPHA = 0.05
+TOKEN_CALIBRATION_BOUNDS = (0.5, 2.0)
+
+# 上流に送る前に弾く / 削る上限（見積もりトークン）
+TRANSLATE_MAX_INPUT_TOKENS = int(os.getenv("TRANSLATE_MAX_INPUT_TOKENS", "4000"))
+SUMMARIZE_MAX_INPUT_TOKENS = int(os.getenv("SUMMARIZE_MAX_INPUT_TOKENS", "300000"))
+PROMPT_GLOSSARY_TOKEN_BUDGET = int(os.getenv("PROMPT_GLOSSARY_TOKEN_BUDGET", "1500"))
+REALTIME_INSTRUCTIONS_TOKEN_BUDGET = int(os.getenv("REALTIME_INSTRUCTIONS_TOKEN_BUDGET", "3000"))
+
+_CJK_CHARS_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff66-\uff9f]")
+_KANA_RE = re.compile(r"[\u3040-\u30ff\uff66-\uff9f]")
+_ASCII_ALNUM_RE = re.compile(r"[A-Za-z0-9]")
+_LATIN_EXT_RE = re.compile(r"[\u00c0-\u024f\u1e00-\u1eff]")
+_WHITESPACE_RE = re.compile(r"\s")
+
+_token_calibration: dict[str, dict] = {}
+
+
+def detect_text_lang(text: str) -> str:
+    """Dominant script of text, mapped onto the languages the estimator is calibrated for."""
+    if _KANA_RE.search(text):
+        return "ja"
+    cjk = len(_CJK_CHARS_RE.findall(text))
+    if cjk and cjk * 4 >= len(text):
+        return "zh"
+    if _LATIN_EXT_RE.search(text):
+        return "vi"
+    return "en"
+
+
+def token_calibration(lang: str) -> float:
+    state = _token_calibration.get(lang)
+    if not state or state["samples"] < TOKEN_CALIBRATION_MIN_SAMPLES:
+        return 1.0
+    low, high = TOKEN_CALIBRATION_BOUNDS
+    return min(high, max(low, state["ratio"]))
+
+
+def estimate_tokens(text: str, lang: str | None = None, calibrated: bool = True) -> int:
+    """Fast local token estimate for text, calibrated per language.
+
+    calibrated=False gives a deterministic estimate (same on every instance, stable over time);
+    use it wherever the result decides chunk boundaries that are cached or persisted.
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_CHARS_RE.findall(text))
+    ascii_alnum = len(_ASCII_ALNUM_RE.findall(text))
+    latin_ext = len(_LATIN_EXT_RE.findall(text))
+    spaces = len(_WHITESPACE_RE.findall(text))
+    symbols = max(0, len(text) - cjk - ascii_alnum - latin_ext - spaces)
+    raw = (
+        cjk * TOKEN_CHAR_WEIGHTS["cjk"]
+        + ascii_alnum * TOKEN_CHAR_WEIGHTS["ascii"]
+        + latin_ext * TOKEN_CHAR_WEIGHTS["latin_ext"]
+        + symbols * TOKEN_CHAR_WEIGHTS["symbol"]
+    )
+    if lang not in TOKEN_LANG_MULTIPLIERS:
+        lang = detect_text_lang(text)
+    calibration = token_calibration(lang) if calibrated else 1.0
+    return max(1, math.ceil(raw * TOKEN_LANG_MULTIPLIERS[lang] * calibration))
 
-    user_ref.set({"stripeSync": sync_status}, merge=True)
 
-    return JSONResponse({
-        "ok": True,
-        "companyProfile": sanitized,
-        "stripeSync": stripe_sync,
-    })
+def payload_messages(payload: dict) -> list[str]:
+    return [
+        message["content"]
+        for message in payload.get("input") or []
+        if isinstance(message, dict) and isinstance(message.get("content"), str)
+    ]
 
 
-@app.get("/api/v1/billing/status")
+def estimate_payload_tokens(payload: dict) -> int:
+    """Estimated input tokens of a Responses API payload (messages + per-message overhead)."""
+    return sum(estimate_tokens(content) + TOKEN_MESSAGE_OVERHEAD for content in payload_messages(payload))
+
+
+def observe_token_usage(payload: dict, usage: dict | None) -> None:
+    """Log estimated vs actual input tokens and fold the ratio into the per-language calibration."""
+    actual = usage.get("input_tokens") if isinstance(usage, dict) else None
+    if not isinstance(actual, int) or actual <= 0 or not payload.get("input"):
+        return
+    estimated = estimate_payload_tokens(payload)
+    if estimated <= 0:
+        return
+    # 言語は最後のメッセージ（ユーザー入力）で判定する。システムプロンプトは英語なので混ぜない
+    lang = detect_text_lang(payload_messages(payload)[-1])
+    # 補正済みの見積もりとの比を取るので、元の（未補正の）比に戻して平滑化する
+    ratio = actual / estimated * token_calibration(lang)
+    state = _token_calibration.setdefault(lang, {"samples": 0, "ratio": 1.0, "absErrorPct": 0.0})
+    # 最初の MIN_SAMPLES 件は単純平均、その後は指数移動平均
+    if state["samples"] < TOKEN_CALIBRATION_MIN_SAMPLES:
+        alpha = 1.0 / (state["samples"] + 1)
+    else:
+        alpha = TOKEN_CALIBRATION_ALPHA
+    state["ratio"] += alpha * (ratio - state["ratio"])
+    state["absErrorPct"] += alpha * (abs(estimated - actual) / actual * 100 - state["absErrorPct"])
+    state["samples"] += 1
+    logger.info(
+        f"token_estimate | lang={lang} model={payload.get('model')} estimated={estimated} actual={actual} "
+        f"error_pct={round((estimated - actual) / actual * 100, 1)}"
+    )
+
+
+def get_token_estimator_stats() -> dict:
+    return {
+        lang: {
+            "samples": state["samples"],
+            "actualToEstimatedRatio": round(state["ratio"], 4),
+            "meanAbsErrorPct": round(state["absErrorPct"], 2),
+            "calibration": round(token_calibration(lang), 4),
+        }
+        for lang, state in _token_calibration.items()
+    }
+
+
+def ensure_input_within_budget(text: str, limit: int, lang: str | None = None) -> int:
+    """Reject oversized input locally (413) instead of letting it fail slowly upstream."""
+    tokens = estimate_tokens(text, lang)
+    if tokens > limit:
+        logger.warning(f"input over token budget | estimated={tokens} limit={limit} text_len={len(text)}")
+        raise HTTPException(status_code=413, detail="input_too_long")
+    return tokens
+
+
+def fit_glossary_entries(
+    entries: list[tuple[str, str]],
+    token_budget: int,
+) -> tuple[list[tuple[str, str]], int]:
+    """Keep glossary entries in order while they fit the budget; returns (kept, dropped_count)."""
+    kept: list[tuple[str, str]] = []
+    used = 0
+    for source, target in entries:
+        # "- source => target" 1 行分
+        cost = estimate_tokens(source) + estimate_tokens(target) + 3
+        if used + cost > token_budget:
+            break
+        kept.append((source, target))
+        used += cost
+    return kept, len(entries) - len(kept)
+
+
+BASE_SESSION_INSTRUCTIONS = (
+    "You are a real-time interpreter. "
+    "Output only the translated text. No extra commentary. "
+    "Preserve proper nouns, acronyms, and numbers."
+)
+GLOSSARY_MAX_LINES = 200
+# サーバー側でユーザー辞書（最大 1000 件）とマージした用語集だけに使う上限
+DICTIONARY_GLOSSARY_MAX_LINES = GLOSSARY_MAX_LINES + 1000
+
+
+def parse_glossary_text(text: str | None, max_lines: int = GLOSSARY_MAX_LINES) -> list[tuple[str, str]]:
+    if not text:
+        return []
+    entries: list[tuple[str, str]] = []
+    for line in text.splitlines():
+        if len(entries) >= max_lines:
+            break
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        match = re.match(r"^(.+?)\s*(?:=>|=)\s*(.+)$", line)
+        if not match:
+            continue
+        source = match.group(1).strip()
+        target = match.group(2).strip()
+        if source and target:
+            entries.append((source, target))
+    return entries
+
+
+def build_session_instructions(glossary_entries: list[tuple[str, str]], output_lang: str | None) -> str:
+    instructions = BASE_SESSION_INSTRUCTIONS
+    if output_lang and output_lang != "auto":
+        lang_names = {"ja": "Japanese", "en": "English", "zh": "Chinese", "vi": "Vietnamese"}
+        lang_name = lang_names.get(output_lang, output_lang)
+        instructions += f" You MUST translate into {lang_name}. Do NOT output in any other language."
+    if glossary_entries:
+        instructions += "\n\nGlossary (must-follow):"
+        for source, target in glossary_entries:
+            instructions += f"\n- {source} => {target}"
+        instructions += "\n\nGlossary rules:"
+        instructions += "\n- If a glossary entry matches, you MUST use the specified target term."
+        instructions += "\n- Avoid partial-match mistakes; prefer whole-word matches when reasonable."
+        instructions += "\n- Do not invent glossary entries."
+    return instructions
+
+
+# ========== Compiled glossary ==========
+# 同じ用語集テキストは一度だけパースし、Aho-Corasick で入力中に出現するエントリだけを抽出する
+GLOSSARY_CACHE_MAX_ENTRIES = int(os.getenv("GLOSSARY_CACHE_MAX_ENTRIES", "256"))
+GLOSSARY_CACHE_TTL_SECONDS = float(os.getenv("GLOSSARY_CACHE_TTL_SECONDS", "3600"))
+
+_glossary_stats = {
+    "compiled": 0,
+    "cacheHits": 0,
+    "lookups": 0,
+    "entriesTotal": 0,
+    "entriesInjected": 0,
+    "enforcementChecked": 0,
+    "enforcementMissed": 0,
+}
+
+
+def normalize_glossary_term(text: str) -> str:
+    """NFKC + casefold so that full-width / case variants of a term still match."""
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def glossary_entries_key(entries: list[tuple[str, str]]) -> str:
+    raw = json.dumps(entries, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def is_ascii_word_char(char: str) -> bool:
+    return char.isascii() and (char.isalnum() or char == "_")
+
+
+class CompiledGlossary:
+    """Parsed glossary entries plus an Aho-Corasick automaton over their source terms."""
+
+    def __init__(self, entries: list[tuple[str, str]]):
+        self.entries = entries
+        self.version = glossary_entries_key(entries)
+        self._terms = [normalize_glossary_term(source) for source, _ in entries]
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[list[int]] = [[]]
+        for index, term in enumerate(self._terms):
+            if term:
+                self._insert(term, index)
+        self._link()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _insert(self, term: str, index: int) -> None:
+        state = 0
+        for char in term:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(index)
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def _is_whole_word(self, text: str, start: int, end: int, term: str) -> bool:
+        # 英数字で始まる/終わる語は単語境界を要求する（"AI" が "SAID" に当たらないように）。CJK は境界なし
+        if is_ascii_word_char(term[0]) and start > 0 and is_ascii_word_char(text[start - 1]):
+            return False
+        if is_ascii_word_char(term[-1]) and end < len(text) and is_ascii_word_char(text[end]):
+            return False
+        return True
+
+    def match(self, text: str) -> list[tuple[str, str]]:
+        """Entries whose source term occurs in text, in glossary order."""
+        if not self.entries or not text:
+            return []
+        normalized = normalize_glossary_term(text)
+        found: set[int] = set()
+        state = 0
+        for position, char in enumerate(normalized):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for index in self._output[state]:
+                if index in found:
+                    continue
+                term = self._terms[index]
+                if self._is_whole_word(normalized, position + 1 - len(term), position + 1, term):
+                    found.add(index)
+        return [self.entries[index] for index in sorted(found)]
+
+
+EMPTY_GLOSSARY = CompiledGlossary([])
+_compiled_glossary_cache = LRUTTLCache(
+    GLOSSARY_CACHE_MAX_ENTRIES,
+    GLOSSARY_CACHE_MAX_ENTRIES * 64 * 1024,
+    GLOSSARY_CACHE_TTL_SECONDS,
+)
+
+
+def compile_glossary(text: str | None, max_lines: int = GLOSSARY_MAX_LINES) -> CompiledGlossary:
+    """Parse + compile a glossary, cached by the hash of its text (and line cap)."""
+    if not text or not text.strip():
+        return EMPTY_GLOSSARY
+    key = hashlib.sha256(f"{max_lines}:{text}".encode("utf-8")).hexdigest()
+    compiled = _compiled_glossary_cache.get(key)
+    if compiled is not None:
+        _glossary_stats["cacheHits"] += 1
+        return compiled
+    compiled = CompiledGlossary(parse_glossary_text(text, max_lines))
+    _glossary_stats["compiled"] += 1
+    # オートマトンの実サイズは測らず、元テキストの数倍として見積もる
+    _compiled_glossary_cache.set(key, compiled, size=len(text.encode("utf-8")) * 8)
+    return compiled
+
+
+def as_compiled_glossary(glossary: CompiledGlossary | str | None) -> CompiledGlossary:
+    """Accept either raw client glossary text or an already compiled (e.g. dictionary-merged) glossary."""
+    if isinstance(glossary, CompiledGlossary):
+        return glossary
+    return compile_glossary(glossary)
+
+
+def select_glossary_entries(
+    glossary: CompiledGlossary,
+    text: str,
+    token_budget: int | None = None,
+) -> list[tuple[str, str]]:
+    """Entries relevant to text (the only ones worth injecting into a prompt), pruned to the token budget."""
+    matched, dropped = fit_glossary_entries(
+        glossary.match(text), PROMPT_GLOSSARY_TOKEN_BUDGET if token_budget is None else token_budget
+    )
+    if dropped:
+        logger.warning(f"glossary pruned to token budget | kept={len(matched)} dropped={dropped}")
+    if glossary.entries:
+        _glossary_stats["lookups"] += 1
+        _glossary_stats["entriesTotal"] += len(glossary.entries)
+        _glossary_stats["entriesInjected"] += len(matched)
+    return matched
+
+
+def missing_glossary_targets(entries: list[tuple[str, str]], output: str) -> list[tuple[str, str]]:
+    """Matched entries whose target term does not appear in the model output."""
+    if not entries:
+        return []
+    _glossary_stats["enforcementChecked"] += 1
+    normalized = normalize_glossary_term(output)
+    missing = [(source, target) for source, target in entries if normalize_glossary_term(target) not in normalized]
+    if missing:
+        _glossary_stats["enforcementMissed"] += 1
+    return missing
+
+
+def get_glossary_stats() -> dict:
+    total = _glossary_stats["entriesTotal"]
+    return dict(
+        _glossary_stats,
+        cache=_compiled_glossary_cache.stats(),
+        injectedRatio=round(_glossary_stats["entriesInjected"] / total, 4) if total else None,
+    )
+
+
+def sanitize_session_for_log(session: dict) -> dict:
+    if not isinstance(session, dict):
+        return {}
+    sanitized: dict = {}
+    for key, value in session.items():
+        if key == "instructions" and isinstance(value, str):
+            sanitized[key] = f"<len={len(value)}>"
+        else:
+            sanitized[key] = value
+    return sanitized
+
+
+@app.get("/", response_class=HTMLResponse)
+async def index() -> HTMLResponse:
+    index_file = STATIC_DIR / "index.html"
+    return HTMLResponse(index_file.read_text(encoding="utf-8"))
+
+
+@app.get("/sw.js", include_in_schema=False)
+async def service_worker() -> FileResponse:
+    return FileResponse(STATIC_DIR / "sw.js", media_type="application/javascript")
+
+
+@app.get("/favicon.ico", include_in_schema=False)
+async def favicon() -> FileResponse:
+    return FileResponse(STATIC_DIR / "icon-192.png", media_type="image/png")
+
+
+def openai_json_headers() -> dict:
+    api_key = get_openai_api_key()
+    return {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+
+
+def build_realtime_session_payload(instructions: str) -> dict:
+    # OpenAI docs: /v1/realtime/client_secrets with session wrapper
+    # https://platform.openai.com/docs/guides/realtime-webrtc
+    # 最小構成で疎通確認 - 追加オプションは疎通後に有効化
+    return {
+        "session": {
+            "type": "realtime",
+            "model": "gpt-4o-realtime-preview",
+            "instructions": instructions,
+            "audio": {
+                "output": {
+                    "voice": "alloy",
+                }
+            },
+            # TODO: 疎通確認後に以下を有効化
+            # "turn_detection": {
+            #     "type": "server_vad",
+            #     "silence_duration_ms": silence_ms,
+            # },
+            # "input_audio_transcription": {
+            #     "model": audio_model_default,
+            # },
+        }
+    }
+
+
+async def mint_realtime_client_secret(payload: dict) -> dict:
+    return await post_openai(
+        "https://api.openai.com/v1/realtime/client_secrets",
+        payload,
+        openai_json_headers(),
+    )
+
+
+# ========== Pre-minted realtime key pool ==========
+# よく使う設定（用語集なし × 各 outputLang）の ephemeral key を事前発行しておき、/token を即答する
+REALTIME_KEY_POOL_ENABLED = parse_bool(os.getenv("REALTIME_KEY_POOL_ENABLED", "1"))
+REALTIME_KEY_POOL_SIZE = int(os.getenv("REALTIME_KEY_POOL_SIZE", "2"))
+REALTIME_KEY_POOL_REFRESH_SECONDS = float(os.getenv("REALTIME_KEY_POOL_REFRESH_SECONDS", "15"))
+# expires_at のこの秒数前にはプールから外す（WebRTC 交渉に使える余裕を残す）
+REALTIME_KEY_EVICT_MARGIN_SECONDS = float(os.getenv("REALTIME_KEY_EVICT_MARGIN_SECONDS", "90"))
+REALTIME_KEY_POOL_WARM_LANGS = ["auto", "ja", "en", "zh", "vi"]
+
+_realtime_key_pool: dict[str, deque[tuple[str, float]]] = {}
+_realtime_key_pool_stats = {"hits": 0, "misses": 0, "minted": 0, "evicted": 0, "mintErrors": 0}
+_realtime_key_pool_task: asyncio.Task | None = None
+_realtime_key_pool_wakeup: asyncio.Event | None = None
+
+
+def realtime_session_key(payload: dict) -> str:
+    """Hash of the session payload (instructions = language + glossary, plus model/voice)."""
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def warm_realtime_session_payloads() -> dict[str, dict]:
+    payloads = {}
+    for lang in REALTIME_KEY_POOL_WARM_LANGS:
+        payload = build_realtime_session_payload(build_session_instructions([], lang))
+        payloads[realtime_session_key(payload)] = payload
+    return payloads
+
+
+def evict_expiring_realtime_keys(now: float | None = None) -> None:
+    now = time.time() if now is None else now
+    for keys in _realtime_key_pool.values():
+        while keys and keys[0][1] - now <= REALTIME_KEY_EVICT_MARGIN_SECONDS:
+            keys.popleft()
+            _realtime_key_pool_stats["evicted"] += 1
+
+
+def take_pooled_realtime_key(session_key: str) -> str | None:
+    if not REALTIME_KEY_POOL_ENABLED:
+        return None
+    evict_expiring_realtime_keys()
+    keys = _realtime_key_pool.get(session_key)
+    if not keys:
+        _realtime_key_pool_stats["misses"] += 1
+        return None
+    value, _ = keys.popleft()
+    _realtime_key_pool_stats["hits"] += 1
+    if _realtime_key_pool_wakeup is not None:
+        _realtime_key_pool_wakeup.set()
+    return value
+
+
+def add_pooled_realtime_key(session_key: str, data: dict) -> bool:
+    value = data.get("value")
+    expires_at = data.get("expires_at")
+    if not isinstance(value, str) or not value.strip() or not isinstance(expires_at, (int, float)):
+        return False
+    if expires_at - time.time() <= REALTIME_KEY_EVICT_MARGIN_SECONDS:
+        return False
+    keys = _realtime_key_pool.setdefault(session_key, deque())
+    keys.append((value, float(expires_at)))
+    # 期限の早い順に使う
+    if len(keys) > 1 and keys[-2][1] > keys[-1][1]:
+        _realtime_key_pool[session_key] = deque(sorted(keys, key=lambda item: item[1]))
+    return True
+
+
+async def refill_realtime_key_pool() -> None:
+    evict_expiring_realtime_keys()
+    for session_key, payload in warm_realtime_session_payloads().items():
+        while len(_realtime_key_pool.get(session_key, ())) < REALTIME_KEY_POOL_SIZE:
+            try:
+                data = await mint_realtime_client_secret(payload)
+            except (httpx.HTTPError, UpstreamOverloadedError, OpenAICircuitOpenError) as exc:
+                _realtime_key_pool_stats["mintErrors"] += 1
+                logger.warning(f"realtime key pool: mint failed ({type(exc).__name__}), will retry later")
+                return
+            if not add_pooled_realtime_key(session_key, data):
+                _realtime_key_pool_stats["mintErrors"] += 1
+                logger.warning("realtime key pool: response without usable value/expires_at")
+                return
+            _realtime_key_pool_stats["minted"] += 1
+
+
+async def run_realtime_key_pool() -> None:
+    global _realtime_key_pool_wakeup
+    _realtime_key_pool_wakeup = asyncio.Event()
+    while True:
+        try:
+            await refill_realtime_key_pool()
+        except Exception:
+            logger.exception("realtime key pool: unexpected refill error")
+        try:
+            await asyncio.wait_for(_realtime_key_pool_wakeup.wait(), timeout=REALTIME_KEY_POOL_REFRESH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _realtime_key_pool_wakeup.clear()
+
+
+def get_realtime_key_pool_stats() -> dict:
+    lookups = _realtime_key_pool_stats["hits"] + _realtime_key_pool_stats["misses"]
+    return dict(
+        _realtime_key_pool_stats,
+        enabled=REALTIME_KEY_POOL_ENABLED,
+        pooled=sum(len(keys) for keys in _realtime_key_pool.values()),
+        hitRate=round(_realtime_key_pool_stats["hits"] / lookups, 4) if lookups else None,
+    )
+
+
+@app.on_event("startup")
+async def start_realtime_key_pool() -> None:
+    global _realtime_key_pool_task
+    if not REALTIME_KEY_POOL_ENABLED:
+        return
+    if not os.getenv("OPENAI_API_KEY"):
+        logger.warning("realtime key pool disabled: OPENAI_API_KEY is not set")
+        return
+    _realtime_key_pool_task = asyncio.create_task(run_realtime_key_pool())
+
+
+@app.on_event("shutdown")
+async def stop_realtime_key_pool() -> None:
+    global _realtime_key_pool_task
+    task = _realtime_key_pool_task
+    _realtime_key_pool_task = None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+def token_response(secret: str, dictionary_glossary_version: int | None) -> dict:
+    body = {"value": secret}
+    if dictionary_glossary_version is not None:
+        body["glossaryVersion"] = dictionary_glossary_version
+    return body
+
+
+@app.post("/token")
+async def create_token(
+    request: Request,
+    vad_silence: int | None = Form(None),
+    glossary_text: str | None = Form(None, alias="glossaryText"),
+    glossary_version: str | None = Form(None, alias="glossaryVersion"),
+    output_lang: str | None = Form(None, alias="outputLang"),
+) -> JSONResponse:
+    # 認証必須: Firebase ID トークンを検証
+    uid = await require_uid(request)
+    logger.info(f"Token requested by uid: {uid}")
+    glossary, dictionary_glossary_version = await resolve_request_glossary(uid, glossary_text, glossary_version)
+
+    # TODO: vad_silence, transcription, server_vad を最小疎通後に戻す
+    # silence_ms = vad_silence if vad_silence is not None else 400
+
+    glossary_entries = glossary.entries
+    # Realtime は入力が未知なので用語集全体を入れるが、instructions がトークン予算を超えないよう末尾から削る
+    glossary_budget = REALTIME_INSTRUCTIONS_TOKEN_BUDGET - estimate_tokens(build_session_instructions([], output_lang))
+    glossary_entries, dropped = fit_glossary_entries(glossary_entries, glossary_budget)
+    if dropped:
+        logger.warning(
+            f"Realtime glossary pruned to token budget | kept={len(glossary_entries)} dropped={dropped} "
+            f"budget={REALTIME_INSTRUCTIONS_TOKEN_BUDGET}"
+        )
+    instructions = build_session_instructions(glossary_entries, output_lang)
+    payload = build_realtime_session_payload(instructions)
+
+    pooled_secret = take_pooled_realtime_key(realtime_session_key(payload))
+    if pooled_secret is not None:
+        logger.info(
+            f"Ephemeral key served from pool (prefix: {pooled_secret[:10]}...) | "
+            f"glossary_entries={len(glossary_entries)}, instructions_len={len(instructions)}"
+        )
+        return JSONResponse(token_response(pooled_secret, dictionary_glossary_version))
+
+    # payload の session 情報をログ出力
+    session_info = payload.get("session", {})
+    logger.info(
+        f"Requesting ephemeral key | type={session_info.get('type')}, "
+        f"model={session_info.get('model')}, voice={session_info.get('audio', {}).get('output', {}).get('voice')}, "
+        f"glossary_entries={len(glossary_entries)}, instructions_len={len(instructions)}"
+    )
+    session_log = sanitize_session_for_log(session_info)
+
+    try:
+        data = await mint_realtime_client_secret(payload)
+    except httpx.HTTPStatusError as exc:
+        resp = exc.response
+        status_code = resp.status_code if resp is not None else 502
+        reason = resp.reason_phrase if resp is not None else "Error"
+        body_text = resp.text if resp is not None else ""
+        logger.error(
+            "OpenAI client_secrets error: "
+            f"status={status_code}, reason={reason}, body={mask_secrets(body_text)}, session={session_log}"
+        )
+        raise HTTPException(
+            status_code=status_code,
+            detail=f"OpenAI API error ({status_code} {reason})",
+        ) from exc
+    except httpx.RequestError as exc:
+        logger.error(
+            "OpenAI request error: "
+            f"{type(exc).__name__}: {exc} session={session_log}"
+        )
+        raise HTTPException(
+            status_code=502,
+            detail="OpenAI request error",
+        )
+
+    # /v1/realtime/client_secrets returns: { "value": "ek_...", "expires_at": ..., "session": {...} }
+    raw_secret = data.get("value")
+
+    if not isinstance(raw_secret, str) or not raw_secret.strip():
+        logger.error(f"value missing in OpenAI response: {mask_secrets(str(data))}")
+        raise HTTPException(status_code=502, detail="client_secret missing in OpenAI response")
+
+    logger.info(f"Ephemeral key obtained successfully (prefix: {raw_secret[:10]}...)")
+    # フロントが data.value を読む前提に合わせる
+    return JSONResponse(token_response(raw_secret, dictionary_glossary_version))
+
+
+
+@app.post("/api/v1/jobs/create")
+async def create_job(request: Request) -> JSONResponse:
+    uid = await require_uid(request)
+    db = get_firestore_client()
+    current_jst = now_jst()
+    now_utc = datetime.now(timezone.utc)
+    job_id = uuid.uuid4().hex
+
+    force_takeover = False
+    raw_force_takeover = request.query_params.get("force_takeover")
+    if raw_force_takeover is not None:
+        force_takeover = parse_bool(raw_force_takeover)
+    else:
+        try:
+            body = await request.json()
+        except Exception:
+            body = {}
+        if isinstance(body, dict):
+            raw_force_takeover = body.get("force_takeover")
+            if raw_force_takeover is None:
+                raw_force_takeover = body.get("forceTakeover")
+            force_takeover = parse_bool(raw_force_takeover)
+
+    use_simple = False
+    if not IS_PRODUCTION:
+        use_simple = os.getenv("DEBUG_AUTH_BYPASS") == "1"
+
+    if use_simple:
+        result = await run_blocking(
+            create_job_transaction_simple, db, uid, job_id, current_jst, now_utc, force_takeover=force_takeover
+        )
+    else:
+        transaction = db.transaction(max_attempts=10)
+        result = await run_blocking(
+            create_job_transaction, transaction, db, uid, job_id, current_jst, now_utc, force_takeover=force_takeover
+        )
+    invalidate_user_doc(uid)
+
+    log_payload = {
+        "uid": uid,
+        "jobId": job_id,
+        "endpoint": "jobs.create",
+        "plan": result.get("plan"),
+        "reservedSeconds": result.get("reservedSeconds"),
+        "reservedBaseSeconds": result.get("reservedBaseSeconds"),
+        "reservedTicketSeconds": result.get("reservedTicketSeconds"),
+        "totalAvailableThisMonth": result.get("totalAvailableThisMonth"),
+    }
+    logger.info(f"Job reservation | {json.dumps(log_payload)}")
+    return JSONResponse(result)
+
+
+@app.post("/api/v1/jobs/complete")
+async def complete_job(request: Request) -> JSONResponse:
+    uid = await require_uid(request)
+    body = await request.json()
+    job_id = body.get("jobId")
+    if not job_id:
+        raise HTTPException(status_code=400, detail="jobId is required")
+    audio_seconds = None
+    if "audioSeconds" in body:
+        try:
+            audio_seconds = int(body.get("audioSeconds"))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="audioSeconds must be an integer")
+        if audio_seconds < 0:
+            raise HTTPException(status_code=400, detail="audioSeconds must be >= 0")
+
+    db = get_firestore_client()
+    job_ref = db.collection("jobs").document(job_id)
+    current_jst = now_jst()
+    now_utc = datetime.now(timezone.utc)
+
+    # 【セキュリティガード】本番環境では simplified transaction を使わない
+    use_simple = False
+    if not IS_PRODUCTION:
+        use_simple = os.getenv("DEBUG_AUTH_BYPASS") == "1"
+
+    if use_simple:
+        result = await run_blocking(
+            complete_job_transaction_simple, db, job_ref, uid, audio_seconds, current_jst, now_utc
+        )
+    else:
+        transaction = db.transaction(max_attempts=10)
+        result = await run_blocking(
+            complete_job_transaction, transaction, db, job_ref, uid, audio_seconds, current_jst, now_utc
+        )
+    invalidate_user_doc(uid)
+
+    result["serverTime"] = now_utc.isoformat()
+
+    log_payload = {
+        "uid": uid,
+        "jobId": job_id,
+        "endpoint": "jobs.complete",
+        "status": result.get("status"),
+        "billedSeconds": result.get("billedSeconds"),
+        "billedBaseSeconds": result.get("billedBaseSeconds"),
+        "billedTicketSeconds": result.get("billedTicketSeconds"),
+    }
+    logger.info(f"Job completed | {json.dumps(log_payload)}")
+    return JSONResponse(result)
+
+
+@app.patch("/api/v1/jobs/{job_id}/title")
+async def update_job_title(job_id: str, request: Request) -> JSONResponse:
+    uid = await require_uid(request)
+    body = await request.json()
+    raw_title = body.get("title")
+    if not isinstance(raw_title, str):
+        raise HTTPException(status_code=400, detail="title_required")
+
+    # Normalize: trim + collapse internal whitespace
+    title = re.sub(r"\s+", " ", raw_title).strip()
+
+    if not title:
+        raise HTTPException(status_code=400, detail="title_required")
+    if len(title) > TITLE_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail="title_too_long")
+    if TITLE_FORBIDDEN_CHARS_RE.search(title):
+        raise HTTPException(status_code=400, detail="title_invalid_chars")
+
+    db = get_firestore_client()
+    job_ref = db.collection("jobs").document(job_id)
+    job_snap = await run_blocking(job_ref.get)
+
+    if not job_snap.exists:
+        raise HTTPException(status_code=404, detail="job_not_found")
+
+    job_data = job_snap.to_dict() or {}
+    if job_data.get("uid") != uid:
+        raise HTTPException(status_code=403, detail="forbidden")
+
+    if job_data.get("status") not in TITLE_EDITABLE_STATUSES:
+        raise HTTPException(status_code=409, detail="job_not_completed")
+
+    delete_at = job_data.get("deleteAt")
+    now_utc = datetime.now(timezone.utc)
+    if delete_at:
+        # Firestore timestamps → datetime comparison
+        delete_at_dt = delete_at if isinstance(delete_at, datetime) else delete_at.replace(tzinfo=timezone.utc)
+        if now_utc > delete_at_dt:
+            raise HTTPException(status_code=409, detail="job_expired")
+
+    title_updated_at = now_utc
+    await run_blocking(job_ref.update, {
+        "title": title,
+        "titleUpdatedAt": title_updated_at,
+        "updatedAt": firebase_firestore.SERVER_TIMESTAMP,
+    })
+
+    logger.info(f"Job title updated | uid={uid} jobId={job_id} title={title!r}")
+    return JSONResponse({
+        "jobId": job_id,
+        "title": title,
+        "titleUpdatedAt": title_updated_at.isoformat(),
+        "serverTime": now_utc.isoformat(),
+    })
+
+
+@app.get("/api/v1/usage/remaining")
+async def get_remaining_usage(request: Request) -> JSONResponse:
+    uid = await require_uid(request)
+    db = get_firestore_client()
+    current_jst = now_jst()
+    _, user_state, plan, plan_config = await run_blocking(read_user_state, db, uid, current_jst, persist=False)
+    snapshot = build_quota_snapshot(user_state, plan_config)
+    response = {
+        "plan": plan,
+        "quotaSeconds": snapshot["baseMonthlyQuotaSeconds"],
+        "usedSeconds": snapshot["usedBaseSecondsThisMonth"],
+        "remainingSeconds": snapshot["baseRemainingThisMonth"],
+        "yyyymm": user_state.get("monthKey"),
+        "baseMonthlyQuotaSeconds": snapshot["baseMonthlyQuotaSeconds"],
+        "baseRemainingThisMonth": snapshot["baseRemainingThisMonth"],
+        "ticketSecondsBalance": snapshot["ticketSecondsBalance"],
+        "totalAvailableThisMonth": snapshot["totalAvailableThisMonth"],
+        "baseDailyQuotaSeconds": snapshot["baseDailyQuotaSeconds"],
+        "usedSecondsToday": snapshot["usedSecondsToday"],
+        "dailyRemainingSeconds": snapshot["dailyRemainingSeconds"],
+    }
+
+    logger.info(
+        f"Usage snapshot | {json.dumps({'uid': uid, 'plan': plan, 'baseRemaining': response['baseRemainingThisMonth'], 'tickets': response['ticketSecondsBalance']})}"
+    )
+
+    return JSONResponse(response)
+
+
+@app.get("/api/v1/me")
+async def get_me(request: Request) -> JSONResponse:
+    uid = await require_uid(request)
+    db = get_firestore_client()
+    current_jst = now_jst()
+    now_utc = datetime.now(timezone.utc)
+    _, user_state, plan, plan_config = await run_blocking(read_user_state, db, uid, current_jst, persist=False)
+    snapshot = build_quota_snapshot(user_state, plan_config)
+
+    # Calculate nextResetAt (first day of next month in JST, as UTC ISO8601)
+    next_reset = next_month_start_utc(current_jst)
+
+    # Determine blockedReason if user cannot start
+    blocked_reason = None
+    total_available = snapshot["totalAvailableThisMonth"]
+    daily_remaining = snapshot["dailyRemainingSeconds"]
+    daily_job_limit = plan_config.get("dailyJobLimit")
+    job_count_today = user_state.get("jobCountToday", 0)
+
+    if total_available <= 0:
+        blocked_reason = "monthly_quota_exhausted"
+    elif plan == "free" and daily_remaining is not None and daily_remaining <= 0:
+        blocked_reason = "daily_limit_reached"
+    elif daily_job_limit is not None and job_count_today >= daily_job_limit:
+        blocked_reason = "daily_job_limit_reached"
+
+    # 日次ジョブ残り計算
+    day_job_remaining = None
+    if daily_job_limit is not None:
+        day_job_remaining = max(0, daily_job_limit - job_count_today)
+
+    # 分単位変換ヘルパー
+    def to_min(seconds):
+        return seconds // 60 if seconds is not None else None
+
+    response = {
+        "uid": uid,
+        "plan": plan,
+        "serverTime": now_utc.isoformat(),
+
+        # 月次 (秒単位 + 分単位)
+        "baseMonthlyQuotaSeconds": snapshot["baseMonthlyQuotaSeconds"],
+        "usedBaseSecondsThisMonth": snapshot["usedBaseSecondsThisMonth"],
+        "baseRemainingThisMonth": snapshot["baseRemainingThisMonth"],
+        "monthLimitMin": to_min(snapshot["baseMonthlyQuotaSeconds"]),
+        "monthUsedMin": to_min(snapshot["usedBaseSecondsThisMonth"]),
+        "monthRemainingMin": to_min(snapshot["baseRemainingThisMonth"]),
+
+        # チケット/合計
+        "ticketSecondsBalance": snapshot["ticketSecondsBalance"],
+        "creditSeconds": snapshot["ticketSecondsBalance"],  # フロント互換性
+        "totalAvailableThisMonth": snapshot["totalAvailableThisMonth"],
+
+        # 日次ジョブ数
+        "dayJobLimit": daily_job_limit,
+        "dayJobUsed": job_count_today,
+        "dayJobRemaining": day_job_remaining,
+
+        # 同時接続
+        "concurrentLimit": plan_config.get("maxConcurrentJobs", 1),
+        "concurrentActive": 1 if user_state.get("activeJobId") else 0,
+
+        # セッション/保持
+        "maxSessionSeconds": plan_config.get("maxSessionSeconds"),
+        "retentionDays": plan_config.get("retentionDays", 7),
+
+        # 状態
+        "activeJob": bool(user_state.get("activeJobId")),
+        "monthKey": user_state.get("monthKey"),
+        "dayKey": user_state.get("dayKey"),
+        "nextResetAt": next_reset.isoformat(),
+
+        # Billing
+        "billingEnabled": True,
+        "purchaseAvailable": True,
+    }
+
+    if blocked_reason:
+        response["blockedReason"] = blocked_reason
+
+    # 日次制限がある場合（freeプラン）
+    if snapshot["baseDailyQuotaSeconds"] is not None:
+        response.update(
+            {
+                "baseDailyQuotaSeconds": snapshot["baseDailyQuotaSeconds"],
+                "usedSecondsToday": snapshot["usedSecondsToday"],
+                "dailyRemainingSeconds": snapshot["dailyRemainingSeconds"],
+                "dayLimitMin": to_min(snapshot["baseDailyQuotaSeconds"]),
+                "dayUsedMin": to_min(snapshot["usedSecondsToday"]),
+                "dayRemainingMin": to_min(snapshot["dailyRemainingSeconds"]),
+            }
+        )
+
+    logger.info(
+        f"Account snapshot | {json.dumps({'uid': uid, 'plan': plan, 'totalAvailable': response['totalAvailableThisMonth'], 'ticketSecondsBalance': response['ticketSecondsBalance']})}"
+    )
+
+    return JSONResponse(response)
+
+
+@app.post("/api/v1/test/create-expired-job")
+async def create_expired_job(request: Request) -> JSONResponse:
+    """DEBUG only: Create a job with past deleteAt for testing cleanup"""
+    # 【セキュリティガード】本番環境では無効化
+    if IS_PRODUCTION:
+        raise HTTPException(status_code=404, detail="not_found")
+
+    if os.getenv("DEBUG_AUTH_BYPASS") != "1":
+        raise HTTPException(status_code=404, detail="not_found")
+
+    uid = await require_uid(request)
+    db = get_firestore_client()
+    current_jst = now_jst()
+    yyyymm = month_key(current_jst)
+
+    job_id = uuid.uuid4().hex
+    delete_at = (current_jst - timedelta(days=1)).astimezone(timezone.utc)
+    plan = "free"
+    plan_config = resolve_plan_config(plan)
+    now_utc = datetime.now(timezone.utc)
+    job_data = {
+        "uid": uid,
+        "status": "completed",
+        "plan": plan,
+        "planAtStart": plan,
+        "reservedSeconds": 0,
+        "reservedBaseSeconds": 0,
+        "reservedTicketSeconds": 0,
+        "billedSeconds": 0,
+        "billedBaseSeconds": 0,
+        "billedTicketSeconds": 0,
+        "maxSessionSeconds": plan_config["maxSessionSeconds"],
+        "retentionDays": plan_config["retentionDays"],
+        "monthKey": yyyymm,
+        "dayKey": day_key(current_jst),
+        "createdAt": now_utc,
+        "startedAt": now_utc - timedelta(minutes=5),
+        "completedAt": now_utc - timedelta(minutes=1),
+        "endedAt": now_utc - timedelta(minutes=1),
+        "deleteAt": delete_at,
+    }
+    await run_blocking(db.collection("jobs").document(job_id).set, job_data)
+
+    logger.info(f"Test expired job created: {job_id} | {json.dumps({'jobId': job_id})}")
+    return JSONResponse({"jobId": job_id, "deleteAt": delete_at.isoformat()})
+
+
+def cleanup_expired_jobs(db, now_utc: datetime, limit: int) -> dict:
+    query = db.collection("jobs").where("deleteAt", "<", now_utc).limit(limit)
+
+    deleted = 0
+    errors = 0
+    scanned = 0
+
+    for doc in query.stream():
+        scanned += 1
+        try:
+            job_data = doc.to_dict() or {}
+            job_id = doc.id
+            maybe_delete_job_assets(job_data)
+            doc.reference.delete()
+            deleted += 1
+            logger.info(f"Deleted expired job: {job_id} | {json.dumps({'jobId': job_id, 'deleteAt': str(job_data.get('deleteAt'))})}")
+        except Exception as e:
+            errors += 1
+            logger.error(f"Failed to delete job: {e} | {json.dumps({'error': str(e)})}")
+
+    return {"deleted": deleted, "scanned": scanned, "errors": errors}
+
+
+@app.post("/api/v1/admin/cleanup")
+async def cleanup_jobs(request: Request, limit: int = 200) -> JSONResponse:
+    """
+    期限切れjobsを削除
+    本番: Cloud SchedulerからOIDC認証で呼び出し
+    開発: x-admin-tokenで認証
+    """
+    verify_admin_access(request)
+    db = get_firestore_client()
+    now_utc = datetime.now(timezone.utc)
+    result = await run_blocking(cleanup_expired_jobs, db, now_utc, limit)
+    logger.info(f"Cleanup completed | {json.dumps(result)}")
+    return JSONResponse(result)
+
+
+@app.post("/api/v1/admin/dictionary/repair-counts")
+async def repair_dictionary_count_fields(
+    request: Request, limit: int = 200, after: str | None = None, uid: str | None = None
+) -> JSONResponse:
+    """
+    users/{uid}.dictionaryCount を実数で数え直し、ずれていれば修正する
+    uid 指定時はそのユーザーのみ、未指定時は uid 順に limit 件ずつ（after で続きから）
+    """
+    verify_admin_access(request)
+    db = get_firestore_client()
+    if uid:
+        uids = [uid]
+    else:
+        query = db.collection("users").order_by("__name__").limit(max(1, min(limit, 1000)))
+        if after:
+            query = query.start_after({"__name__": after})
+        uids = [doc.id for doc in await run_blocking(lambda: list(query.stream()))]
+    result = await run_blocking(repair_dictionary_counts, db, uids)
+    result["nextAfter"] = uids[-1] if uids and not uid else None
+    logger.info(f"Dictionary count repair completed | {json.dumps({k: v for k, v in result.items() if k != 'drifted'})}")
+    return JSONResponse(result)
+
+
+@app.post("/api/v1/billing/stripe/checkout")
+async def create_checkout_session(request: Request) -> JSONResponse:
+    """Stripe Checkout Session 作成（Proプラン登録用）"""
+    uid = await require_uid(request)
+    body = await request.json()
+    success_url = body.get("successUrl", "https://example.com/success")
+    cancel_url = body.get("cancelUrl", "https://example.com/cancel")
+
+    secret_key = os.getenv("STRIPE_SECRET_KEY")
+    price_id = os.getenv("STRIPE_PRO_PRICE_ID")
+    if not secret_key or not price_id:
+        raise HTTPException(status_code=500, detail="stripe_not_configured")
+
+    stripe.api_key = secret_key
+
+    try:
+        session = await run_blocking(
+            stripe.checkout.Session.create,
+            mode="subscription",
+            payment_method_types=["card"],
+            line_items=[
+                {
+                    "price": price_id,
+                    "quantity": 1,
+                }
+            ],
+            client_reference_id=uid,
+            metadata={"uid": uid},
+            subscription_data={"metadata": {"uid": uid}},
+            success_url=success_url,
+            cancel_url=cancel_url,
+            customer_email=body.get("email"),
+        )
+        logger.info(f"Checkout session created for uid: {uid} | {json.dumps({'uid': uid, 'sessionId': session.id})}")
+        return JSONResponse({"sessionId": session.id, "url": session.url})
+    except Exception as e:
+        logger.error(f"Stripe checkout session creation failed: {e} | {json.dumps({'uid': uid, 'error': str(e)})}")
+        raise HTTPException(status_code=500, detail=f"checkout_failed: {str(e)}")
+
+
+@app.get("/api/v1/company/profile")
+async def get_company_profile(request: Request) -> JSONResponse:
+    """会社情報を取得"""
+    uid = await require_uid(request)
+    db = get_firestore_client()
+    user_data = await run_blocking(get_user_doc, db, uid) or {}
+    company_profile = user_data.get("companyProfile", {})
+    logger.info(f"[company_profile] GET | {json.dumps({'uid': uid})}")
+    return JSONResponse({"companyProfile": company_profile})
+
+
+def build_stripe_customer_payload(company_profile: dict) -> dict:
+    """
+    companyProfile から Stripe Customer.modify 用の payload を構築
+    安全域のみ: name, address, metadata
+    """
+    payload = {}
+
+    # name = companyName（あれば）
+    company_name = company_profile.get("companyName", "").strip()
+    if company_name:
+        payload["name"] = company_name
+
+    # address（line1, postal_code, country）
+    address = {}
+    addr_line1 = company_profile.get("address", "").strip()
+    if addr_line1:
+        address["line1"] = addr_line1
+    postal_code = company_profile.get("postalCode", "").strip()
+    if postal_code:
+        address["postal_code"] = postal_code
+    country = company_profile.get("country", "").strip()
+    if country:
+        address["country"] = country
+    if address:
+        payload["address"] = address
+
+    # metadata に全フィールドを保存
+    metadata = {
+        "source": "company_profile_sync",
+    }
+    for key in ["companyName", "department", "position", "address", "postalCode", "country", "taxIdLabel", "taxIdValue"]:
+        val = company_profile.get(key, "").strip()
+        if val:
+            metadata[key] = val[:500]  # Stripe metadata value limit
+    payload["metadata"] = metadata
+
+    return payload
+
+
+def sync_company_profile_to_stripe(customer_id: str, company_profile: dict) -> dict:
+    """
+    companyProfile を Stripe Customer に同期（ベストエフォート）
+    Returns: {"attempted": bool, "updated": bool, "skipped": bool, "reason": str|None, "error": str|None}
+    """
+    result = {
+        "attempted": False,
+        "updated": False,
+        "skipped": False,
+        "reason": None,
+        "error": None,
+    }
+
+    secret_key = os.getenv("STRIPE_SECRET_KEY")
+    if not secret_key:
+        result["skipped"] = True
+        result["reason"] = "stripe_not_configured"
+        logger.info(f"[stripe_sync] Skipped: STRIPE_SECRET_KEY not set")
+        return result
+
+    if not customer_id:
+        result["skipped"] = True
+        result["reason"] = "no_customer_id"
+        logger.info(f"[stripe_sync] Skipped: no stripeCustomerId")
+        return result
+
+    result["attempted"] = True
+    stripe.api_key = secret_key
+
+    try:
+        payload = build_stripe_customer_payload(company_profile)
+        stripe.Customer.modify(customer_id, **payload)
+        result["updated"] = True
+        logger.info(f"[stripe_sync] Customer updated | {json.dumps({'customerId': customer_id, 'fields': list(payload.keys())})}")
+    except Exception as e:
+        result["error"] = str(e)
+        logger.error(f"[stripe_sync] Customer update failed | {json.dumps({'customerId': customer_id, 'error': str(e)})}")
+
+    return result
+
+
+@app.post("/api/v1/company/profile")
+async def save_company_profile(request: Request) -> JSONResponse:
+    """会社情報を保存"""
+    uid = await require_uid(request)
+    body = await request.json()
+    company_profile = body.get("companyProfile", {})
+
+    # 許可するフィールドのみ保存
+    allowed_fields = ["companyName", "department", "position", "address", "postalCode", "country", "taxIdLabel", "taxIdValue"]
+    sanitized = {k: v for k, v in company_profile.items() if k in allowed_fields and isinstance(v, str)}
+
+    db = get_firestore_client()
+    user_ref = db.collection("users").document(uid)
+
+    # Firestore に保存
+    await run_blocking(user_ref.set, {
+        "companyProfile": sanitized,
+        "updatedAt": firebase_firestore.SERVER_TIMESTAMP,
+    }, merge=True)
+    invalidate_user_doc(uid)
+
+    logger.info(f"[company_profile] POST | {json.dumps({'uid': uid, 'fields': list(sanitized.keys())})}")
+
+    # Stripe Customer に同期（ベストエフォート）
+    user_data = await run_blocking(get_user_doc, db, uid) or {}
+    customer_id = user_data.get("stripeCustomerId")
+
+    stripe_sync = await run_blocking(sync_company_profile_to_stripe, customer_id, sanitized)
+
+    # Firestore に同期結果を保存（任意）
+    sync_status = {
+        "lastCompanyProfileSyncAt": firebase_firestore.SERVER_TIMESTAMP,
+    }
+    if stripe_sync["updated"]:
+        sync_status["lastCompanyProfileSyncOk"] = True
+        sync_status["lastCompanyProfileSyncError"] = None
+    elif stripe_sync["error"]:
+        sync_status["lastCompanyProfileSyncOk"] = False
+        sync_status["lastCompanyProfileSyncError"] = stripe_sync["error"]
+    elif stripe_sync["skipped"]:
+        sync_status["lastCompanyProfileSyncOk"] = None
+        sync_status["lastCompanyProfileSyncError"] = stripe_sync["reason"]
+
+    await run_blocking(user_ref.set, {"stripeSync": sync_status}, merge=True)
+    invalidate_user_doc(uid)
+
+    return JSONResponse({
+        "ok": True,
+        "companyProfile": sanitized,
+        "stripeSync": stripe_sync,
+    })
+
+
+@app.get("/api/v1/billing/status")
 async def get_billing_status(request: Request) -> JSONResponse:
     """サブスクリプション状態を取得"""
-    uid = get_uid_from_request(request)
+    uid = await require_uid(request)
+    db = get_firestore_client()
+    user_ref = db.collection("users").document(uid)
+    user_data = await run_blocking(get_user_doc, db, uid) or {}
+
+    plan = normalize_plan(user_data.get("plan"))
+    subscription_status = user_data.get("subscriptionStatus", "free")
+    cancel_at_period_end = user_data.get("cancelAtPeriodEnd", False)
+    current_period_end = user_data.get("currentPeriodEnd")
+    is_pro = plan == "pro"
+
+    # Stripe fallback: currentPeriodEnd が Firestore に無い場合、Stripe から取得してバックフィル
+    if not current_period_end and is_pro:
+        subscription_id = user_data.get("stripeSubscriptionId")
+        if subscription_id:
+            try:
+                secret_key = os.getenv("STRIPE_SECRET_KEY")
+                if secret_key:
+                    stripe.api_key = secret_key
+                    sub = await run_blocking(stripe.Subscription.retrieve, subscription_id)
+                    cpe = sub.get("current_period_end")
+                    if cpe:
+                        current_period_end = datetime.fromtimestamp(cpe, tz=timezone.utc)
+                        await run_blocking(user_ref.set, {"currentPeriodEnd": current_period_end}, merge=True)
+                        invalidate_user_doc(uid)
+                        logger.info(f"[billing_status] Backfilled currentPeriodEnd from Stripe | uid={uid}")
+            except Exception as e:
+                logger.warning(f"[billing_status] Stripe fallback failed | uid={uid} error={e}")
+
+    # currentPeriodEnd を ISO 文字列に変換
+    current_period_end_iso = None
+    current_period_end_unix = None
+    if current_period_end:
+        if hasattr(current_period_end, "isoformat"):
+            current_period_end_iso = current_period_end.isoformat()
+            current_period_end_unix = int(current_period_end.timestamp())
+        elif isinstance(current_period_end, (int, float)):
+            current_period_end_unix = int(current_period_end)
+            current_period_end_iso = datetime.fromtimestamp(current_period_end, tz=timezone.utc).isoformat()
+
+    response = {
+        "plan": plan,
+        "subscriptionStatus": subscription_status,
+        "cancelAtPeriodEnd": cancel_at_period_end,
+        "currentPeriodEnd": current_period_end_iso,
+        "currentPeriodEndUnix": current_period_end_unix,
+        "isPro": is_pro,
+        "isPastDue": subscription_status == "past_due",
+        "isCanceling": cancel_at_period_end and is_pro,
+    }
+
+    logger.info(f"[billing_status] GET | {json.dumps({'uid': uid, 'plan': plan, 'status': subscription_status})}")
+    return JSONResponse(response)
+
+
+@app.post("/api/v1/billing/stripe/portal")
+async def create_portal_session(request: Request) -> JSONResponse:
+    """Stripe Customer Portal Session 作成（サブスク管理用）"""
+    uid = await require_uid(request)
+    body = await request.json()
+    return_url = body.get("returnUrl", "https://example.com")
+
+    secret_key = os.getenv("STRIPE_SECRET_KEY")
+    if not secret_key:
+        raise HTTPException(status_code=500, detail="stripe_not_configured")
+
+    stripe.api_key = secret_key
+
+    # uidからStripe Customer IDを取得
+    db = get_firestore_client()
+    user_data = await run_blocking(get_user_doc, db, uid) or {}
+    customer_id = user_data.get("stripeCustomerId")
+
+    if not customer_id:
+        logger.error(f"[stripe_portal] No Stripe customer ID for uid: {uid} | {json.dumps({'uid': uid})}")
+        raise HTTPException(status_code=400, detail="no_customer_id")
+
+    try:
+        session = await run_blocking(
+            stripe.billing_portal.Session.create,
+            customer=customer_id,
+            return_url=return_url,
+        )
+        logger.info(f"[stripe_portal] Portal session created for uid: {uid} | {json.dumps({'uid': uid, 'customerId': customer_id})}")
+        print(f"[stripe_portal] Portal session created for uid: {uid} | customerId={customer_id}")
+        return JSONResponse({"url": session.url})
+    except Exception as e:
+        logger.error(f"[stripe_portal] Stripe portal session creation failed: {e} | {json.dumps({'uid': uid, 'error': str(e)})}")
+        raise HTTPException(status_code=500, detail=f"portal_failed: {str(e)}")
+
+
+@app.post("/api/v1/billing/stripe/webhook")
+async def stripe_webhook(request: Request) -> JSONResponse:
+    """
+    Stripe Webhook ハンドラー
+    対応イベント:
+    - checkout.session.completed (subscription or ticket_purchase)
+    - customer.subscription.created/updated/deleted
+    - invoice.paid
+    - invoice.payment_failed
+    """
+    webhook_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
+    if not webhook_secret:
+        logger.error("STRIPE_WEBHOOK_SECRET is not configured")
+        raise HTTPException(status_code=500, detail="stripe_webhook_not_configured")
+
+    sig_header = request.headers.get("Stripe-Signature")
+    if not sig_header:
+        logger.warning("Stripe webhook called without Stripe-Signature header")
+        raise HTTPException(status_code=400, detail="Missing Stripe-Signature header")
+
+    payload = await request.body()
+
+    try:
+        event = stripe.Webhook.construct_event(payload, sig_header, webhook_secret)
+    except stripe.SignatureVerificationError:
+        logger.error("Stripe webhook signature verification failed")
+        raise HTTPException(status_code=400, detail="Invalid signature")
+    except ValueError:
+        logger.error("Stripe webhook invalid payload (JSON parse error)")
+        raise HTTPException(status_code=400, detail="Invalid payload")
+
+    event_type = event.get("type", "unknown")
+    event_id = event.get("id", "unknown")
+
+    # stdout に出力（Cloud Logging で確認用）
+    print(f"[stripe_webhook] received event type={event_type} id={event_id}")
+
+    logger.info(f"Stripe webhook received | {json.dumps({'eventType': event_type, 'eventId': event_id})}")
+
+    # 以降は Firestore の読み書きのみなので、まとめて blocking I/O プールで処理する
+    return await run_blocking(apply_stripe_event, event)
+
+
+def apply_stripe_event(event) -> JSONResponse:
+    """Apply a verified Stripe event to Firestore (blocking)."""
+    event_type = event.get("type", "unknown")
+    db = get_firestore_client()
+
+    # Checkout完了イベント（購入直後のuid紐付け）
+    if event_type == "checkout.session.completed":
+        session = event["data"]["object"]
+        session_id = session.get("id")
+        client_ref_id = session.get("client_reference_id")
+        metadata = session.get("metadata") or {}
+        metadata_uid = metadata.get("uid")
+        uid = client_ref_id or metadata_uid
+        customer_id = session.get("customer")
+        subscription_id = session.get("subscription")
+        purchase_type = metadata.get("type")  # "ticket_purchase" or None (subscription)
+
+        # 抽出した全フィールドをログ出力（デバッグ用）
+        logger.info(f"[stripe_webhook] checkout.session.completed extracted | {json.dumps({'sessionId': session_id, 'clientReferenceId': client_ref_id, 'metadataUid': metadata_uid, 'uid': uid, 'customerId': customer_id, 'subscriptionId': subscription_id, 'type': purchase_type})}")
+        print(f"[stripe_webhook] checkout.session.completed | sessionId={session_id} uid={uid} type={purchase_type}")
+
+        if not uid:
+            logger.warning(f"[stripe_webhook] checkout.session.completed without uid | {json.dumps({'sessionId': session_id, 'customerId': customer_id, 'clientReferenceId': client_ref_id, 'metadataUid': metadata_uid})}")
+            return JSONResponse({"received": True, "warning": "uid_not_found"})
+
+        # チケット購入の場合: ticketSecondsBalance を加算
+        if purchase_type == "ticket_purchase":
+            pack_id = metadata.get("packId")
+            minutes_str = metadata.get("minutes")
+            try:
+                minutes = int(minutes_str) if minutes_str else 0
+            except (ValueError, TypeError):
+                minutes = 0
+
+            if minutes <= 0:
+                logger.error(f"[stripe_webhook] ticket_purchase invalid_minutes | {json.dumps({'sessionId': session_id, 'uid': uid, 'minutes': minutes_str})}")
+                return JSONResponse({"received": True, "error": "invalid_minutes"}, status_code=400)
+
+            seconds_to_add = minutes * 60
+            user_ref = db.collection("users").document(uid)
+            purchase_ref = user_ref.collection("purchases").document(session_id)
+
+            # トランザクション内で冪等性チェック + 加算を行う
+            @firebase_firestore.transactional
+            def add_ticket_balance_idempotent(transaction, user_ref, purchase_ref, seconds_to_add, session_id, pack_id, minutes):
+                # 1. 既処理チェック（トランザクション内で読み取り）
+                purchase_snap = purchase_ref.get(transaction=transaction)
+                if purchase_snap.exists:
+                    # 既に処理済み - 何もせず None を返す
+                    return None
+
+                # 2. ユーザー残高を読み取り
+                user_snap = user_ref.get(transaction=transaction)
+                user_data = user_snap.to_dict() if user_snap.exists else {}
+                current_balance = safe_int(user_data.get("ticketSecondsBalance"), 0)
+                new_balance = current_balance + seconds_to_add
+
+                # 3. ユーザー残高を更新
+                transaction.set(user_ref, {
+                    "ticketSecondsBalance": new_balance,
+                    "updatedAt": firebase_firestore.SERVER_TIMESTAMP,
+                }, merge=True)
+
+                # 4. 購入履歴を記録（冪等性キー）
+                transaction.set(purchase_ref, {
+                    "sessionId": session_id,
+                    "packId": pack_id,
+                    "minutes": minutes,
+                    "secondsAdded": seconds_to_add,
+                    "balanceBefore": current_balance,
+                    "balanceAfter": new_balance,
+                    "createdAt": firebase_firestore.SERVER_TIMESTAMP,
+                })
+
+                return {"balanceBefore": current_balance, "balanceAfter": new_balance}
+
+            try:
+                transaction = db.transaction()
+                result = add_ticket_balance_idempotent(transaction, user_ref, purchase_ref, seconds_to_add, session_id, pack_id, minutes)
+                invalidate_user_doc(uid)
+
+                if result is None:
+                    # 既処理（トランザクション内で検出）
+                    logger.warning(f"[stripe_webhook] ticket_purchase already_processed | {json.dumps({'sessionId': session_id, 'uid': uid})}")
+                    return JSONResponse({"received": True, "warning": "already_processed"})
+
+                # 成功
+                logger.info(f"[stripe_webhook] ticket_purchase success | {json.dumps({'sessionId': session_id, 'uid': uid, 'packId': pack_id, 'minutes': minutes, 'secondsAdded': seconds_to_add, 'balanceBefore': result['balanceBefore'], 'balanceAfter': result['balanceAfter']})}")
+                print(f"[stripe_webhook] ticket_purchase success | uid={uid} packId={pack_id} minutes={minutes} balanceBefore={result['balanceBefore']} balanceAfter={result['balanceAfter']}")
+                return JSONResponse({"received": True, "ticketSecondsAdded": seconds_to_add})
+            except Exception as e:
+                logger.exception(f"[stripe_webhook] ticket_purchase FAILED | {json.dumps({'sessionId': session_id, 'uid': uid, 'error': str(e)})}")
+                return JSONResponse({"received": True, "error": "ticket_update_failed"}, status_code=500)
+
+        # サブスクリプション購入の場合: 既存処理
+        user_updates = {
+            "updatedAt": firebase_firestore.SERVER_TIMESTAMP,
+        }
+        if customer_id:
+            user_updates["stripeCustomerId"] = customer_id
+        if subscription_id:
+            user_updates["stripeSubscriptionId"] = subscription_id
+
+        try:
+            db.collection("users").document(uid).set(user_updates, merge=True)
+            invalidate_user_doc(uid)
+            logger.info(f"[stripe_webhook] checkout.session.completed Firestore updated | {json.dumps({'uid': uid, 'customerId': customer_id, 'subscriptionId': subscription_id, 'fields': list(user_updates.keys())})}")
+        except Exception as e:
+            logger.exception(f"[stripe_webhook] checkout.session.completed Firestore set FAILED | {json.dumps({'uid': uid, 'customerId': customer_id, 'subscriptionId': subscription_id, 'error': str(e)})}")
+            return JSONResponse({"received": True, "error": "firestore_update_failed"}, status_code=500)
+
+        return JSONResponse({"received": True})
+
+    # サブスクリプション関連イベント
+    if event_type in ["customer.subscription.created", "customer.subscription.updated", "customer.subscription.deleted"]:
+        subscription = event["data"]["object"]
+        metadata = subscription.get("metadata") or {}
+        uid = metadata.get("uid")
+        customer_id = subscription.get("customer")
+
+        if not uid:
+            logger.warning(f"Subscription event without uid metadata | {json.dumps({'eventType': event_type, 'subscriptionId': subscription.get('id')})}")
+            # customer_idからuidを逆引きする試み
+            if customer_id:
+                users_query = db.collection("users").where("stripeCustomerId", "==", customer_id).limit(1)
+                for user_doc in users_query.stream():
+                    uid = user_doc.id
+                    break
+
+        if not uid:
+            logger.error(f"Cannot determine uid from subscription event | {json.dumps({'eventType': event_type})}")
+            return JSONResponse({"received": True, "warning": "uid_not_found"})
+
+        status = subscription.get("status", "")
+        current_period_end = subscription.get("current_period_end")
+        cancel_at_period_end = subscription.get("cancel_at_period_end", False)
+
+        # customer.subscription.deleted の場合は明示的に free に戻す
+        if event_type == "customer.subscription.deleted":
+            plan = "free"
+            status = "canceled"
+            cancel_at_period_end = False
+            logger.info(f"[stripe_webhook] Subscription deleted, resetting to free | {json.dumps({'uid': uid, 'subscriptionId': subscription.get('id')})}")
+        # ステータスに応じてプラン設定
+        # active または trialing の場合は pro、それ以外は free
+        elif status in ("active", "trialing"):
+            plan = "pro"
+        else:
+            plan = "free"
+
+        plan_config = resolve_plan_config(plan)
+
+        user_updates = {
+            "plan": plan,
+            "quotaSeconds": plan_config["quotaSeconds"],
+            "retentionDays": plan_config["retentionDays"],
+            "subscriptionStatus": status,
+            "cancelAtPeriodEnd": cancel_at_period_end,
+            "updatedAt": firebase_firestore.SERVER_TIMESTAMP,
+        }
+
+        if customer_id:
+            user_updates["stripeCustomerId"] = customer_id
+        if current_period_end:
+            user_updates["currentPeriodEnd"] = datetime.fromtimestamp(current_period_end, tz=timezone.utc)
+
+        db.collection("users").document(uid).set(user_updates, merge=True)
+        invalidate_user_doc(uid)
+        logger.info(f"[stripe_webhook] User plan updated from subscription event | {json.dumps({'uid': uid, 'plan': plan, 'status': status, 'cancelAtPeriodEnd': cancel_at_period_end})}")
+        print(f"[stripe_webhook] User plan updated | uid={uid} plan={plan} status={status} cancelAtPeriodEnd={cancel_at_period_end}")
+
+    # 支払い成功
+    elif event_type == "invoice.paid":
+        invoice = event["data"]["object"]
+        customer_id = invoice.get("customer")
+        subscription_id = invoice.get("subscription")
+
+        if customer_id:
+            # customer_idからuidを取得
+            users_query = db.collection("users").where("stripeCustomerId", "==", customer_id).limit(1)
+            for user_doc in users_query.stream():
+                uid = user_doc.id
+                logger.info(f"[stripe_webhook] Invoice paid for uid: {uid} | {json.dumps({'uid': uid, 'invoiceId': invoice.get('id')})}")
+                print(f"[stripe_webhook] Invoice paid | uid={uid} invoiceId={invoice.get('id')}")
+                # 必要に応じて追加処理（通知等）
+                break
+
+    # 支払い失敗
+    elif event_type == "invoice.payment_failed":
+        invoice = event["data"]["object"]
+        customer_id = invoice.get("customer")
+
+        if customer_id:
+            users_query = db.collection("users").where("stripeCustomerId", "==", customer_id).limit(1)
+            for user_doc in users_query.stream():
+                uid = user_doc.id
+                # subscriptionStatus を past_due に更新（plan は即 free にしない方針）
+                db.collection("users").document(uid).set({
+                    "subscriptionStatus": "past_due",
+                    "updatedAt": firebase_firestore.SERVER_TIMESTAMP,
+                }, merge=True)
+                invalidate_user_doc(uid)
+                logger.warning(f"[stripe_webhook] Invoice payment failed for uid: {uid} | {json.dumps({'uid': uid, 'invoiceId': invoice.get('id')})}")
+                print(f"[stripe_webhook] Invoice payment failed | uid={uid} invoiceId={invoice.get('id')} subscriptionStatus=past_due")
+                break
+
+    return JSONResponse({"received": True})
+
+
+# ========== Ticket Purchase API ==========
+# Allowed ticket minutes (UI options)
+ALLOWED_TICKET_MINUTES = [120, 240, 360, 1200, 1800, 3000]
+
+# Ticket pack definitions (packId -> minutes, JPY price)
+# Price ID is resolved from STRIPE_TICKET_PRICE_MAP_JSON or price_T{minutes} env
+TICKET_PACKS = {
+    "t120": {"minutes": 120, "price_jpy": 1440},
+    "t240": {"minutes": 240, "price_jpy": 2440},
+    "t360": {"minutes": 360, "price_jpy": 3240},
+    "t1200": {"minutes": 1200, "price_jpy": 9600},
+    "t1800": {"minutes": 1800, "price_jpy": 12600},
+    "t3000": {"minutes": 3000, "price_jpy": 21000},
+}
+
+# Cache for parsed JSON map
+_ticket_price_map_cache: dict | None = None
+
+
+def _get_ticket_price_map() -> dict:
+    """Parse STRIPE_TICKET_PRICE_MAP_JSON and cache the result."""
+    global _ticket_price_map_cache
+    if _ticket_price_map_cache is not None:
+        return _ticket_price_map_cache
+
+    json_str = os.getenv("STRIPE_TICKET_PRICE_MAP_JSON")
+    if json_str:
+        try:
+            data = json.loads(json_str)
+            _ticket_price_map_cache = data.get("packs", {})
+            logger.info(f"Loaded STRIPE_TICKET_PRICE_MAP_JSON with {len(_ticket_price_map_cache)} packs")
+            return _ticket_price_map_cache
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse STRIPE_TICKET_PRICE_MAP_JSON: {e}")
+
+    _ticket_price_map_cache = {}
+    return _ticket_price_map_cache
+
+
+def get_ticket_price_id(pack_id: str, minutes: int) -> str | None:
+    """
+    Get Stripe Price ID for ticket pack.
+    Priority (canonical first):
+    1. price_T{minutes} env var (canonical - highest priority)
+    2. STRIPE_TICKET_PRICE_MAP_JSON (JSON map fallback)
+    3. STRIPE_TICKET_{minutes}_PRICE_ID (legacy fallback)
+    """
+    canonical_key = f"price_T{minutes}"
+
+    # 1. Canonical env var: price_T{minutes} (highest priority)
+    price_id = os.getenv(canonical_key)
+    if price_id:
+        return price_id
+
+    # 2. Fallback: STRIPE_TICKET_PRICE_MAP_JSON
+    price_map = _get_ticket_price_map()
+    if pack_id in price_map:
+        price_id = price_map[pack_id].get("priceId")
+        if price_id:
+            logger.warning(
+                f"Using STRIPE_TICKET_PRICE_MAP_JSON for {pack_id}, "
+                f"please migrate to env var {canonical_key}"
+            )
+            return price_id
+
+    # 3. Legacy fallback: STRIPE_TICKET_{minutes}_PRICE_ID
+    legacy_key = f"STRIPE_TICKET_{minutes}_PRICE_ID"
+    price_id = os.getenv(legacy_key)
+    if price_id:
+        logger.warning(f"Using legacy env var {legacy_key}, please migrate to {canonical_key}")
+        return price_id
+
+    return None
+
+
+@app.post("/api/v1/billing/stripe/tickets/checkout")
+async def create_ticket_checkout_session(request: Request) -> JSONResponse:
+    """Stripe Checkout Session for ticket purchase (one-time payment)"""
+    uid = await require_uid(request)
+    body = await request.json()
+    pack_id = body.get("packId")
+    success_url = body.get("successUrl", "https://example.com/success")
+    cancel_url = body.get("cancelUrl", "https://example.com/cancel")
+
+    if pack_id not in TICKET_PACKS:
+        raise HTTPException(status_code=400, detail="invalid_pack_id")
+
+    pack = TICKET_PACKS[pack_id]
+    minutes = pack["minutes"]
+
+    # Validate minutes is in allowed list
+    if minutes not in ALLOWED_TICKET_MINUTES:
+        logger.error(f"Invalid ticket minutes: {minutes} (allowed: {ALLOWED_TICKET_MINUTES})")
+        raise HTTPException(status_code=400, detail="invalid_ticket_minutes")
+
+    # Check if user is Pro (only Pro users can buy tickets)
+    db = get_firestore_client()
+    user_data = await run_blocking(get_user_doc, db, uid) or {}
+    user_plan = user_data.get("plan", "free")
+
+    if user_plan != "pro":
+        raise HTTPException(status_code=403, detail="pro_required")
+
+    # Get Price ID from JSON map or env var
+    price_id = get_ticket_price_id(pack_id, minutes)
+    if not price_id:
+        env_key = f"price_T{minutes}"
+        logger.error(f"Ticket price ID not configured | pack_id={pack_id} env_key={env_key}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"ticket_price_not_configured: {pack_id} (env: {env_key})"
+        )
+
+    secret_key = os.getenv("STRIPE_SECRET_KEY")
+    if not secret_key:
+        raise HTTPException(status_code=500, detail="stripe_not_configured")
+
+    stripe.api_key = secret_key
+
+    try:
+        session = await run_blocking(
+            stripe.checkout.Session.create,
+            mode="payment",
+            payment_method_types=["card"],
+            line_items=[{"price": price_id, "quantity": 1}],
+            client_reference_id=uid,
+            metadata={
+                "uid": uid,
+                "packId": pack_id,
+                "minutes": pack["minutes"],
+                "type": "ticket_purchase",
+            },
+            success_url=success_url,
+            cancel_url=cancel_url,
+        )
+        logger.info(f"Ticket checkout session created | uid={uid} packId={pack_id} sessionId={session.id}")
+        return JSONResponse({"sessionId": session.id, "url": session.url})
+    except Exception as e:
+        logger.error(f"Ticket checkout session creation failed: {e}")
+        raise HTTPException(status_code=500, detail=f"checkout_failed: {str(e)}")
+
+
+# ========== Dictionary API ==========
+DICTIONARY_LIMIT_FREE = 10
+DICTIONARY_LIMIT_PRO = 1000
+
+
+# users/{uid} に保持するエントリ数。追加/削除/一括登録と同じ書き込みで更新し、サブコレクションを数え直さない
+DICTIONARY_COUNT_FIELD = "dictionaryCount"
+
+
+# 追加/更新/削除/一括登録のたびに進める。一覧の ETag とスナップショットの照合に使う
+DICTIONARY_VERSION_FIELD = "dictionaryVersion"
+# CSV 一括登録が確保したまだコミットしていない枠。件数とは別に持つので、件数の修復（repair）が巻き戻さない
+DICTIONARY_RESERVED_FIELD = "dictionaryReserved"
+DICTIONARY_RESERVED_AT_FIELD = "dictionaryReservedAt"
+# 予約からこの秒数を過ぎても残っている枠は、途中で落ちたインポートのものとみなして数えない
+DICTIONARY_RESERVATION_TTL_SECONDS = float(os.getenv("DICTIONARY_RESERVATION_TTL_SECONDS", "900"))
+DICTIONARY_SNAPSHOT_ENABLED = parse_bool(os.getenv("DICTIONARY_SNAPSHOT_ENABLED", "1"))
+DICTIONARY_SNAPSHOT_TTL_SECONDS = float(os.getenv("DICTIONARY_SNAPSHOT_TTL_SECONDS", "600"))
+DICTIONARY_SNAPSHOT_MAX_ENTRIES = int(os.getenv("DICTIONARY_SNAPSHOT_MAX_ENTRIES", "1000"))
+DICTIONARY_SNAPSHOT_MAX_BYTES = int(os.getenv("DICTIONARY_SNAPSHOT_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_dictionary_snapshot_cache = LRUTTLCache(
+    DICTIONARY_SNAPSHOT_MAX_ENTRIES, DICTIONARY_SNAPSHOT_MAX_BYTES, DICTIONARY_SNAPSHOT_TTL_SECONDS
+)
+_dictionary_snapshot_stats = {"builds": 0, "notModified": 0}
+
+DICTIONARY_PAGE_MAX_LIMIT = int(os.getenv("DICTIONARY_PAGE_MAX_LIMIT", str(DICTIONARY_LIMIT_PRO)))
+DICTIONARY_PREFIX_MAX_CHARS = 100
+# 一覧で返すフィールドだけを読む（projection）
+DICTIONARY_LIST_FIELDS = ["source", "target", "note", "createdAt"]
+
+
+def dictionary_limit_for_plan(plan: str | None) -> int:
+    return DICTIONARY_LIMIT_PRO if plan == "pro" else DICTIONARY_LIMIT_FREE
+
+
+def count_dictionary_entries(dict_ref, transaction=None) -> int:
+    """Server-side count aggregation (billed per 1000 entries, not per document)."""
+    result = dict_ref.count().get(transaction=transaction)
+    return int(result[0][0].value)
+
+
+def stored_dictionary_count(user_data: dict) -> int | None:
+    count = user_data.get(DICTIONARY_COUNT_FIELD)
+    if isinstance(count, int) and not isinstance(count, bool) and count >= 0:
+        return count
+    return None
+
+
+def active_dictionary_reservation(user_data: dict, now: float | None = None) -> int:
+    """Slots held by in-flight CSV imports (0 once the reservation is older than the TTL)."""
+    reserved = user_data.get(DICTIONARY_RESERVED_FIELD)
+    reserved_at = user_data.get(DICTIONARY_RESERVED_AT_FIELD)
+    if not isinstance(reserved, int) or isinstance(reserved, bool) or reserved <= 0:
+        return 0
+    now = time.time() if now is None else now
+    if not isinstance(reserved_at, (int, float)) or now - reserved_at > DICTIONARY_RESERVATION_TTL_SECONDS:
+        return 0
+    return reserved
+
+
+def dictionary_version(user_data: dict) -> int:
+    version = user_data.get(DICTIONARY_VERSION_FIELD)
+    return version if isinstance(version, int) and not isinstance(version, bool) else 0
+
+
+def dictionary_item(doc) -> dict:
+    data = doc.to_dict() or {}
+    return {
+        "id": doc.id,
+        "source": data.get("source", ""),
+        "target": data.get("target", ""),
+        "note": data.get("note", ""),
+        "createdAt": data.get("createdAt").isoformat() if data.get("createdAt") else None,
+    }
+
+
+def get_dictionary_snapshot(db, uid: str, version: int) -> list[dict]:
+    """All entries (newest first) for the given dictionary version; rebuilt only when the version moves."""
+    if DICTIONARY_SNAPSHOT_ENABLED:
+        cached = _dictionary_snapshot_cache.get(uid)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+    dict_ref = db.collection("users").document(uid).collection("dictionary")
+    items = [dictionary_item(doc) for doc in dict_ref.select(DICTIONARY_LIST_FIELDS).stream()]
+    items.sort(key=lambda item: dictionary_sort_key(item, None), reverse=True)
+    _dictionary_snapshot_stats["builds"] += 1
+    if DICTIONARY_SNAPSHOT_ENABLED:
+        _dictionary_snapshot_cache.set(uid, (version, items))
+    return items
+
+
+def dictionary_sort_key(item: dict, prefix: str | None) -> tuple[str, str]:
+    # 通常は createdAt 降順、prefix 検索時は source 昇順。どちらもドキュメント ID で同順位を分ける
+    if prefix:
+        return item["source"], item["id"]
+    return item["createdAt"] or "", item["id"]
+
+
+def encode_dictionary_cursor(item: dict, prefix: str | None) -> str:
+    """Opaque keyset cursor: the sort value of the last item plus its document id."""
+    value, doc_id = dictionary_sort_key(item, prefix)
+    payload = {"k": "source" if prefix else "createdAt", "v": value, "i": doc_id}
+    if prefix:
+        payload["p"] = prefix
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_dictionary_cursor(cursor: str, prefix: str | None) -> tuple[str, str]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        kind, value, doc_id = payload["k"], payload["v"], payload["i"]
+    except Exception:
+        raise HTTPException(status_code=400, detail={"reason": "Invalid cursor"})
+    if (
+        kind != ("source" if prefix else "createdAt")
+        or payload.get("p") != (prefix or None)
+        or not isinstance(value, str)
+        or not isinstance(doc_id, str)
+        or not doc_id
+    ):
+        raise HTTPException(status_code=400, detail={"reason": "Invalid cursor"})
+    return value, doc_id
+
+
+def page_from_snapshot(snapshot: list[dict], limit: int, position: tuple[str, str] | None, prefix: str | None) -> list[dict]:
+    """limit + 1 items after position, in the same order the Firestore query would return them."""
+    if prefix:
+        items = sorted(
+            (item for item in snapshot if item["source"].startswith(prefix)),
+            key=lambda item: dictionary_sort_key(item, prefix),
+        )
+        if position:
+            items = [item for item in items if dictionary_sort_key(item, prefix) > position]
+    else:
+        items = snapshot
+        if position:
+            items = [item for item in items if dictionary_sort_key(item, None) < position]
+    return items[:limit + 1]
+
+
+def query_dictionary_page(dict_ref, limit: int, position: tuple[str, str] | None, prefix: str | None) -> list[dict]:
+    """One keyset query (no cursor document read); used when the snapshot is disabled."""
+    query = dict_ref.select(DICTIONARY_LIST_FIELDS)
+    if prefix:
+        query = (
+            query.where("source", ">=", prefix)
+            .where("source", "<", prefix + "\uf8ff")
+            .order_by("source")
+            .order_by("__name__")
+        )
+    else:
+        direction = firebase_firestore.Query.DESCENDING
+        query = query.order_by("createdAt", direction=direction).order_by("__name__", direction=direction)
+    if position:
+        value, doc_id = position
+        if prefix:
+            query = query.start_after({"source": value, "__name__": doc_id})
+        else:
+            try:
+                created_at = datetime.fromisoformat(value)
+            except ValueError:
+                raise HTTPException(status_code=400, detail={"reason": "Invalid cursor"})
+            query = query.start_after({"createdAt": created_at, "__name__": doc_id})
+    return [dictionary_item(doc) for doc in query.limit(limit + 1).stream()]
+
+
+def invalidate_dictionary_snapshot(uid: str) -> None:
+    # 用語集の成果物もスナップショットから作るので一緒に捨てる
+    _dictionary_snapshot_cache.pop(uid)
+    _dictionary_glossary_cache.pop(uid)
+
+
+def get_dictionary_snapshot_stats() -> dict:
+    return dict(
+        _dictionary_snapshot_stats,
+        enabled=DICTIONARY_SNAPSHOT_ENABLED,
+        cache=_dictionary_snapshot_cache.stats(),
+    )
+
+
+# ========== Dictionary glossary ==========
+# 辞書を用語集テキストに変換した成果物。辞書のバージョンごとに一度だけ作り、/token と /summarize が参照する
+DICTIONARY_GLOSSARY_PERSIST = parse_bool(os.getenv("DICTIONARY_GLOSSARY_PERSIST", "0"))
+DICTIONARY_GLOSSARY_CACHE_TTL_SECONDS = float(os.getenv("DICTIONARY_GLOSSARY_CACHE_TTL_SECONDS", "600"))
+DICTIONARY_GLOSSARY_CACHE_MAX_ENTRIES = int(os.getenv("DICTIONARY_GLOSSARY_CACHE_MAX_ENTRIES", "1000"))
+DICTIONARY_GLOSSARY_CACHE_MAX_BYTES = int(os.getenv("DICTIONARY_GLOSSARY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_dictionary_glossary_cache = LRUTTLCache(
+    DICTIONARY_GLOSSARY_CACHE_MAX_ENTRIES, DICTIONARY_GLOSSARY_CACHE_MAX_BYTES, DICTIONARY_GLOSSARY_CACHE_TTL_SECONDS
+)
+_dictionary_glossary_stats = {"builds": 0, "persistedHits": 0, "persistErrors": 0, "staleReferences": 0}
+
+
+def dictionary_glossary_entries(items: list[dict]) -> list[list[str]]:
+    entries = []
+    for item in items:
+        # 用語集は 1 行 1 エントリで "=" を区切りに使うので、改行は空白に寄せ、"=" を含む原語は入れない
+        source = " ".join(item.get("source", "").split())
+        target = " ".join(item.get("target", "").split())
+        if source and target and "=" not in source and not source.startswith("#"):
+            entries.append([source, target])
+    return entries
+
+
+def get_dictionary_glossary(db, uid: str) -> dict:
+    """{"version", "entries"} for the user's current dictionary: memory, then the persisted artifact, then a build."""
+    user_data = get_user_doc(db, uid) or {}
+    version = dictionary_version(user_data)
+    cached = _dictionary_glossary_cache.get(uid)
+    if cached is not None and cached["version"] == version:
+        return cached
+
+    artifact = None
+    artifact_ref = db.collection("users").document(uid).collection("glossary").document("compiled")
+    if DICTIONARY_GLOSSARY_PERSIST:
+        snap = artifact_ref.get()
+        data = snap.to_dict() if snap.exists else None
+        if data and data.get("version") == version and isinstance(data.get("entries"), list):
+            artifact = {"version": version, "entries": data["entries"]}
+            _dictionary_glossary_stats["persistedHits"] += 1
+
+    if artifact is None:
+        entries = dictionary_glossary_entries(get_dictionary_snapshot(db, uid, version))
+        artifact = {"version": version, "entries": entries}
+        _dictionary_glossary_stats["builds"] += 1
+        if DICTIONARY_GLOSSARY_PERSIST:
+            try:
+                artifact_ref.set({
+                    "version": version,
+                    "entries": entries,
+                    "compiledAt": firebase_firestore.SERVER_TIMESTAMP,
+                })
+            except Exception as exc:  # noqa: BLE001
+                _dictionary_glossary_stats["persistErrors"] += 1
+                logger.warning(f"Dictionary glossary persist failed | uid={uid} error={exc}")
+
+    _dictionary_glossary_cache.set(uid, artifact)
+    return artifact
+
+
+def merge_glossary_text(dictionary_entries: list[list[str]], client_text: str | None) -> str:
+    """Client (ad-hoc) entries first so they override the dictionary and survive token-budget pruning."""
+    client_entries = parse_glossary_text(client_text, max_lines=GLOSSARY_MAX_LINES)
+    overridden = {normalize_glossary_term(source) for source, _ in client_entries}
+    lines = [f"{source} => {target}" for source, target in client_entries]
+    lines.extend(
+        f"{source} => {target}"
+        for source, target in dictionary_entries
+        if normalize_glossary_term(source) not in overridden
+    )
+    return "\n".join(lines)
+
+
+async def resolve_request_glossary(uid: str, client_text: str | None, glossary_version: str | None):
+    """
+    glossaryVersion を指定されたら、ユーザー辞書の用語集とクライアントの用語集をマージしてコンパイルする
+    Returns (CompiledGlossary, dictionary_version or None). サーバーには最新版しかないので、古い版の指定は最新版で置き換える
+    """
+    glossary_version = (glossary_version or "").strip()
+    if not glossary_version:
+        return compile_glossary(client_text), None
+    artifact = await run_blocking(get_dictionary_glossary, get_firestore_client(), uid)
+    if glossary_version not in ("latest", str(artifact["version"])):
+        _dictionary_glossary_stats["staleReferences"] += 1
+        logger.info(f"Stale glossaryVersion | uid={uid} requested={glossary_version} current={artifact['version']}")
+    merged = merge_glossary_text(artifact["entries"], client_text)
+    return compile_glossary(merged, max_lines=DICTIONARY_GLOSSARY_MAX_LINES), artifact["version"]
+
+
+def get_dictionary_glossary_stats() -> dict:
+    return dict(
+        _dictionary_glossary_stats,
+        persist=DICTIONARY_GLOSSARY_PERSIST,
+        cache=_dictionary_glossary_cache.stats(),
+    )
+
+
+def dictionary_etag(uid: str, version: int, *parts) -> str:
+    digest = hashlib.sha256(json.dumps([uid, version, *parts], default=str).encode("utf-8")).hexdigest()[:16]
+    return f'"dict-{version}-{digest}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def ensure_dictionary_count(db, uid: str, user_data: dict) -> int:
+    """Maintained counter; users created before it existed are counted once and backfilled."""
+    count = stored_dictionary_count(user_data)
+    if count is not None:
+        return count
+    return run_dictionary_transaction(db, _backfill_dictionary_count_core, uid)["count"]
+
+
+def run_dictionary_transaction(db, core, *args):
+    """Run core(db, *args, transaction=...) in a Firestore transaction (directly with the mock client)."""
+    # 【セキュリティガード】本番環境では simplified transaction を使わない
+    if not IS_PRODUCTION and os.getenv("DEBUG_AUTH_BYPASS") == "1":
+        result = core(db, *args)
+    else:
+        @firebase_firestore.transactional
+        def run(transaction):
+            return core(db, *args, transaction=transaction)
+
+        result = run(db.transaction(max_attempts=10))
+    invalidate_user_doc(args[0])
+    invalidate_dictionary_snapshot(args[0])
+    return result
+
+
+def read_in_transaction(doc_ref, transaction=None):
+    if transaction is not None:
+        return doc_ref.get(transaction=transaction)
+    return doc_ref.get()
+
+
+def write_in_transaction(transaction, doc_ref, data: dict, merge: bool = False) -> None:
+    if transaction is not None:
+        transaction.set(doc_ref, data, merge=merge)
+    else:
+        doc_ref.set(data, merge=merge)
+
+
+def _backfill_dictionary_count_core(db, uid: str, transaction=None) -> dict:
+    user_ref = db.collection("users").document(uid)
+    user_snap = read_in_transaction(user_ref, transaction)
+    user_data = user_snap.to_dict() if user_snap.exists else {}
+    count = stored_dictionary_count(user_data)
+    if count is None:
+        count = count_dictionary_entries(user_ref.collection("dictionary"), transaction)
+        write_in_transaction(transaction, user_ref, {DICTIONARY_COUNT_FIELD: count}, merge=True)
+    return {"count": count}
+
+
+def _repair_dictionary_count_core(db, uid: str, transaction=None) -> dict:
+    # 実行中のインポートの予約（dictionaryReserved）には触れない。件数はコミット済みのエントリだけを数える
+    user_ref = db.collection("users").document(uid)
+    user_snap = read_in_transaction(user_ref, transaction)
+    user_data = user_snap.to_dict() if user_snap.exists else {}
+    stored = user_data.get(DICTIONARY_COUNT_FIELD)
+    actual = count_dictionary_entries(user_ref.collection("dictionary"), transaction)
+    repaired = stored != actual
+    if repaired:
+        write_in_transaction(transaction, user_ref, {DICTIONARY_COUNT_FIELD: actual}, merge=True)
+    return {"uid": uid, "stored": stored, "actual": actual, "repaired": repaired}
+
+
+def repair_dictionary_counts(db, uids: list[str]) -> dict:
+    results = []
+    errors = 0
+    for uid in uids:
+        try:
+            results.append(run_dictionary_transaction(db, _repair_dictionary_count_core, uid))
+        except Exception as exc:  # noqa: BLE001
+            errors += 1
+            logger.error(f"Dictionary count repair failed | {json.dumps({'uid': uid, 'error': str(exc)})}")
+    drifted = [item for item in results if item["repaired"]]
+    for item in drifted:
+        logger.warning(f"Dictionary count repaired | {json.dumps(item, default=str)}")
+    return {"scanned": len(results), "repaired": len(drifted), "errors": errors, "drifted": drifted}
+
+
+def list_dictionary_page(
+    uid: str, limit: int, cursor: str | None, if_none_match: str | None = None, prefix: str | None = None
+):
+    """
+    Returns (etag, page). page is None when if_none_match already matches the current version,
+    in which case only users/{uid} was read.
+    """
+    limit = max(1, min(limit, DICTIONARY_PAGE_MAX_LIMIT))
+    prefix = (prefix or "").strip() or None
+    if prefix and len(prefix) > DICTIONARY_PREFIX_MAX_CHARS:
+        raise HTTPException(status_code=400, detail={"reason": f"prefix must be at most {DICTIONARY_PREFIX_MAX_CHARS} characters"})
+    position = decode_dictionary_cursor(cursor, prefix) if cursor else None
+
     db = get_firestore_client()
+    # ETag の元になる版は毎回読む（他インスタンスの書き込みを users/{uid} キャッシュの TTL の間見逃さないように）
+    user_snap = db.collection("users").document(uid).get(
+        field_paths=["plan", DICTIONARY_COUNT_FIELD, DICTIONARY_VERSION_FIELD]
+    )
+    user_data = (user_snap.to_dict() if user_snap.exists else None) or {}
+    user_limit = dictionary_limit_for_plan(user_data.get("plan", "free"))
+    total_count = ensure_dictionary_count(db, uid, user_data)
+    version = dictionary_version(user_data)
+    etag = dictionary_etag(uid, version, limit, cursor, prefix, user_limit, total_count)
+    if etag_matches(if_none_match, etag):
+        _dictionary_snapshot_stats["notModified"] += 1
+        return etag, None
+
+    if DICTIONARY_SNAPSHOT_ENABLED:
+        items = page_from_snapshot(get_dictionary_snapshot(db, uid, version), limit, position, prefix)
+    else:
+        dict_ref = db.collection("users").document(uid).collection("dictionary")
+        items = query_dictionary_page(dict_ref, limit, position, prefix)
+
+    has_more = len(items) > limit
+    items = items[:limit]
+    next_cursor = encode_dictionary_cursor(items[-1], prefix) if has_more and items else None
+
+    return etag, {
+        "items": items,
+        "nextCursor": next_cursor,
+        "limit": user_limit,
+        "count": total_count,
+        "version": version,
+    }
+
+
+@app.get("/api/v1/dictionary")
+async def get_dictionary(
+    request: Request, limit: int = 100, cursor: str = None, prefix: str = None
+) -> Response:
+    """Get user's dictionary entries with pagination (If-None-Match → 304 while the dictionary is unchanged)"""
+    uid = await require_uid(request)
+    etag, page = await run_blocking(
+        list_dictionary_page, uid, limit, cursor, request.headers.get("if-none-match"), prefix
+    )
+    # private: 共有キャッシュには載せない / no-cache: ブラウザは毎回 ETag で再検証する
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if page is None:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(page, headers=headers)
+
+
+@app.get("/api/v1/dictionary/glossary")
+async def get_dictionary_glossary_info(request: Request) -> JSONResponse:
+    """Current version of the glossary compiled from the user's dictionary (pass it as glossaryVersion)"""
+    uid = await require_uid(request)
+    artifact = await run_blocking(get_dictionary_glossary, get_firestore_client(), uid)
+    return JSONResponse({"version": artifact["version"], "entries": len(artifact["entries"])})
+
+
+def _add_dictionary_entry_core(db, uid: str, entry: dict, transaction=None) -> dict:
     user_ref = db.collection("users").document(uid)
-    user_snap = user_ref.get()
+    dict_ref = user_ref.collection("dictionary")
+    user_snap = read_in_transaction(user_ref, transaction)
     user_data = user_snap.to_dict() if user_snap.exists else {}
 
-    plan = normalize_plan(user_data.get("plan"))
-    subscription_status = user_data.get("subscriptionStatus", "free")
-    cancel_at_period_end = user_data.get("cancelAtPeriodEnd", False)
-    current_period_end = user_data.get("currentPeriodEnd")
-    is_pro = plan == "pro"
-
-    # Stripe fallback: currentPeriodEnd が Firestore に無い場合、Stripe から取得してバックフィル
-    if not current_period_end and is_pro:
-        subscription_id = user_data.get("stripeSubscriptionId")
-        if subscription_id:
-            try:
-                secret_key = os.getenv("STRIPE_SECRET_KEY")
-                if secret_key:
-                    stripe.api_key = secret_key
-                    sub = stripe.Subscription.retrieve(subscription_id)
-                    cpe = sub.get("current_period_end")
-                    if cpe:
-                        current_period_end = datetime.fromtimestamp(cpe, tz=timezone.utc)
-                        user_ref.set({"currentPeriodEnd": current_period_end}, merge=True)
-                        logger.info(f"[billing_status] Backfilled currentPeriodEnd from Stripe | uid={uid}")
-            except Exception as e:
-                logger.warning(f"[billing_status] Stripe fallback failed | uid={uid} error={e}")
+    # Check limit
+    user_limit = dictionary_limit_for_plan(user_data.get("plan", "free"))
+    current_count = stored_dictionary_count(user_data)
+    if current_count is None:
+        current_count = count_dictionary_entries(dict_ref, transaction)
+    if current_count + active_dictionary_reservation(user_data) >= user_limit:
+        raise HTTPException(status_code=400, detail={"reason": f"Dictionary limit reached ({user_limit})"})
 
-    # currentPeriodEnd を ISO 文字列に変換
-    current_period_end_iso = None
-    current_period_end_unix = None
-    if current_period_end:
-        if hasattr(current_period_end, "isoformat"):
-            current_period_end_iso = current_period_end.isoformat()
-            current_period_end_unix = int(current_period_end.timestamp())
-        elif isinstance(current_period_end, (int, float)):
-            current_period_end_unix = int(current_period_end)
-            current_period_end_iso = datetime.fromtimestamp(current_period_end, tz=timezone.utc).isoformat()
+    # Add entry（エントリとカウンタを同じトランザクションで書く）
+    entry_ref = dict_ref.document()
+    write_in_transaction(transaction, entry_ref, dict(entry, createdAt=firebase_firestore.SERVER_TIMESTAMP))
+    write_in_transaction(transaction, user_ref, {
+        DICTIONARY_COUNT_FIELD: current_count + 1,
+        DICTIONARY_VERSION_FIELD: dictionary_version(user_data) + 1,
+    }, merge=True)
+    return {"id": entry_ref.id, "count": current_count + 1, "limit": user_limit}
 
-    response = {
-        "plan": plan,
-        "subscriptionStatus": subscription_status,
-        "cancelAtPeriodEnd": cancel_at_period_end,
-        "currentPeriodEnd": current_period_end_iso,
-        "currentPeriodEndUnix": current_period_end_unix,
-        "isPro": is_pro,
-        "isPastDue": subscription_status == "past_due",
-        "isCanceling": cancel_at_period_end and is_pro,
-    }
 
-    logger.info(f"[billing_status] GET | {json.dumps({'uid': uid, 'plan': plan, 'status': subscription_status})}")
-    return JSONResponse(response)
+def insert_dictionary_entry(uid: str, source: str, target: str, note: str) -> dict:
+    db = get_firestore_client()
+    entry = {"source": source, "target": target, "note": note}
+    result = run_dictionary_transaction(db, _add_dictionary_entry_core, uid, entry)
+    logger.info(f"Dictionary entry added | uid={uid} id={result['id']}")
+    return result
 
 
-@app.post("/api/v1/billing/stripe/portal")
-async def create_portal_session(request: Request) -> JSONResponse:
-    """Stripe Customer Portal Session 作成（サブスク管理用）"""
-    uid = get_uid_from_request(request)
+@app.post("/api/v1/dictionary/entry")
+async def add_dictionary_entry(request: Request) -> JSONResponse:
+    """Add a new dictionary entry"""
+    uid = await require_uid(request)
     body = await request.json()
-    return_url = body.get("returnUrl", "https://example.com")
+    source = (body.get("source") or "").strip()
+    target = (body.get("target") or "").strip()
+    note = (body.get("note") or "").strip()
 
-    secret_key = os.getenv("STRIPE_SECRET_KEY")
-    if not secret_key:
-        raise HTTPException(status_code=500, detail="stripe_not_configured")
+    if not source or not target:
+        raise HTTPException(status_code=400, detail={"reason": "source and target are required"})
 
-    stripe.api_key = secret_key
+    return JSONResponse(await run_blocking(insert_dictionary_entry, uid, source, target, note))
 
-    # uidからStripe Customer IDを取得
+
+def replace_dictionary_entry(uid: str, entry_id: str, source: str, target: str, note: str) -> dict:
     db = get_firestore_client()
     user_ref = db.collection("users").document(uid)
-    user_snap = user_ref.get()
+    entry_ref = user_ref.collection("dictionary").document(entry_id)
+    entry_snap = entry_ref.get()
+
+    if not entry_snap.exists:
+        raise HTTPException(status_code=404, detail={"reason": "Entry not found"})
+
+    batch = db.batch()
+    batch.update(entry_ref, {
+        "source": source,
+        "target": target,
+        "note": note,
+        "updatedAt": firebase_firestore.SERVER_TIMESTAMP,
+    })
+    batch.set(user_ref, {DICTIONARY_VERSION_FIELD: firebase_firestore.Increment(1)}, merge=True)
+    batch.commit()
+    invalidate_user_doc(uid)
+    invalidate_dictionary_snapshot(uid)
+    logger.info(f"Dictionary entry updated | uid={uid} id={entry_id}")
+
+    return {"id": entry_id, "updated": True}
+
+
+@app.put("/api/v1/dictionary/entry/{entry_id}")
+async def update_dictionary_entry(request: Request, entry_id: str) -> JSONResponse:
+    """Update a dictionary entry"""
+    uid = await require_uid(request)
+    body = await request.json()
+    source = (body.get("source") or "").strip()
+    target = (body.get("target") or "").strip()
+    note = (body.get("note") or "").strip()
+
+    if not source or not target:
+        raise HTTPException(status_code=400, detail={"reason": "source and target are required"})
+
+    return JSONResponse(await run_blocking(replace_dictionary_entry, uid, entry_id, source, target, note))
+
+
+def _delete_dictionary_entry_core(db, uid: str, entry_id: str, transaction=None) -> dict:
+    user_ref = db.collection("users").document(uid)
+    dict_ref = user_ref.collection("dictionary")
+    entry_ref = dict_ref.document(entry_id)
+    entry_snap = read_in_transaction(entry_ref, transaction)
+    user_snap = read_in_transaction(user_ref, transaction)
+
+    if not entry_snap.exists:
+        raise HTTPException(status_code=404, detail={"reason": "Entry not found"})
+
     user_data = user_snap.to_dict() if user_snap.exists else {}
-    customer_id = user_data.get("stripeCustomerId")
+    current_count = stored_dictionary_count(user_data)
+    if current_count is None:
+        current_count = count_dictionary_entries(dict_ref, transaction)
+    current_count = max(0, current_count - 1)
 
-    if not customer_id:
-        logger.error(f"[stripe_portal] No Stripe customer ID for uid: {uid} | {json.dumps({'uid': uid})}")
-        raise HTTPException(status_code=400, detail="no_customer_id")
+    if transaction is not None:
+        transaction.delete(entry_ref)
+    else:
+        entry_ref.delete()
+    write_in_transaction(transaction, user_ref, {
+        DICTIONARY_COUNT_FIELD: current_count,
+        DICTIONARY_VERSION_FIELD: dictionary_version(user_data) + 1,
+    }, merge=True)
+    return {
+        "deleted": True,
+        "count": current_count,
+        "limit": dictionary_limit_for_plan(user_data.get("plan", "free")),
+    }
 
-    try:
-        session = stripe.billing_portal.Session.create(
-            customer=customer_id,
-            return_url=return_url,
-        )
-        logger.info(f"[stripe_portal] Portal session created for uid: {uid} | {json.dumps({'uid': uid, 'customerId': customer_id})}")
-        print(f"[stripe_portal] Portal session created for uid: {uid} | customerId={customer_id}")
-        return JSONResponse({"url": session.url})
-    except Exception as e:
-        logger.error(f"[stripe_portal] Stripe portal session creation failed: {e} | {json.dumps({'uid': uid, 'error': str(e)})}")
-        raise HTTPException(status_code=500, detail=f"portal_failed: {str(e)}")
 
+def remove_dictionary_entry(uid: str, entry_id: str) -> dict:
+    db = get_firestore_client()
+    result = run_dictionary_transaction(db, _delete_dictionary_entry_core, uid, entry_id)
+    logger.info(f"Dictionary entry deleted | uid={uid} id={entry_id}")
+    return result
 
-@app.post("/api/v1/billing/stripe/webhook")
-async def stripe_webhook(request: Request) -> JSONResponse:
+
+@app.delete("/api/v1/dictionary/entry/{entry_id}")
+async def delete_dictionary_entry(request: Request, entry_id: str) -> JSONResponse:
+    """Delete a dictionary entry"""
+    uid = await require_uid(request)
+    return JSONResponse(await run_blocking(remove_dictionary_entry, uid, entry_id))
+
+
+@app.get("/api/v1/dictionary/template.csv")
+async def get_dictionary_template(request: Request) -> JSONResponse:
+    """Get CSV template for dictionary upload"""
+    await require_uid(request)  # Require auth
+    csv_content = "source,target,note\n半導体,semiconductor,電子部品\n人工知能,AI,artificial intelligence"
+    return JSONResponse({"csv": csv_content, "filename": "dictionary_template.csv"})
+
+
+# Firestore のバッチは 1 コミット 500 書き込みまで。エントリ N 件 + カウンタ加算 1 件で 500 に収める
+DICTIONARY_IMPORT_BATCH_SIZE = max(1, min(int(os.getenv("DICTIONARY_IMPORT_BATCH_SIZE", "499")), 499))
+DICTIONARY_IMPORT_MAX_PARALLEL_BATCHES = int(os.getenv("DICTIONARY_IMPORT_MAX_PARALLEL_BATCHES", "4"))
+DICTIONARY_IMPORT_PREVIEW_ROWS = 20
+
+
+def open_dictionary_csv_text(csv_content: str) -> io.StringIO:
+    # newline="" にしないと、クォート内の改行や CRLF を csv モジュールが正しく扱えない
+    return io.StringIO(csv_content.removeprefix("\ufeff"), newline="")
+
+
+def plan_dictionary_import(uid: str, stream, skip_existing: bool = False) -> dict:
     """
-    Stripe Webhook ハンドラー
-    対応イベント:
-    - checkout.session.completed (subscription or ticket_purchase)
-    - customer.subscription.created/updated/deleted
-    - invoice.paid
-    - invoice.payment_failed
+    CSV（1 行目はヘッダー: source,target,note）を 1 行ずつ読み、登録するエントリを決める
+    skip_existing（差分モード）のときだけ既存の source を全件読み、辞書に既にある source とファイル内で重複した source を飛ばす
+    上限はここでは目安として数えるだけで、実際の枠は reserve_dictionary_capacity がトランザクションで確保する
     """
-    webhook_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
-    if not webhook_secret:
-        logger.error("STRIPE_WEBHOOK_SECRET is not configured")
-        raise HTTPException(status_code=500, detail="stripe_webhook_not_configured")
+    db = get_firestore_client()
+    user_ref = db.collection("users").document(uid)
+    dict_ref = user_ref.collection("dictionary")
+    user_data = get_user_doc(db, uid) or {}
+    user_limit = dictionary_limit_for_plan(user_data.get("plan", "free"))
+    current_count = ensure_dictionary_count(db, uid, user_data)
+    remaining = max(0, user_limit - current_count - active_dictionary_reservation(user_data))
+
+    known_sources = set()
+    if skip_existing and current_count:
+        known_sources = {
+            (doc.to_dict() or {}).get("source", "")
+            for doc in dict_ref.select(["source"]).stream()
+        }
 
-    sig_header = request.headers.get("Stripe-Signature")
-    if not sig_header:
-        logger.warning("Stripe webhook called without Stripe-Signature header")
-        raise HTTPException(status_code=400, detail="Missing Stripe-Signature header")
+    entries = []
+    rows = invalid = duplicates = truncated = 0
+    reader = csv.reader(stream)
+    try:
+        header = next((row for row in reader if any(cell.strip() for cell in row)), None)
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            rows += 1
+            source = row[0].strip() if row else ""
+            target = row[1].strip() if len(row) > 1 else ""
+            note = row[2].strip() if len(row) > 2 else ""
+            if not source or not target:
+                invalid += 1
+                continue
+            if skip_existing:
+                if source in known_sources:
+                    duplicates += 1
+                    continue
+                known_sources.add(source)
+            if len(entries) >= remaining:
+                truncated += 1
+                continue
+            entries.append({"source": source, "target": target, "note": note})
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail={"reason": "CSV must be UTF-8 encoded"})
+    except csv.Error as exc:
+        raise HTTPException(status_code=400, detail={"reason": f"Invalid CSV (line {reader.line_num}): {exc}"})
 
-    payload = await request.body()
+    if header is None or rows == 0:
+        raise HTTPException(status_code=400, detail={"reason": "CSV must have header and at least one data row"})
 
-    try:
-        event = stripe.Webhook.construct_event(payload, sig_header, webhook_secret)
-    except stripe.SignatureVerificationError:
-        logger.error("Stripe webhook signature verification failed")
-        raise HTTPException(status_code=400, detail="Invalid signature")
-    except ValueError:
-        logger.error("Stripe webhook invalid payload (JSON parse error)")
-        raise HTTPException(status_code=400, detail="Invalid payload")
+    return {
+        "entries": entries,
+        "rows": rows,
+        "invalidRows": invalid,
+        "duplicatesSkipped": duplicates,
+        "truncatedByLimit": truncated,
+        "count": current_count,
+        "limit": user_limit,
+    }
 
-    event_type = event.get("type", "unknown")
-    event_id = event.get("id", "unknown")
 
-    # stdout に出力（Cloud Logging で確認用）
-    print(f"[stripe_webhook] received event type={event_type} id={event_id}")
+def _reserve_dictionary_capacity_core(db, uid: str, requested: int, transaction=None) -> dict:
+    user_ref = db.collection("users").document(uid)
+    user_snap = read_in_transaction(user_ref, transaction)
+    user_data = user_snap.to_dict() if user_snap.exists else {}
+    user_limit = dictionary_limit_for_plan(user_data.get("plan", "free"))
+    updates = {}
+    current_count = stored_dictionary_count(user_data)
+    if current_count is None:
+        current_count = count_dictionary_entries(user_ref.collection("dictionary"), transaction)
+        updates[DICTIONARY_COUNT_FIELD] = current_count
+    now = time.time()
+    pending = active_dictionary_reservation(user_data, now)
+    reserved = max(0, min(requested, user_limit - current_count - pending))
+    if reserved:
+        updates.update({DICTIONARY_RESERVED_FIELD: pending + reserved, DICTIONARY_RESERVED_AT_FIELD: now})
+    if updates:
+        write_in_transaction(transaction, user_ref, updates, merge=True)
+    return {"reserved": reserved, "count": current_count, "limit": user_limit}
 
-    logger.info(f"Stripe webhook received | {json.dumps({'eventType': event_type, 'eventId': event_id})}")
 
+def reserve_dictionary_capacity(uid: str, requested: int) -> dict:
+    """Atomically claim up to requested slots under the plan limit (concurrent uploads/adds cannot overshoot)."""
+    return run_dictionary_transaction(get_firestore_client(), _reserve_dictionary_capacity_core, uid, requested)
+
+
+def release_dictionary_capacity(uid: str, released: int) -> None:
+    """Give back slots reserved for batches that failed to commit."""
     db = get_firestore_client()
+    db.collection("users").document(uid).set(
+        {DICTIONARY_RESERVED_FIELD: firebase_firestore.Increment(-released)}, merge=True
+    )
 
-    # Checkout完了イベント（購入直後のuid紐付け）
-    if event_type == "checkout.session.completed":
-        session = event["data"]["object"]
-        session_id = session.get("id")
-        client_ref_id = session.get("client_reference_id")
-        metadata = session.get("metadata") or {}
-        metadata_uid = metadata.get("uid")
-        uid = client_ref_id or metadata_uid
-        customer_id = session.get("customer")
-        subscription_id = session.get("subscription")
-        purchase_type = metadata.get("type")  # "ticket_purchase" or None (subscription)
 
-        # 抽出した全フィールドをログ出力（デバッグ用）
-        logger.info(f"[stripe_webhook] checkout.session.completed extracted | {json.dumps({'sessionId': session_id, 'clientReferenceId': client_ref_id, 'metadataUid': metadata_uid, 'uid': uid, 'customerId': customer_id, 'subscriptionId': subscription_id, 'type': purchase_type})}")
-        print(f"[stripe_webhook] checkout.session.completed | sessionId={session_id} uid={uid} type={purchase_type}")
+def commit_dictionary_batch(uid: str, entries: list[dict]) -> int:
+    """エントリの作成・件数の加算・予約の消化・版の更新を 1 つのバッチでアトミックに書く"""
+    db = get_firestore_client()
+    user_ref = db.collection("users").document(uid)
+    dict_ref = user_ref.collection("dictionary")
+    batch = db.batch()
+    for entry in entries:
+        batch.create(dict_ref.document(), dict(entry, createdAt=firebase_firestore.SERVER_TIMESTAMP))
+    batch.set(user_ref, {
+        DICTIONARY_COUNT_FIELD: firebase_firestore.Increment(len(entries)),
+        DICTIONARY_RESERVED_FIELD: firebase_firestore.Increment(-len(entries)),
+        DICTIONARY_VERSION_FIELD: firebase_firestore.Increment(1),
+    }, merge=True)
+    batch.commit()
+    return len(entries)
+
+
+async def import_dictionary_csv(uid: str, stream, dry_run: bool = False, skip_existing: bool | None = None) -> dict:
+    started = time.perf_counter()
+    if skip_existing is None:
+        # 既存 source の全件読み込みは差分モードだけ（dry-run は既定で差分を出す）
+        skip_existing = dry_run
+    plan = await run_blocking(plan_dictionary_import, uid, stream, skip_existing)
+    entries = plan.pop("entries")
+    if not dry_run and entries:
+        reservation = await run_blocking(reserve_dictionary_capacity, uid, len(entries))
+        if reservation["reserved"] < len(entries):
+            plan["truncatedByLimit"] += len(entries) - reservation["reserved"]
+            entries = entries[:reservation["reserved"]]
+        plan["count"] = reservation["count"]
+        plan["limit"] = reservation["limit"]
+    chunks = [
+        entries[offset:offset + DICTIONARY_IMPORT_BATCH_SIZE]
+        for offset in range(0, len(entries), DICTIONARY_IMPORT_BATCH_SIZE)
+    ]
 
-        if not uid:
-            logger.warning(f"[stripe_webhook] checkout.session.completed without uid | {json.dumps({'sessionId': session_id, 'customerId': customer_id, 'clientReferenceId': client_ref_id, 'metadataUid': metadata_uid})}")
-            return JSONResponse({"received": True, "warning": "uid_not_found"})
+    added = failed = 0
+    if not dry_run and chunks:
+        semaphore = asyncio.Semaphore(max(1, DICTIONARY_IMPORT_MAX_PARALLEL_BATCHES))
+
+        async def commit(chunk: list[dict]) -> int:
+            async with semaphore:
+                return await run_blocking(commit_dictionary_batch, uid, chunk)
+
+        results = await asyncio.gather(*(commit(chunk) for chunk in chunks), return_exceptions=True)
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                failed += len(chunk)
+                logger.error(f"Dictionary CSV batch failed | uid={uid} size={len(chunk)} error={result}")
+            else:
+                added += result
+        if failed:
+            await run_blocking(release_dictionary_capacity, uid, failed)
+        invalidate_user_doc(uid)
+        invalidate_dictionary_snapshot(uid)
+
+    elapsed = time.perf_counter() - started
+    result = dict(plan)
+    result.update({
+        "dryRun": dry_run,
+        "added": added,
+        "failed": failed,
+        "skipped": plan["invalidRows"] + plan["duplicatesSkipped"] + plan["truncatedByLimit"],
+        "count": plan["count"] + added,
+        "batches": len(chunks),
+        "elapsedMs": round(elapsed * 1000, 1),
+        "rowsPerSec": round(plan["rows"] / elapsed, 1) if elapsed > 0 else None,
+    })
+    if dry_run:
+        result["wouldAdd"] = len(entries)
+        result["preview"] = entries[:DICTIONARY_IMPORT_PREVIEW_ROWS]
+    warnings = []
+    if plan["truncatedByLimit"]:
+        warnings.append(f"Dictionary limit reached ({plan['limit']}): {plan['truncatedByLimit']} rows not imported")
+    if failed:
+        warnings.append(f"{failed} rows failed to save; please retry")
+    if warnings:
+        result["warning"] = " / ".join(warnings)
+
+    logger.info(
+        f"Dictionary CSV uploaded | uid={uid} dryRun={dry_run} rows={plan['rows']} added={added} "
+        f"duplicates={plan['duplicatesSkipped']} invalid={plan['invalidRows']} "
+        f"truncated={plan['truncatedByLimit']} failed={failed} batches={len(chunks)} "
+        f"rowsPerSec={result['rowsPerSec']}"
+    )
+    return result
+
+
+@app.post("/api/v1/dictionary/upload")
+async def upload_dictionary_csv(request: Request, dryRun: bool = False) -> JSONResponse:
+    """
+    Upload dictionary entries from CSV
+    multipart（file フィールド）または JSON（{"csv": "..."}）で受け付ける
+    """
+    uid = await require_uid(request)
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail={"reason": "CSV file is required"})
+        # utf-8-sig で BOM を落としつつ、ファイル全体をメモリに載せずに読む
+        stream = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+        options = form
+    else:
+        body = await request.json()
+        csv_content = body.get("csv", "")
+        if not csv_content:
+            raise HTTPException(status_code=400, detail={"reason": "CSV content is required"})
+        stream = open_dictionary_csv_text(csv_content)
+        options = body
+
+    dry_run = dryRun or parse_bool(options.get("dryRun"))
+    skip_existing = options.get("skipExisting")
+    skip_existing = None if skip_existing is None else parse_bool(skip_existing)
+    return JSONResponse(await import_dictionary_csv(uid, stream, dry_run=dry_run, skip_existing=skip_existing))
+
+
+# Language code to display name mapping for translation prompts
+LANG_NAMES = {
+    "ja": "Japanese",
+    "en": "English",
+    "zh": "Simplified Chinese",
+    "vi": "Vietnamese",
+}
+
+VALID_INPUT_LANGS = {"auto", "ja", "en", "zh", "vi"}
+VALID_OUTPUT_LANGS = {"ja", "en", "zh", "vi"}
+JAPANESE_KANA_RE = re.compile(r"[ぁ-んァ-ヶー]")
+JAPANESE_STYLE_RE = re.compile(r"(です|ます|だ|する)")
+
+
+def normalize_input_lang(lang: str | None) -> str:
+    if lang and lang in VALID_INPUT_LANGS:
+        return lang
+    return "auto"
 
-        # チケット購入の場合: ticketSecondsBalance を加算
-        if purchase_type == "ticket_purchase":
-            pack_id = metadata.get("packId")
-            minutes_str = metadata.get("minutes")
-            try:
-                minutes = int(minutes_str) if minutes_str else 0
-            except (ValueError, TypeError):
-                minutes = 0
 
-            if minutes <= 0:
-                logger.error(f"[stripe_webhook] ticket_purchase invalid_minutes | {json.dumps({'sessionId': session_id, 'uid': uid, 'minutes': minutes_str})}")
-                return JSONResponse({"received": True, "error": "invalid_minutes"}, status_code=400)
+def normalize_output_lang(lang: str | None) -> str:
+    if lang and lang in VALID_OUTPUT_LANGS:
+        return lang
+    return "ja"
 
-            seconds_to_add = minutes * 60
-            user_ref = db.collection("users").document(uid)
-            purchase_ref = user_ref.collection("purchases").document(session_id)
 
-            # トランザクション内で冪等性チェック + 加算を行う
-            @firebase_firestore.transactional
-            def add_ticket_balance_idempotent(transaction, user_ref, purchase_ref, seconds_to_add, session_id, pack_id, minutes):
-                # 1. 既処理チェック（トランザクション内で読み取り）
-                purchase_snap = purchase_ref.get(transaction=transaction)
-                if purchase_snap.exists:
-                    # 既に処理済み - 何もせず None を返す
-                    return None
+def looks_like_japanese(text: str) -> bool:
+    if not text:
+        return False
+    kana_count = len(JAPANESE_KANA_RE.findall(text))
+    return (
+        kana_count >= 10
+        or "。" in text
+        or "、" in text
+        or bool(JAPANESE_STYLE_RE.search(text))
+    )
 
-                # 2. ユーザー残高を読み取り
-                user_snap = user_ref.get(transaction=transaction)
-                user_data = user_snap.to_dict() if user_snap.exists else {}
-                current_balance = safe_int(user_data.get("ticketSecondsBalance"), 0)
-                new_balance = current_balance + seconds_to_add
 
-                # 3. ユーザー残高を更新
-                transaction.set(user_ref, {
-                    "ticketSecondsBalance": new_balance,
-                    "updatedAt": firebase_firestore.SERVER_TIMESTAMP,
-                }, merge=True)
+# ========== Translation cache ==========
+# プロンプト文面を変えたらバージョンを上げてキャッシュを無効化する
+TRANSLATE_PROMPT_VERSION = "v1"
+TRANSLATION_CACHE_ENABLED = parse_bool(os.getenv("TRANSLATION_CACHE_ENABLED", "1"))
+TRANSLATION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", "5000"))
+TRANSLATION_CACHE_MAX_BYTES = int(os.getenv("TRANSLATION_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+TRANSLATION_CACHE_TTL_SECONDS = float(os.getenv("TRANSLATION_CACHE_TTL_SECONDS", "86400"))
+TRANSLATION_CACHE_MAX_TEXT_CHARS = int(os.getenv("TRANSLATION_CACHE_MAX_TEXT_CHARS", "500"))
+# 空なら共有ティア無効。例: "translation_cache"
+TRANSLATION_CACHE_SHARED_COLLECTION = os.getenv("TRANSLATION_CACHE_SHARED_COLLECTION", "")
+
+_translation_cache = LRUTTLCache(
+    TRANSLATION_CACHE_MAX_ENTRIES,
+    TRANSLATION_CACHE_MAX_BYTES,
+    TRANSLATION_CACHE_TTL_SECONDS,
+)
+_translation_shared_tier = (
+    FirestoreCacheTier(TRANSLATION_CACHE_SHARED_COLLECTION) if TRANSLATION_CACHE_SHARED_COLLECTION else None
+)
+_translation_shared_stats = {"hits": 0, "misses": 0, "errors": 0, "rejected": 0}
 
-                # 4. 購入履歴を記録（冪等性キー）
-                transaction.set(purchase_ref, {
-                    "sessionId": session_id,
-                    "packId": pack_id,
-                    "minutes": minutes,
-                    "secondsAdded": seconds_to_add,
-                    "balanceBefore": current_balance,
-                    "balanceAfter": new_balance,
-                    "createdAt": firebase_firestore.SERVER_TIMESTAMP,
-                })
 
-                return {"balanceBefore": current_balance, "balanceAfter": new_balance}
+def normalize_translation_text(text: str) -> str:
+    """NFKC + whitespace collapse, used only for the cache key."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
 
-            try:
-                transaction = db.transaction()
-                result = add_ticket_balance_idempotent(transaction, user_ref, purchase_ref, seconds_to_add, session_id, pack_id, minutes)
 
-                if result is None:
-                    # 既処理（トランザクション内で検出）
-                    logger.warning(f"[stripe_webhook] ticket_purchase already_processed | {json.dumps({'sessionId': session_id, 'uid': uid})}")
-                    return JSONResponse({"received": True, "warning": "already_processed"})
+def translation_cache_key(
+    text: str,
+    input_lang: str,
+    output_lang: str,
+    model: str | None = None,
+    prompt_version: str = TRANSLATE_PROMPT_VERSION,
+    glossary_entries: list[tuple[str, str]] | None = None,
+) -> str:
+    parts = [normalize_translation_text(text), input_lang, output_lang, model or translate_model_default, prompt_version]
+    if glossary_entries:
+        # 入力に効く用語集エントリだけをキーに含める（無関係な用語集の違いではキャッシュを分けない）
+        parts.append(glossary_entries_key(glossary_entries))
+    raw = json.dumps(parts, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
-                # 成功
-                logger.info(f"[stripe_webhook] ticket_purchase success | {json.dumps({'sessionId': session_id, 'uid': uid, 'packId': pack_id, 'minutes': minutes, 'secondsAdded': seconds_to_add, 'balanceBefore': result['balanceBefore'], 'balanceAfter': result['balanceAfter']})}")
-                print(f"[stripe_webhook] ticket_purchase success | uid={uid} packId={pack_id} minutes={minutes} balanceBefore={result['balanceBefore']} balanceAfter={result['balanceAfter']}")
-                return JSONResponse({"received": True, "ticketSecondsAdded": seconds_to_add})
-            except Exception as e:
-                logger.exception(f"[stripe_webhook] ticket_purchase FAILED | {json.dumps({'sessionId': session_id, 'uid': uid, 'error': str(e)})}")
-                return JSONResponse({"received": True, "error": "ticket_update_failed"}, status_code=500)
 
-        # サブスクリプション購入の場合: 既存処理
-        user_updates = {
-            "updatedAt": firebase_firestore.SERVER_TIMESTAMP,
-        }
-        if customer_id:
-            user_updates["stripeCustomerId"] = customer_id
-        if subscription_id:
-            user_updates["stripeSubscriptionId"] = subscription_id
+def is_cacheable_translation(translated: str, output_lang: str) -> bool:
+    """ja_guard に引っかかる訳文はキャッシュしない"""
+    if not translated:
+        return False
+    if output_lang != "ja" and looks_like_japanese(translated):
+        return False
+    return True
+
+
+async def get_cached_translation(key: str) -> str | None:
+    if not TRANSLATION_CACHE_ENABLED:
+        return None
+    cached = _translation_cache.get(key)
+    if cached is not None:
+        return cached
+    tier = _translation_shared_tier
+    if tier is None:
+        return None
+    try:
+        shared = await run_blocking(tier.get, key)
+    except Exception as exc:  # noqa: BLE001
+        _translation_shared_stats["errors"] += 1
+        logger.warning(f"translation cache shared tier read failed: {exc}")
+        return None
+    if not isinstance(shared, str) or not shared:
+        _translation_shared_stats["misses"] += 1
+        return None
+    _translation_shared_stats["hits"] += 1
+    _translation_cache.set(key, shared)
+    return shared
+
 
+async def store_cached_translation(key: str, text: str, translated: str, output_lang: str) -> bool:
+    if not TRANSLATION_CACHE_ENABLED or len(text) > TRANSLATION_CACHE_MAX_TEXT_CHARS:
+        return False
+    if not is_cacheable_translation(translated, output_lang):
+        _translation_shared_stats["rejected"] += 1
+        return False
+    _translation_cache.set(key, translated)
+    tier = _translation_shared_tier
+    if tier is not None:
         try:
-            db.collection("users").document(uid).set(user_updates, merge=True)
-            logger.info(f"[stripe_webhook] checkout.session.completed Firestore updated | {json.dumps({'uid': uid, 'customerId': customer_id, 'subscriptionId': subscription_id, 'fields': list(user_updates.keys())})}")
-        except Exception as e:
-            logger.exception(f"[stripe_webhook] checkout.session.completed Firestore set FAILED | {json.dumps({'uid': uid, 'customerId': customer_id, 'subscriptionId': subscription_id, 'error': str(e)})}")
-            return JSONResponse({"received": True, "error": "firestore_update_failed"}, status_code=500)
+            await run_blocking(tier.set, key, translated, TRANSLATION_CACHE_TTL_SECONDS)
+        except Exception as exc:  # noqa: BLE001
+            _translation_shared_stats["errors"] += 1
+            logger.warning(f"translation cache shared tier write failed: {exc}")
+    return True
 
-        return JSONResponse({"received": True})
 
-    # サブスクリプション関連イベント
-    if event_type in ["customer.subscription.created", "customer.subscription.updated", "customer.subscription.deleted"]:
-        subscription = event["data"]["object"]
-        metadata = subscription.get("metadata") or {}
-        uid = metadata.get("uid")
-        customer_id = subscription.get("customer")
+def get_translation_cache_stats() -> dict:
+    stats = _translation_cache.stats()
+    stats["enabled"] = TRANSLATION_CACHE_ENABLED
+    stats["shared"] = dict(_translation_shared_stats, enabled=_translation_shared_tier is not None)
+    return stats
 
-        if not uid:
-            logger.warning(f"Subscription event without uid metadata | {json.dumps({'eventType': event_type, 'subscriptionId': subscription.get('id')})}")
-            # customer_idからuidを逆引きする試み
-            if customer_id:
-                users_query = db.collection("users").where("stripeCustomerId", "==", customer_id).limit(1)
-                for user_doc in users_query.stream():
-                    uid = user_doc.id
-                    break
 
-        if not uid:
-            logger.error(f"Cannot determine uid from subscription event | {json.dumps({'eventType': event_type})}")
-            return JSONResponse({"received": True, "warning": "uid_not_found"})
+def build_translate_glossary_instructions(glossary_entries: list[tuple[str, str]] | None) -> str:
+    if not glossary_entries:
+        return ""
+    lines = "".join(f"\n- {source} => {target}" for source, target in glossary_entries)
+    return f"\n\nGlossary (must-follow):{lines}\nWhen a source term appears, you MUST use the specified target term."
 
-        status = subscription.get("status", "")
-        current_period_end = subscription.get("current_period_end")
-        cancel_at_period_end = subscription.get("cancel_at_period_end", False)
 
-        # customer.subscription.deleted の場合は明示的に free に戻す
-        if event_type == "customer.subscription.deleted":
-            plan = "free"
-            status = "canceled"
-            cancel_at_period_end = False
-            logger.info(f"[stripe_webhook] Subscription deleted, resetting to free | {json.dumps({'uid': uid, 'subscriptionId': subscription.get('id')})}")
-        # ステータスに応じてプラン設定
-        # active または trialing の場合は pro、それ以外は free
-        elif status in ("active", "trialing"):
-            plan = "pro"
-        else:
-            plan = "free"
+def build_translate_payload(
+    text: str,
+    target_lang_name: str,
+    strict: bool = False,
+    glossary_entries: list[tuple[str, str]] | None = None,
+) -> dict:
+    if strict:
+        system_prompt = (
+            f"The previous output was not in {target_lang_name}. "
+            f"Translate the user's text into natural {target_lang_name}. "
+            f"You MUST output in {target_lang_name} only. "
+            "Do NOT output in Japanese. "
+            "Output the translation only."
+        )
+    else:
+        system_prompt = (
+            f"Translate the user's text into natural {target_lang_name}. "
+            f"You MUST output in {target_lang_name} only. "
+            "Do NOT output in the same language as the input. "
+            "Output the translation only."
+        )
+    system_prompt += build_translate_glossary_instructions(glossary_entries)
+    return {
+        "model": translate_model_default,
+        "input": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": text},
+        ],
+    }
 
-        plan_config = resolve_plan_config(plan)
 
-        user_updates = {
-            "plan": plan,
-            "quotaSeconds": plan_config["quotaSeconds"],
-            "retentionDays": plan_config["retentionDays"],
-            "subscriptionStatus": status,
-            "cancelAtPeriodEnd": cancel_at_period_end,
-            "updatedAt": firebase_firestore.SERVER_TIMESTAMP,
-        }
+# ========== Japanese-output guard: stats and hedged retry ==========
+# ヘッジ（厳格プロンプトの投機的並行実行）はオプトイン。対象ペアを "ja:en,auto:zh" のように列挙（"*" で全ペア）
+TRANSLATE_HEDGE_PAIRS = {
+    pair.strip() for pair in os.getenv("TRANSLATE_HEDGE_PAIRS", "").split(",") if pair.strip()
+}
+# 0 なら最初から並行、>0 ならその ms 待っても一次応答が無ければ厳格プロンプトを開始
+TRANSLATE_HEDGE_DELAY_MS = int(os.getenv("TRANSLATE_HEDGE_DELAY_MS", "400"))
 
-        if customer_id:
-            user_updates["stripeCustomerId"] = customer_id
-        if current_period_end:
-            user_updates["currentPeriodEnd"] = datetime.fromtimestamp(current_period_end, tz=timezone.utc)
+_ja_guard_stats: dict[str, dict] = {}
 
-        db.collection("users").document(uid).set(user_updates, merge=True)
-        logger.info(f"[stripe_webhook] User plan updated from subscription event | {json.dumps({'uid': uid, 'plan': plan, 'status': status, 'cancelAtPeriodEnd': cancel_at_period_end})}")
-        print(f"[stripe_webhook] User plan updated | uid={uid} plan={plan} status={status} cancelAtPeriodEnd={cancel_at_period_end}")
 
-    # 支払い成功
-    elif event_type == "invoice.paid":
-        invoice = event["data"]["object"]
-        customer_id = invoice.get("customer")
-        subscription_id = invoice.get("subscription")
+def language_pair_key(input_lang: str, output_lang: str) -> str:
+    return f"{input_lang}:{output_lang}"
 
-        if customer_id:
-            # customer_idからuidを取得
-            users_query = db.collection("users").where("stripeCustomerId", "==", customer_id).limit(1)
-            for user_doc in users_query.stream():
-                uid = user_doc.id
-                logger.info(f"[stripe_webhook] Invoice paid for uid: {uid} | {json.dumps({'uid': uid, 'invoiceId': invoice.get('id')})}")
-                print(f"[stripe_webhook] Invoice paid | uid={uid} invoiceId={invoice.get('id')}")
-                # 必要に応じて追加処理（通知等）
-                break
 
-    # 支払い失敗
-    elif event_type == "invoice.payment_failed":
-        invoice = event["data"]["object"]
-        customer_id = invoice.get("customer")
+def record_ja_guard_stat(pair: str, field: str) -> None:
+    stats = _ja_guard_stats.setdefault(
+        pair, {"requests": 0, "guardFired": 0, "hedged": 0, "strictWon": 0}
+    )
+    stats[field] += 1
 
-        if customer_id:
-            users_query = db.collection("users").where("stripeCustomerId", "==", customer_id).limit(1)
-            for user_doc in users_query.stream():
-                uid = user_doc.id
-                # subscriptionStatus を past_due に更新（plan は即 free にしない方針）
-                db.collection("users").document(uid).set({
-                    "subscriptionStatus": "past_due",
-                    "updatedAt": firebase_firestore.SERVER_TIMESTAMP,
-                }, merge=True)
-                logger.warning(f"[stripe_webhook] Invoice payment failed for uid: {uid} | {json.dumps({'uid': uid, 'invoiceId': invoice.get('id')})}")
-                print(f"[stripe_webhook] Invoice payment failed | uid={uid} invoiceId={invoice.get('id')} subscriptionStatus=past_due")
-                break
 
-    return JSONResponse({"received": True})
+def get_ja_guard_stats() -> dict:
+    pairs = {}
+    for pair, stats in _ja_guard_stats.items():
+        requests = stats["requests"]
+        pairs[pair] = dict(
+            stats,
+            guardRate=round(stats["guardFired"] / requests, 4) if requests else None,
+            hedgeEnabled=is_hedge_enabled(*pair.split(":", 1)),
+        )
+    return {"hedgePairs": sorted(TRANSLATE_HEDGE_PAIRS), "hedgeDelayMs": TRANSLATE_HEDGE_DELAY_MS, "pairs": pairs}
 
 
-# ========== Ticket Purchase API ==========
-# Allowed ticket minutes (UI options)
-ALLOWED_TICKET_MINUTES = [120, 240, 360, 1200, 1800, 3000]
+def is_hedge_enabled(input_lang: str, output_lang: str) -> bool:
+    if output_lang == "ja" or not TRANSLATE_HEDGE_PAIRS:
+        return False
+    return "*" in TRANSLATE_HEDGE_PAIRS or language_pair_key(input_lang, output_lang) in TRANSLATE_HEDGE_PAIRS
+
+
+async def call_translation_prompt(
+    text: str,
+    target_lang_name: str,
+    headers: dict,
+    strict: bool,
+    glossary_entries: list[tuple[str, str]] | None = None,
+) -> str:
+    result = await post_openai_coalesced(
+        "https://api.openai.com/v1/responses",
+        build_translate_payload(text, target_lang_name, strict=strict, glossary_entries=glossary_entries),
+        headers,
+    )
+    return extract_output_text(result)
+
+
+async def request_translation_hedged(
+    text: str,
+    input_lang: str,
+    output_lang: str,
+    headers: dict,
+    glossary_entries: list[tuple[str, str]] | None = None,
+) -> str:
+    """Race the normal prompt against a delayed strict prompt; first guard-passing answer wins."""
+    pair = language_pair_key(input_lang, output_lang)
+    target_lang_name = LANG_NAMES.get(output_lang, "Japanese")
+    primary = asyncio.create_task(
+        call_translation_prompt(text, target_lang_name, headers, strict=False, glossary_entries=glossary_entries)
+    )
+    strict_task: asyncio.Task | None = None
 
-# Ticket pack definitions (packId -> minutes, JPY price)
-# Price ID is resolved from STRIPE_TICKET_PRICE_MAP_JSON or price_T{minutes} env
-TICKET_PACKS = {
-    "t120": {"minutes": 120, "price_jpy": 1440},
-    "t240": {"minutes": 240, "price_jpy": 2440},
-    "t360": {"minutes": 360, "price_jpy": 3240},
-    "t1200": {"minutes": 1200, "price_jpy": 9600},
-    "t1800": {"minutes": 1800, "price_jpy": 12600},
-    "t3000": {"minutes": 3000, "price_jpy": 21000},
-}
+    def start_strict() -> asyncio.Task:
+        record_ja_guard_stat(pair, "hedged")
+        return asyncio.create_task(
+            call_translation_prompt(text, target_lang_name, headers, strict=True, glossary_entries=glossary_entries)
+        )
 
-# Cache for parsed JSON map
-_ticket_price_map_cache: dict | None = None
+    try:
+        if TRANSLATE_HEDGE_DELAY_MS > 0:
+            await asyncio.wait({primary}, timeout=TRANSLATE_HEDGE_DELAY_MS / 1000)
+        if not primary.done():
+            strict_task = start_strict()
+        pending = {task for task in (primary, strict_task) if task is not None}
+        error: BaseException | None = None
+        # ガードに引っかかった訳文は、他に待つタスクがなくなったときだけ返す（strict の結果を優先。直列経路と同じ）
+        fallback: dict[asyncio.Task, str] = {}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                translated = task.result()
+                if looks_like_japanese(translated):
+                    fallback[task] = translated
+                    if task is primary:
+                        record_ja_guard_stat(pair, "guardFired")
+                        logger.warning(
+                            f"/translate ja_guard triggered (hedged) | output_lang={output_lang} "
+                            f"translation_head={translated[:80]!r}"
+                        )
+                        if strict_task is None:
+                            strict_task = start_strict()
+                            pending.add(strict_task)
+                    continue
+                if task is strict_task:
+                    record_ja_guard_stat(pair, "strictWon")
+                return translated
+        if fallback:
+            return fallback.get(strict_task) or fallback[primary]
+        raise error if error is not None else RuntimeError("hedged translation produced no result")
+    finally:
+        for task in (primary, strict_task):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+async def request_translation(
+    text: str,
+    output_lang: str,
+    input_lang: str = "auto",
+    glossary_entries: list[tuple[str, str]] | None = None,
+) -> str:
+    """Call the Responses API, retrying with a stricter prompt if ja_guard fires."""
+    pair = language_pair_key(input_lang, output_lang)
+    record_ja_guard_stat(pair, "requests")
+    headers = openai_json_headers()
+    if is_hedge_enabled(input_lang, output_lang):
+        translated = await request_translation_hedged(text, input_lang, output_lang, headers, glossary_entries)
+        logger.info(
+            f"/translate result (hedged) | output_lang={output_lang} translation_len={len(translated)} "
+            f"translation_head={translated[:80]!r}"
+        )
+        return translated
 
+    target_lang_name = LANG_NAMES.get(output_lang, "Japanese")
+    translated = await call_translation_prompt(
+        text, target_lang_name, headers, strict=False, glossary_entries=glossary_entries
+    )
+    logger.info(
+        f"/translate result | output_lang={output_lang} translation_len={len(translated)} "
+        f"translation_head={translated[:80]!r}"
+    )
+    if output_lang != "ja" and looks_like_japanese(translated):
+        record_ja_guard_stat(pair, "guardFired")
+        logger.warning(
+            f"/translate ja_guard triggered | output_lang={output_lang} "
+            f"translation_head={translated[:80]!r}"
+        )
+        translated = await call_translation_prompt(
+            text, target_lang_name, headers, strict=True, glossary_entries=glossary_entries
+        )
+        logger.info(
+            f"/translate retry_result | output_lang={output_lang} translation_len={len(translated)} "
+            f"translation_head={translated[:80]!r}"
+        )
+    return translated
+
+
+async def translate_with_cache(
+    text: str,
+    input_lang: str,
+    output_lang: str,
+    glossary: CompiledGlossary = EMPTY_GLOSSARY,
+) -> str:
+    glossary_entries = select_glossary_entries(glossary, text)
+    cache_key = translation_cache_key(text, input_lang, output_lang, glossary_entries=glossary_entries)
+    cached = await get_cached_translation(cache_key)
+    if cached is not None:
+        logger.info(f"/translate cache_hit | output_lang={output_lang} text_len={len(text)}")
+        return cached
+    translated = await request_translation(text, output_lang, input_lang, glossary_entries)
+    missing = missing_glossary_targets(glossary_entries, translated)
+    if missing:
+        # 用語集違反の訳文は返すがキャッシュしない（次回は再翻訳させる）
+        logger.warning(
+            f"/translate glossary_miss | output_lang={output_lang} "
+            f"missing={[target for _, target in missing][:5]!r}"
+        )
+        return translated
+    await store_cached_translation(cache_key, text, translated, output_lang)
+    return translated
 
-def _get_ticket_price_map() -> dict:
-    """Parse STRIPE_TICKET_PRICE_MAP_JSON and cache the result."""
-    global _ticket_price_map_cache
-    if _ticket_price_map_cache is not None:
-        return _ticket_price_map_cache
 
-    json_str = os.getenv("STRIPE_TICKET_PRICE_MAP_JSON")
-    if json_str:
-        try:
-            data = json.loads(json_str)
-            _ticket_price_map_cache = data.get("packs", {})
-            logger.info(f"Loaded STRIPE_TICKET_PRICE_MAP_JSON with {len(_ticket_price_map_cache)} packs")
-            return _ticket_price_map_cache
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse STRIPE_TICKET_PRICE_MAP_JSON: {e}")
+@app.post("/translate")
+async def translate_text(
+    request: Request,
+    text: str = Form(...),
+    input_lang: str = Form("auto"),
+    output_lang: str = Form("ja"),
+    glossary_text: str = Form(""),
+) -> JSONResponse:
+    # 認証必須: Firebase ID トークンを検証
+    await require_uid(request)
 
-    _ticket_price_map_cache = {}
-    return _ticket_price_map_cache
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="text is required")
 
+    # Normalize and validate language codes
+    output_lang_raw = output_lang
+    input_lang = normalize_input_lang(input_lang)
+    output_lang = normalize_output_lang(output_lang)
+    ensure_input_within_budget(text, TRANSLATE_MAX_INPUT_TOKENS, input_lang)
+    target_lang_name = LANG_NAMES.get(output_lang, "Japanese")
+    logger.info(
+        f"/translate request | output_lang_raw={output_lang_raw!r} output_lang={output_lang} "
+        f"target={target_lang_name} text_len={len(text)}"
+    )
 
-def get_ticket_price_id(pack_id: str, minutes: int) -> str | None:
-    """
-    Get Stripe Price ID for ticket pack.
-    Priority (canonical first):
-    1. price_T{minutes} env var (canonical - highest priority)
-    2. STRIPE_TICKET_PRICE_MAP_JSON (JSON map fallback)
-    3. STRIPE_TICKET_{minutes}_PRICE_ID (legacy fallback)
-    """
-    canonical_key = f"price_T{minutes}"
+    translated = await translate_with_cache(text, input_lang, output_lang, compile_glossary(glossary_text))
+    return JSONResponse({"translation": translated})
 
-    # 1. Canonical env var: price_T{minutes} (highest priority)
-    price_id = os.getenv(canonical_key)
-    if price_id:
-        return price_id
 
-    # 2. Fallback: STRIPE_TICKET_PRICE_MAP_JSON
-    price_map = _get_ticket_price_map()
-    if pack_id in price_map:
-        price_id = price_map[pack_id].get("priceId")
-        if price_id:
-            logger.warning(
-                f"Using STRIPE_TICKET_PRICE_MAP_JSON for {pack_id}, "
-                f"please migrate to env var {canonical_key}"
-            )
-            return price_id
+# ========== Streaming translation ==========
+# 非日本語ターゲットでは最初の N 文字をバッファして ja_guard を判定してから送出する
+TRANSLATE_STREAM_GUARD_CHARS = int(os.getenv("TRANSLATE_STREAM_GUARD_CHARS", "24"))
 
-    # 3. Legacy fallback: STRIPE_TICKET_{minutes}_PRICE_ID
-    legacy_key = f"STRIPE_TICKET_{minutes}_PRICE_ID"
-    price_id = os.getenv(legacy_key)
-    if price_id:
-        logger.warning(f"Using legacy env var {legacy_key}, please migrate to {canonical_key}")
-        return price_id
 
-    return None
+def elapsed_ms(started: float) -> int:
+    return int((time.perf_counter() - started) * 1000)
 
 
-@app.post("/api/v1/billing/stripe/tickets/checkout")
-async def create_ticket_checkout_session(request: Request) -> JSONResponse:
-    """Stripe Checkout Session for ticket purchase (one-time payment)"""
-    uid = get_uid_from_request(request)
-    body = await request.json()
-    pack_id = body.get("packId")
-    success_url = body.get("successUrl", "https://example.com/success")
-    cancel_url = body.get("cancelUrl", "https://example.com/cancel")
+async def stream_translation_events(
+    text: str,
+    input_lang: str,
+    output_lang: str,
+    glossary: CompiledGlossary = EMPTY_GLOSSARY,
+):
+    """Yield SSE frames (delta / retry / done / error) for one translation."""
+    started = time.perf_counter()
+    glossary_entries = select_glossary_entries(glossary, text)
+    cache_key = translation_cache_key(text, input_lang, output_lang, glossary_entries=glossary_entries)
+    cached = await get_cached_translation(cache_key)
+    if cached is not None:
+        yield format_sse("delta", {"text": cached})
+        yield format_sse("done", {"translation": cached, "cached": True})
+        logger.info(
+            f"/translate/stream done | output_lang={output_lang} cached=True ttft_ms={elapsed_ms(started)}"
+        )
+        return
 
-    if pack_id not in TICKET_PACKS:
-        raise HTTPException(status_code=400, detail="invalid_pack_id")
+    pair = language_pair_key(input_lang, output_lang)
+    record_ja_guard_stat(pair, "requests")
+    target_lang_name = LANG_NAMES.get(output_lang, "Japanese")
+    headers = openai_json_headers()
+    upstream_ttft_ms = None
+    ttft_ms = None
+    retried = False
+    translated = ""
 
-    pack = TICKET_PACKS[pack_id]
-    minutes = pack["minutes"]
+    try:
+        for strict in (False, True):
+            hold = output_lang != "ja" and not strict
+            buffered = ""
+            parts: list[str] = []
+            guard_fired = False
+            events = stream_openai(
+                "https://api.openai.com/v1/responses",
+                build_translate_payload(text, target_lang_name, strict=strict, glossary_entries=glossary_entries),
+                headers,
+            )
+            try:
+                async for event in events:
+                    event_type = event.get("type")
+                    if event_type in ("response.failed", "error"):
+                        raise RuntimeError(f"upstream stream failed: {event_type}")
+                    if event_type != "response.output_text.delta":
+                        continue
+                    delta = event.get("delta") or ""
+                    if not delta:
+                        continue
+                    if upstream_ttft_ms is None:
+                        upstream_ttft_ms = elapsed_ms(started)
+                    parts.append(delta)
+                    if not hold:
+                        if ttft_ms is None:
+                            ttft_ms = elapsed_ms(started)
+                        yield format_sse("delta", {"text": delta})
+                        continue
+                    buffered += delta
+                    if len(buffered) < TRANSLATE_STREAM_GUARD_CHARS:
+                        continue
+                    if looks_like_japanese(buffered):
+                        guard_fired = True
+                        break
+                    hold = False
+                    if ttft_ms is None:
+                        ttft_ms = elapsed_ms(started)
+                    yield format_sse("delta", {"text": buffered})
+            finally:
+                await events.aclose()
+
+            translated = "".join(parts).strip()
+            if hold and not guard_fired and looks_like_japanese(translated):
+                guard_fired = True
+            if guard_fired:
+                record_ja_guard_stat(pair, "guardFired")
+                logger.warning(
+                    f"/translate/stream ja_guard triggered | output_lang={output_lang} "
+                    f"translation_head={''.join(parts)[:80]!r}"
+                )
+                retried = True
+                yield format_sse("retry", {"reason": "ja_guard"})
+                continue
+            if hold and buffered:
+                if ttft_ms is None:
+                    ttft_ms = elapsed_ms(started)
+                yield format_sse("delta", {"text": buffered})
+            break
+    except SSE_UPSTREAM_ERRORS as exc:
+        yield format_upstream_error_sse(exc, "/translate/stream")
+        return
 
-    # Validate minutes is in allowed list
-    if minutes not in ALLOWED_TICKET_MINUTES:
-        logger.error(f"Invalid ticket minutes: {minutes} (allowed: {ALLOWED_TICKET_MINUTES})")
-        raise HTTPException(status_code=400, detail="invalid_ticket_minutes")
+    missing = missing_glossary_targets(glossary_entries, translated)
+    if missing:
+        # /translate と同じく、用語集違反の訳文は返すがキャッシュしない
+        logger.warning(
+            f"/translate/stream glossary_miss | output_lang={output_lang} "
+            f"missing={[target for _, target in missing][:5]!r}"
+        )
+    else:
+        await store_cached_translation(cache_key, text, translated, output_lang)
+    yield format_sse("done", {"translation": translated, "cached": False})
+    logger.info(
+        f"/translate/stream done | output_lang={output_lang} cached=False retried={retried} "
+        f"ttft_ms={ttft_ms} upstream_ttft_ms={upstream_ttft_ms} total_ms={elapsed_ms(started)} "
+        f"translation_len={len(translated)}"
+    )
 
-    # Check if user is Pro (only Pro users can buy tickets)
-    db = get_firestore_client()
-    user_ref = db.collection("users").document(uid)
-    user_snap = user_ref.get()
-    user_data = user_snap.to_dict() if user_snap.exists else {}
-    user_plan = user_data.get("plan", "free")
 
-    if user_plan != "pro":
-        raise HTTPException(status_code=403, detail="pro_required")
+@app.post("/translate/stream")
+async def translate_text_stream(
+    request: Request,
+    text: str = Form(...),
+    input_lang: str = Form("auto"),
+    output_lang: str = Form("ja"),
+    glossary_text: str = Form(""),
+) -> StreamingResponse:
+    # 認証必須: Firebase ID トークンを検証
+    await require_uid(request)
 
-    # Get Price ID from JSON map or env var
-    price_id = get_ticket_price_id(pack_id, minutes)
-    if not price_id:
-        env_key = f"price_T{minutes}"
-        logger.error(f"Ticket price ID not configured | pack_id={pack_id} env_key={env_key}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"ticket_price_not_configured: {pack_id} (env: {env_key})"
-        )
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="text is required")
 
-    secret_key = os.getenv("STRIPE_SECRET_KEY")
-    if not secret_key:
-        raise HTTPException(status_code=500, detail="stripe_not_configured")
+    input_lang = normalize_input_lang(input_lang)
+    output_lang = normalize_output_lang(output_lang)
+    ensure_input_within_budget(text, TRANSLATE_MAX_INPUT_TOKENS, input_lang)
+    logger.info(f"/translate/stream request | output_lang={output_lang} text_len={len(text)}")
+    return StreamingResponse(
+        stream_translation_events(text, input_lang, output_lang, compile_glossary(glossary_text)),
+        media_type="text/event-stream",
+        headers=SSE_RESPONSE_HEADERS,
+    )
 
-    stripe.api_key = secret_key
 
-    try:
-        session = stripe.checkout.Session.create(
-            mode="payment",
-            payment_method_types=["card"],
-            line_items=[{"price": price_id, "quantity": 1}],
-            client_reference_id=uid,
-            metadata={
-                "uid": uid,
-                "packId": pack_id,
-                "minutes": pack["minutes"],
-                "type": "ticket_purchase",
+# ========== Batch translation ==========
+TRANSLATE_BATCH_MAX_SEGMENTS = int(os.getenv("TRANSLATE_BATCH_MAX_SEGMENTS", "500"))
+TRANSLATE_BATCH_MAX_SEGMENT_CHARS = int(os.getenv("TRANSLATE_BATCH_MAX_SEGMENT_CHARS", "2000"))
+# 1 回の上流呼び出しに詰める入力トークン数の上限（見積もり）
+TRANSLATE_BATCH_TOKEN_BUDGET = int(os.getenv("TRANSLATE_BATCH_TOKEN_BUDGET", "2000"))
+TRANSLATE_BATCH_CONCURRENCY = int(os.getenv("TRANSLATE_BATCH_CONCURRENCY", "4"))
+
+TRANSLATE_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "translations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "i": {"type": "integer"},
+                    "text": {"type": "string"},
+                },
+                "required": ["i", "text"],
+                "additionalProperties": False,
             },
-            success_url=success_url,
-            cancel_url=cancel_url,
-        )
-        logger.info(f"Ticket checkout session created | uid={uid} packId={pack_id} sessionId={session.id}")
-        return JSONResponse({"sessionId": session.id, "url": session.url})
-    except Exception as e:
-        logger.error(f"Ticket checkout session creation failed: {e}")
-        raise HTTPException(status_code=500, detail=f"checkout_failed: {str(e)}")
-
+        }
+    },
+    "required": ["translations"],
+    "additionalProperties": False,
+}
 
-# ========== Dictionary API ==========
-DICTIONARY_LIMIT_FREE = 10
-DICTIONARY_LIMIT_PRO = 1000
 
+# 構造化出力の 1 セグメントあたりの JSON オーバーヘッド（{"i": n, "text": "..."}）
+TRANSLATE_BATCH_SEGMENT_OVERHEAD_TOKENS = 8
+
+
+def pack_batch_segments(
+    items: list[tuple[int, str]],
+    token_budget: int,
+    overhead_tokens: int = 0,
+    calibrated: bool = True,
+) -> list[list[tuple[int, str]]]:
+    """Greedily pack (index, text) pairs into chunks whose estimated tokens fit the budget."""
+    chunks: list[list[tuple[int, str]]] = []
+    current: list[tuple[int, str]] = []
+    current_tokens = 0
+    for index, text in items:
+        tokens = estimate_tokens(text, calibrated=calibrated) + overhead_tokens
+        if current and current_tokens + tokens > token_budget:
+            chunks.append(current)
+            current = []
+            current_tokens = 0
+        current.append((index, text))
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def build_batch_translate_payload(
+    chunk: list[tuple[int, str]],
+    target_lang_name: str,
+    glossary_entries: list[tuple[str, str]] | None = None,
+) -> dict:
+    system_prompt = (
+        f"Translate each segment's text into natural {target_lang_name}. "
+        f"You MUST output in {target_lang_name} only. "
+        "Do NOT output in the same language as the input. "
+        "Translate every segment independently and keep its index `i`. "
+        "Return one entry per input segment and nothing else."
+    )
+    system_prompt += build_translate_glossary_instructions(glossary_entries)
+    segments = [{"i": index, "text": text} for index, text in chunk]
+    return {
+        "model": translate_model_default,
+        "input": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": json.dumps({"segments": segments}, ensure_ascii=False)},
+        ],
+        "text": {
+            "format": {
+                "type": "json_schema",
+                "name": "batch_translation",
+                "schema": TRANSLATE_BATCH_SCHEMA,
+                "strict": True,
+            }
+        },
+    }
 
-def get_user_dictionary_limit(uid: str) -> int:
-    """Get dictionary limit based on user plan"""
-    db = get_firestore_client()
-    user_ref = db.collection("users").document(uid)
-    user_snap = user_ref.get()
-    user_data = user_snap.to_dict() if user_snap.exists else {}
-    plan = user_data.get("plan", "free")
-    return DICTIONARY_LIMIT_PRO if plan == "pro" else DICTIONARY_LIMIT_FREE
 
+def parse_batch_translation_output(raw: str, expected: set[int]) -> dict[int, str]:
+    try:
+        data = json.loads(raw)
+    except (TypeError, json.JSONDecodeError):
+        return {}
+    results: dict[int, str] = {}
+    entries = data.get("translations") if isinstance(data, dict) else None
+    for entry in entries or []:
+        if not isinstance(entry, dict):
+            continue
+        index = entry.get("i")
+        text = entry.get("text")
+        if index in expected and isinstance(text, str) and index not in results:
+            results[index] = text.strip()
+    return results
+
+
+async def translate_batch_chunk(
+    chunk: list[tuple[int, str]],
+    output_lang: str,
+    glossary_entries: list[tuple[str, str]] | None = None,
+) -> dict[int, str]:
+    target_lang_name = LANG_NAMES.get(output_lang, "Japanese")
+    result = await post_openai_coalesced(
+        "https://api.openai.com/v1/responses",
+        build_batch_translate_payload(chunk, target_lang_name, glossary_entries),
+        openai_json_headers(),
+    )
+    return parse_batch_translation_output(extract_output_text(result), {index for index, _ in chunk})
+
+
+async def translate_segments(
+    segments: list[str],
+    input_lang: str,
+    output_lang: str,
+    glossary: CompiledGlossary = EMPTY_GLOSSARY,
+) -> tuple[list[str], dict]:
+    """Translate segments in order: cache first, then packed upstream calls, then per-segment retries."""
+    translations = [""] * len(segments)
+    stats = {"segments": len(segments), "cached": 0, "upstreamCalls": 0, "retried": 0}
+    pending: list[tuple[int, str]] = []
+    keys: dict[int, str] = {}
+    glossary_entries: dict[int, list[tuple[str, str]]] = {}
+    for index, text in enumerate(segments):
+        if not text.strip():
+            continue
+        glossary_entries[index] = select_glossary_entries(glossary, text)
+        keys[index] = translation_cache_key(text, input_lang, output_lang, glossary_entries=glossary_entries[index])
+        cached = await get_cached_translation(keys[index])
+        if cached is not None:
+            translations[index] = cached
+            stats["cached"] += 1
+        else:
+            pending.append((index, text))
 
-@app.get("/api/v1/dictionary")
-async def get_dictionary(request: Request, limit: int = 100, cursor: str = None) -> JSONResponse:
-    """Get user's dictionary entries with pagination"""
-    uid = get_uid_from_request(request)
-    db = get_firestore_client()
+    chunks = pack_batch_segments(pending, TRANSLATE_BATCH_TOKEN_BUDGET, TRANSLATE_BATCH_SEGMENT_OVERHEAD_TOKENS)
+    stats["upstreamCalls"] = len(chunks)
+    semaphore = asyncio.Semaphore(max(1, TRANSLATE_BATCH_CONCURRENCY))
 
-    dict_ref = db.collection("users").document(uid).collection("dictionary")
-    query = dict_ref.order_by("createdAt", direction=firebase_firestore.Query.DESCENDING).limit(limit + 1)
+    def chunk_glossary_entries(chunk: list[tuple[int, str]]) -> list[tuple[str, str]]:
+        # チャンク内のセグメントが一致した用語だけを、重複を除いてプロンプトに入れる
+        merged_entries = list(dict.fromkeys(entry for index, _ in chunk for entry in glossary_entries[index]))
+        return fit_glossary_entries(merged_entries, PROMPT_GLOSSARY_TOKEN_BUDGET)[0]
 
-    if cursor:
-        # Decode cursor (base64 encoded document ID)
-        try:
-            cursor_doc_id = base64.b64decode(cursor).decode("utf-8")
-            cursor_doc = dict_ref.document(cursor_doc_id).get()
-            if cursor_doc.exists:
-                query = query.start_after(cursor_doc)
-        except Exception:
-            pass  # Invalid cursor, ignore
-
-    docs = list(query.stream())
-    has_more = len(docs) > limit
-    if has_more:
-        docs = docs[:limit]
-
-    items = []
-    for doc in docs:
-        data = doc.to_dict()
-        items.append({
-            "id": doc.id,
-            "source": data.get("source", ""),
-            "target": data.get("target", ""),
-            "note": data.get("note", ""),
-            "createdAt": data.get("createdAt").isoformat() if data.get("createdAt") else None,
-        })
-
-    next_cursor = None
-    if has_more and docs:
-        next_cursor = base64.b64encode(docs[-1].id.encode("utf-8")).decode("utf-8")
-
-    user_limit = get_user_dictionary_limit(uid)
-    total_count = len(list(dict_ref.stream()))
+    async def run_chunk(chunk: list[tuple[int, str]]) -> dict[int, str]:
+        async with semaphore:
+            try:
+                return await translate_batch_chunk(chunk, output_lang, chunk_glossary_entries(chunk))
+            except (httpx.HTTPStatusError, httpx.RequestError) as exc:
+                logger.warning(f"/translate/batch chunk failed, retrying segments individually | {exc}")
+                return {}
+
+    chunk_results = await asyncio.gather(*(run_chunk(chunk) for chunk in chunks))
+    merged: dict[int, str] = {}
+    for chunk_result in chunk_results:
+        merged.update(chunk_result)
+
+    retry_items: list[tuple[int, str]] = []
+    for index, text in pending:
+        translated = merged.get(index, "")
+        if not is_cacheable_translation(translated, output_lang):
+            retry_items.append((index, text))
+            continue
+        translations[index] = translated
+        if missing_glossary_targets(glossary_entries[index], translated):
+            # 用語集違反の訳文は返すがキャッシュしない（/translate と同じ）
+            continue
+        await store_cached_translation(keys[index], text, translated, output_lang)
 
-    return JSONResponse({
-        "items": items,
-        "nextCursor": next_cursor,
-        "limit": user_limit,
-        "count": total_count,
-    })
+    async def retry_one(index: int, text: str) -> None:
+        async with semaphore:
+            translations[index] = await translate_with_cache(text, input_lang, output_lang, glossary)
 
+    stats["retried"] = len(retry_items)
+    await asyncio.gather(*(retry_one(index, text) for index, text in retry_items))
+    return translations, stats
 
-@app.post("/api/v1/dictionary/entry")
-async def add_dictionary_entry(request: Request) -> JSONResponse:
-    """Add a new dictionary entry"""
-    uid = get_uid_from_request(request)
-    body = await request.json()
-    source = (body.get("source") or "").strip()
-    target = (body.get("target") or "").strip()
-    note = (body.get("note") or "").strip()
 
-    if not source or not target:
-        raise HTTPException(status_code=400, detail={"reason": "source and target are required"})
+@app.post("/translate/batch")
+async def translate_batch(request: Request) -> JSONResponse:
+    """Translate an ordered list of segments with one language pair."""
+    # 認証必須: Firebase ID トークンを検証
+    await require_uid(request)
+    try:
+        body = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid_json")
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="invalid_json")
+
+    segments = body.get("segments")
+    if not isinstance(segments, list) or not segments:
+        raise HTTPException(status_code=400, detail="segments is required")
+    if len(segments) > TRANSLATE_BATCH_MAX_SEGMENTS:
+        raise HTTPException(status_code=413, detail="too_many_segments")
+    if not all(isinstance(segment, str) for segment in segments):
+        raise HTTPException(status_code=400, detail="segments must be strings")
+    if any(len(segment) > TRANSLATE_BATCH_MAX_SEGMENT_CHARS for segment in segments):
+        raise HTTPException(status_code=413, detail="segment_too_long")
+
+    input_lang = normalize_input_lang(body.get("input_lang") or body.get("inputLang"))
+    output_lang = normalize_output_lang(body.get("output_lang") or body.get("outputLang"))
+    glossary_text = body.get("glossary_text") or body.get("glossaryText") or ""
+    if not isinstance(glossary_text, str):
+        raise HTTPException(status_code=400, detail="glossary_text must be a string")
+    started = time.perf_counter()
+    translations, stats = await translate_segments(segments, input_lang, output_lang, compile_glossary(glossary_text))
+    logger.info(
+        f"/translate/batch done | {json.dumps(dict(stats, outputLang=output_lang, elapsedMs=elapsed_ms(started)))}"
+    )
+    return JSONResponse({"translations": translations, "stats": stats})
 
-    db = get_firestore_client()
-    dict_ref = db.collection("users").document(uid).collection("dictionary")
 
-    # Check limit
-    user_limit = get_user_dictionary_limit(uid)
-    current_count = len(list(dict_ref.stream()))
-    if current_count >= user_limit:
-        raise HTTPException(status_code=400, detail={"reason": f"Dictionary limit reached ({user_limit})"})
 
-    # Add entry
-    new_entry = {
-        "source": source,
-        "target": target,
-        "note": note,
-        "createdAt": firebase_firestore.SERVER_TIMESTAMP,
-    }
-    doc_ref = dict_ref.add(new_entry)
-    logger.info(f"Dictionary entry added | uid={uid} id={doc_ref[1].id}")
+# ========== WebSocket translation ==========
+# 1 接続 = 1 ジョブ。最初の auth メッセージで 1 回だけ認証し、以降の発話は seq 順にパイプライン翻訳する
+WS_TRANSLATE_MAX_INFLIGHT = int(os.getenv("WS_TRANSLATE_MAX_INFLIGHT", "4"))
+WS_TRANSLATE_AUTH_TIMEOUT_SECONDS = float(os.getenv("WS_TRANSLATE_AUTH_TIMEOUT_SECONDS", "10"))
+WS_CLOSE_AUTH_FAILED = 4401
 
-    return JSONResponse({"id": doc_ref[1].id, "count": current_count + 1, "limit": user_limit})
+_ws_translate_stats = {
+    "connections": 0,
+    "active": 0,
+    "authFailures": 0,
+    "segments": 0,
+    "errors": 0,
+    "backpressureWaits": 0,
+}
 
 
-@app.put("/api/v1/dictionary/entry/{entry_id}")
-async def update_dictionary_entry(request: Request, entry_id: str) -> JSONResponse:
-    """Update a dictionary entry"""
-    uid = get_uid_from_request(request)
-    body = await request.json()
-    source = (body.get("source") or "").strip()
-    target = (body.get("target") or "").strip()
-    note = (body.get("note") or "").strip()
+def authenticate_ws_token(token: str) -> tuple[str, float | None]:
+    """(uid, exp) for the token sent in the socket's auth message."""
+    if is_debug_auth_bypass():
+        return "debug-user", None
+    claims = verify_firebase_token(token)
+    exp = claims.get("exp")
+    return claims["uid"], float(exp) if isinstance(exp, (int, float)) else None
 
-    if not source or not target:
-        raise HTTPException(status_code=400, detail={"reason": "source and target are required"})
 
-    db = get_firestore_client()
-    entry_ref = db.collection("users").document(uid).collection("dictionary").document(entry_id)
-    entry_snap = entry_ref.get()
+def ws_error_message(seq, status_code: int, detail: str, **extra) -> dict:
+    return dict({"type": "error", "seq": seq, "status": status_code, "detail": detail}, **extra)
 
-    if not entry_snap.exists:
-        raise HTTPException(status_code=404, detail={"reason": "Entry not found"})
 
-    entry_ref.update({
-        "source": source,
-        "target": target,
-        "note": note,
-        "updatedAt": firebase_firestore.SERVER_TIMESTAMP,
-    })
-    logger.info(f"Dictionary entry updated | uid={uid} id={entry_id}")
+async def translate_ws_segment(seq: int, message: dict, session: dict) -> dict:
+    """Translate one segment message; upstream failures become an error message for that seq."""
+    text = message.get("text")
+    if not isinstance(text, str) or not text.strip():
+        return ws_error_message(seq, 400, "text is required")
+    input_lang = normalize_input_lang(message.get("input_lang") or session["input_lang"])
+    output_lang = normalize_output_lang(message.get("output_lang") or session["output_lang"])
+    try:
+        ensure_input_within_budget(text, TRANSLATE_MAX_INPUT_TOKENS, input_lang)
+        translated = await translate_with_cache(text, input_lang, output_lang, session["glossary"])
+    except HTTPException as exc:
+        return ws_error_message(seq, exc.status_code, str(exc.detail))
+    except httpx.HTTPStatusError as exc:
+        status_code = exc.response.status_code if exc.response is not None else 502
+        return ws_error_message(seq, status_code, f"OpenAI API error ({status_code})")
+    except UpstreamOverloadedError as exc:
+        return ws_error_message(seq, 503, "upstream_overloaded", retryAfter=exc.retry_after)
+    except OpenAICircuitOpenError as exc:
+        return ws_error_message(seq, 503, "openai_circuit_open", retryAfter=exc.retry_after)
+    except httpx.RequestError:
+        return ws_error_message(seq, 502, "OpenAI request error")
+    except Exception as exc:  # noqa: BLE001
+        # 想定外の失敗もその seq のエラーにする（ライターを落とすと以降の結果とスロットが失われる）
+        _ws_translate_stats["errors"] += 1
+        logger.error(f"/ws/translate segment failed | seq={seq} {type(exc).__name__}: {exc}")
+        return ws_error_message(seq, 500, "translation_failed")
+    return {"type": "result", "seq": seq, "translation": translated}
 
-    return JSONResponse({"id": entry_id, "updated": True})
 
+def completed_future(value) -> asyncio.Future:
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(value)
+    return future
 
-@app.delete("/api/v1/dictionary/entry/{entry_id}")
-async def delete_dictionary_entry(request: Request, entry_id: str) -> JSONResponse:
-    """Delete a dictionary entry"""
-    uid = get_uid_from_request(request)
-    db = get_firestore_client()
-    entry_ref = db.collection("users").document(uid).collection("dictionary").document(entry_id)
-    entry_snap = entry_ref.get()
 
-    if not entry_snap.exists:
-        raise HTTPException(status_code=404, detail={"reason": "Entry not found"})
+def get_ws_translate_stats() -> dict:
+    return dict(_ws_translate_stats, maxInflight=WS_TRANSLATE_MAX_INFLIGHT)
 
-    entry_ref.delete()
-    logger.info(f"Dictionary entry deleted | uid={uid} id={entry_id}")
 
-    user_limit = get_user_dictionary_limit(uid)
-    dict_ref = db.collection("users").document(uid).collection("dictionary")
-    current_count = len(list(dict_ref.stream()))
+@app.websocket("/ws/translate")
+async def translate_websocket(websocket: WebSocket) -> None:
+    """
+    Client → server: {"type": "auth", "token", "input_lang", "output_lang", "glossary_text"} (first, and to refresh),
+    {"type": "translate", "seq", "text", ...}, {"type": "config", ...}.
+    Server → client: {"type": "ready"}, {"type": "result" | "error", "seq", ...} in seq order.
+    """
+    await websocket.accept()
+    _ws_translate_stats["connections"] += 1
+    try:
+        message = await asyncio.wait_for(websocket.receive_json(), WS_TRANSLATE_AUTH_TIMEOUT_SECONDS)
+        if not isinstance(message, dict) or message.get("type") != "auth":
+            raise HTTPException(status_code=401, detail="auth_required")
+        uid, expires_at = await run_blocking(authenticate_ws_token, str(message.get("token") or ""))
+    except (asyncio.TimeoutError, ValueError, HTTPException):
+        _ws_translate_stats["authFailures"] += 1
+        await websocket.close(code=WS_CLOSE_AUTH_FAILED, reason="invalid_auth")
+        return
+    except WebSocketDisconnect:
+        return
 
-    return JSONResponse({"deleted": True, "count": current_count, "limit": user_limit})
+    session = {
+        "input_lang": normalize_input_lang(message.get("input_lang")),
+        "output_lang": normalize_output_lang(message.get("output_lang")),
+        "glossary": compile_glossary(message.get("glossary_text")),
+    }
+    logger.info(f"/ws/translate connected | uid={uid} output_lang={session['output_lang']}")
+    _ws_translate_stats["active"] += 1
+    # 受信前にスロットを取るので、上限に達したら読み取り自体を止める（TCP レベルで送信側に背圧がかかる）
+    slots = asyncio.Semaphore(max(1, WS_TRANSLATE_MAX_INFLIGHT))
+    outbox: asyncio.Queue = asyncio.Queue()
+    close_code: int | None = None
+
+    async def write_in_order() -> None:
+        try:
+            while True:
+                pending = await outbox.get()
+                if pending is None:
+                    return
+                try:
+                    try:
+                        outgoing = await pending
+                    except Exception as exc:  # noqa: BLE001
+                        logger.error(f"/ws/translate result failed | {type(exc).__name__}: {exc}")
+                        outgoing = ws_error_message(None, 500, "translation_failed")
+                    await websocket.send_json(outgoing)
+                finally:
+                    slots.release()
+        finally:
+            # 送信できなくなったら、スロット待ちの読み取りループを起こして終了させる
+            for _ in range(max(1, WS_TRANSLATE_MAX_INFLIGHT)):
+                slots.release()
+
+    writer = asyncio.create_task(write_in_order())
+    inflight: list[asyncio.Future] = []
+    last_seq: int | None = None
+    try:
+        await websocket.send_json({"type": "ready", "maxInflight": WS_TRANSLATE_MAX_INFLIGHT})
+        while not writer.done():
+            if slots.locked():
+                _ws_translate_stats["backpressureWaits"] += 1
+            await slots.acquire()
+            try:
+                message = await websocket.receive_json()
+            except (ValueError, KeyError):
+                outbox.put_nowait(completed_future(ws_error_message(None, 400, "invalid_json")))
+                continue
+            message_type = message.get("type") if isinstance(message, dict) else None
+            if message_type == "translate":
+                seq = message.get("seq")
+                if not isinstance(seq, int) or (last_seq is not None and seq <= last_seq):
+                    outbox.put_nowait(completed_future(ws_error_message(seq, 400, "seq_out_of_order")))
+                    continue
+                last_seq = seq
+                if expires_at is not None and time.time() >= expires_at:
+                    outbox.put_nowait(completed_future(ws_error_message(seq, 401, "auth_expired")))
+                    close_code = WS_CLOSE_AUTH_FAILED
+                    break
+                _ws_translate_stats["segments"] += 1
+                task = asyncio.create_task(translate_ws_segment(seq, message, session))
+                inflight.append(task)
+                inflight[:] = [item for item in inflight if not item.done()]
+                outbox.put_nowait(task)
+            elif message_type == "auth":
+                # ID トークンの更新（1 時間で失効するため長いジョブではクライアントが送り直す）
+                try:
+                    new_uid, expires_at = await run_blocking(
+                        authenticate_ws_token, str(message.get("token") or "")
+                    )
+                except HTTPException:
+                    new_uid = None
+                if new_uid != uid:
+                    outbox.put_nowait(completed_future(ws_error_message(None, 401, "invalid_auth")))
+                    close_code = WS_CLOSE_AUTH_FAILED
+                    break
+                outbox.put_nowait(completed_future({"type": "auth_ok"}))
+            elif message_type == "config":
+                if message.get("input_lang"):
+                    session["input_lang"] = normalize_input_lang(message.get("input_lang"))
+                if message.get("output_lang"):
+                    session["output_lang"] = normalize_output_lang(message.get("output_lang"))
+                if "glossary_text" in message:
+                    session["glossary"] = compile_glossary(message.get("glossary_text"))
+                slots.release()
+            else:
+                outbox.put_nowait(completed_future(ws_error_message(None, 400, "unknown_message_type")))
+        # 送信済みの結果をすべて返してから閉じる
+        outbox.put_nowait(None)
+        await writer
+        if close_code is not None:
+            await websocket.close(code=close_code, reason="invalid_auth")
+    except WebSocketDisconnect:
+        pass
+    except Exception as exc:  # noqa: BLE001
+        _ws_translate_stats["errors"] += 1
+        logger.warning(f"/ws/translate closed with error | uid={uid} {type(exc).__name__}: {exc}")
+    finally:
+        _ws_translate_stats["active"] -= 1
+        writer.cancel()
+        for task in inflight:
+            task.cancel()
+        logger.info(f"/ws/translate disconnected | uid={uid} last_seq={last_seq}")
 
 
-@app.get("/api/v1/dictionary/template.csv")
-async def get_dictionary_template(request: Request) -> JSONResponse:
-    """Get CSV template for dictionary upload"""
-    get_uid_from_request(request)  # Require auth
-    csv_content = "source,target,note\n半導体,semiconductor,電子部品\n人工知能,AI,artificial intelligence"
-    return JSONResponse({"csv": csv_content, "filename": "dictionary_template.csv"})
+# Summarize section headers by language
+SUMMARIZE_HEADERS = {
+    "ja": {"summary": "要約", "key_points": "重要ポイント", "actions": "次のアクション"},
+    "en": {"summary": "Summary", "key_points": "Key Points", "actions": "Next Actions"},
+    "zh": {"summary": "摘要", "key_points": "要点", "actions": "下一步行动"},
+    "vi": {"summary": "Tóm tắt", "key_points": "Điểm chính", "actions": "Hành động tiếp theo"},
+}
 
 
-@app.post("/api/v1/dictionary/upload")
-async def upload_dictionary_csv(request: Request) -> JSONResponse:
-    """Upload dictionary entries from CSV"""
-    uid = get_uid_from_request(request)
-    body = await request.json()
-    csv_content = body.get("csv", "")
+def build_glossary_instructions_for_summary(glossary_text: CompiledGlossary | str | None, text: str) -> str:
+    """Build glossary instructions for summarize prompt (not for Realtime); only terms that occur in text."""
+    entries = select_glossary_entries(as_compiled_glossary(glossary_text), text)
+    if not entries:
+        return ""
+    lines = [f"{src}→{dst}" for src, dst in entries]
+    return f"\n\n用語は必ず次の表記に統一してください：{', '.join(lines)}。該当語が出たら置換して要約に反映すること。"
 
-    if not csv_content:
-        raise HTTPException(status_code=400, detail={"reason": "CSV content is required"})
 
-    db = get_firestore_client()
-    dict_ref = db.collection("users").document(uid).collection("dictionary")
-    user_limit = get_user_dictionary_limit(uid)
-    current_count = len(list(dict_ref.stream()))
+SUMMARY_PROMPT_MAX_LENGTH = 2000
 
-    lines = csv_content.strip().split("\n")
-    if len(lines) < 2:
-        raise HTTPException(status_code=400, detail={"reason": "CSV must have header and at least one data row"})
 
-    # Skip header
-    added = 0
-    skipped = 0
-    for line in lines[1:]:
-        if current_count + added >= user_limit:
-            skipped += 1
-            continue
+def build_custom_summary_instructions(summary_prompt: str | None) -> str:
+    """Build custom summary prompt (user-provided, optional)."""
+    if not summary_prompt:
+        return ""
+    # Sanitize: trim and enforce max length
+    sanitized = summary_prompt.strip()[:SUMMARY_PROMPT_MAX_LENGTH]
+    if not sanitized:
+        return ""
+    return f"\n\n追加の指示: {sanitized}"
 
-        parts = line.split(",")
-        if len(parts) < 2:
-            skipped += 1
-            continue
 
-        source = parts[0].strip()
-        target = parts[1].strip()
-        note = parts[2].strip() if len(parts) > 2 else ""
+def build_summary_system_prompt(output_lang: str, glossary_inst: str, custom_inst: str) -> str:
+    headers_i18n = SUMMARIZE_HEADERS.get(output_lang, SUMMARIZE_HEADERS["ja"])
+    target_lang_name = LANG_NAMES.get(output_lang, "Japanese")
+    return (
+        f"You are a meeting summarizer. Produce concise Markdown in {target_lang_name} with three sections: "
+        f"1) {headers_i18n['summary']} 2) {headers_i18n['key_points']} (bullets) 3) {headers_i18n['actions']} (bullets)."
+        f"{glossary_inst}{custom_inst}"
+    )
 
-        if not source or not target:
-            skipped += 1
-            continue
 
-        dict_ref.add({
-            "source": source,
-            "target": target,
-            "note": note,
-            "createdAt": firebase_firestore.SERVER_TIMESTAMP,
-        })
-        added += 1
+# ========== Summary cache ==========
+# 要約プロンプトのテンプレートを変えたらバージョンを上げてキャッシュを無効化する
+SUMMARY_PROMPT_VERSION = "v1"
+SUMMARY_CACHE_ENABLED = parse_bool(os.getenv("SUMMARY_CACHE_ENABLED", "1"))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "500"))
+SUMMARY_CACHE_MAX_BYTES = int(os.getenv("SUMMARY_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+SUMMARY_CACHE_TTL_SECONDS = float(os.getenv("SUMMARY_CACHE_TTL_SECONDS", "86400"))
+# 空なら永続ティア無効。例: "summary_cache"
+SUMMARY_CACHE_SHARED_COLLECTION = os.getenv("SUMMARY_CACHE_SHARED_COLLECTION", "")
+
+_summary_cache = LRUTTLCache(SUMMARY_CACHE_MAX_ENTRIES, SUMMARY_CACHE_MAX_BYTES, SUMMARY_CACHE_TTL_SECONDS)
+_summary_shared_tier = FirestoreCacheTier(SUMMARY_CACHE_SHARED_COLLECTION) if SUMMARY_CACHE_SHARED_COLLECTION else None
+_summary_shared_stats = {"hits": 0, "misses": 0, "errors": 0}
+
+
+def summary_cache_key(
+    text: str,
+    output_lang: str,
+    glossary_text: CompiledGlossary | str | None,
+    summary_prompt: str | None,
+    model: str | None = None,
+    prompt_version: str = SUMMARY_PROMPT_VERSION,
+) -> str:
+    # 用語集はテキストに出現してプロンプトに入るエントリだけ、追加指示はサニタイズ後の文面をキーにする
+    glossary_entries = as_compiled_glossary(glossary_text).match(text)
+    raw = json.dumps(
+        [
+            text,
+            output_lang,
+            glossary_entries_key(glossary_entries) if glossary_entries else "",
+            build_custom_summary_instructions(summary_prompt),
+            model or summarize_model_default,
+            prompt_version,
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
-    logger.info(f"Dictionary CSV uploaded | uid={uid} added={added} skipped={skipped}")
-    return JSONResponse({
-        "added": added,
-        "skipped": skipped,
-        "count": current_count + added,
-        "limit": user_limit,
-    })
 
+async def get_cached_summary(key: str) -> str | None:
+    if not SUMMARY_CACHE_ENABLED:
+        return None
+    cached = _summary_cache.get(key)
+    if cached is not None:
+        return cached
+    tier = _summary_shared_tier
+    if tier is None:
+        return None
+    try:
+        shared = await run_blocking(tier.get, key)
+    except Exception as exc:  # noqa: BLE001
+        _summary_shared_stats["errors"] += 1
+        logger.warning(f"summary cache shared tier read failed: {exc}")
+        return None
+    if not isinstance(shared, str) or not shared:
+        _summary_shared_stats["misses"] += 1
+        return None
+    _summary_shared_stats["hits"] += 1
+    _summary_cache.set(key, shared)
+    return shared
 
-# Language code to display name mapping for translation prompts
-LANG_NAMES = {
-    "ja": "Japanese",
-    "en": "English",
-    "zh": "Simplified Chinese",
-    "vi": "Vietnamese",
-}
 
-VALID_INPUT_LANGS = {"auto", "ja", "en", "zh", "vi"}
-VALID_OUTPUT_LANGS = {"ja", "en", "zh", "vi"}
-JAPANESE_KANA_RE = re.compile(r"[ぁ-んァ-ヶー]")
-JAPANESE_STYLE_RE = re.compile(r"(です|ます|だ|する)")
+async def store_cached_summary(key: str, summary: str) -> bool:
+    if not SUMMARY_CACHE_ENABLED or not summary:
+        return False
+    _summary_cache.set(key, summary)
+    tier = _summary_shared_tier
+    if tier is not None:
+        try:
+            await run_blocking(tier.set, key, summary, SUMMARY_CACHE_TTL_SECONDS)
+        except Exception as exc:  # noqa: BLE001
+            _summary_shared_stats["errors"] += 1
+            logger.warning(f"summary cache shared tier write failed: {exc}")
+    return True
+
+
+def get_summary_cache_stats() -> dict:
+    stats = _summary_cache.stats()
+    stats["enabled"] = SUMMARY_CACHE_ENABLED
+    stats["promptVersion"] = SUMMARY_PROMPT_VERSION
+    stats["shared"] = dict(_summary_shared_stats, enabled=_summary_shared_tier is not None)
+    return stats
+
+
+# ========== Map-reduce summarization ==========
+# 見積もりトークンがこの予算を超える書き起こしは発話境界でチャンクに分け、部分要約 → 統合の 2 段で要約する
+SUMMARIZE_CHUNK_TOKEN_BUDGET = int(os.getenv("SUMMARIZE_CHUNK_TOKEN_BUDGET", "6000"))
+SUMMARIZE_MAP_CONCURRENCY = int(os.getenv("SUMMARIZE_MAP_CONCURRENCY", "4"))
+# 部分要約（チャンクごとのメモ）のプロンプトを変えたらバージョンを上げる
+SUMMARY_NOTES_PROMPT_VERSION = "v1"
+SUMMARY_NOTES_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_NOTES_CACHE_MAX_ENTRIES", "2000"))
+SUMMARY_NOTES_CACHE_MAX_BYTES = int(os.getenv("SUMMARY_NOTES_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+SUMMARY_NOTES_CACHE_TTL_SECONDS = float(os.getenv("SUMMARY_NOTES_CACHE_TTL_SECONDS", "86400"))
+
+_summary_notes_cache = LRUTTLCache(
+    SUMMARY_NOTES_CACHE_MAX_ENTRIES,
+    SUMMARY_NOTES_CACHE_MAX_BYTES,
+    SUMMARY_NOTES_CACHE_TTL_SECONDS,
+)
 
 
-def normalize_input_lang(lang: str | None) -> str:
-    if lang and lang in VALID_INPUT_LANGS:
-        return lang
-    return "auto"
+def split_transcript_units(text: str, token_budget: int) -> list[str]:
+    """Split on utterance boundaries (blank-line blocks, then lines); only oversized lines are cut by length."""
+    # 境界が実行時の補正で動くと、チャンク単位のノートキャッシュ（rolling summary）が全部外れるので未補正の見積もりで切る
+    units: list[str] = []
+    for block in re.split(r"(?<=\n\n)", text):
+        if estimate_tokens(block, calibrated=False) <= token_budget:
+            units.append(block)
+            continue
+        for line in block.splitlines(keepends=True):
+            line_tokens = estimate_tokens(line, calibrated=False)
+            if line_tokens <= token_budget:
+                units.append(line)
+                continue
+            # 行の平均トークン密度から、予算に 1 割余裕を残して収まる文字数で切る
+            step = max(1, int(len(line) * token_budget * 0.9 / line_tokens))
+            units.extend(line[offset : offset + step] for offset in range(0, len(line), step))
+    return [unit for unit in units if unit]
 
 
-def normalize_output_lang(lang: str | None) -> str:
-    if lang and lang in VALID_OUTPUT_LANGS:
-        return lang
-    return "ja"
+def chunk_transcript(text: str, token_budget: int) -> list[str]:
+    units = split_transcript_units(text, token_budget)
+    chunks = pack_batch_segments(list(enumerate(units)), token_budget, calibrated=False)
+    return [chunk_text for chunk_text in ("".join(unit for _, unit in chunk).strip() for chunk in chunks) if chunk_text]
 
 
-def looks_like_japanese(text: str) -> bool:
-    if not text:
-        return False
-    kana_count = len(JAPANESE_KANA_RE.findall(text))
-    return (
-        kana_count >= 10
-        or "。" in text
-        or "、" in text
-        or bool(JAPANESE_STYLE_RE.search(text))
+def build_summary_map_payload(chunk: str, output_lang: str, glossary_inst: str) -> dict:
+    target_lang_name = LANG_NAMES.get(output_lang, "Japanese")
+    system_prompt = (
+        "You are summarizing one part of a longer meeting transcript. "
+        f"Write concise bullet notes in {target_lang_name} covering the topics discussed, key points, "
+        "decisions, and action items (with owners and dates when mentioned). "
+        "Do not add information that is not in the transcript. Output the notes only."
+        f"{glossary_inst}"
     )
+    return {
+        "model": summarize_model_default,
+        "input": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": chunk},
+        ],
+    }
 
 
-@app.post("/translate")
-async def translate_text(
-    request: Request,
-    text: str = Form(...),
-    input_lang: str = Form("auto"),
-    output_lang: str = Form("ja"),
-) -> JSONResponse:
-    # 認証必須: Firebase ID トークンを検証
-    get_uid_from_request(request)
+def build_summary_reduce_input(partials: list[str]) -> str:
+    parts = "\n\n".join(f"### Part {index}\n{partial}" for index, partial in enumerate(partials, start=1))
+    return (
+        "The following are notes from consecutive parts of one meeting. "
+        "Merge them into a single summary of the whole meeting.\n\n"
+        f"{parts}"
+    )
 
-    if not text.strip():
-        raise HTTPException(status_code=400, detail="text is required")
 
-    # Normalize and validate language codes
-    output_lang_raw = output_lang
-    input_lang = normalize_input_lang(input_lang)
-    output_lang = normalize_output_lang(output_lang)
-    target_lang_name = LANG_NAMES.get(output_lang, "Japanese")
-    logger.info(
-        f"/translate request | output_lang_raw={output_lang_raw!r} output_lang={output_lang} "
-        f"target={target_lang_name} text_len={len(text)}"
+def summary_notes_cache_key(chunk: str, output_lang: str, glossary_entries: list[tuple[str, str]]) -> str:
+    parts = [chunk, output_lang, summarize_model_default, SUMMARY_NOTES_PROMPT_VERSION]
+    if glossary_entries:
+        parts.append(glossary_entries_key(glossary_entries))
+    raw = json.dumps(parts, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def summarize_chunk(
+    chunk: str,
+    output_lang: str,
+    glossary_text: CompiledGlossary | str | None,
+    usage: dict | None = None,
+) -> tuple[str, str, bool]:
+    """Notes for one chunk as (cache_key, notes, cached); keyed by chunk content, not by position."""
+    # 部分要約は summary_prompt に依存させない（プロンプトを変えた再生成でも使い回せるように）
+    glossary_entries = select_glossary_entries(as_compiled_glossary(glossary_text), chunk)
+    key = summary_notes_cache_key(chunk, output_lang, glossary_entries)
+    cached = _summary_notes_cache.get(key)
+    if cached is not None:
+        return key, cached, True
+    glossary_inst = build_glossary_instructions_for_summary(glossary_text, chunk)
+    result = await post_openai_coalesced(
+        "https://api.openai.com/v1/responses",
+        build_summary_map_payload(chunk, output_lang, glossary_inst),
+        openai_json_headers(),
     )
+    if usage is not None:
+        accumulate_usage(usage, result.get("usage"))
+    notes = extract_output_text(result)
+    if notes:
+        _summary_notes_cache.set(key, notes)
+    return key, notes, False
 
-    # Build translation system prompt
-    system_prompt = (
-        f"Translate the user's text into natural {target_lang_name}. "
-        f"You MUST output in {target_lang_name} only. "
-        "Do NOT output in the same language as the input. "
-        "Output the translation only."
-    )
 
-    payload = {
-        "model": translate_model_default,
+def build_summary_reduce_payload(partials: list[str], system_prompt: str) -> dict:
+    return {
+        "model": summarize_model_default,
         "input": [
             {"role": "system", "content": system_prompt},
-            {"role": "user", "content": text},
+            {"role": "user", "content": build_summary_reduce_input(partials)},
         ],
     }
 
-    api_key = get_openai_api_key()
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
 
-    result = await post_openai("https://api.openai.com/v1/responses", payload, headers)
-    translated = extract_output_text(result)
-    logger.info(
-        f"/translate result | output_lang={output_lang} translation_len={len(translated)} "
-        f"translation_head={translated[:80]!r}"
+def accumulate_usage(total: dict, usage: dict | None) -> dict:
+    """Sum Responses API usage counters (input/output/total tokens) across calls."""
+    if isinstance(usage, dict):
+        for field in ("input_tokens", "output_tokens", "total_tokens"):
+            value = usage.get(field)
+            if isinstance(value, int):
+                total[field] = total.get(field, 0) + value
+    return total
+
+
+async def prepare_summary_request(
+    text: str,
+    chunks: list[str],
+    output_lang: str,
+    glossary_text: CompiledGlossary | str | None,
+    summary_prompt: str | None,
+    usage: dict,
+) -> tuple[dict, dict]:
+    """Run the map stage when there are several chunks; return the final (single or reduce) payload and stats."""
+    started = time.perf_counter()
+    # Build glossary instructions (only for summarize, not Realtime)
+    glossary_inst = build_glossary_instructions_for_summary(glossary_text, text)
+    system_prompt = build_summary_system_prompt(
+        output_lang, glossary_inst, build_custom_summary_instructions(summary_prompt)
     )
-    if output_lang != "ja" and looks_like_japanese(translated):
-        logger.warning(
-            f"/translate ja_guard triggered | output_lang={output_lang} "
-            f"translation_head={translated[:80]!r}"
-        )
-        retry_prompt = (
-            f"The previous output was not in {target_lang_name}. "
-            f"Translate the user's text into natural {target_lang_name}. "
-            f"You MUST output in {target_lang_name} only. "
-            "Do NOT output in Japanese. "
-            "Output the translation only."
-        )
-        retry_payload = {
-            "model": translate_model_default,
+    if len(chunks) <= 1:
+        # Use same Responses API format as /translate (input array with roles, no top-level "system")
+        payload = {
+            "model": summarize_model_default,
             "input": [
-                {"role": "system", "content": retry_prompt},
+                {"role": "system", "content": system_prompt},
                 {"role": "user", "content": text},
             ],
         }
-        retry_result = await post_openai("https://api.openai.com/v1/responses", retry_payload, headers)
-        translated = extract_output_text(retry_result)
-        logger.info(
-            f"/translate retry_result | output_lang={output_lang} translation_len={len(translated)} "
-            f"translation_head={translated[:80]!r}"
+        return payload, {"mode": "single", "chunks": 1}
+
+    semaphore = asyncio.Semaphore(max(1, SUMMARIZE_MAP_CONCURRENCY))
+
+    async def run_map(chunk: str) -> tuple[str, str, bool]:
+        async with semaphore:
+            return await summarize_chunk(chunk, output_lang, glossary_text, usage)
+
+    mapped = await asyncio.gather(*(run_map(chunk) for chunk in chunks))
+    partials = [notes for _, notes, _ in mapped]
+    cached_chunks = sum(1 for _, _, cached in mapped if cached)
+
+    # 部分要約の合計もまだ予算を超えるなら、さらにまとめてから最終統合する（階層 reduce）
+    rounds = 0
+    while (
+        len(partials) > 1
+        and estimate_tokens(build_summary_reduce_input(partials)) > SUMMARIZE_CHUNK_TOKEN_BUDGET
+    ):
+        groups = pack_batch_segments(list(enumerate(partials)), SUMMARIZE_CHUNK_TOKEN_BUDGET, calibrated=False)
+        if len(groups) >= len(partials):
+            break
+        rounds += 1
+        merged = await asyncio.gather(
+            *(run_map(build_summary_reduce_input([partial for _, partial in group])) for group in groups)
         )
-    return JSONResponse({"translation": translated})
-
+        partials = [notes for _, notes, _ in merged]
+
+    stats = {
+        "mode": "map_reduce",
+        "chunks": len(chunks),
+        "cachedChunks": cached_chunks,
+        "intermediateRounds": rounds,
+        "mapMs": elapsed_ms(started),
+    }
+    return build_summary_reduce_payload(partials, system_prompt), stats
+
+
+async def summarize_transcript(
+    text: str,
+    output_lang: str,
+    glossary_text: CompiledGlossary | str | None,
+    summary_prompt: str | None,
+) -> tuple[str, dict]:
+    """Summarize text in one call, or map-reduce it when it exceeds SUMMARIZE_CHUNK_TOKEN_BUDGET."""
+    started = time.perf_counter()
+    cache_key = summary_cache_key(text, output_lang, glossary_text, summary_prompt)
+    cached = await get_cached_summary(cache_key)
+    if cached is not None:
+        return cached, {"mode": "cached", "chunks": 0, "totalMs": elapsed_ms(started), "usage": {}}
+
+    usage: dict = {}
+    chunks = chunk_transcript(text, SUMMARIZE_CHUNK_TOKEN_BUDGET)
+    payload, stats = await prepare_summary_request(text, chunks, output_lang, glossary_text, summary_prompt, usage)
+    final_started = time.perf_counter()
+    result = await post_openai_coalesced("https://api.openai.com/v1/responses", payload, openai_json_headers())
+    accumulate_usage(usage, result.get("usage"))
+    if stats["mode"] == "map_reduce":
+        stats["reduceMs"] = elapsed_ms(final_started)
+    stats["totalMs"] = elapsed_ms(started)
+    stats["usage"] = usage
+    summary = extract_output_text(result)
+    await store_cached_summary(cache_key, summary)
+    return summary, stats
 
 
-# Summarize section headers by language
-SUMMARIZE_HEADERS = {
-    "ja": {"summary": "要約", "key_points": "重要ポイント", "actions": "次のアクション"},
-    "en": {"summary": "Summary", "key_points": "Key Points", "actions": "Next Actions"},
-    "zh": {"summary": "摘要", "key_points": "要点", "actions": "下一步行动"},
-    "vi": {"summary": "Tóm tắt", "key_points": "Điểm chính", "actions": "Hành động tiếp theo"},
-}
+@app.post("/summarize")
+async def summarize(
+    request: Request,
+    text: str = Form(...),
+    output_lang: str = Form("ja"),
+    glossary_text: str = Form(""),
+    glossary_version: str = Form(""),
+    summary_prompt: str = Form(""),
+) -> JSONResponse:
+    # 認証必須: Firebase ID トークンを検証
+    uid = await require_uid(request)
 
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="text is required")
 
-def build_glossary_instructions_for_summary(glossary_text: str | None) -> str:
-    """Build glossary instructions for summarize prompt (not for Realtime)."""
-    entries = parse_glossary_text(glossary_text)
-    if not entries:
-        return ""
-    lines = [f"{src}→{dst}" for src, dst in entries]
-    return f"\n\n用語は必ず次の表記に統一してください：{', '.join(lines)}。該当語が出たら置換して要約に反映すること。"
+    ensure_input_within_budget(text, SUMMARIZE_MAX_INPUT_TOKENS)
+    # Normalize output language
+    output_lang = normalize_output_lang(output_lang)
+    glossary, dictionary_glossary_version = await resolve_request_glossary(uid, glossary_text, glossary_version)
+    summary, stats = await summarize_transcript(text, output_lang, glossary, summary_prompt)
+    if dictionary_glossary_version is not None:
+        stats["glossaryVersion"] = dictionary_glossary_version
+    logger.info(
+        f"/summarize done | {json.dumps(dict(stats, outputLang=output_lang, textLen=len(text)))}"
+    )
+    return JSONResponse({"summary": summary, "stats": stats})
+
+
+# ========== Streaming summarization ==========
+async def stream_summary_events(
+    text: str, output_lang: str, glossary_text: CompiledGlossary | str | None, summary_prompt: str
+):
+    """Yield SSE frames (progress / delta / done / error); only the final call is streamed."""
+    started = time.perf_counter()
+    cache_key = summary_cache_key(text, output_lang, glossary_text, summary_prompt)
+    cached = await get_cached_summary(cache_key)
+    if cached is not None:
+        stats = {"mode": "cached", "chunks": 0, "totalMs": elapsed_ms(started)}
+        yield format_sse("delta", {"text": cached})
+        yield format_sse("done", {"summary": cached, "usage": {}, "stats": stats, "cached": True})
+        logger.info(f"/summarize/stream done | {json.dumps(dict(stats, outputLang=output_lang, textLen=len(text)))}")
+        return
 
+    usage: dict = {}
+    chunks = chunk_transcript(text, SUMMARIZE_CHUNK_TOKEN_BUDGET)
+    parts: list[str] = []
+    ttft_ms = None
+    try:
+        if len(chunks) > 1:
+            yield format_sse("progress", {"stage": "map", "chunks": len(chunks)})
+        payload, stats = await prepare_summary_request(
+            text, chunks, output_lang, glossary_text, summary_prompt, usage
+        )
+        if stats["mode"] == "map_reduce":
+            yield format_sse(
+                "progress", {"stage": "reduce", "chunks": len(chunks), "cachedChunks": stats["cachedChunks"]}
+            )
+        final_started = time.perf_counter()
+        events = stream_openai("https://api.openai.com/v1/responses", payload, openai_json_headers())
+        try:
+            async for event in events:
+                event_type = event.get("type")
+                if event_type in ("response.failed", "error"):
+                    raise RuntimeError(f"upstream stream failed: {event_type}")
+                if event_type == "response.completed":
+                    response = event.get("response")
+                    accumulate_usage(usage, response.get("usage") if isinstance(response, dict) else None)
+                    continue
+                if event_type != "response.output_text.delta":
+                    continue
+                delta = event.get("delta") or ""
+                if not delta:
+                    continue
+                if ttft_ms is None:
+                    ttft_ms = elapsed_ms(started)
+                parts.append(delta)
+                yield format_sse("delta", {"text": delta})
+        finally:
+            await events.aclose()
+    except SSE_UPSTREAM_ERRORS as exc:
+        yield format_upstream_error_sse(exc, "/summarize/stream")
+        return
 
-SUMMARY_PROMPT_MAX_LENGTH = 2000
+    if stats["mode"] == "map_reduce":
+        stats["reduceMs"] = elapsed_ms(final_started)
+    stats["totalMs"] = elapsed_ms(started)
+    stats["ttftMs"] = ttft_ms
+    summary = "".join(parts).strip()
+    await store_cached_summary(cache_key, summary)
+    yield format_sse("done", {"summary": summary, "usage": usage, "stats": stats, "cached": False})
+    logger.info(
+        f"/summarize/stream done | {json.dumps(dict(stats, usage=usage, outputLang=output_lang, textLen=len(text)))}"
+    )
 
 
-@app.post("/summarize")
-async def summarize(
+@app.post("/summarize/stream")
+async def summarize_stream(
     request: Request,
     text: str = Form(...),
     output_lang: str = Form("ja"),
     glossary_text: str = Form(""),
+    glossary_version: str = Form(""),
     summary_prompt: str = Form(""),
-) -> JSONResponse:
+) -> StreamingResponse:
     # 認証必須: Firebase ID トークンを検証
-    get_uid_from_request(request)
+    uid = await require_uid(request)
 
     if not text.strip():
         raise HTTPException(status_code=400, detail="text is required")
 
-    # Normalize output language
+    ensure_input_within_budget(text, SUMMARIZE_MAX_INPUT_TOKENS)
     output_lang = normalize_output_lang(output_lang)
-    headers_i18n = SUMMARIZE_HEADERS.get(output_lang, SUMMARIZE_HEADERS["ja"])
-    target_lang_name = LANG_NAMES.get(output_lang, "Japanese")
+    glossary, _ = await resolve_request_glossary(uid, glossary_text, glossary_version)
+    logger.info(f"/summarize/stream request | output_lang={output_lang} text_len={len(text)}")
+    return StreamingResponse(
+        stream_summary_events(text, output_lang, glossary, summary_prompt),
+        media_type="text/event-stream",
+        headers=SSE_RESPONSE_HEADERS,
+    )
 
-    # Build glossary instructions (only for summarize, not Realtime)
-    glossary_inst = build_glossary_instructions_for_summary(glossary_text)
 
-    # Build custom summary prompt (user-provided, optional)
-    custom_inst = ""
-    if summary_prompt:
-        # Sanitize: trim and enforce max length
-        sanitized = summary_prompt.strip()[:SUMMARY_PROMPT_MAX_LENGTH]
-        if sanitized:
-            custom_inst = f"\n\n追加の指示: {sanitized}"
+# ========== Rolling summary per job ==========
+# 録音中に確定した発話を jobs/{jobId} 単位で受け取り、閉じたチャンクの部分要約をバックグラウンドで先に作っておく
+ROLLING_SUMMARY_MAX_JOBS = int(os.getenv("ROLLING_SUMMARY_MAX_JOBS", "500"))
+ROLLING_SUMMARY_TTL_SECONDS = float(os.getenv("ROLLING_SUMMARY_TTL_SECONDS", str(6 * 3600)))
+ROLLING_SUMMARY_MAX_SEGMENTS_PER_APPEND = int(os.getenv("ROLLING_SUMMARY_MAX_SEGMENTS_PER_APPEND", "200"))
+ROLLING_SUMMARY_MAX_CHARS = int(os.getenv("ROLLING_SUMMARY_MAX_CHARS", "400000"))
+# インスタンス内に保持する原文の合計（UTF-8 バイト）。超える追記は 503 で断る
+ROLLING_SUMMARY_MAX_BYTES = int(os.getenv("ROLLING_SUMMARY_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+class RollingSummaryState:
+    """Transcript segments of one running job plus the chunk notes already folded for it."""
+
+    def __init__(
+        self,
+        job_id: str,
+        uid: str,
+        output_lang: str,
+        glossary: CompiledGlossary | str | None,
+        glossary_request: tuple[str, str] = ("", ""),
+    ):
+        self.job_id = job_id
+        self.uid = uid
+        self.output_lang = output_lang
+        # 最初の追記で解決した用語集（辞書マージ済み）。部分要約のキーが用語集に依存するので最終要約でも同じものを使う
+        self.glossary = as_compiled_glossary(glossary)
+        # 解決に使った (glossaryText, glossaryVersion)。最終要約の指定と一致するときだけ self.glossary を再利用する
+        self.glossary_request = glossary_request
+        self.glossary_version: int | None = None
+        self.segments: list[str] = []
+        # クライアント側の通し番号（次に来るべき offset）と、キャッシュに登録した原文のバイト数
+        self.received = 0
+        self.chars = 0
+        self.bytes = 0
+        self.revision = 0
+        self.notes: dict[str, str] = {}
+        self.fold_task: asyncio.Task | None = None
+
+    def transcript(self) -> str:
+        # フロントの原文ダウンロード（state.logs.join('\n')）と同じ連結にしてチャンク境界を揃える
+        return "\n".join(self.segments)
+
+
+_rolling_summaries = LRUTTLCache(
+    ROLLING_SUMMARY_MAX_JOBS,
+    ROLLING_SUMMARY_MAX_BYTES,
+    ROLLING_SUMMARY_TTL_SECONDS,
+)
+_rolling_summary_stats = {
+    "appends": 0,
+    "segments": 0,
+    "folds": 0,
+    "foldedChunks": 0,
+    "foldErrors": 0,
+    "finals": 0,
+    "resyncs": 0,
+    "rejected": 0,
+}
+
 
-    system_prompt = (
-        f"You are a meeting summarizer. Produce concise Markdown in {target_lang_name} with three sections: "
-        f"1) {headers_i18n['summary']} 2) {headers_i18n['key_points']} (bullets) 3) {headers_i18n['actions']} (bullets)."
-        f"{glossary_inst}{custom_inst}"
+def load_owned_job(db, job_id: str, uid: str) -> dict:
+    job_snap = db.collection("jobs").document(job_id).get()
+    if not job_snap.exists:
+        raise HTTPException(status_code=404, detail="job_not_found")
+    job_data = job_snap.to_dict() or {}
+    if job_data.get("uid") != uid:
+        raise HTTPException(status_code=403, detail="forbidden")
+    return job_data
+
+
+def seed_persisted_summary_notes(job_data: dict) -> int:
+    """Put chunk notes saved on the job document (by any instance) back into the notes cache."""
+    rolling = job_data.get("rollingSummary")
+    notes = rolling.get("notes") if isinstance(rolling, dict) else None
+    if not isinstance(notes, dict):
+        return 0
+    seeded = 0
+    for key, value in notes.items():
+        if isinstance(value, str) and value and _summary_notes_cache.get(key) is None:
+            _summary_notes_cache.set(key, value)
+            seeded += 1
+    return seeded
+
+
+async def persist_rolling_summary_notes(state: RollingSummaryState) -> None:
+    db = get_firestore_client()
+    job_ref = db.collection("jobs").document(state.job_id)
+    # ノートは毎回マップ全体を書き込む（ジョブ削除と一緒に消える）
+    await run_blocking(
+        job_ref.update,
+        {"rollingSummary": {"outputLang": state.output_lang, "notes": dict(state.notes)}},
     )
-    # Use same Responses API format as /translate (input array with roles, no top-level "system")
-    payload = {
-        "model": summarize_model_default,
-        "input": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": text},
-        ],
-    }
-    api_key = get_openai_api_key()
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-    result = await post_openai("https://api.openai.com/v1/responses", payload, headers)
-    summary = extract_output_text(result)
-    return JSONResponse({"summary": summary})
+
+
+async def fold_rolling_summary(state: RollingSummaryState) -> None:
+    """Summarize every closed chunk (all but the last, still-growing one) until no new segments arrive."""
+    semaphore = asyncio.Semaphore(max(1, SUMMARIZE_MAP_CONCURRENCY))
+
+    async def run_map(chunk: str) -> tuple[str, str, bool]:
+        async with semaphore:
+            return await summarize_chunk(chunk, state.output_lang, state.glossary)
+
+    while True:
+        revision = state.revision
+        closed = chunk_transcript(state.transcript(), SUMMARIZE_CHUNK_TOKEN_BUDGET)[:-1]
+        mapped = await asyncio.gather(*(run_map(chunk) for chunk in closed))
+        fresh = {key: notes for key, notes, _ in mapped if notes and key not in state.notes}
+        if fresh:
+            state.notes.update(fresh)
+            _rolling_summary_stats["folds"] += 1
+            _rolling_summary_stats["foldedChunks"] += len(fresh)
+            try:
+                await persist_rolling_summary_notes(state)
+            except Exception as exc:  # noqa: BLE001
+                logger.warning(f"rolling summary persist failed | jobId={state.job_id} error={exc}")
+        if state.revision == revision:
+            return
+
+
+def schedule_rolling_summary_fold(state: RollingSummaryState) -> None:
+    if state.fold_task is not None and not state.fold_task.done():
+        return
+
+    async def run() -> None:
+        try:
+            await fold_rolling_summary(state)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            # 失敗したチャンクは次の追記か最終要約で作り直す
+            _rolling_summary_stats["foldErrors"] += 1
+            logger.warning(f"rolling summary fold failed | jobId={state.job_id} error={exc}")
+
+    state.fold_task = asyncio.create_task(run())
+
+
+def get_rolling_summary_stats() -> dict:
+    cache_stats = _rolling_summaries.stats()
+    return dict(_rolling_summary_stats, jobs=cache_stats["entries"], bytes=cache_stats["bytes"])
+
+
+def job_summary_glossary_request(body: dict) -> tuple[str, str]:
+    return str(body.get("glossaryText") or ""), str(body.get("glossaryVersion") or "").strip()
+
+
+@app.post("/api/v1/jobs/{job_id}/summary/segments")
+async def append_job_summary_segments(job_id: str, request: Request) -> JSONResponse:
+    uid = await require_uid(request)
+    body = await request.json()
+    segments = body.get("segments") if isinstance(body, dict) else None
+    if not isinstance(segments, list) or not all(isinstance(segment, str) for segment in segments):
+        raise HTTPException(status_code=400, detail="segments must be a list of strings")
+    if len(segments) > ROLLING_SUMMARY_MAX_SEGMENTS_PER_APPEND:
+        raise HTTPException(status_code=413, detail="too_many_segments")
+    offset = body.get("offset")
+    if offset is not None and (not isinstance(offset, int) or isinstance(offset, bool) or offset < 0):
+        raise HTTPException(status_code=400, detail="offset must be a non-negative integer")
+    received = len(segments)
+    segments = [segment.strip() for segment in segments if segment.strip()]
+
+    state = _rolling_summaries.get(job_id)
+    received_before = state.received if state is not None else 0
+    if state is not None and state.uid != uid:
+        raise HTTPException(status_code=403, detail="forbidden")
+    if offset is not None and offset != received_before:
+        # 状態が追い出された・期限切れになった（または追記が抜けた）: 途中からの原文を畳むとチャンク境界がずれるので、
+        # segmentCount 以降の原文を送り直させる（状態が無いときは 0 = 全文）
+        if state is None:
+            await run_blocking(load_owned_job, get_firestore_client(), job_id, uid)
+        _rolling_summary_stats["resyncs"] += 1
+        raise HTTPException(
+            status_code=409,
+            detail={"reason": "rolling_summary_resync", "segmentCount": received_before},
+        )
+
+    created = state is None
+    if created:
+        db = get_firestore_client()
+        job_data = await run_blocking(load_owned_job, db, job_id, uid)
+        if job_data.get("status") != "running":
+            raise HTTPException(status_code=409, detail="job_not_running")
+        glossary_request = job_summary_glossary_request(body)
+        glossary, glossary_version = await resolve_request_glossary(uid, *glossary_request)
+        state = RollingSummaryState(
+            job_id, uid, normalize_output_lang(body.get("outputLang")), glossary, glossary_request
+        )
+        state.glossary_version = glossary_version
+
+    added_chars = sum(len(segment) for segment in segments)
+    if state.chars + added_chars > ROLLING_SUMMARY_MAX_CHARS:
+        raise HTTPException(status_code=413, detail="transcript_too_long")
+    added_bytes = sum(len(segment.encode("utf-8")) for segment in segments)
+    _rolling_summaries.purge_expired()
+    held_bytes = _rolling_summaries.stats()["bytes"] - (0 if created else state.bytes)
+    if held_bytes + state.bytes + added_bytes > ROLLING_SUMMARY_MAX_BYTES:
+        _rolling_summary_stats["rejected"] += 1
+        raise HTTPException(status_code=503, detail="rolling_summary_capacity_exceeded")
+    if segments:
+        state.segments.extend(segments)
+        state.chars += added_chars
+        state.bytes += added_bytes
+        state.revision += 1
+        _rolling_summary_stats["appends"] += 1
+        _rolling_summary_stats["segments"] += len(segments)
+        schedule_rolling_summary_fold(state)
+    state.received += received
+    # 実サイズで登録し直す（追記のたびに TTL も延びる）
+    _rolling_summaries.set(job_id, state, size=state.bytes)
+    return JSONResponse(
+        {"jobId": job_id, "segmentCount": state.received, "foldedChunks": len(state.notes)}
+    )
+
+
+@app.post("/api/v1/jobs/{job_id}/summary")
+async def summarize_job(job_id: str, request: Request) -> JSONResponse:
+    """Final (or regenerated) summary: reuses chunk notes folded while the job was running."""
+    uid = await require_uid(request)
+    body = await request.json()
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="invalid body")
+
+    state = _rolling_summaries.get(job_id)
+    if state is not None and state.uid != uid:
+        raise HTTPException(status_code=403, detail="forbidden")
+    if state is None:
+        # 別インスタンスで追記された場合もジョブに保存されたノートを使う
+        db = get_firestore_client()
+        job_data = await run_blocking(load_owned_job, db, job_id, uid)
+        seed_persisted_summary_notes(job_data)
+    elif state.fold_task is not None and not state.fold_task.done():
+        await asyncio.shield(state.fold_task)
+
+    text = body.get("text")
+    if not isinstance(text, str) or not text.strip():
+        text = state.transcript() if state is not None else ""
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="text is required")
+    ensure_input_within_budget(text, SUMMARIZE_MAX_INPUT_TOKENS)
+
+    output_lang = normalize_output_lang(body.get("outputLang"))
+    glossary_request = job_summary_glossary_request(body)
+    if state is not None and state.glossary_request == glossary_request:
+        # 部分要約を畳んだときと同じ用語集を使う（途中で辞書が更新されてもノートのキーを揃える）
+        glossary = state.glossary
+        dictionary_glossary_version = state.glossary_version
+    else:
+        glossary, dictionary_glossary_version = await resolve_request_glossary(uid, *glossary_request)
+    summary, stats = await summarize_transcript(
+        text,
+        output_lang,
+        glossary,
+        str(body.get("summaryPrompt") or ""),
+    )
+    if dictionary_glossary_version is not None:
+        stats["glossaryVersion"] = dictionary_glossary_version
+    _rolling_summary_stats["finals"] += 1
+    logger.info(
+        f"/jobs/summary done | {json.dumps(dict(stats, jobId=job_id, outputLang=output_lang, textLen=len(text)))}"
+    )
+    return JSONResponse({"summary": summary, "stats": stats})
 
 
 async def run_ffmpeg(input_path: Path, output_path: Path) -> None:
@@ -2750,7 +6738,7 @@ async def run_ffmpeg(input_path: Path, output_path: Path) -> None:
 @app.post("/audio_m4a")
 async def convert_audio(request: Request, file: UploadFile = File(...)) -> JSONResponse:
     # 認証必須: Firebase ID トークンを検証
-    get_uid_from_request(request)
+    await require_uid(request)
 
     suffix = Path(file.filename).suffix or ".webm"
     token = uuid.uuid4().hex
@@ -2758,7 +6746,7 @@ async def convert_audio(request: Request, file: UploadFile = File(...)) -> JSONR
     output_path = DOWNLOAD_DIR / f"converted-{token}.m4a"
 
     content = await file.read()
-    input_path.write_bytes(content)
+    await run_blocking(input_path.write_bytes, content)
 
     try:
         await run_ffmpeg(input_path, output_path)
@@ -2770,7 +6758,7 @@ async def convert_audio(request: Request, file: UploadFile = File(...)) -> JSONR
 
     download_url = f"/downloads/{output_path.name}"
     try:
-        cleanup_downloads_dir()
+        await run_blocking(cleanup_downloads_dir)
     except Exception:
         logger.exception("cleanup after conversion failed")
     return JSONResponse({"url": download_url})
@@ -2786,6 +6774,37 @@ async def healthcheck() -> JSONResponse:
             "service": SERVICE_NAME,
             "version": APP_VERSION,
             "time": datetime.now(timezone.utc).isoformat(),
+            "openai": {"circuit": _openai_breaker.stats()},
+        }
+    )
+
+
+@app.get("/api/v1/admin/metrics")
+async def get_metrics(request: Request) -> JSONResponse:
+    """プロセス内メトリクス（OpenAI 接続プールなど）を返す"""
+    verify_admin_access(request)
+    return JSONResponse(
+        {
+            "service": SERVICE_NAME,
+            "version": APP_VERSION,
+            "time": datetime.now(timezone.utc).isoformat(),
+            "openaiPool": get_openai_pool_stats(),
+            "translationCache": get_translation_cache_stats(),
+            "openaiCoalesce": get_openai_coalesce_stats(),
+            "jaGuard": get_ja_guard_stats(),
+            "upstreamLimiters": get_upstream_limiter_stats(),
+            "openaiCircuit": _openai_breaker.stats(),
+            "realtimeKeyPool": get_realtime_key_pool_stats(),
+            "glossary": get_glossary_stats(),
+            "rollingSummary": get_rolling_summary_stats(),
+            "summaryCache": get_summary_cache_stats(),
+            "tokenEstimator": get_token_estimator_stats(),
+            "wsTranslate": get_ws_translate_stats(),
+            "authTokenCache": get_auth_token_cache_stats(),
+            "blockingIo": get_blocking_io_stats(),
+            "userDocCache": get_user_doc_cache_stats(),
+            "dictionarySnapshot": get_dictionary_snapshot_stats(),
+            "dictionaryGlossary": get_dictionary_glossary_stats(),
         }
     )
 
@@ -2798,6 +6817,25 @@ async def httpx_error_handler(_: Request, exc: httpx.HTTPStatusError) -> JSONRes
     )
 
 
+@app.exception_handler(UpstreamOverloadedError)
+async def upstream_overloaded_handler(_: Request, exc: UpstreamOverloadedError) -> JSONResponse:
+    logger.warning(f"Upstream load shed | endpoint={exc.name} retry_after={exc.retry_after:.1f}")
+    return JSONResponse(
+        {"detail": "upstream_overloaded"},
+        status_code=503,
+        headers={"Retry-After": str(max(1, int(exc.retry_after + 0.999)))},
+    )
+
+
+@app.exception_handler(OpenAICircuitOpenError)
+async def openai_circuit_open_handler(_: Request, exc: OpenAICircuitOpenError) -> JSONResponse:
+    return JSONResponse(
+        {"detail": "openai_circuit_open"},
+        status_code=503,
+        headers={"Retry-After": str(max(1, int(exc.retry_after + 0.999)))},
+    )
+
+
 @app.exception_handler(httpx.RequestError)
 async def httpx_request_error(_: Request, exc: httpx.RequestError) -> JSONResponse:
     return JSONResponse({"detail": f"Network error: {exc}"}, status_code=502)
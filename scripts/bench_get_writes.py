@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+GET エンドポイント（/api/v1/me, /api/v1/usage/remaining）の Firestore 書き込み回数ベンチマーク
+
+MockFirestoreClient 上で、複数ユーザーが 00:00 JST をまたいでポーリングする状況を再現し、
+書き込み回数を数えます。--legacy を付けると、GET でもロールオーバーを永続化していた従来の挙動で計測します。
+
+使用方法:
+  python scripts/bench_get_writes.py
+  python scripts/bench_get_writes.py --legacy
+  python scripts/bench_get_writes.py --users 500 --polls 6
+"""
+
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+os.environ.setdefault("DEBUG_AUTH_BYPASS", "1")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import app as app_module  # noqa: E402
+
+
+def install_write_counter() -> dict:
+    counts = {"writes": 0}
+    # MockTransaction の書き込みも MockDocument.set / update に委譲されるので、ここだけ数えれば足りる
+    for cls, name in ((app_module.MockDocument, "set"), (app_module.MockDocument, "update")):
+        original = getattr(cls, name)
+
+        def counted(self, *args, _original=original, **kwargs):
+            counts["writes"] += 1
+            return _original(self, *args, **kwargs)
+
+        setattr(cls, name, counted)
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--polls", type=int, default=3, help="日付をまたぐ前後それぞれのポーリング回数")
+    parser.add_argument("--legacy", action="store_true", help="GET でもロールオーバーを書き込む従来の挙動")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    db = app_module.MockFirestoreClient()
+    app_module._firestore_client = db
+    counts = install_write_counter()
+
+    async def bench_uid(request):
+        return request.headers["x-bench-uid"]
+
+    app_module.require_uid = bench_uid
+    if args.legacy:
+        read_user_state = app_module.read_user_state
+
+        def legacy_read_user_state(*call_args, persist=True, **kwargs):
+            return read_user_state(*call_args, **kwargs)
+
+        app_module.read_user_state = legacy_read_user_state
+
+    before_midnight = datetime(2026, 1, 31, 23, 58, tzinfo=app_module.JST)
+    after_midnight = before_midnight + timedelta(minutes=4)
+    client = TestClient(app_module.app)
+
+    # 前日までに利用があったユーザー（dayKey / monthKey が前日・前月のまま残っている）
+    for index in range(args.users):
+        db.collection("users").document(f"user-{index}").set(
+            app_module.normalize_user_usage_data({"plan": "free"}, before_midnight - timedelta(days=1), True)[0]
+        )
+    counts["writes"] = 0
+
+    results = {}
+    for label, current in (("before 00:00", before_midnight), ("after 00:00", after_midnight)):
+        app_module.now_jst = lambda current=current: current
+        start = counts["writes"]
+        for _ in range(args.polls):
+            for index in range(args.users):
+                headers = {"x-bench-uid": f"user-{index}"}
+                for path in ("/api/v1/me", "/api/v1/usage/remaining"):
+                    response = client.get(path, headers=headers)
+                    response.raise_for_status()
+        results[label] = counts["writes"] - start
+
+    mode = "legacy (GET persists rollover)" if args.legacy else "read-only GET"
+    requests = args.users * args.polls * 2
+    print(f"mode: {mode}")
+    for label, writes in results.items():
+        print(f"  {label}: {requests} GETs -> {writes} Firestore writes")
+
+
+if __name__ == "__main__":
+    main()
@@ -43,6 +43,7 @@ const STRINGS = {
     errorLoginFailed: 'ログインに失敗しました: ',
     errorLogoutFailed: 'ログアウトに失敗しました: ',
     errorTranslation: '翻訳に失敗しました',
+    errorTranslationUnavailable: '翻訳サービスが一時的に利用できません。しばらくしてから再試行してください。',
     errorQuotaCheck: '利用可能時間の確認に失敗しました。しばらくしてから再試行してください。',
     errorMonthlyExhausted: '今月の利用可能時間が残っていません。',
     errorDailyLimit: 'Freeプランの本日の利用上限(10分)に達しました。',
@@ -196,6 +197,7 @@ const STRINGS = {
     errorLoginFailed: 'Login failed: ',
     errorLogoutFailed: 'Logout failed: ',
     errorTranslation: 'Translation failed',
+    errorTranslationUnavailable: 'The translation service is temporarily unavailable. Please try again shortly.',
     errorQuotaCheck: 'Failed to check available time. Please try again later.',
     errorMonthlyExhausted: 'No remaining time this month.',
     errorDailyLimit: 'Daily limit (10 min) reached for Free plan.',
@@ -349,6 +351,7 @@ const STRINGS = {
     errorLoginFailed: 'Đăng nhập thất bại: ',
     errorLogoutFailed: 'Đăng xuất thất bại: ',
     errorTranslation: 'Dịch thất bại',
+    errorTranslationUnavailable: 'Dịch vụ dịch tạm thời không khả dụng. Vui lòng thử lại sau.',
     errorQuotaCheck: 'Không thể kiểm tra thời gian khả dụng. Vui lòng thử lại sau.',
     errorMonthlyExhausted: 'Đã hết thời gian sử dụng trong tháng.',
     errorDailyLimit: 'Đã đạt giới hạn hàng ngày (10 phút) cho gói Free.',
@@ -526,6 +529,7 @@ const STRINGS = {
     errorLoginFailed: '登录失败: ',
     errorLogoutFailed: '登出失败: ',
     errorTranslation: '翻译失败',
+    errorTranslationUnavailable: '翻译服务暂时不可用，请稍后重试。',
     errorQuotaCheck: '无法确认可用时间，请稍后重试。',
     errorMonthlyExhausted: '本月可用时间已用完。',
     errorDailyLimit: '免费版今日使用上限(10分钟)已达到。',
@@ -1652,6 +1656,8 @@ const state = {
   currentJob: null,
   jobStartedAt: null,
   jobActive: false, // ジョブが有効（予約済み〜完了前）かどうか
+  rollingSummaryQueue: [], // ジョブの rolling summary へ未送信の確定原文
+  rollingSummaryFlush: Promise.resolve(), // 追記の順序を保つための直列化チェーン
   startInFlight: false, // Start処理がin-flight中かどうか（二重発火防止）
   uiBound: false, // UIイベントハンドラが登録済みか（二重登録防止）
   linkAnalyticsBound: false, // 導線クリック計測の二重登録防止
@@ -5092,6 +5098,7 @@ const reserveJobSlot = async ({ forceTakeover = false } = {}) => {
   };
   state.jobStartedAt = Date.now();
   state.jobActive = true; // ジョブ有効化
+  state.rollingSummaryQueue = [];
   applyQuotaFromPayload(data);
   addDiagLog(`Job reserved | jobId=${data.jobId} | reused=${reused} | jobActive=true | clientRequestId=${clientRequestId}`);
   return data;
@@ -5261,6 +5268,136 @@ const uploadForM4AAndGetUrl = async (blob) => {
   return data.url;
 };
 
+// text/event-stream のレスポンスを読み、イベントごとに onEvent(event, data) を呼ぶ
+const readSseEvents = async (res, onEvent) => {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  const dispatch = (frame) => {
+    let event = 'message';
+    const dataLines = [];
+    frame.split('\n').forEach((line) => {
+      if (line.startsWith('event:')) event = line.slice(6).trim();
+      else if (line.startsWith('data:')) dataLines.push(line.slice(5).trimStart());
+    });
+    if (!dataLines.length) return;
+    let data = {};
+    try {
+      data = JSON.parse(dataLines.join('\n'));
+    } catch (e) {
+      return;
+    }
+    onEvent(event, data);
+  };
+  try {
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        dispatch(buffer.slice(0, boundary));
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+      }
+    }
+    if (buffer.trim()) dispatch(buffer);
+  } catch (err) {
+    reader.cancel().catch(() => {});
+    throw err;
+  }
+};
+
+// Rolling summary: 確定した原文をジョブ単位でサーバへ送り、録音中に部分要約を作らせておく
+const ROLLING_SUMMARY_FLUSH_SEGMENTS = 8;
+const ROLLING_SUMMARY_MAX_SEGMENTS_PER_APPEND = 200;
+
+// offset は state.logs 上の位置。サーバの通し番号とずれたら 409 が返る
+const postRollingSummarySegments = (jobId, segments, offset) => authFetch(`/api/v1/jobs/${jobId}/summary/segments`, {
+  method: 'POST',
+  headers: { 'Content-Type': 'application/json' },
+  body: JSON.stringify({
+    segments,
+    offset,
+    outputLang: state.outputLang,
+    glossaryText: state.glossaryText || '',
+    glossaryVersion: 'latest',
+  }),
+});
+
+// サーバ側の状態が消えた（追い出し・期限切れ）ときは、segmentCount 以降の原文を送り直して揃える
+const resyncRollingSummary = async (jobId, from, until) => {
+  for (let offset = from; offset < until; offset += ROLLING_SUMMARY_MAX_SEGMENTS_PER_APPEND) {
+    const end = Math.min(offset + ROLLING_SUMMARY_MAX_SEGMENTS_PER_APPEND, until);
+    const res = await postRollingSummarySegments(jobId, state.logs.slice(offset, end), offset);
+    if (!res.ok) return res;
+  }
+  addDiagLog(`[rolling-summary] resynced | jobId=${jobId} from=${from} until=${until}`);
+  return null;
+};
+
+const queueRollingSummarySegment = (text) => {
+  const jobId = state.currentJob?.jobId;
+  if (!jobId || !state.jobActive) return;
+  state.rollingSummaryQueue.push(text);
+  if (state.rollingSummaryQueue.length < ROLLING_SUMMARY_FLUSH_SEGMENTS) return;
+  const segments = state.rollingSummaryQueue.splice(0);
+  const offset = state.logs.length - segments.length;
+  state.rollingSummaryFlush = state.rollingSummaryFlush.then(async () => {
+    try {
+      let res = await postRollingSummarySegments(jobId, segments, offset);
+      if (res.status === 409) {
+        const data = await res.json().catch(() => ({}));
+        const segmentCount = data?.detail?.segmentCount;
+        if (Number.isInteger(segmentCount)) {
+          res = await resyncRollingSummary(jobId, segmentCount, offset + segments.length);
+          if (!res) return;
+        }
+      }
+      if (!res.ok) addDiagLog(`[rolling-summary] append failed | jobId=${jobId} status=${res.status}`);
+    } catch (err) {
+      addDiagLog(`[rolling-summary] append error | jobId=${jobId} ${err.message || err}`);
+    }
+  });
+};
+
+// 終了時の要約: ジョブがあれば録音中に作った部分要約を再利用するジョブ要約を使い、失敗時は /summarize へフォールバック
+const requestSessionSummary = async (originals, jobId) => {
+  if (jobId) {
+    try {
+      const res = await authFetch(`/api/v1/jobs/${jobId}/summary`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          text: originals,
+          outputLang: state.outputLang,
+          glossaryText: state.glossaryText || '',
+          glossaryVersion: 'latest',
+          summaryPrompt: state.summaryPrompt || '',
+        }),
+      });
+      if (res.ok) return res;
+      addDiagLog(`[summary] job summary failed, falling back | jobId=${jobId} status=${res.status}`);
+    } catch (err) {
+      addDiagLog(`[summary] job summary error, falling back | jobId=${jobId} ${err.message || err}`);
+    }
+  }
+  const fd = new FormData();
+  fd.append('text', originals);
+  fd.append('output_lang', state.outputLang);
+  if (state.glossaryText) {
+    fd.append('glossary_text', state.glossaryText);
+  }
+  fd.append('glossary_version', 'latest');
+  if (state.summaryPrompt) {
+    fd.append('summary_prompt', state.summaryPrompt);
+  }
+  return authFetch('/summarize', {
+    method: 'POST',
+    body: fd,
+  });
+};
+
 const saveTextDownloads = async () => {
   const originals = state.logs.join('\n');
   const bilingual = state.logs
@@ -5269,19 +5406,7 @@ const saveTextDownloads = async () => {
 
   let summaryMd = '';
   if (originals.trim()) {
-    const fd = new FormData();
-    fd.append('text', originals);
-    fd.append('output_lang', state.outputLang);
-    if (state.glossaryText) {
-      fd.append('glossary_text', state.glossaryText);
-    }
-    if (state.summaryPrompt) {
-      fd.append('summary_prompt', state.summaryPrompt);
-    }
-    const summaryRes = await authFetch('/summarize', {
-      method: 'POST',
-      body: fd,
-    });
+    const summaryRes = await requestSessionSummary(originals, state.currentSessionResult?.jobId);
     if (summaryRes.ok) {
       const data = await summaryRes.json();
       summaryMd = data.summary || '';
@@ -5332,6 +5457,7 @@ const saveTextDownloadsWithResultCard = async () => {
         if (validation.glossaryText) {
           fd.append('glossary_text', validation.glossaryText);
         }
+        fd.append('glossary_version', 'latest');
         if (validation.summaryPrompt) {
           fd.append('summary_prompt', validation.summaryPrompt);
         }
@@ -5463,23 +5589,153 @@ const hideResultCard = () => {
   state.currentSessionResult = null;
 };
 
+// /ws/translate: 接続時に 1 回だけ認証し、確定した発話を seq 付きで送ってサーバ側で並行翻訳させる（結果は seq 順に届く）
+const TRANSLATE_SOCKET_READY_TIMEOUT_MS = 5000;
+const translateSocket = { ws: null, ready: false, seq: 0, pending: new Map(), opening: null };
+
+const openTranslateSocket = async () => {
+  if (translateSocket.ready) return true;
+  if (translateSocket.opening) return translateSocket.opening;
+  if (typeof WebSocket === 'undefined' || (isLocalhost() && !state.apiAvailable)) return false;
+  translateSocket.opening = (async () => {
+    const token = await getAuthToken();
+    if (!token) return false;
+    const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const ws = new WebSocket(`${protocol}//${location.host}/ws/translate`);
+    return new Promise((resolve) => {
+      const timer = setTimeout(() => {
+        addDiagLog('[translate-ws] ready timeout, falling back to HTTP');
+        ws.close();
+        resolve(false);
+      }, TRANSLATE_SOCKET_READY_TIMEOUT_MS);
+      ws.onopen = () => {
+        ws.send(JSON.stringify({
+          type: 'auth',
+          token,
+          input_lang: state.inputLang,
+          output_lang: state.outputLang,
+          glossary_text: state.glossaryText || '',
+        }));
+      };
+      ws.onmessage = (event) => {
+        let msg;
+        try {
+          msg = JSON.parse(event.data);
+        } catch (e) {
+          return;
+        }
+        if (msg.type === 'ready') {
+          clearTimeout(timer);
+          translateSocket.ws = ws;
+          translateSocket.ready = true;
+          addDiagLog(`[translate-ws] ready | maxInflight=${msg.maxInflight}`);
+          resolve(true);
+          return;
+        }
+        const entry = translateSocket.pending.get(msg.seq);
+        if (!entry) return;
+        translateSocket.pending.delete(msg.seq);
+        if (msg.type === 'result') {
+          entry.resolve(msg.translation || '');
+        } else {
+          const err = new Error(msg.detail || 'translate_failed');
+          err.status = msg.status;
+          entry.reject(err);
+        }
+      };
+      ws.onclose = (event) => {
+        clearTimeout(timer);
+        translateSocket.ready = false;
+        translateSocket.ws = null;
+        // 未応答の発話は HTTP で再送させる（status なしのエラー）
+        translateSocket.pending.forEach((entry) => entry.reject(new Error('socket_closed')));
+        translateSocket.pending.clear();
+        addDiagLog(`[translate-ws] closed | code=${event.code}`);
+        resolve(false);
+      };
+    });
+  })();
+  try {
+    return await translateSocket.opening;
+  } finally {
+    translateSocket.opening = null;
+  }
+};
+
+const closeTranslateSocket = () => {
+  if (translateSocket.ws) {
+    translateSocket.ws.close(1000);
+  }
+};
+
+// WebSocket が使えなければ null を返し、呼び出し側は HTTP にフォールバックする
+const translateViaSocket = async (text) => {
+  if (!(await openTranslateSocket())) return null;
+  translateSocket.seq += 1;
+  const seq = translateSocket.seq;
+  return new Promise((resolve, reject) => {
+    translateSocket.pending.set(seq, { resolve, reject });
+    translateSocket.ws.send(JSON.stringify({
+      type: 'translate',
+      seq,
+      text,
+      input_lang: state.inputLang,
+      output_lang: state.outputLang,
+    }));
+  });
+};
+
+const translateViaHttp = async (text) => {
+  const fd = new FormData();
+  fd.append('text', text);
+  fd.append('input_lang', state.inputLang);
+  fd.append('output_lang', state.outputLang);
+  // サーバ側で原文に出現する用語だけをプロンプトに入れる（用語集はハッシュでキャッシュされる）
+  if (state.glossaryText) {
+    fd.append('glossary_text', state.glossaryText);
+  }
+  addDiagLog(
+    `[translate] req | output_lang=${state.outputLang || 'ja'} input_lang=${state.inputLang || 'auto'} text_len=${(text || '').length} text_head=${(text || '').trim().substring(0, 40)}`
+  );
+  const res = await authFetch('/translate', { method: 'POST', body: fd });
+  if (!res.ok) {
+    // 503 openai_circuit_open / upstream_overloaded: OpenAI 側の障害・混雑（サーバが即時に失敗を返す）
+    if (res.status === 503) {
+      const errBody = await res.json().catch(() => ({}));
+      addDiagLog(`[translate] unavailable | detail=${errBody.detail || 'unknown'}`);
+      throw new Error(t('errorTranslationUnavailable'));
+    }
+    throw new Error(t('errorTranslation'));
+  }
+  const data = await res.json();
+  const keys = data && typeof data === 'object' ? Object.keys(data).join(',') : 'non_object';
+  const translation = data.translation || '';
+  addDiagLog(
+    `[translate] res | keys=${keys} translation_len=${translation.length} translation_head=${translation.substring(0, 40)}`
+  );
+  return translation;
+};
+
 const translateCompleted = async (text) => {
   try {
-    const fd = new FormData();
-    fd.append('text', text);
-    fd.append('input_lang', state.inputLang);
-    fd.append('output_lang', state.outputLang);
-    addDiagLog(
-      `[translate] req | output_lang=${state.outputLang || 'ja'} input_lang=${state.inputLang || 'auto'} text_len=${(text || '').length} text_head=${(text || '').trim().substring(0, 40)}`
-    );
-    const res = await authFetch('/translate', { method: 'POST', body: fd });
-    if (!res.ok) throw new Error(t('errorTranslation'));
-    const data = await res.json();
-    const translation = data.translation || '';
-    const keys = data && typeof data === 'object' ? Object.keys(data).join(',') : 'non_object';
-    addDiagLog(
-      `[translate] res | keys=${keys} translation_len=${translation.length} translation_head=${translation.substring(0, 40)}`
-    );
+    let translation = null;
+    try {
+      translation = await translateViaSocket(text);
+    } catch (err) {
+      if (err.status === 503) {
+        addDiagLog(`[translate-ws] unavailable | detail=${err.message}`);
+        throw new Error(t('errorTranslationUnavailable'));
+      }
+      // 401 auth_expired はソケットが閉じられるので、HTTP（トークン再取得あり）で再送する
+      if (err.status && err.status !== 401) {
+        addDiagLog(`[translate-ws] error | status=${err.status} detail=${err.message}`);
+        throw new Error(t('errorTranslation'));
+      }
+      addDiagLog(`[translate-ws] ${err.message}, retrying over HTTP`);
+    }
+    if (translation === null) {
+      translation = await translateViaHttp(text);
+    }
     state.translations.push(translation);
     addTranslationLog(translation);
     // GA4: fire first_translation once for LP→PWA attribution
@@ -5510,6 +5766,7 @@ const commitLog = (text, itemId = null) => {
   state.logs.push(text);
   addTranscriptLog(text);
   translateCompleted(text);
+  queueRollingSummarySegment(text);
   state.liveOriginal = '';
   if (itemId) {
     state.committedItems.add(itemId);
@@ -5627,6 +5884,8 @@ const fetchToken = async () => {
   const fd = new FormData();
   fd.append('vad_silence', String(state.vadSilence || 400));
   fd.append('glossaryText', state.glossaryText || '');
+  // サーバー側でユーザー辞書から作った用語集（最新版）をマージしてもらう
+  fd.append('glossaryVersion', 'latest');
   fd.append('outputLang', state.outputLang || 'auto');
   let res;
   let statusLogged = false;
@@ -5995,6 +6254,7 @@ const stop = async () => {
   clearGapTimer();
   stopMedia();
   closeRtc();
+  closeTranslateSocket();
   setStatus('Standby');
 
   // Initialize session result for this stop
@@ -6922,10 +7182,12 @@ document.addEventListener('DOMContentLoaded', () => {
         if (validation.glossaryText) {
           fd.append('glossary_text', validation.glossaryText);
         }
+        fd.append('glossary_version', 'latest');
         if (validation.summaryPrompt) {
           fd.append('summary_prompt', validation.summaryPrompt);
         }
-        const res = await authFetch('/summarize', { method: 'POST', body: fd });
+        // SSE で差分を逐次表示し、done イベントの全文で確定する
+        const res = await authFetch('/summarize/stream', { method: 'POST', body: fd });
         if (!res.ok) {
           if (res.status === 413) {
             throw new Error(
@@ -6934,15 +7196,35 @@ document.addEventListener('DOMContentLoaded', () => {
           }
           throw new Error(t('errorSummaryFailed') || 'Summary generation failed');
         }
-        const data = await res.json();
-        const summaryMd = data.summary || '';
-        if (els.summaryOutput) {
-          els.summaryOutput.textContent = summaryMd;
+        let summaryMd = '';
+        let usage = null;
+        if (els.summaryOutput) els.summaryOutput.textContent = '';
+        await readSseEvents(res, (event, data) => {
+          if (event === 'delta') {
+            summaryMd += data.text || '';
+            if (els.summaryOutput) els.summaryOutput.textContent = summaryMd;
+          } else if (event === 'done') {
+            summaryMd = data.summary || summaryMd;
+            usage = data.usage || null;
+            if (els.summaryOutput) els.summaryOutput.textContent = summaryMd;
+          } else if (event === 'error') {
+            addDiagLog(`[summary] stream error | detail=${data.detail || 'unknown'} status=${data.status || 'n/a'}`);
+            throw new Error(
+              data.status === 503
+                ? t('errorTranslationUnavailable')
+                : t('errorSummaryFailed') || 'Summary generation failed'
+            );
+          }
+        });
+        if (!summaryMd) {
+          throw new Error(t('errorSummaryFailed') || 'Summary generation failed');
         }
         if (els.copySummary && summaryMd) {
           els.copySummary.style.display = 'inline-block';
         }
-        addDiagLog(`Summary generated | length=${summaryMd.length}`);
+        addDiagLog(
+          `Summary generated | length=${summaryMd.length} total_tokens=${usage?.total_tokens ?? 'n/a'}`
+        );
       } catch (err) {
         const errorMsg = err.message || 'Summary failed';
         setError(errorMsg);
@@ -7149,6 +7431,7 @@ document.addEventListener('DOMContentLoaded', () => {
         if (validation.glossaryText) {
           fd.append('glossary_text', validation.glossaryText);
         }
+        fd.append('glossary_version', 'latest');
         if (validation.summaryPrompt) {
           fd.append('summary_prompt', validation.summaryPrompt);
         }
@@ -0,0 +1,96 @@
+from pathlib import Path
+import sys
+import time
+
+import pytest
+from fastapi import HTTPException
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+def install_fake_verifier(monkeypatch, exp_in=3600):
+    calls = []
+
+    def fake_verify(token, check_revoked=False):
+        calls.append((token, check_revoked))
+        if token == "bad":
+            raise ValueError("invalid signature")
+        return {"uid": f"uid-{token}", "exp": time.time() + exp_in}
+
+    monkeypatch.setattr(app_module.firebase_auth, "verify_id_token", fake_verify)
+    monkeypatch.setattr(app_module, "ensure_firebase_app", lambda: None)
+    app_module._auth_token_cache.clear()
+    return calls
+
+
+def test_verified_claims_are_reused_until_expiry(monkeypatch):
+    calls = install_fake_verifier(monkeypatch)
+    for _ in range(3):
+        assert app_module.verify_firebase_token("tok")["uid"] == "uid-tok"
+    assert len(calls) == 1
+    assert app_module.verify_firebase_token("other")["uid"] == "uid-other"
+    assert len(calls) == 2
+    stats = app_module.get_auth_token_cache_stats()
+    assert stats["cache"]["hits"] >= 2
+    # the raw token is never used as the cache key
+    assert app_module._auth_token_cache.get("tok") is None
+
+
+def test_failures_and_nearly_expired_tokens_are_not_cached(monkeypatch):
+    calls = install_fake_verifier(monkeypatch, exp_in=app_module.AUTH_TOKEN_CACHE_SKEW_SECONDS - 1)
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc_info:
+            app_module.verify_firebase_token("bad")
+        assert exc_info.value.detail == "invalid_auth"
+    app_module.verify_firebase_token("tok")
+    app_module.verify_firebase_token("tok")
+    assert len(calls) == 4
+
+
+def test_revocation_check_bounds_cache_lifetime(monkeypatch):
+    calls = install_fake_verifier(monkeypatch)
+    monkeypatch.setattr(app_module, "AUTH_CHECK_REVOKED", True)
+    app_module.verify_firebase_token("tok")
+    assert calls == [("tok", True)]
+    claims = {"uid": "u", "exp": 10_000 + 3600}
+    monkeypatch.setattr(app_module, "AUTH_REVOCATION_RECHECK_SECONDS", 0)
+    assert app_module.store_verified_token("key", claims, now=10_000) is False
+
+
+def test_cert_refresh_uses_the_session_verify_id_token_uses(monkeypatch):
+    # fails if the installed firebase_admin moves the internals the refresh relies on
+    import firebase_admin
+    from firebase_admin import _token_gen, credentials
+    from google.auth.credentials import AnonymousCredentials
+
+    class FakeCredential(credentials.Base):
+        def get_credential(self):
+            return AnonymousCredentials()
+
+    firebase_app = firebase_admin.initialize_app(
+        FakeCredential(), options={"projectId": "cert-refresh-test"}, name="cert-refresh-test"
+    )
+    try:
+        monkeypatch.setattr(app_module, "ensure_firebase_app", lambda: None)
+        monkeypatch.setattr(app_module.firebase_admin, "get_app", lambda *args: firebase_app)
+        request = app_module.firebase_cert_fetch_request()
+        assert isinstance(request, _token_gen.CertificateFetchRequest)
+        verifier = app_module.firebase_auth._get_client(firebase_app)._token_verifier
+        assert verifier.id_token_verifier.cert_url == app_module.FIREBASE_ID_TOKEN_CERT_URL
+
+        fetched = []
+
+        class FakeResponse:
+            status = 200
+
+        monkeypatch.setattr(
+            request, "_delegate", lambda url, method="GET", **kwargs: fetched.append(url) or FakeResponse()
+        )
+        app_module.refresh_firebase_certs()
+        assert fetched == [app_module.FIREBASE_ID_TOKEN_CERT_URL]
+    finally:
+        firebase_admin.delete_app(firebase_app)
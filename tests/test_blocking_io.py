@@ -0,0 +1,55 @@
+import asyncio
+from pathlib import Path
+import sys
+import threading
+import time
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+def test_run_blocking_uses_the_bounded_pool():
+    def work(value, suffix=""):
+        return threading.current_thread().name, f"{value}{suffix}"
+
+    async def run():
+        return await app_module.run_blocking(work, "ok", suffix="!")
+
+    thread_name, value = asyncio.run(run())
+    assert thread_name.startswith("blocking-io")
+    assert value == "ok!"
+
+
+def test_run_blocking_propagates_errors():
+    def fail():
+        raise ValueError("boom")
+
+    errors_before = app_module.get_blocking_io_stats()["errors"]
+    with pytest.raises(ValueError):
+        asyncio.run(app_module.run_blocking(fail))
+    assert app_module.get_blocking_io_stats()["errors"] == errors_before + 1
+
+
+def test_watchdog_flags_blocking_call_site():
+    def block_the_loop():
+        time.sleep(0.3)
+
+    async def run():
+        watchdog = app_module.EventLoopWatchdog(threshold_ms=100, interval_seconds=0.02)
+        watchdog.start()
+        await asyncio.sleep(0.05)
+        block_the_loop()
+        await asyncio.sleep(0.05)
+        await watchdog.stop()
+        return watchdog.stats()
+
+    stats = asyncio.run(run())
+    assert stats["stalls"] == 1
+    assert stats["maxStallMs"] >= 200
+    (site,) = stats["topSites"]
+    assert "block_the_loop" in site
@@ -0,0 +1,88 @@
+import asyncio
+from pathlib import Path
+import sys
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+def make_breaker(**overrides):
+    options = dict(
+        window_seconds=30,
+        min_calls=4,
+        error_rate=0.5,
+        slow_call_seconds=5,
+        slow_rate=0.8,
+        open_seconds=60,
+        half_open_max_calls=1,
+    )
+    options.update(overrides)
+    return app_module.CircuitBreaker("test", **options)
+
+
+def test_breaker_opens_on_error_rate_and_fails_fast():
+    breaker = make_breaker()
+    for ok in (True, False, True, False):
+        breaker.allow()
+        breaker.record(ok, 0.1)
+    assert breaker.state == "open"
+    with pytest.raises(app_module.OpenAICircuitOpenError):
+        breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_breaker_opens_on_slow_calls():
+    breaker = make_breaker()
+    for _ in range(4):
+        breaker.allow()
+        breaker.record(True, 6.0)
+    assert breaker.state == "open"
+
+
+def test_half_open_probe_closes_or_reopens():
+    breaker = make_breaker(open_seconds=0)
+    breaker._trip(0, "test")
+    breaker.allow()
+    assert breaker.state == "half_open"
+    with pytest.raises(app_module.OpenAICircuitOpenError):
+        breaker.allow()
+    breaker.record(True, 0.1)
+    assert breaker.state == "closed"
+
+    breaker._trip(0, "test")
+    breaker.allow()
+    breaker.record(False, 0.1)
+    assert breaker.state == "open"
+
+
+def test_post_openai_fails_fast_while_open(monkeypatch):
+    breaker = make_breaker()
+    breaker._trip(time.monotonic(), "test")
+    monkeypatch.setattr(app_module, "_openai_breaker", breaker)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise AssertionError("upstream must not be called while open")
+
+    async def run():
+        app_module._openai_client = app_module.create_openai_client(transport=httpx.MockTransport(handler))
+        try:
+            await app_module.post_openai("https://api.openai.com/v1/responses", {"input": "x"})
+        finally:
+            await app_module.close_openai_client()
+
+    with pytest.raises(app_module.OpenAICircuitOpenError):
+        asyncio.run(run())
+
+
+def test_health_reports_breaker_state():
+    client = TestClient(app_module.app)
+    body = client.get("/health").json()
+    assert body["openai"]["circuit"]["state"] in {"closed", "open", "half_open"}
@@ -0,0 +1,71 @@
+import asyncio
+from pathlib import Path
+import sys
+
+import pytest
+from fastapi import HTTPException
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setenv("DEBUG_AUTH_BYPASS", "1")
+    client = app_module.MockFirestoreClient()
+    monkeypatch.setattr(app_module, "get_firestore_client", lambda: client)
+    app_module._user_doc_cache.clear()
+    client.collection("users").document("user-1").set({"plan": "free"})
+    return client
+
+
+def stored_count(db):
+    return db.data["users"]["user-1"].get(app_module.DICTIONARY_COUNT_FIELD)
+
+
+def test_add_and_delete_maintain_the_counter_without_streaming(db, monkeypatch):
+    first = app_module.insert_dictionary_entry("user-1", "ASR", "音声認識", "")
+    app_module.insert_dictionary_entry("user-1", "LLM", "大規模言語モデル", "")
+    assert stored_count(db) == 2
+
+    def no_stream(self):
+        raise AssertionError("dictionary subcollection must not be streamed for counting")
+
+    monkeypatch.setattr(app_module.MockCollection, "stream", no_stream)
+    assert app_module.remove_dictionary_entry("user-1", first["id"])["count"] == 1
+    assert stored_count(db) == 1
+    with pytest.raises(HTTPException) as exc_info:
+        app_module.remove_dictionary_entry("user-1", first["id"])
+    assert exc_info.value.status_code == 404
+    assert stored_count(db) == 1
+
+
+def test_limit_uses_the_counter_and_missing_counter_is_backfilled(db):
+    dict_ref = db.collection("users").document("user-1").collection("dictionary")
+    for index in range(app_module.DICTIONARY_LIMIT_FREE):
+        dict_ref.add({"source": f"s{index}", "target": f"t{index}"})
+    assert stored_count(db) is None
+
+    with pytest.raises(HTTPException) as exc_info:
+        app_module.insert_dictionary_entry("user-1", "extra", "追加", "")
+    assert exc_info.value.status_code == 400
+    _, page = app_module.list_dictionary_page("user-1", 5, None)
+    assert page["count"] == app_module.DICTIONARY_LIMIT_FREE
+    assert stored_count(db) == app_module.DICTIONARY_LIMIT_FREE
+
+
+def test_csv_upload_increments_and_repair_fixes_drift(db):
+    stream = app_module.open_dictionary_csv_text("source,target,note\nA,あ,\nB,い,\n")
+    result = asyncio.run(app_module.import_dictionary_csv("user-1", stream))
+    assert result["added"] == 2
+    assert stored_count(db) == 2
+
+    db.collection("users").document("user-1").update({app_module.DICTIONARY_COUNT_FIELD: 7})
+    summary = app_module.repair_dictionary_counts(db, ["user-1"])
+    assert summary["repaired"] == 1
+    assert summary["drifted"][0]["actual"] == 2
+    assert stored_count(db) == 2
+    assert app_module.repair_dictionary_counts(db, ["user-1"])["repaired"] == 0
@@ -0,0 +1,88 @@
+from pathlib import Path
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("DEBUG_AUTH_BYPASS", "1")
+    db = app_module.MockFirestoreClient()
+    monkeypatch.setattr(app_module, "get_firestore_client", lambda: db)
+    app_module._user_doc_cache.clear()
+    app_module._dictionary_snapshot_cache.clear()
+    db.collection("users").document("user-1").set({"plan": "pro"})
+
+    async def fake_uid(request):
+        return "user-1"
+
+    monkeypatch.setattr(app_module, "require_uid", fake_uid)
+    return TestClient(app_module.app)
+
+
+def test_unchanged_dictionary_answers_304(client):
+    client.post("/api/v1/dictionary/entry", json={"source": "ASR", "target": "音声認識"})
+    first = client.get("/api/v1/dictionary")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    builds = app_module._dictionary_snapshot_stats["builds"]
+    second = client.get("/api/v1/dictionary", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.headers["etag"] == etag
+    assert app_module._dictionary_snapshot_stats["builds"] == builds
+
+
+@pytest.mark.parametrize("change", ["add", "update", "delete", "upload"])
+def test_every_write_changes_the_etag(client, change):
+    created = client.post("/api/v1/dictionary/entry", json={"source": "ASR", "target": "音声認識"}).json()
+    etag = client.get("/api/v1/dictionary").headers["etag"]
+
+    if change == "add":
+        client.post("/api/v1/dictionary/entry", json={"source": "LLM", "target": "大規模言語モデル"})
+    elif change == "update":
+        client.put(f"/api/v1/dictionary/entry/{created['id']}", json={"source": "ASR", "target": "自動音声認識"})
+    elif change == "delete":
+        client.delete(f"/api/v1/dictionary/entry/{created['id']}")
+    else:
+        client.post("/api/v1/dictionary/upload", json={"csv": "source,target\nTTS,音声合成\n"})
+
+    response = client.get("/api/v1/dictionary", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_pages_are_served_from_the_snapshot(client):
+    for index in range(5):
+        client.post("/api/v1/dictionary/entry", json={"source": f"term{index}", "target": f"訳{index}"})
+    first = client.get("/api/v1/dictionary", params={"limit": 2}).json()
+    builds = app_module._dictionary_snapshot_stats["builds"]
+    second = client.get("/api/v1/dictionary", params={"limit": 2, "cursor": first["nextCursor"]}).json()
+    assert app_module._dictionary_snapshot_stats["builds"] == builds
+    ids = [item["id"] for item in first["items"] + second["items"]]
+    assert len(set(ids)) == 4
+    assert second["count"] == 5
+
+
+def test_writes_from_another_instance_are_seen_despite_the_user_doc_cache(client):
+    client.post("/api/v1/dictionary/entry", json={"source": "ASR", "target": "音声認識"})
+    etag = client.get("/api/v1/dictionary").headers["etag"]
+    db = app_module.get_firestore_client()
+    app_module.get_user_doc(db, "user-1")  # warm the per-instance cache
+    # another instance adds an entry: no local invalidation happens
+    db.collection("users").document("user-1").collection("dictionary").add({"source": "LLM", "target": "大規模言語モデル"})
+    user = db.data["users"]["user-1"]
+    user[app_module.DICTIONARY_COUNT_FIELD] += 1
+    user[app_module.DICTIONARY_VERSION_FIELD] += 1
+
+    response = client.get("/api/v1/dictionary", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert {item["source"] for item in response.json()["items"]} == {"ASR", "LLM"}
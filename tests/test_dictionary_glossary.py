@@ -0,0 +1,93 @@
+import asyncio
+from pathlib import Path
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setenv("DEBUG_AUTH_BYPASS", "1")
+    client = app_module.MockFirestoreClient()
+    monkeypatch.setattr(app_module, "get_firestore_client", lambda: client)
+    app_module._user_doc_cache.clear()
+    app_module._dictionary_snapshot_cache.clear()
+    app_module._dictionary_glossary_cache.clear()
+    client.collection("users").document("user-1").set({"plan": "pro"})
+    app_module.insert_dictionary_entry("user-1", "ASR", "音声認識", "")
+    app_module.insert_dictionary_entry("user-1", "a=b", "skipped", "")
+    return client
+
+
+def test_artifact_is_built_once_per_dictionary_version(db):
+    builds = app_module._dictionary_glossary_stats["builds"]
+    first = app_module.get_dictionary_glossary(db, "user-1")
+    assert first["entries"] == [["ASR", "音声認識"]]
+    assert app_module.get_dictionary_glossary(db, "user-1") is first
+    assert app_module._dictionary_glossary_stats["builds"] == builds + 1
+
+    app_module.insert_dictionary_entry("user-1", "LLM", "大規模言語モデル", "")
+    second = app_module.get_dictionary_glossary(db, "user-1")
+    assert second["version"] == first["version"] + 1
+    assert ["LLM", "大規模言語モデル"] in second["entries"]
+
+
+def test_persisted_artifact_is_reused_by_a_fresh_instance(db, monkeypatch):
+    monkeypatch.setattr(app_module, "DICTIONARY_GLOSSARY_PERSIST", True)
+    built = app_module.get_dictionary_glossary(db, "user-1")
+    app_module._dictionary_glossary_cache.clear()
+    app_module._dictionary_snapshot_cache.clear()
+    builds = app_module._dictionary_glossary_stats["builds"]
+    assert app_module.get_dictionary_glossary(db, "user-1")["entries"] == built["entries"]
+    assert app_module._dictionary_glossary_stats["builds"] == builds
+    assert db.data["users/user-1/glossary"]["compiled"]["version"] == built["version"]
+
+
+def test_client_terms_are_merged_ahead_of_the_dictionary(db):
+    glossary, version = asyncio.run(
+        app_module.resolve_request_glossary("user-1", "asr => 自動音声認識\nGPU => GPU", "latest")
+    )
+    assert version == app_module.get_dictionary_glossary(db, "user-1")["version"]
+    assert glossary.entries == [("asr", "自動音声認識"), ("GPU", "GPU")]
+    glossary, version = asyncio.run(app_module.resolve_request_glossary("user-1", "x => y", ""))
+    assert (glossary.entries, version) == ([("x", "y")], None)
+
+
+def test_only_dictionary_merges_get_the_larger_line_cap(db, monkeypatch):
+    many = [[f"term{index}", f"訳{index}"] for index in range(app_module.GLOSSARY_MAX_LINES + 50)]
+    monkeypatch.setattr(
+        app_module, "get_dictionary_glossary", lambda db, uid: {"version": 1, "entries": many}
+    )
+    glossary, _ = asyncio.run(app_module.resolve_request_glossary("user-1", "", "latest"))
+    assert len(glossary.entries) == len(many)
+
+    client_text = "# dictionary glossary v1\n" + "\n".join(f"{source} => {target}" for source, target in many)
+    assert len(app_module.compile_glossary(client_text).entries) == app_module.GLOSSARY_MAX_LINES
+
+
+def test_token_uses_the_dictionary_glossary(db, monkeypatch):
+    payloads = []
+
+    async def fake_uid(request):
+        return "user-1"
+
+    async def fake_mint(payload):
+        payloads.append(payload)
+        return {"value": "ek_test"}
+
+    monkeypatch.setattr(app_module, "require_uid", fake_uid)
+    monkeypatch.setattr(app_module, "take_pooled_realtime_key", lambda key: None)
+    monkeypatch.setattr(app_module, "mint_realtime_client_secret", fake_mint)
+    response = TestClient(app_module.app).post("/token", data={"glossaryVersion": "latest", "outputLang": "ja"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["value"] == "ek_test"
+    assert body["glossaryVersion"] == app_module.get_dictionary_glossary(db, "user-1")["version"]
+    assert "- ASR => 音声認識" in payloads[0]["session"]["instructions"]
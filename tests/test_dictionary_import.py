@@ -0,0 +1,194 @@
+import asyncio
+from pathlib import Path
+import sys
+import time
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setenv("DEBUG_AUTH_BYPASS", "1")
+    client = app_module.MockFirestoreClient()
+    monkeypatch.setattr(app_module, "get_firestore_client", lambda: client)
+    app_module._user_doc_cache.clear()
+    client.collection("users").document("user-1").set({"plan": "pro"})
+    return client
+
+
+def run_import(csv_content, **kwargs):
+    stream = app_module.open_dictionary_csv_text(csv_content)
+    return asyncio.run(app_module.import_dictionary_csv("user-1", stream, **kwargs))
+
+
+def entries(db):
+    return sorted(
+        (doc["source"], doc["target"], doc["note"])
+        for doc in db.data.get("users/user-1/dictionary", {}).values()
+    )
+
+
+def test_parser_handles_bom_quoting_and_crlf(db):
+    csv_content = '\ufeffsource,target,note\r\n"Acme, Inc.",アクメ社,"社名, 表記固定"\r\n"multi\r\nline",複数行,\r\n,訳のみ,\r\n'
+    result = run_import(csv_content)
+    assert result["added"] == 2
+    assert result["invalidRows"] == 1
+    assert entries(db) == [("Acme, Inc.", "アクメ社", "社名, 表記固定"), ("multi\r\nline", "複数行", "")]
+
+
+def test_rows_are_committed_in_batches_with_one_counter_write_each(db, monkeypatch):
+    monkeypatch.setattr(app_module, "DICTIONARY_IMPORT_BATCH_SIZE", 2)
+    commits = []
+    original_commit = app_module.MockWriteBatch.commit
+
+    def counted_commit(self):
+        commits.append(len(self))
+        return original_commit(self)
+
+    monkeypatch.setattr(app_module.MockWriteBatch, "commit", counted_commit)
+    rows = "".join(f"term{index},訳{index}\n" for index in range(5))
+    result = run_import("source,target\n" + rows)
+    assert result["added"] == 5
+    assert result["batches"] == 3
+    assert sorted(commits) == [2, 3, 3]
+    assert db.data["users"]["user-1"][app_module.DICTIONARY_COUNT_FIELD] == 5
+    assert result["rowsPerSec"] > 0
+
+
+def test_dry_run_reports_the_diff_without_writing(db):
+    run_import("source,target\nASR,音声認識\n")
+    result = run_import("source,target\nASR,音声認識\nLLM,大規模言語モデル\nLLM,重複\n", dry_run=True)
+    assert result["dryRun"] is True
+    assert result["added"] == 0
+    assert result["wouldAdd"] == 1
+    assert result["duplicatesSkipped"] == 2
+    assert result["preview"] == [{"source": "LLM", "target": "大規模言語モデル", "note": ""}]
+    assert entries(db) == [("ASR", "音声認識", "")]
+
+
+def test_rows_over_the_plan_limit_are_reported(db):
+    db.collection("users").document("user-1").set({"plan": "free"})
+    app_module._user_doc_cache.clear()
+    rows = "".join(f"term{index},訳{index}\n" for index in range(app_module.DICTIONARY_LIMIT_FREE + 3))
+    result = run_import("source,target\n" + rows)
+    assert result["added"] == app_module.DICTIONARY_LIMIT_FREE
+    assert result["truncatedByLimit"] == 3
+    assert "warning" in result
+    with pytest.raises(HTTPException):
+        run_import("source,target\n")
+
+
+def test_multipart_upload_streams_the_file(db, monkeypatch):
+    async def fake_uid(request):
+        return "user-1"
+
+    monkeypatch.setattr(app_module, "require_uid", fake_uid)
+    client = TestClient(app_module.app)
+    csv_bytes = "\ufeffsource,target\r\nGPU,GPU\r\n".encode("utf-8")
+    response = client.post(
+        "/api/v1/dictionary/upload",
+        files={"file": ("dictionary.csv", csv_bytes, "text/csv")},
+    )
+    assert response.status_code == 200
+    assert response.json()["added"] == 1
+    assert entries(db) == [("GPU", "GPU", "")]
+
+
+def test_plain_upload_does_not_scan_existing_sources(db, monkeypatch):
+    run_import("source,target\nASR,音声認識\n")
+
+    def no_scan(self, field_paths):
+        raise AssertionError("existing sources must only be read in diff mode")
+
+    monkeypatch.setattr(app_module.MockCollection, "select", no_scan)
+    result = run_import("source,target\nLLM,大規模言語モデル\n")
+    assert result["added"] == 1
+    assert db.data["users"]["user-1"][app_module.DICTIONARY_COUNT_FIELD] == 2
+
+
+def test_capacity_is_reserved_before_batches_commit(db, monkeypatch):
+    limit = app_module.DICTIONARY_LIMIT_FREE
+    db.collection("users").document("user-1").set({"plan": "free", app_module.DICTIONARY_COUNT_FIELD: limit - 2})
+    app_module._user_doc_cache.clear()
+    # another writer takes one slot after the plan was made but before the reservation
+    original_reserve = app_module.reserve_dictionary_capacity
+
+    def racing_reserve(uid, requested):
+        db.collection("users").document(uid).set({app_module.DICTIONARY_COUNT_FIELD: limit - 1}, merge=True)
+        return original_reserve(uid, requested)
+
+    monkeypatch.setattr(app_module, "reserve_dictionary_capacity", racing_reserve)
+    result = run_import("source,target\nA,あ\nB,い\nC,う\n")
+    assert result["added"] == 1
+    assert result["truncatedByLimit"] == 2
+    assert result["count"] == limit
+    assert db.data["users"]["user-1"][app_module.DICTIONARY_COUNT_FIELD] == limit
+
+
+def test_failed_batches_release_their_reservation(db, monkeypatch):
+    monkeypatch.setattr(app_module, "DICTIONARY_IMPORT_BATCH_SIZE", 2)
+    calls = []
+    original_commit = app_module.commit_dictionary_batch
+
+    def flaky_commit(uid, chunk):
+        calls.append(len(chunk))
+        if len(calls) == 1:
+            raise RuntimeError("batch write failed")
+        return original_commit(uid, chunk)
+
+    monkeypatch.setattr(app_module, "commit_dictionary_batch", flaky_commit)
+    result = run_import("source,target\nA,あ\nB,い\nC,う\n")
+    assert result["failed"] == calls[0]
+    assert result["added"] == 3 - calls[0]
+    assert result["count"] == result["added"]
+    assert db.data["users"]["user-1"][app_module.DICTIONARY_COUNT_FIELD] == result["added"]
+
+
+def test_repair_during_an_import_keeps_the_reservation(db, monkeypatch):
+    limit = app_module.DICTIONARY_LIMIT_FREE
+    db.collection("users").document("user-1").set({"plan": "free"})
+    app_module._user_doc_cache.clear()
+    run_import("source,target\nA,あ\n")
+    original_commit = app_module.commit_dictionary_batch
+
+    def commit_after_repair(uid, chunk):
+        # the admin repair runs between the reservation and the batch commit
+        assert app_module.repair_dictionary_counts(db, [uid])["repaired"] == 0
+        return original_commit(uid, chunk)
+
+    monkeypatch.setattr(app_module, "commit_dictionary_batch", commit_after_repair)
+    rows = "".join(f"term{index},訳{index}\n" for index in range(limit + 5))
+    result = run_import("source,target\n" + rows)
+    user = db.data["users"]["user-1"]
+    assert result["added"] == limit - 1
+    assert user[app_module.DICTIONARY_COUNT_FIELD] == len(entries(db)) == limit
+    assert user[app_module.DICTIONARY_RESERVED_FIELD] == 0
+
+
+def test_active_reservations_hold_slots_until_they_expire(db, monkeypatch):
+    limit = app_module.DICTIONARY_LIMIT_FREE
+    now = time.time()
+    db.collection("users").document("user-1").set({
+        "plan": "free",
+        app_module.DICTIONARY_COUNT_FIELD: limit - 2,
+        app_module.DICTIONARY_RESERVED_FIELD: 2,
+        app_module.DICTIONARY_RESERVED_AT_FIELD: now,
+    })
+    with pytest.raises(HTTPException):
+        app_module.insert_dictionary_entry("user-1", "GPU", "GPU", "")
+    assert app_module.reserve_dictionary_capacity("user-1", 5)["reserved"] == 0
+
+    # a reservation left behind by an import that never finished stops counting after the TTL
+    db.collection("users").document("user-1").set(
+        {app_module.DICTIONARY_RESERVED_AT_FIELD: now - app_module.DICTIONARY_RESERVATION_TTL_SECONDS - 1}, merge=True
+    )
+    assert app_module.reserve_dictionary_capacity("user-1", 5)["reserved"] == 2
+    assert db.data["users"]["user-1"][app_module.DICTIONARY_RESERVED_FIELD] == 2
@@ -0,0 +1,77 @@
+from pathlib import Path
+import sys
+
+import pytest
+from fastapi import HTTPException
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+@pytest.fixture(params=[True, False], ids=["snapshot", "keyset-query"])
+def db(request, monkeypatch):
+    monkeypatch.setenv("DEBUG_AUTH_BYPASS", "1")
+    monkeypatch.setattr(app_module, "DICTIONARY_SNAPSHOT_ENABLED", request.param)
+    client = app_module.MockFirestoreClient()
+    monkeypatch.setattr(app_module, "get_firestore_client", lambda: client)
+    app_module._user_doc_cache.clear()
+    app_module._dictionary_snapshot_cache.clear()
+    client.collection("users").document("user-1").set({"plan": "pro"})
+    for source in ["apple", "apricot", "banana", "applet", "cherry"]:
+        app_module.insert_dictionary_entry("user-1", source, source.upper(), "")
+    return client
+
+
+def walk(limit, prefix=None):
+    pages, cursor = [], None
+    while True:
+        _, page = app_module.list_dictionary_page("user-1", limit, cursor, prefix=prefix)
+        pages.append(page["items"])
+        cursor = page["nextCursor"]
+        if not cursor:
+            return pages
+
+
+def test_keyset_pages_cover_every_entry_once_without_cursor_reads(db, monkeypatch):
+    reads = []
+    original_get = app_module.MockDocument.get
+
+    def counted_get(self, *args, **kwargs):
+        reads.append(self.path)
+        return original_get(self, *args, **kwargs)
+
+    monkeypatch.setattr(app_module.MockDocument, "get", counted_get)
+    pages = walk(2)
+    assert [len(page) for page in pages] == [2, 2, 1]
+    items = [item for page in pages for item in page]
+    assert len({item["id"] for item in items}) == 5
+    assert set(items[0]) == {"id", "source", "target", "note", "createdAt"}
+    assert not [path for path in reads if path.endswith("/dictionary")]
+
+
+def test_prefix_search_on_source(db):
+    pages = walk(1, prefix="app")
+    assert [item["source"] for page in pages for item in page] == ["apple", "applet"]
+    _, page = app_module.list_dictionary_page("user-1", 10, None, prefix="zzz")
+    assert page["items"] == [] and page["nextCursor"] is None
+
+
+def test_invalid_or_mismatched_cursors_are_rejected(db):
+    _, page = app_module.list_dictionary_page("user-1", 2, None)
+    for cursor in ["not-a-cursor", app_module.base64.b64encode(b"doc-id").decode()]:
+        with pytest.raises(HTTPException) as exc_info:
+            app_module.list_dictionary_page("user-1", 2, cursor)
+        assert exc_info.value.status_code == 400
+    with pytest.raises(HTTPException):
+        app_module.list_dictionary_page("user-1", 2, page["nextCursor"], prefix="app")
+
+
+def test_limit_is_capped(db, monkeypatch):
+    monkeypatch.setattr(app_module, "DICTIONARY_PAGE_MAX_LIMIT", 3)
+    _, page = app_module.list_dictionary_page("user-1", 10_000, None)
+    assert len(page["items"]) == 3
+    _, page = app_module.list_dictionary_page("user-1", 0, None)
+    assert len(page["items"]) == 1
@@ -0,0 +1,74 @@
+import asyncio
+from pathlib import Path
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+GLOSSARY_TEXT = """# comment
+AI => 人工知能
+OpenAI => オープンエーアイ
+議事録 = minutes
+Realtime API => リアルタイムAPI
+"""
+
+
+def test_compile_glossary_is_cached_by_content():
+    app_module._compiled_glossary_cache.clear()
+    first = app_module.compile_glossary(GLOSSARY_TEXT)
+    second = app_module.compile_glossary(GLOSSARY_TEXT)
+    assert first is second
+    assert len(first) == 4
+    assert app_module.compile_glossary("") is app_module.EMPTY_GLOSSARY
+
+
+def test_match_returns_only_occurring_entries_with_word_boundaries():
+    glossary = app_module.CompiledGlossary(app_module.parse_glossary_text(GLOSSARY_TEXT))
+    assert glossary.match("He SAID nothing about ＯｐｅｎＡＩ.") == [("OpenAI", "オープンエーアイ")]
+    assert glossary.match("今日の議事録とrealtime apiの話") == [
+        ("議事録", "minutes"),
+        ("Realtime API", "リアルタイムAPI"),
+    ]
+    assert glossary.match("AI, and more AI") == [("AI", "人工知能")]
+    assert glossary.match("nothing relevant") == []
+
+
+def test_missing_glossary_targets():
+    entries = [("AI", "人工知能"), ("議事録", "minutes")]
+    assert app_module.missing_glossary_targets(entries, "人工知能の Minutes") == []
+    assert app_module.missing_glossary_targets(entries, "AI の議事録") == entries
+
+
+def test_translate_injects_matched_entries_and_skips_cache_on_miss(monkeypatch):
+    payloads = []
+
+    async def fake_post(url, payload, headers=None):
+        payloads.append(payload)
+        return {"output_text": "AI is useful"}
+
+    monkeypatch.setattr(app_module, "post_openai_coalesced", fake_post)
+    monkeypatch.setattr(app_module, "get_openai_api_key", lambda: "test-key")
+    glossary = app_module.CompiledGlossary(app_module.parse_glossary_text(GLOSSARY_TEXT))
+
+    async def run():
+        app_module._translation_cache.clear()
+        first = await app_module.translate_with_cache("AIは便利", "ja", "en", glossary)
+        second = await app_module.translate_with_cache("AIは便利", "ja", "en", glossary)
+        return first, second
+
+    assert asyncio.run(run()) == ("AI is useful", "AI is useful")
+    assert len(payloads) == 2
+    system_prompt = payloads[0]["input"][0]["content"]
+    assert "AI => 人工知能" in system_prompt
+    assert "OpenAI" not in system_prompt
+
+
+def test_summary_glossary_instructions_only_include_matches():
+    inst = app_module.build_glossary_instructions_for_summary(GLOSSARY_TEXT, "OpenAI の発表")
+    assert "OpenAI→オープンエーアイ" in inst
+    assert "議事録" not in inst
+    assert app_module.build_glossary_instructions_for_summary(GLOSSARY_TEXT, "無関係") == ""
@@ -0,0 +1,49 @@
+import asyncio
+from pathlib import Path
+import sys
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+def test_resolve_openai_timeout_uses_per_endpoint_values():
+    responses = app_module.resolve_openai_timeout("https://api.openai.com/v1/responses")
+    secrets = app_module.resolve_openai_timeout("https://api.openai.com/v1/realtime/client_secrets")
+    assert responses.read == app_module.OPENAI_READ_TIMEOUTS["/v1/responses"]
+    assert secrets.read == app_module.OPENAI_READ_TIMEOUTS["/v1/realtime/client_secrets"]
+    assert responses.connect == app_module.OPENAI_CONNECT_TIMEOUT_SECONDS
+
+
+def test_post_openai_reuses_shared_client():
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.path)
+        return httpx.Response(200, json={"output_text": "ok"})
+
+    async def run():
+        app_module._openai_client = app_module.create_openai_client(transport=httpx.MockTransport(handler))
+        client = app_module.get_openai_client()
+        first = await app_module.post_openai("https://api.openai.com/v1/responses", {"input": "a"})
+        second = await app_module.post_openai("https://api.openai.com/v1/responses", {"input": "b"})
+        assert app_module.get_openai_client() is client
+        await app_module.close_openai_client()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second == {"output_text": "ok"}
+    assert seen == ["/v1/responses", "/v1/responses"]
+    assert app_module._openai_client is None
+
+
+def test_pool_stats_without_client():
+    app_module._openai_client = None
+    stats = app_module.get_openai_pool_stats()
+    assert stats["open"] == 0
+    assert stats["inUse"] == 0
+    assert stats["waiting"] == 0
@@ -0,0 +1,83 @@
+import asyncio
+from pathlib import Path
+import sys
+
+import httpx
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+URL = "https://api.openai.com/v1/responses"
+
+
+def install_fake_post(monkeypatch, results):
+    calls = []
+
+    async def fake_post_openai(url, payload, headers=None, timeout=None):
+        calls.append(payload)
+        await asyncio.sleep(0.02)
+        result = results[len(calls) - 1]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(app_module, "post_openai", fake_post_openai)
+    return calls
+
+
+def test_identical_inflight_requests_share_one_call(monkeypatch):
+    calls = install_fake_post(monkeypatch, [{"output_text": "a"}, {"output_text": "b"}])
+    before = dict(app_module._openai_coalesce_stats)
+
+    async def run():
+        return await asyncio.gather(
+            app_module.post_openai_coalesced(URL, {"input": "x"}),
+            app_module.post_openai_coalesced(URL, {"input": "x"}),
+            app_module.post_openai_coalesced(URL, {"input": "x"}),
+        )
+
+    assert asyncio.run(run()) == [{"output_text": "a"}] * 3
+    assert len(calls) == 1
+    assert app_module._openai_coalesce_stats["deduplicated"] - before["deduplicated"] == 2
+    assert app_module._openai_inflight == {}
+
+
+def test_leader_failure_reaches_all_waiters_and_is_not_cached(monkeypatch):
+    request = httpx.Request("POST", URL)
+    error = httpx.HTTPStatusError("boom", request=request, response=httpx.Response(500, request=request))
+    calls = install_fake_post(monkeypatch, [error, {"output_text": "ok"}])
+
+    async def run():
+        first = await asyncio.gather(
+            app_module.post_openai_coalesced(URL, {"input": "y"}),
+            app_module.post_openai_coalesced(URL, {"input": "y"}),
+            return_exceptions=True,
+        )
+        second = await app_module.post_openai_coalesced(URL, {"input": "y"})
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert all(isinstance(result, httpx.HTTPStatusError) for result in first)
+    assert second == {"output_text": "ok"}
+    assert len(calls) == 2
+
+
+def test_cancelled_leader_does_not_cancel_followers(monkeypatch):
+    calls = install_fake_post(monkeypatch, [{"output_text": "shared"}])
+
+    async def run():
+        leader = asyncio.create_task(app_module.post_openai_coalesced(URL, {"input": "z"}))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(app_module.post_openai_coalesced(URL, {"input": "z"}))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == {"output_text": "shared"}
+    assert len(calls) == 1
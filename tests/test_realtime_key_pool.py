@@ -0,0 +1,58 @@
+import asyncio
+from pathlib import Path
+import sys
+import time
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+def reset_pool():
+    app_module._realtime_key_pool.clear()
+    for key in app_module._realtime_key_pool_stats:
+        app_module._realtime_key_pool_stats[key] = 0
+
+
+def test_warm_configs_share_key_with_token_payload():
+    payload = app_module.build_realtime_session_payload(app_module.build_session_instructions([], "en"))
+    assert app_module.realtime_session_key(payload) in app_module.warm_realtime_session_payloads()
+    glossary_payload = app_module.build_realtime_session_payload(
+        app_module.build_session_instructions([("API", "エーピーアイ")], "en")
+    )
+    assert app_module.realtime_session_key(glossary_payload) not in app_module.warm_realtime_session_payloads()
+
+
+def test_pool_serves_keys_and_evicts_before_expiry():
+    reset_pool()
+    now = time.time()
+    assert app_module.add_pooled_realtime_key("k", {"value": "ek_late", "expires_at": now + 600})
+    assert app_module.add_pooled_realtime_key("k", {"value": "ek_soon", "expires_at": now + 300})
+    assert not app_module.add_pooled_realtime_key("k", {"value": "ek_stale", "expires_at": now + 10})
+    assert app_module.take_pooled_realtime_key("k") == "ek_soon"
+
+    app_module.evict_expiring_realtime_keys(now=now + 600)
+    assert app_module.take_pooled_realtime_key("k") is None
+    stats = app_module.get_realtime_key_pool_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["evicted"] == 1
+    assert stats["hitRate"] == 0.5
+
+
+def test_refill_mints_until_pool_size(monkeypatch):
+    reset_pool()
+    monkeypatch.setattr(app_module, "REALTIME_KEY_POOL_SIZE", 2)
+    minted = []
+
+    async def fake_mint(payload):
+        minted.append(payload)
+        return {"value": f"ek_{len(minted)}", "expires_at": time.time() + 600}
+
+    monkeypatch.setattr(app_module, "mint_realtime_client_secret", fake_mint)
+    asyncio.run(app_module.refill_realtime_key_pool())
+    warm = app_module.warm_realtime_session_payloads()
+    assert len(minted) == 2 * len(warm)
+    assert all(len(app_module._realtime_key_pool[key]) == 2 for key in warm)
+    asyncio.run(app_module.refill_realtime_key_pool())
+    assert len(minted) == 2 * len(warm)
@@ -0,0 +1,166 @@
+import asyncio
+from pathlib import Path
+import sys
+import time
+
+from fastapi.testclient import TestClient
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+def install_fakes(monkeypatch):
+    calls = []
+
+    async def fake_post(url, payload, headers=None):
+        system_prompt = payload["input"][0]["content"]
+        calls.append(system_prompt)
+        if system_prompt.startswith("You are summarizing one part"):
+            return {"output_text": f"- notes {len(calls)}"}
+        return {"output_text": "## Summary\nfinal"}
+
+    db = app_module.MockFirestoreClient()
+    db.collection("jobs").document("job-1").set({"uid": "user-1", "status": "running"})
+    monkeypatch.setattr(app_module, "post_openai_coalesced", fake_post)
+    monkeypatch.setattr(app_module, "get_openai_api_key", lambda: "test-key")
+    monkeypatch.setattr(app_module, "get_firestore_client", lambda: db)
+    monkeypatch.setattr(app_module, "SUMMARIZE_CHUNK_TOKEN_BUDGET", 60)
+    app_module._summary_notes_cache.clear()
+    app_module._summary_cache.clear()
+    return calls, db
+
+
+def test_fold_summarizes_closed_chunks_and_final_reuses_them(monkeypatch):
+    calls, db = install_fakes(monkeypatch)
+    state = app_module.RollingSummaryState("job-1", "user-1", "en", "")
+    state.segments = [f"segment {index} about the quarterly plan" for index in range(30)]
+    state.revision = 1
+
+    async def run():
+        await app_module.fold_rolling_summary(state)
+        folded_calls = len(calls)
+        summary, stats = await app_module.summarize_transcript(state.transcript(), "en", "", "Only risks")
+        return folded_calls, summary, stats
+
+    folded_calls, summary, stats = asyncio.run(run())
+    closed = len(app_module.chunk_transcript(state.transcript(), 60)) - 1
+    assert folded_calls == closed == len(state.notes)
+    assert summary == "## Summary\nfinal"
+    assert stats["cachedChunks"] == closed
+    # only the open tail chunk still needed a map call at the end
+    assert stats["chunks"] - stats["cachedChunks"] == 1
+
+    persisted = db.collection("jobs").document("job-1").get().to_dict()["rollingSummary"]
+    assert persisted["notes"] == state.notes
+
+
+def test_persisted_notes_are_seeded_into_cache(monkeypatch):
+    install_fakes(monkeypatch)
+    job_data = {"rollingSummary": {"outputLang": "en", "notes": {"k1": "- a", "k2": "- b"}}}
+    assert app_module.seed_persisted_summary_notes(job_data) == 2
+    assert app_module._summary_notes_cache.get("k1") == "- a"
+    assert app_module.seed_persisted_summary_notes({}) == 0
+
+
+def make_client(monkeypatch, max_bytes=10_000, ttl_seconds=60):
+    install_fakes(monkeypatch)
+
+    async def fake_uid(request):
+        return "user-1"
+
+    monkeypatch.setattr(app_module, "require_uid", fake_uid)
+    monkeypatch.setattr(app_module, "ROLLING_SUMMARY_MAX_BYTES", max_bytes)
+    monkeypatch.setattr(app_module, "_rolling_summaries", app_module.LRUTTLCache(10, max_bytes, ttl_seconds))
+    return TestClient(app_module.app)
+
+
+def append(client, segments, offset, job_id="job-1"):
+    return client.post(f"/api/v1/jobs/{job_id}/summary/segments", json={"segments": segments, "offset": offset})
+
+
+def test_appends_record_their_real_size_and_respect_the_byte_budget(monkeypatch):
+    client = make_client(monkeypatch, max_bytes=100)
+    app_module.get_firestore_client().collection("jobs").document("job-2").set({"uid": "user-1", "status": "running"})
+    assert append(client, ["あ" * 10], 0).json()["segmentCount"] == 1
+    assert app_module._rolling_summaries.stats()["bytes"] == 30
+    assert append(client, ["b" * 40], 0, job_id="job-2").status_code == 200
+    response = append(client, ["c" * 40], 1)
+    assert response.status_code == 503
+    assert response.json()["detail"] == "rolling_summary_capacity_exceeded"
+    # the rejected append left both jobs intact
+    assert app_module._rolling_summaries.get("job-1").segments == ["あ" * 10]
+    assert app_module._rolling_summaries.stats()["bytes"] == 70
+
+
+def test_appends_refresh_the_ttl(monkeypatch):
+    client = make_client(monkeypatch, ttl_seconds=0.3)
+    for offset in range(4):
+        assert append(client, [f"segment {offset}"], offset).status_code == 200
+        time.sleep(0.1)
+    assert app_module._rolling_summaries.get("job-1").received == 4
+
+
+def test_lost_state_asks_the_client_to_resend_from_the_start(monkeypatch):
+    client = make_client(monkeypatch)
+    assert append(client, ["one", "two"], 0).status_code == 200
+    app_module._rolling_summaries.clear()
+    response = append(client, ["three"], 2)
+    assert response.status_code == 409
+    assert response.json()["detail"] == {"reason": "rolling_summary_resync", "segmentCount": 0}
+    assert app_module._rolling_summaries.get("job-1") is None
+
+    assert append(client, ["one", "two", "three"], 0).json()["segmentCount"] == 3
+    # a skipped append is reported the same way, from the server's position
+    response = append(client, ["five"], 4)
+    assert response.json()["detail"]["segmentCount"] == 3
+    assert app_module._rolling_summaries.get("job-1").transcript() == "one\ntwo\nthree"
+
+
+def test_job_summary_reuses_the_dictionary_glossary_resolved_on_first_append(monkeypatch):
+    monkeypatch.setenv("DEBUG_AUTH_BYPASS", "1")
+    client = make_client(monkeypatch)
+    calls = []
+    original_post = app_module.post_openai_coalesced
+
+    async def recording_post(url, payload, headers=None):
+        calls.append(payload["input"][0]["content"])
+        return await original_post(url, payload, headers)
+
+    monkeypatch.setattr(app_module, "post_openai_coalesced", recording_post)
+    monkeypatch.setattr(app_module, "schedule_rolling_summary_fold", lambda state: None)
+    app_module._user_doc_cache.clear()
+    app_module._dictionary_snapshot_cache.clear()
+    app_module._dictionary_glossary_cache.clear()
+    db = app_module.get_firestore_client()
+    db.collection("users").document("user-1").set({"plan": "pro"})
+    app_module.insert_dictionary_entry("user-1", "ASR", "音声認識", "")
+    segments = [f"segment {index} about the ASR rollout plan" for index in range(30)]
+    body = {"segments": segments, "offset": 0, "outputLang": "en", "glossaryVersion": "latest"}
+    assert client.post("/api/v1/jobs/job-1/summary/segments", json=body).status_code == 200
+
+    state = app_module._rolling_summaries.get("job-1")
+    assert ("ASR", "音声認識") in state.glossary.entries
+    asyncio.run(app_module.fold_rolling_summary(state))
+    assert calls and all("ASR→音声認識" in prompt for prompt in calls)
+    version = state.glossary_version
+
+    # a dictionary edit mid-meeting must not change the glossary the folded notes were keyed with
+    app_module.insert_dictionary_entry("user-1", "rollout", "展開", "")
+    response = client.post(
+        "/api/v1/jobs/job-1/summary", json={"outputLang": "en", "glossaryVersion": "latest"}
+    )
+    stats = response.json()["stats"]
+    assert stats["cachedChunks"] == len(state.notes) == stats["chunks"] - 1
+    assert stats["glossaryVersion"] == version
+
+    # without the rolling state (another instance) the endpoint resolves the dictionary itself
+    app_module._rolling_summaries.clear()
+    response = client.post(
+        "/api/v1/jobs/job-1/summary",
+        json={"text": state.transcript(), "outputLang": "en", "glossaryVersion": "latest"},
+    )
+    assert response.json()["stats"]["glossaryVersion"] == version + 1
+    assert "rollout→展開" in calls[-1]
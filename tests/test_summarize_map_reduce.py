@@ -0,0 +1,74 @@
+import asyncio
+from pathlib import Path
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+def test_chunk_transcript_splits_on_utterance_boundaries():
+    lines = [f"utterance number {index} about the roadmap" for index in range(40)]
+    text = "\n".join(lines)
+    chunks = app_module.chunk_transcript(text, token_budget=60)
+    assert len(chunks) > 1
+    assert "\n".join(chunks) == text
+    for chunk in chunks:
+        assert app_module.estimate_tokens(chunk) <= 60
+
+    long_line = "あ" * 500
+    pieces = app_module.chunk_transcript(long_line, token_budget=100)
+    assert "".join(pieces) == long_line
+    assert all(app_module.estimate_tokens(piece) <= 100 for piece in pieces)
+
+
+def install_fake_responses(monkeypatch):
+    calls = []
+
+    async def fake_post(url, payload, headers=None):
+        system_prompt = payload["input"][0]["content"]
+        user_content = payload["input"][1]["content"]
+        calls.append((system_prompt, user_content))
+        if system_prompt.startswith("You are summarizing one part"):
+            return {"output_text": f"- notes for {user_content.splitlines()[0]}"}
+        return {"output_text": "## Summary\nmerged"}
+
+    monkeypatch.setattr(app_module, "post_openai_coalesced", fake_post)
+    app_module._summary_cache.clear()
+    monkeypatch.setattr(app_module, "get_openai_api_key", lambda: "test-key")
+    return calls
+
+
+def test_short_transcript_uses_single_call(monkeypatch):
+    calls = install_fake_responses(monkeypatch)
+    summary, stats = asyncio.run(
+        app_module.summarize_transcript("short meeting", "en", "", "Focus on risks")
+    )
+    assert summary == "## Summary\nmerged"
+    assert stats["mode"] == "single"
+    assert len(calls) == 1
+    assert "Focus on risks" in calls[0][0]
+
+
+def test_long_transcript_is_mapped_then_reduced(monkeypatch):
+    monkeypatch.setattr(app_module, "SUMMARIZE_CHUNK_TOKEN_BUDGET", 60)
+    calls = install_fake_responses(monkeypatch)
+    app_module._summary_notes_cache.clear()
+    text = "\n".join(f"line {index} OpenAI roadmap discussion" for index in range(30))
+    summary, stats = asyncio.run(
+        app_module.summarize_transcript(text, "en", "OpenAI => オープンエーアイ\nStripe => ストライプ", "Focus on risks")
+    )
+    assert summary == "## Summary\nmerged"
+    assert stats["mode"] == "map_reduce"
+    assert stats["chunks"] > 1
+    assert {"mapMs", "reduceMs", "totalMs"} <= set(stats)
+
+    map_prompts = [system for system, _ in calls if system.startswith("You are summarizing one part")]
+    assert len(map_prompts) >= stats["chunks"]
+    assert all("Focus on risks" not in prompt for prompt in map_prompts)
+    assert all("OpenAI→オープンエーアイ" in prompt and "Stripe" not in prompt for prompt in map_prompts)
+    reduce_system, reduce_input = calls[-1]
+    assert "Summary" in reduce_system and "Focus on risks" in reduce_system
+    assert "### Part 1" in reduce_input
@@ -0,0 +1,74 @@
+import asyncio
+import json
+from pathlib import Path
+import sys
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+def sse_body(deltas, usage):
+    frames = []
+    for delta in deltas:
+        event = {"type": "response.output_text.delta", "delta": delta}
+        frames.append(f"event: response.output_text.delta\ndata: {json.dumps(event, ensure_ascii=False)}\n\n")
+    completed = {"type": "response.completed", "response": {"usage": usage}}
+    frames.append(f"event: response.completed\ndata: {json.dumps(completed)}\n\n")
+    return "".join(frames).encode("utf-8")
+
+
+def parse_frames(frames):
+    parsed = []
+    for frame in frames:
+        event_line, data_line = frame.strip().split("\n", 1)
+        parsed.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+    return parsed
+
+
+def run_stream(handler, text, summary_prompt=""):
+    async def run():
+        app_module._openai_client = app_module.create_openai_client(transport=httpx.MockTransport(handler))
+        app_module._summary_cache.clear()
+        try:
+            return [
+                frame
+                async for frame in app_module.stream_summary_events(text, "en", "", summary_prompt)
+            ]
+        finally:
+            await app_module.close_openai_client()
+
+    return parse_frames(asyncio.run(run()))
+
+
+def test_stream_relays_deltas_and_reports_usage(monkeypatch):
+    monkeypatch.setattr(app_module, "get_openai_api_key", lambda: "test-key")
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(json.loads(request.content))
+        body = sse_body(["## Summary\n", "- shipped"], {"input_tokens": 50, "output_tokens": 7, "total_tokens": 57})
+        return httpx.Response(200, content=body, headers={"content-type": "text/event-stream"})
+
+    frames = run_stream(handler, "we shipped the release", summary_prompt="Be brief")
+    assert [event for event, _ in frames] == ["delta", "delta", "done"]
+    done = frames[-1][1]
+    assert done["summary"] == "## Summary\n- shipped"
+    assert done["usage"] == {"input_tokens": 50, "output_tokens": 7, "total_tokens": 57}
+    assert done["stats"]["mode"] == "single"
+    assert requests[0]["stream"] is True
+    assert "Be brief" in requests[0]["input"][0]["content"]
+
+
+def test_stream_reports_upstream_error(monkeypatch):
+    monkeypatch.setattr(app_module, "get_openai_api_key", lambda: "test-key")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(400, json={"error": {"message": "bad request"}})
+
+    frames = run_stream(handler, "some text")
+    assert frames == [("error", {"detail": "OpenAI API error (400)", "status": 400})]
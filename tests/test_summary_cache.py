@@ -0,0 +1,61 @@
+import asyncio
+from pathlib import Path
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+class DictTier:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ttl_seconds):
+        self.data[key] = value
+
+
+def test_summary_cache_key_inputs():
+    base = app_module.summary_cache_key("OpenAI meeting", "ja", "OpenAI => オープンエーアイ", "Be brief")
+    assert base == app_module.summary_cache_key(
+        "OpenAI meeting", "ja", "OpenAI => オープンエーアイ\nStripe => ストライプ", "  Be brief  "
+    )
+    assert base != app_module.summary_cache_key("OpenAI meeting", "en", "OpenAI => オープンエーアイ", "Be brief")
+    assert base != app_module.summary_cache_key("OpenAI meeting", "ja", "", "Be brief")
+    assert base != app_module.summary_cache_key("OpenAI meeting", "ja", "OpenAI => オープンエーアイ", "Be long")
+    assert base != app_module.summary_cache_key(
+        "OpenAI meeting", "ja", "OpenAI => オープンエーアイ", "Be brief", prompt_version="v0"
+    )
+
+
+def test_repeated_summaries_hit_memory_then_shared_tier(monkeypatch):
+    calls = []
+
+    async def fake_post(url, payload, headers=None):
+        calls.append(payload)
+        return {"output_text": "## 要約\n- done", "usage": {"total_tokens": 10}}
+
+    tier = DictTier()
+    monkeypatch.setattr(app_module, "post_openai_coalesced", fake_post)
+    monkeypatch.setattr(app_module, "get_openai_api_key", lambda: "test-key")
+    monkeypatch.setattr(app_module, "_summary_shared_tier", tier)
+
+    async def run():
+        app_module._summary_cache.clear()
+        first = await app_module.summarize_transcript("same transcript", "ja", "", "")
+        second = await app_module.summarize_transcript("same transcript", "ja", "", "")
+        app_module._summary_cache.clear()
+        third = await app_module.summarize_transcript("same transcript", "ja", "", "")
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert len(calls) == 1
+    assert first[0] == second[0] == third[0] == "## 要約\n- done"
+    assert first[1]["mode"] == "single"
+    assert second[1]["mode"] == "cached" and third[1]["mode"] == "cached"
+    assert len(tier.data) == 1
@@ -0,0 +1,83 @@
+import asyncio
+from pathlib import Path
+import sys
+
+import pytest
+from fastapi import HTTPException
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+def test_estimate_tokens_depends_on_script():
+    english = "The quarterly roadmap review is scheduled for next Tuesday."
+    japanese = "四半期のロードマップレビューは来週の火曜日に予定されています。"
+    assert app_module.detect_text_lang(english) == "en"
+    assert app_module.detect_text_lang(japanese) == "ja"
+    assert app_module.detect_text_lang("我们下周二讨论季度路线图") == "zh"
+    assert app_module.detect_text_lang("Chúng tôi sẽ họp vào thứ Ba") == "vi"
+    # English packs ~4 characters per token, Japanese close to one per character
+    assert app_module.estimate_tokens(english) < len(english) / 2
+    assert app_module.estimate_tokens(japanese) > len(japanese) / 2
+    assert app_module.estimate_tokens("") == 0
+
+
+def test_calibration_tracks_actual_usage(monkeypatch):
+    monkeypatch.setattr(app_module, "_token_calibration", {})
+    monkeypatch.setattr(app_module, "TOKEN_CALIBRATION_MIN_SAMPLES", 3)
+    payload = {"input": [{"role": "user", "content": "hello there, this is a calibration sample"}]}
+    estimated = app_module.estimate_payload_tokens(payload)
+    for _ in range(3):
+        app_module.observe_token_usage(payload, {"input_tokens": estimated * 2})
+    stats = app_module.get_token_estimator_stats()["en"]
+    assert stats["samples"] == 3
+    assert stats["calibration"] == pytest.approx(2.0)
+    assert app_module.estimate_payload_tokens(payload) > estimated
+
+
+def test_budget_helpers():
+    with pytest.raises(HTTPException) as exc_info:
+        app_module.ensure_input_within_budget("word " * 1000, limit=100)
+    assert exc_info.value.status_code == 413
+    entries = [(f"term{i}", f"用語{i}") for i in range(50)]
+    kept, dropped = app_module.fit_glossary_entries(entries, token_budget=40)
+    assert kept == entries[: len(kept)]
+    assert dropped == 50 - len(kept) and 0 < len(kept) < 50
+
+
+def test_post_openai_observes_usage(monkeypatch):
+    observed = []
+    monkeypatch.setattr(app_module, "observe_token_usage", lambda payload, usage: observed.append(usage))
+
+    class FakeResponse:
+        status_code = 200
+        is_success = True
+        headers = {}
+
+        def json(self):
+            return {"output_text": "ok", "usage": {"input_tokens": 12}}
+
+    class FakeClient:
+        async def post(self, url, json, headers, timeout):
+            return FakeResponse()
+
+    monkeypatch.setattr(app_module, "get_openai_client", lambda: FakeClient())
+    payload = {"model": "m", "input": [{"role": "user", "content": "hi"}]}
+    asyncio.run(app_module.post_openai("https://api.openai.com/v1/responses", payload))
+    assert observed == [{"input_tokens": 12}]
+
+
+def test_chunk_boundaries_ignore_calibration(monkeypatch):
+    monkeypatch.setattr(app_module, "_token_calibration", {})
+    monkeypatch.setattr(app_module, "TOKEN_CALIBRATION_MIN_SAMPLES", 1)
+    transcript = "".join(f"Speaker {i}: we reviewed item {i} of the quarterly roadmap.\n\n" for i in range(40))
+    before = app_module.chunk_transcript(transcript, 120)
+    assert len(before) > 1
+    payload = {"input": [{"role": "user", "content": "calibration sample for the english estimator"}]}
+    estimated = app_module.estimate_payload_tokens(payload)
+    app_module.observe_token_usage(payload, {"input_tokens": estimated * 2})
+    assert app_module.token_calibration("en") > 1.5
+    assert app_module.chunk_transcript(transcript, 120) == before
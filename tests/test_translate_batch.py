@@ -0,0 +1,89 @@
+import asyncio
+import json
+from pathlib import Path
+import sys
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+def test_pack_batch_segments_respects_budget_and_order():
+    items = [(i, "x" * 30) for i in range(5)]
+    # "x" * 30 is ~8 estimated tokens, plus 8 tokens of per-segment overhead
+    chunks = app_module.pack_batch_segments(items, token_budget=40, overhead_tokens=8)
+    assert [index for chunk in chunks for index, _ in chunk] == [0, 1, 2, 3, 4]
+    assert len(chunks) == 3
+    assert app_module.pack_batch_segments([(0, "x" * 300)], token_budget=10) == [[(0, "x" * 300)]]
+
+
+def test_parse_batch_output_ignores_unknown_indices():
+    raw = json.dumps({"translations": [{"i": 0, "text": " a "}, {"i": 9, "text": "z"}]})
+    assert app_module.parse_batch_translation_output(raw, {0, 1}) == {0: "a"}
+    assert app_module.parse_batch_translation_output("not json", {0}) == {}
+
+
+def test_translate_segments_aligns_by_index_and_retries_guard_failures(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        calls.append(payload)
+        if "text" in payload:
+            segments = json.loads(payload["input"][1]["content"])["segments"]
+            out = []
+            for segment in segments:
+                text = "これは日本語のままです。" if segment["i"] == 1 else f"EN:{segment['text']}"
+                out.append({"i": segment["i"], "text": text})
+            return httpx.Response(200, json={"output_text": json.dumps({"translations": out[::-1]})})
+        return httpx.Response(200, json={"output_text": "Retried."})
+
+    async def run():
+        app_module._translation_cache.clear()
+        app_module._openai_client = app_module.create_openai_client(transport=httpx.MockTransport(handler))
+        try:
+            return await app_module.translate_segments(["はい", "次のスライド", "", "ありがとう"], "ja", "en")
+        finally:
+            await app_module.close_openai_client()
+
+    translations, stats = asyncio.run(run())
+    assert translations == ["EN:はい", "Retried.", "", "EN:ありがとう"]
+    assert stats == {"segments": 4, "cached": 0, "upstreamCalls": 1, "retried": 1}
+    assert len(calls) == 2
+
+
+def test_translate_segments_injects_each_chunks_matched_glossary(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    prompts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        prompts.append(payload["input"][0]["content"])
+        segments = json.loads(payload["input"][1]["content"])["segments"]
+        english = {0: "We will share the minutes.", 1: "Speech recognition accuracy.", 2: "Yes."}
+        out = [{"i": segment["i"], "text": english[segment["i"]]} for segment in segments]
+        return httpx.Response(200, json={"output_text": json.dumps({"translations": out})})
+
+    glossary = app_module.compile_glossary("議事録 => minutes\n音声認識 => ASR\n請求書 => invoice")
+
+    async def run():
+        app_module._translation_cache.clear()
+        app_module._openai_client = app_module.create_openai_client(transport=httpx.MockTransport(handler))
+        try:
+            return await app_module.translate_segments(["議事録を共有します", "音声認識の精度", "はい"], "ja", "en", glossary)
+        finally:
+            await app_module.close_openai_client()
+
+    translations, stats = asyncio.run(run())
+    assert translations == ["We will share the minutes.", "Speech recognition accuracy.", "Yes."]
+    assert stats == {"segments": 3, "cached": 0, "upstreamCalls": 1, "retried": 0}
+    assert "- 議事録 => minutes" in prompts[0]
+    assert "- 音声認識 => ASR" in prompts[0]
+    assert "請求書" not in prompts[0]
+    # segment 1 missed its glossary target ("ASR"), so it is returned but not cached
+    assert len(app_module._translation_cache) == 2
@@ -0,0 +1,83 @@
+import asyncio
+from pathlib import Path
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+def install_fake_prompt(monkeypatch, primary, strict, primary_delay, strict_delay):
+    calls = {"primary": 0, "strict": 0, "strict_cancelled": 0}
+
+    async def fake_call(text, target_lang_name, headers, strict, glossary_entries=None):
+        name = "strict" if strict else "primary"
+        calls[name] += 1
+        try:
+            await asyncio.sleep(strict_delay if strict else primary_delay)
+        except asyncio.CancelledError:
+            if strict:
+                calls["strict_cancelled"] += 1
+            raise
+        return globals_map[name]
+
+    globals_map = {"primary": primary, "strict": strict}
+    monkeypatch.setattr(app_module, "call_translation_prompt", fake_call)
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    return calls
+
+
+def test_hedge_disabled_by_default_and_never_for_japanese(monkeypatch):
+    monkeypatch.setattr(app_module, "TRANSLATE_HEDGE_PAIRS", set())
+    assert app_module.is_hedge_enabled("ja", "en") is False
+    monkeypatch.setattr(app_module, "TRANSLATE_HEDGE_PAIRS", {"*"})
+    assert app_module.is_hedge_enabled("en", "ja") is False
+    assert app_module.is_hedge_enabled("ja", "en") is True
+
+
+def test_hedged_strict_wins_when_primary_fails_guard(monkeypatch):
+    monkeypatch.setattr(app_module, "TRANSLATE_HEDGE_PAIRS", {"ja:en"})
+    monkeypatch.setattr(app_module, "TRANSLATE_HEDGE_DELAY_MS", 10)
+    calls = install_fake_prompt(
+        monkeypatch, "これは日本語です。", "This is English.", primary_delay=0.05, strict_delay=0.01
+    )
+    app_module._ja_guard_stats.clear()
+    result = asyncio.run(app_module.request_translation("これは日本語です。", "en", "ja"))
+    assert result == "This is English."
+    assert calls["primary"] == 1 and calls["strict"] == 1
+    stats = app_module.get_ja_guard_stats()["pairs"]["ja:en"]
+    assert stats["hedged"] == 1
+    assert stats["strictWon"] == 1
+
+
+def test_hedged_primary_wins_and_strict_is_cancelled(monkeypatch):
+    monkeypatch.setattr(app_module, "TRANSLATE_HEDGE_PAIRS", {"*"})
+    monkeypatch.setattr(app_module, "TRANSLATE_HEDGE_DELAY_MS", 0)
+    calls = install_fake_prompt(monkeypatch, "Hello.", "Strict hello.", primary_delay=0.01, strict_delay=0.2)
+    result = asyncio.run(app_module.request_translation("こんにちは", "en", "ja"))
+    assert result == "Hello."
+    assert calls["strict_cancelled"] == 1
+
+
+def test_serial_path_records_guard_rate(monkeypatch):
+    monkeypatch.setattr(app_module, "TRANSLATE_HEDGE_PAIRS", set())
+    install_fake_prompt(monkeypatch, "これは日本語です。", "English.", primary_delay=0, strict_delay=0)
+    app_module._ja_guard_stats.clear()
+    assert asyncio.run(app_module.request_translation("x", "zh", "en")) == "English."
+    assert app_module.get_ja_guard_stats()["pairs"]["en:zh"]["guardRate"] == 1.0
+
+
+def test_hedged_guard_failing_strict_does_not_beat_pending_primary(monkeypatch):
+    monkeypatch.setattr(app_module, "TRANSLATE_HEDGE_PAIRS", {"*"})
+    monkeypatch.setattr(app_module, "TRANSLATE_HEDGE_DELAY_MS", 0)
+    install_fake_prompt(monkeypatch, "Hello.", "まだ日本語です。", primary_delay=0.1, strict_delay=0.01)
+    assert asyncio.run(app_module.request_translation("こんにちは", "en", "ja")) == "Hello."
+
+
+def test_hedged_falls_back_to_strict_when_both_fail_guard(monkeypatch):
+    monkeypatch.setattr(app_module, "TRANSLATE_HEDGE_PAIRS", {"*"})
+    monkeypatch.setattr(app_module, "TRANSLATE_HEDGE_DELAY_MS", 0)
+    install_fake_prompt(monkeypatch, "日本語の一次結果です。", "日本語の厳格結果です。", primary_delay=0.05, strict_delay=0.01)
+    assert asyncio.run(app_module.request_translation("こんにちは", "en", "ja")) == "日本語の厳格結果です。"
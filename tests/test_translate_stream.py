@@ -0,0 +1,88 @@
+import asyncio
+import json
+from pathlib import Path
+import sys
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+def sse_body(deltas):
+    frames = []
+    for delta in deltas:
+        event = {"type": "response.output_text.delta", "delta": delta}
+        frames.append(f"event: response.output_text.delta\ndata: {json.dumps(event, ensure_ascii=False)}\n\n")
+    frames.append('event: response.completed\ndata: {"type": "response.completed"}\n\n')
+    return "".join(frames).encode("utf-8")
+
+
+def parse_frames(frames):
+    parsed = []
+    for frame in frames:
+        event_line, data_line = frame.strip().split("\n", 1)
+        parsed.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+    return parsed
+
+
+def run_stream(bodies, text, output_lang, clear_cache=True, glossary=app_module.EMPTY_GLOSSARY):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(json.loads(request.content))
+        return httpx.Response(200, content=bodies[len(calls) - 1], headers={"content-type": "text/event-stream"})
+
+    async def run():
+        if clear_cache:
+            app_module._translation_cache.clear()
+        app_module._openai_client = app_module.create_openai_client(transport=httpx.MockTransport(handler))
+        try:
+            return [frame async for frame in app_module.stream_translation_events(text, "auto", output_lang, glossary)]
+        finally:
+            await app_module.close_openai_client()
+
+    return parse_frames(asyncio.run(run())), calls
+
+
+def test_stream_relays_deltas_and_caches(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    events, calls = run_stream([sse_body(["こんにちは", "、世界"])], "Hello, world", "ja")
+    assert calls[0]["stream"] is True
+    assert [name for name, _ in events] == ["delta", "delta", "done"]
+    assert events[-1][1] == {"translation": "こんにちは、世界", "cached": False}
+
+    cached_events, cached_calls = run_stream([], "Hello, world", "ja", clear_cache=False)
+    assert cached_calls == []
+    assert cached_events == [("delta", {"text": "こんにちは、世界"}), ("done", {"translation": "こんにちは、世界", "cached": True})]
+
+
+def test_stream_guard_stops_and_retries_wrong_language(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(app_module, "TRANSLATE_STREAM_GUARD_CHARS", 8)
+    bodies = [
+        sse_body(["これは日本語です。", "まだ続きます"]),
+        sse_body(["This is ", "English."]),
+    ]
+    events, calls = run_stream(bodies, "これは日本語です。", "en")
+    names = [name for name, _ in events]
+    assert names[0] == "retry"
+    assert "Do NOT output in Japanese" in calls[1]["input"][0]["content"]
+    assert events[-1] == ("done", {"translation": "This is English.", "cached": False})
+
+
+def test_stream_injects_matched_glossary_and_skips_caching_misses(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    glossary = app_module.compile_glossary("ASR => 音声認識\nGPU => ジーピーユー")
+    events, calls = run_stream([sse_body(["エーエスアールの精度"])], "ASR accuracy", "ja", glossary=glossary)
+    system_prompt = calls[0]["input"][0]["content"]
+    assert "- ASR => 音声認識" in system_prompt
+    assert "GPU" not in system_prompt
+    assert events[-1] == ("done", {"translation": "エーエスアールの精度", "cached": False})
+    # the output missed the glossary target, so the next request goes upstream again
+    events, calls = run_stream([sse_body(["音声認識の精度"])], "ASR accuracy", "ja", clear_cache=False, glossary=glossary)
+    assert len(calls) == 1
+    assert events[-1] == ("done", {"translation": "音声認識の精度", "cached": False})
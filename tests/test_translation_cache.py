@@ -0,0 +1,99 @@
+import asyncio
+from pathlib import Path
+import sys
+import threading
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+class DictTier:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ttl_seconds):
+        self.data[key] = value
+
+
+def test_lru_ttl_cache_evicts_by_entries_and_bytes():
+    cache = app_module.LRUTTLCache(max_entries=2, max_bytes=10_000, ttl_seconds=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.evictions == 1
+
+    small = app_module.LRUTTLCache(max_entries=100, max_bytes=20, ttl_seconds=60)
+    small.set("k1", "x" * 9)
+    small.set("k2", "y" * 9)
+    assert small.get("k1") is None
+    assert small.stats()["bytes"] <= 20
+
+
+def test_lru_ttl_cache_expires_entries():
+    cache = app_module.LRUTTLCache(max_entries=10, max_bytes=10_000, ttl_seconds=60)
+    cache.set("a", "1", ttl_seconds=-1)
+    assert cache.get("a") is None
+    cache.set("b", "2", ttl_seconds=0.0001)
+    asyncio.run(asyncio.sleep(0.01))
+    assert cache.get("b") is None
+
+
+def test_lru_ttl_cache_stats_wait_for_writers():
+    cache = app_module.LRUTTLCache(max_entries=10, max_bytes=10_000, ttl_seconds=60)
+    cache.set("a", "1")
+    result = {}
+    with cache._lock:
+        reader = threading.Thread(target=lambda: result.update(cache.stats()))
+        reader.start()
+        reader.join(timeout=0.05)
+        # a writer holds the lock, so the snapshot must not be taken mid-update
+        assert reader.is_alive()
+    reader.join(timeout=1)
+    assert result["entries"] == 1 and result["bytes"] == app_module.estimate_cache_bytes("a", "1")
+
+
+def test_translation_cache_key_normalizes_text():
+    key_a = app_module.translation_cache_key("  Thank   you ", "auto", "ja")
+    key_b = app_module.translation_cache_key("Thank you", "auto", "ja")
+    key_c = app_module.translation_cache_key("Thank you", "auto", "en")
+    key_d = app_module.translation_cache_key("Thank you", "auto", "ja", prompt_version="v0")
+    assert key_a == key_b
+    assert key_a != key_c
+    assert key_a != key_d
+
+
+def test_translation_guard_failures_are_not_cached():
+    async def run():
+        app_module._translation_cache.clear()
+        key = app_module.translation_cache_key("はい", "ja", "en")
+        stored = await app_module.store_cached_translation(key, "はい", "はい、そうです。", "en")
+        return stored, await app_module.get_cached_translation(key)
+
+    stored, cached = asyncio.run(run())
+    assert stored is False
+    assert cached is None
+
+
+def test_shared_tier_hit_is_promoted_to_memory(monkeypatch):
+    tier = DictTier()
+    monkeypatch.setattr(app_module, "_translation_shared_tier", tier)
+
+    async def run():
+        app_module._translation_cache.clear()
+        key = app_module.translation_cache_key("Thank you", "en", "ja")
+        tier.data[key] = "ありがとう"
+        first = await app_module.get_cached_translation(key)
+        tier.data.clear()
+        second = await app_module.get_cached_translation(key)
+        return first, second
+
+    assert asyncio.run(run()) == ("ありがとう", "ありがとう")
@@ -0,0 +1,97 @@
+import asyncio
+from pathlib import Path
+import sys
+
+import httpx
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+URL = "https://api.openai.com/v1/responses"
+
+
+def test_parse_rate_limit_duration_formats():
+    assert app_module.parse_rate_limit_duration("2") == 2.0
+    assert app_module.parse_rate_limit_duration("20ms") == pytest.approx(0.02)
+    assert app_module.parse_rate_limit_duration("6m0s") == 360.0
+    assert app_module.parse_rate_limit_duration("1h2m3.5s") == pytest.approx(3723.5)
+    assert app_module.parse_rate_limit_duration("soon") is None
+
+
+def test_retry_after_prefers_explicit_headers():
+    response = httpx.Response(429, headers={"retry-after-ms": "1500", "retry-after": "9"})
+    assert app_module.retry_after_seconds(response) == 1.5
+    response = httpx.Response(
+        429,
+        headers={
+            "x-ratelimit-remaining-requests": "0",
+            "x-ratelimit-reset-requests": "2s",
+            "x-ratelimit-remaining-tokens": "100",
+            "x-ratelimit-reset-tokens": "30s",
+        },
+    )
+    assert app_module.retry_after_seconds(response) == 2.0
+
+
+def test_insufficient_quota_is_not_retried():
+    response = httpx.Response(429, json={"error": {"code": "insufficient_quota"}})
+    assert app_module.next_retry_delay(response, 0, float("inf")) is None
+    assert app_module.next_retry_delay(httpx.Response(400), 0, float("inf")) is None
+
+
+def test_limiter_queues_then_sheds():
+    async def run():
+        limiter = app_module.UpstreamLimiter("test", max_concurrency=1, max_queue=1, max_wait_seconds=0.05)
+        await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(app_module.UpstreamOverloadedError):
+            await limiter.acquire()
+        limiter.release()
+        await queued
+        stats = limiter.stats()
+        limiter.release()
+        return stats
+
+    stats = asyncio.run(run())
+    assert stats["shed"] == 1
+    assert stats["maxQueueDepth"] == 1
+    assert stats["inFlight"] == 1
+
+
+def test_limiter_halves_limit_on_rate_limit_and_recovers():
+    limiter = app_module.UpstreamLimiter("test", max_concurrency=16, max_queue=10, max_wait_seconds=1)
+    limiter.on_rate_limited(None)
+    assert limiter.limit == 8
+    for _ in range(8):
+        limiter.on_success()
+    assert limiter.limit == 9
+
+
+def test_post_openai_retries_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(app_module, "OPENAI_RETRY_BASE_DELAY_SECONDS", 0.001)
+    statuses = [429, 200]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        status = statuses.pop(0)
+        if status == 429:
+            return httpx.Response(429, headers={"retry-after-ms": "10"}, json={"error": {"code": "rate_limit_exceeded"}})
+        return httpx.Response(200, json={"output_text": "ok"})
+
+    async def run():
+        app_module._openai_client = app_module.create_openai_client(transport=httpx.MockTransport(handler))
+        limiter = app_module.get_upstream_limiter(URL)
+        retries_before = limiter.retries
+        try:
+            result = await app_module.post_openai(URL, {"input": "x"})
+        finally:
+            await app_module.close_openai_client()
+        return result, limiter.retries - retries_before
+
+    result, retries = asyncio.run(run())
+    assert result == {"output_text": "ok"}
+    assert retries == 1
@@ -0,0 +1,54 @@
+from datetime import datetime, timezone
+from pathlib import Path
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+def make_db(monkeypatch):
+    reads = []
+    original_get = app_module.MockDocument.get
+
+    def counted_get(self, *args, **kwargs):
+        reads.append(self.doc_id)
+        return original_get(self, *args, **kwargs)
+
+    monkeypatch.setattr(app_module.MockDocument, "get", counted_get)
+    app_module._user_doc_cache.clear()
+    db = app_module.MockFirestoreClient()
+    db.collection("users").document("user-1").set({"plan": "pro"})
+    return db, reads
+
+
+def test_repeated_reads_are_served_from_cache(monkeypatch):
+    db, reads = make_db(monkeypatch)
+    assert app_module.get_user_doc(db, "user-1") == {"plan": "pro"}
+    assert app_module.get_user_doc(db, "user-1") == {"plan": "pro"}
+    assert len(reads) == 1
+    assert app_module.get_user_doc(db, "missing") is None
+    assert app_module.get_user_doc(db, "missing") is None
+    assert len(reads) == 2
+
+
+def test_own_writes_invalidate_the_cached_document(monkeypatch):
+    db, reads = make_db(monkeypatch)
+    app_module.get_user_doc(db, "user-1")
+    user_ref = db.collection("users").document("user-1")
+    app_module.apply_user_updates(user_ref, {"plan": "free"})
+    assert app_module.get_user_doc(db, "user-1")["plan"] == "free"
+    assert len(reads) == 2
+
+
+def test_read_only_user_state_uses_cache_but_transactions_read_fresh(monkeypatch):
+    db, reads = make_db(monkeypatch)
+    current = datetime(2026, 2, 1, 9, 0, tzinfo=app_module.JST)
+    app_module.read_user_state(db, "user-1", current, persist=False)
+    app_module.read_user_state(db, "user-1", current, persist=False)
+    assert len(reads) == 1
+    app_module.create_job_transaction_simple(db, "user-1", "job-1", current, datetime.now(timezone.utc))
+    assert len(reads) >= 2
+    assert app_module._user_doc_cache.get("user-1") is None
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+YESTERDAY = datetime(2026, 1, 31, 23, 58, tzinfo=app_module.JST)
+TODAY = YESTERDAY + timedelta(minutes=4)
+
+
+def seed_user(db):
+    app_module._user_doc_cache.clear()
+    state, _, _, _ = app_module.normalize_user_usage_data({"plan": "free"}, YESTERDAY, True)
+    state.update({"usedSecondsToday": 300, "usedBaseSecondsThisMonth": 900, "jobCountToday": 4})
+    db.collection("users").document("user-1").set(state)
+    return dict(db.data["users"]["user-1"])
+
+
+def test_read_only_state_rolls_over_virtually_without_writing():
+    db = app_module.MockFirestoreClient()
+    stored = seed_user(db)
+    _, state, plan, _ = app_module.read_user_state(db, "user-1", TODAY, persist=False)
+    assert plan == "free"
+    assert state["dayKey"] == app_module.day_key(TODAY)
+    assert state["usedSecondsToday"] == 0
+    assert state["usedBaseSecondsThisMonth"] == 0
+    assert db.data["users"]["user-1"] == stored
+
+
+def test_job_create_persists_rollover():
+    db = app_module.MockFirestoreClient()
+    seed_user(db)
+    app_module.create_job_transaction_simple(db, "user-1", "job-1", TODAY, datetime.now(timezone.utc))
+    persisted = db.data["users"]["user-1"]
+    assert persisted["dayKey"] == app_module.day_key(TODAY)
+    assert persisted["monthKey"] == app_module.month_key(TODAY)
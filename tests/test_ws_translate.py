@@ -0,0 +1,94 @@
+import asyncio
+from pathlib import Path
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import app as app_module
+
+
+def install_fake_translate(monkeypatch, delays):
+    state = {"active": 0, "peak": 0}
+
+    async def fake_translate(text, input_lang, output_lang, glossary=app_module.EMPTY_GLOSSARY):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        try:
+            await asyncio.sleep(delays.get(text, 0))
+        finally:
+            state["active"] -= 1
+        return f"{output_lang}:{text}"
+
+    monkeypatch.setattr(app_module, "translate_with_cache", fake_translate)
+    monkeypatch.setattr(app_module, "is_debug_auth_bypass", lambda: True)
+    return state
+
+
+def test_results_are_pipelined_but_returned_in_order(monkeypatch):
+    state = install_fake_translate(monkeypatch, {"slow": 0.2, "fast": 0.0, "mid": 0.05})
+    monkeypatch.setattr(app_module, "WS_TRANSLATE_MAX_INFLIGHT", 3)
+    client = TestClient(app_module.app)
+    with client.websocket_connect("/ws/translate") as ws:
+        ws.send_json({"type": "auth", "token": "t", "output_lang": "en"})
+        assert ws.receive_json() == {"type": "ready", "maxInflight": 3}
+        for seq, text in enumerate(["slow", "fast", "mid"], start=1):
+            ws.send_json({"type": "translate", "seq": seq, "text": text})
+        results = [ws.receive_json() for _ in range(3)]
+    assert [(item["seq"], item["translation"]) for item in results] == [
+        (1, "en:slow"),
+        (2, "en:fast"),
+        (3, "en:mid"),
+    ]
+    assert state["peak"] >= 2
+
+
+def test_invalid_messages_get_errors_in_sequence(monkeypatch):
+    install_fake_translate(monkeypatch, {})
+    client = TestClient(app_module.app)
+    with client.websocket_connect("/ws/translate") as ws:
+        ws.send_json({"type": "auth", "token": "t"})
+        ws.receive_json()
+        ws.send_json({"type": "translate", "seq": 5, "text": "hello"})
+        ws.send_json({"type": "translate", "seq": 5, "text": "again"})
+        ws.send_json({"type": "translate", "seq": 6, "text": "  "})
+        first, second, third = (ws.receive_json() for _ in range(3))
+    assert first == {"type": "result", "seq": 5, "translation": "ja:hello"}
+    assert second["detail"] == "seq_out_of_order"
+    assert third == {"type": "error", "seq": 6, "status": 400, "detail": "text is required"}
+
+
+def test_socket_closes_without_valid_auth(monkeypatch):
+    monkeypatch.setattr(app_module, "is_debug_auth_bypass", lambda: False)
+    client = TestClient(app_module.app)
+    with client.websocket_connect("/ws/translate") as ws:
+        ws.send_json({"type": "translate", "seq": 1, "text": "hi"})
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            ws.receive_json()
+    assert exc_info.value.code == app_module.WS_CLOSE_AUTH_FAILED
+
+
+def test_unexpected_exception_becomes_an_error_for_that_seq(monkeypatch):
+    async def flaky_translate(text, input_lang, output_lang, glossary=app_module.EMPTY_GLOSSARY):
+        if text == "boom":
+            raise RuntimeError("hedged translation produced no result")
+        return f"{output_lang}:{text}"
+
+    monkeypatch.setattr(app_module, "translate_with_cache", flaky_translate)
+    monkeypatch.setattr(app_module, "is_debug_auth_bypass", lambda: True)
+    monkeypatch.setattr(app_module, "WS_TRANSLATE_MAX_INFLIGHT", 1)
+    client = TestClient(app_module.app)
+    with client.websocket_connect("/ws/translate") as ws:
+        ws.send_json({"type": "auth", "token": "t", "output_lang": "en"})
+        ws.receive_json()
+        for seq, text in enumerate(["ok", "boom", "after"], start=1):
+            ws.send_json({"type": "translate", "seq": seq, "text": text})
+        results = [ws.receive_json() for _ in range(3)]
+    assert results[0]["translation"] == "en:ok"
+    assert results[1] == {"type": "error", "seq": 2, "status": 500, "detail": "translation_failed"}
+    assert results[2]["translation"] == "en:after"